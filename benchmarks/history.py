@@ -0,0 +1,168 @@
+"""
+Measure the time and the peak memory of reading a large migration history,
+through ORM objects, through the projected DTOs and streamed from a server
+side cursor.
+
+    python benchmarks/history.py --rows 100000
+    python benchmarks/history.py --url mysql+mysqldb://root@127.0.0.1/sdm_bench
+
+The history table of the database at --url is dropped and filled with --rows
+rows, use a dedicated schema. The default in-memory SQLite has no server side
+cursor, the streamed read is only bounded in memory against MySQL.
+"""
+import argparse
+import datetime
+import gc
+import json
+import logging
+import os
+import platform
+import statistics
+import sys
+import time
+import tracemalloc
+from typing import Callable, Dict, List
+
+from run import REPO_DIR, git_commit
+
+INSERT_BATCH = 5000
+
+
+def fill(engine, rows: int):
+    from sqlalchemy import insert
+
+    from migration import migration_plan as mp
+    from migration.db import model
+
+    table = model.MigrationHistory.__table__
+    table.drop(engine, checkfirst=True)
+    table.create(engine)
+    now = datetime.datetime(2024, 1, 1)
+    with engine.begin() as conn:
+        for start in range(0, rows, INSERT_BATCH):
+            conn.execute(
+                insert(table),
+                [
+                    dict(
+                        id=i + 1,
+                        ver=str(i).zfill(6),
+                        name=f"plan_{i}",
+                        type=mp.Type.SCHEMA if i % 2 else mp.Type.DATA,
+                        state=model.MigrationState.SUCCESSFUL,
+                        created=now,
+                        updated=now,
+                        checksum="0" * 40,
+                    )
+                    for i in range(start, min(start + INSERT_BATCH, rows))
+                ],
+            )
+
+
+def build_reads(batch_size: int) -> Dict[str, Callable]:
+    from migration.db import hist_dao, model
+
+    def orm(dao: hist_dao.MigrationHistoryDAO) -> int:
+        # how get_all_dto read the histories before the projection
+        hists = (
+            dao.session.query(model.MigrationHistory)
+            .order_by(model.MigrationHistory.id.asc())
+            .all()
+        )
+        return len([hist.to_dto() for hist in hists])
+
+    def projected(dao: hist_dao.MigrationHistoryDAO) -> int:
+        return len(dao.get_all_dto())
+
+    def streamed(dao: hist_dao.MigrationHistoryDAO) -> int:
+        return sum(1 for _ in dao.iter_dto(batch_size=batch_size))
+
+    return {"orm": orm, "projected": projected, "streamed": streamed}
+
+
+def measure(engine, read: Callable, rows: int, repeat: int) -> Dict:
+    from sqlalchemy.orm import Session
+
+    from migration.db import hist_dao
+
+    def once() -> int:
+        session = Session(engine)
+        try:
+            return read(hist_dao.MigrationHistoryDAO(session))
+        finally:
+            session.close()
+
+    runs = []
+    for _ in range(repeat):
+        gc.collect()
+        start = time.perf_counter()
+        count = once()
+        runs.append(time.perf_counter() - start)
+        if count != rows:
+            raise Exception(f"Read {count} histories, expected {rows}")
+    # tracemalloc slows the read down, the peak is taken from its own run
+    gc.collect()
+    tracemalloc.start()
+    once()
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return {
+        "runs": runs,
+        "median": statistics.median(runs),
+        "peak_bytes": peak,
+    }
+
+
+def main(argv: List[str] = None) -> int:
+    parser = argparse.ArgumentParser(description="sdm history read benchmark")
+    parser.add_argument("--rows", type=int, default=100000)
+    parser.add_argument("--url", default="sqlite://", help="SQLAlchemy URL")
+    parser.add_argument("--batch-size", type=int, default=1000)
+    parser.add_argument("--repeat", type=int, default=3)
+    parser.add_argument("--output", default=None, help="write results to this file")
+    args = parser.parse_args(sys.argv[1:] if argv is None else argv)
+    sys.path.insert(0, os.path.join(REPO_DIR, "src"))
+    os.environ.setdefault("MYSQL_PWD", "")
+    logging.basicConfig(level=logging.WARNING)
+
+    from sqlalchemy import create_engine
+
+    engine = create_engine(args.url)
+    start = time.perf_counter()
+    fill(engine, args.rows)
+    print(f"inserted {args.rows} histories in {time.perf_counter() - start:.1f}s")
+
+    results = {}
+    for name, read in build_reads(args.batch_size).items():
+        results[name] = measure(engine, read, args.rows, args.repeat)
+        print(
+            f"{name}: median {results[name]['median']:.3f}s"
+            f" peak {results[name]['peak_bytes'] / 2**20:.1f}MiB"
+        )
+    engine.dispose()
+
+    if args.output is not None:
+        with open(args.output, "w") as f:
+            json.dump(
+                {
+                    "commit": git_commit(),
+                    "timestamp": datetime.datetime.now(
+                        datetime.timezone.utc
+                    ).isoformat(),
+                    "python": platform.python_version(),
+                    "platform": platform.platform(),
+                    "params": {
+                        "rows": args.rows,
+                        "dialect": engine.dialect.name,
+                        "batch_size": args.batch_size,
+                        "repeat": args.repeat,
+                    },
+                    "results": results,
+                },
+                f,
+                indent=2,
+            )
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,312 @@
+"""
+Time sdm operations on a synthetic workspace, see the Benchmarks section of
+README.md.
+
+    python benchmarks/run.py --schema-plans 500 --output results.json
+    python benchmarks/run.py --baseline results.json
+
+info and fake_migrate need a MySQL server, they run with --environment.
+"""
+import argparse
+import contextlib
+import datetime
+import json
+import logging
+import os
+import platform
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+from argparse import Namespace
+from typing import Callable, Dict, Iterator, List, Optional
+
+# cli_env reads MIGRATION_CWD on import, the workspace is created first
+WORKSPACE_ENV = "MIGRATION_CWD"
+REPO_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def parse_args(argv: List[str]) -> Namespace:
+    parser = argparse.ArgumentParser(description="sdm benchmarks")
+    parser.add_argument("--schema-plans", type=int, default=200)
+    parser.add_argument("--data-plans", type=int, default=200)
+    parser.add_argument("--repeatable-plans", type=int, default=20)
+    parser.add_argument("--tables", type=int, default=50, help="tables per index")
+    parser.add_argument(
+        "--garbage", type=int, default=20, help="unreachable objects in the store"
+    )
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--repeat", type=int, default=5)
+    parser.add_argument("--warmup", type=int, default=1)
+    parser.add_argument(
+        "--case", action="append", default=None, help="run only these cases"
+    )
+    parser.add_argument(
+        "--workspace",
+        default=None,
+        help="generate the workspace in this empty directory and keep it",
+    )
+    parser.add_argument(
+        "--output", default=None, help="write the results to this json file"
+    )
+    parser.add_argument(
+        "--baseline", default=None, help="compare with the results of this file"
+    )
+    parser.add_argument(
+        "--threshold",
+        type=float,
+        default=1.2,
+        help="exit with 1 if a median is slower than the baseline by this ratio",
+    )
+    parser.add_argument(
+        "--environment",
+        default=None,
+        help="run the cases that need MySQL against this environment",
+    )
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("-P", "--port", type=int, default=3306)
+    parser.add_argument("-u", "--user", default="root")
+    parser.add_argument("--schema", default="sdm_bench")
+    return parser.parse_args(argv)
+
+
+def git_commit() -> Optional[str]:
+    try:
+        commit = subprocess.check_output(
+            ["git", "rev-parse", "HEAD"], cwd=REPO_DIR, stderr=subprocess.DEVNULL
+        )
+        dirty = subprocess.check_output(
+            ["git", "status", "--porcelain", "--untracked-files=no"], cwd=REPO_DIR
+        )
+    except (OSError, subprocess.CalledProcessError):
+        return None
+    return commit.decode().strip() + ("-dirty" if dirty.strip() else "")
+
+
+@contextlib.contextmanager
+def quiet_stdout() -> Iterator[None]:
+    """
+    silence stdout of this process and its children, e.g. diff
+    """
+    sys.stdout.flush()
+    saved = os.dup(1)
+    with open(os.devnull, "w") as devnull:
+        os.dup2(devnull.fileno(), 1)
+        try:
+            yield
+        finally:
+            sys.stdout.flush()
+            os.dup2(saved, 1)
+            os.close(saved)
+
+
+class Case:
+    def __init__(
+        self,
+        name: str,
+        func: Callable[[], None],
+        setup: Callable[[], None] = lambda: None,
+    ):
+        self.name = name
+        self.func = func
+        # called before every run, not timed
+        self.setup = setup
+
+    def run(self, repeat: int, warmup: int) -> Dict:
+        runs = []
+        for i in range(warmup + repeat):
+            self.setup()
+            start = time.perf_counter()
+            with quiet_stdout():
+                self.func()
+            elapsed = time.perf_counter() - start
+            if i >= warmup:
+                runs.append(elapsed)
+        return {
+            "runs": runs,
+            "min": min(runs),
+            "median": statistics.median(runs),
+            "mean": statistics.fmean(runs),
+        }
+
+
+def build_cases(args: Namespace) -> List[Case]:
+    from migration import migration_plan as mp
+    from migration import store_gc
+    from migration.env import cli_env
+    from migration.lib import CLI
+
+    def make_cli(**kwargs) -> CLI:
+        return CLI(args=Namespace(**kwargs))
+
+    cli = make_cli()
+    cli.read_migration_plans()
+    schema_versions = [p.version for p in cli.mpm.get_plans_by_type(mp.Type.SCHEMA)]
+
+    def clean_gc_state():
+        state_path = os.path.join(cli_env.SDM_SCRATCH_DIR, store_gc.GC_STATE_FILE)
+        if os.path.exists(state_path):
+            os.remove(state_path)
+
+    def diff():
+        try:
+            make_cli(left=schema_versions[0], right=schema_versions[-1]).diff()
+        except Exception as e:
+            # a difference is raised as an exception
+            if not str(e).startswith("Difference found"):
+                raise
+
+    cases = [
+        Case("load_plans", mp.MigrationPlanManager),
+        Case("check_integrity", cli._check_integrity),
+        Case("check_integrity_fast", lambda: cli._check_integrity(fast=True)),
+        Case(
+            "clean_store_cold",
+            lambda: cli._clean_schema_store(dry_run=True),
+            setup=clean_gc_state,
+        ),
+        Case("clean_store_warm", lambda: cli._clean_schema_store(dry_run=True)),
+        Case("diff_versions", diff),
+    ]
+
+    if args.environment is not None:
+        env = args.environment
+
+        def rollback_to_init():
+            # the first warmup run migrates from an empty history
+            migrator = make_cli(environment=env, version="0000", fake=True)
+            migrator.read_migration_plans()
+            dao = migrator.build_dao()
+            applied = len(dao.get_all_dto())
+            dao.session.close()
+            if applied > 1:
+                migrator.rollback()
+
+        cases += [
+            Case(
+                "fake_migrate",
+                lambda: make_cli(environment=env, fake=True).migrate(),
+                setup=rollback_to_init,
+            ),
+            Case("info", lambda: make_cli(environment=env).info()),
+        ]
+
+    if args.case:
+        unknown = set(args.case) - {c.name for c in cases}
+        if unknown:
+            raise Exception(f"Unknown cases {sorted(unknown)}")
+        cases = [c for c in cases if c.name in args.case]
+    return cases
+
+
+def compare(results: Dict, baseline: Dict, threshold: float) -> bool:
+    """
+    print the medians against the baseline, return False on a regression
+    """
+    from tabulate import tabulate
+
+    rows = []
+    ok = True
+    for name, result in results["results"].items():
+        base = baseline["results"].get(name)
+        if base is None:
+            rows.append([name, None, f"{result['median']:.4f}", None, "new"])
+            continue
+        ratio = result["median"] / base["median"] if base["median"] > 0 else 0
+        regressed = ratio > threshold
+        ok = ok and not regressed
+        rows.append(
+            [
+                name,
+                f"{base['median']:.4f}",
+                f"{result['median']:.4f}",
+                f"{ratio:.2f}",
+                "regression" if regressed else "",
+            ]
+        )
+    if baseline.get("params", {}).get("workspace") != results["params"]["workspace"]:
+        print("warning: the baseline was run on another workspace")
+    print(
+        f"baseline {baseline.get('commit')} vs {results['commit']}\n"
+        + tabulate(
+            rows,
+            headers=["case", "baseline(s)", "current(s)", "ratio", ""],
+            tablefmt="orgtbl",
+        )
+    )
+    return ok
+
+
+def main(argv: List[str] = None) -> int:
+    args = parse_args(sys.argv[1:] if argv is None else argv)
+    with contextlib.ExitStack() as stack:
+        workspace = args.workspace
+        if workspace is None:
+            workspace = stack.enter_context(tempfile.TemporaryDirectory())
+        workspace = os.path.abspath(workspace)
+        os.environ[WORKSPACE_ENV] = workspace
+        os.environ.setdefault("MYSQL_PWD", "")
+
+        from workspace import WorkspaceGenerator, WorkspaceSpec
+
+        from migration.env import cli_env
+
+        if cli_env.MIGRATION_CWD != workspace:
+            raise Exception("migration is imported before the workspace is set")
+        logging.basicConfig(level=logging.WARNING)
+
+        spec = WorkspaceSpec(
+            schema_plans=args.schema_plans,
+            data_plans=args.data_plans,
+            repeatable_plans=args.repeatable_plans,
+            tables=args.tables,
+            garbage=args.garbage,
+            seed=args.seed,
+            environment=args.environment or "bench",
+            host=args.host,
+            port=args.port,
+            user=args.user,
+            schema=args.schema,
+        )
+        start = time.perf_counter()
+        WorkspaceGenerator(spec, workspace).generate()
+        print(f"generated workspace in {time.perf_counter() - start:.1f}s")
+
+        results = {
+            "commit": git_commit(),
+            "timestamp": datetime.datetime.now(datetime.timezone.utc).isoformat(),
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "params": {
+                "workspace": {
+                    k: v
+                    for k, v in spec.to_dict().items()
+                    if k not in ("host", "port", "user", "schema")
+                },
+                "repeat": args.repeat,
+                "warmup": args.warmup,
+            },
+            "results": {},
+        }
+        for case in build_cases(args):
+            result = case.run(args.repeat, args.warmup)
+            results["results"][case.name] = result
+            print(
+                f"{case.name}: median {result['median']:.4f}s min {result['min']:.4f}s"
+            )
+
+    if args.output is not None:
+        with open(args.output, "w") as f:
+            json.dump(results, f, indent=2)
+            f.write("\n")
+    if args.baseline is not None:
+        with open(args.baseline) as f:
+            baseline = json.load(f)
+        if not compare(results, baseline, args.threshold):
+            return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,338 @@
+"""
+Measure how many plans per second migrate and rollback sustain against the
+MySQL servers of the integration tests, and where the time goes.
+
+    python benchmarks/throughput.py --sizes 10,100 --kinds sql,python
+
+The workspace is bootstrapped with tests/testcommon.py, so the servers are
+configured like for the tests (UNITTEST_MYSQL_HOST1/2, MYSQL_PWD). Every
+chain starts from a fresh workspace with testtable applied.
+"""
+import argparse
+import datetime
+import functools
+import inspect
+import json
+import logging
+import os
+import platform
+import sys
+import tempfile
+import threading
+import time
+from argparse import Namespace
+from typing import Callable, Dict, List
+
+from run import REPO_DIR, WORKSPACE_ENV, git_commit
+
+KINDS = ["sql", "sql_file", "python", "schema"]
+BASE_VERSION = "0001"
+
+PYTHON_FORWARD = """from sqlalchemy import text
+
+
+def run(session, args):
+    with session.begin():
+        session.execute(text("insert into testtable (id, name) values ({i}, 'x')"))
+"""
+PYTHON_BACKWARD = """from sqlalchemy import text
+
+
+def run(session, args):
+    with session.begin():
+        session.execute(text("delete from testtable where id = {i}"))
+"""
+
+
+class PhaseTimer:
+    """
+    Accumulate the self time of phases: time spent in a nested phase is
+    counted for the nested phase only, and a phase calling itself is counted
+    once.
+    """
+
+    def __init__(self):
+        self.seconds: Dict[str, float] = {}
+        self.calls: Dict[str, int] = {}
+        self._local = threading.local()
+        self._mutex = threading.Lock()
+
+    def _stack(self) -> List[List]:
+        if not hasattr(self._local, "stack"):
+            self._local.stack = []
+        return self._local.stack
+
+    def wrap(self, phase: str, func: Callable) -> Callable:
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            stack = self._stack()
+            if stack and stack[-1][0] == phase:
+                return func(*args, **kwargs)
+            # [phase, time of nested phases]
+            frame = [phase, 0.0]
+            stack.append(frame)
+            start = time.perf_counter()
+            try:
+                return func(*args, **kwargs)
+            finally:
+                elapsed = time.perf_counter() - start
+                stack.pop()
+                if stack:
+                    stack[-1][1] += elapsed
+                with self._mutex:
+                    self.seconds[phase] = (
+                        self.seconds.get(phase, 0.0) + elapsed - frame[1]
+                    )
+                    self.calls[phase] = self.calls.get(phase, 0) + 1
+
+        return wrapper
+
+    def reset(self):
+        self.seconds = {}
+        self.calls = {}
+
+
+def instrument(timer: PhaseTimer):
+    from migration import helper
+    from migration.db import hist_dao
+    from migration.migrator import Migrator
+
+    for name in ["build_session_from_env", "build_engine_from_env"]:
+        setattr(helper, name, timer.wrap("session", getattr(helper, name)))
+    helper.call_skeema = timer.wrap("skeema", helper.call_skeema)
+    for name, attr in list(vars(hist_dao.MigrationHistoryDAO).items()):
+        if inspect.isfunction(attr) and not name.startswith("__"):
+            setattr(hist_dao.MigrationHistoryDAO, name, timer.wrap("history_dao", attr))
+    for name in [
+        "migrate_data_sql",
+        "migrate_data_sql_file",
+        "migrate_data_python",
+        "migrate_data_shell",
+        "migrate_data_typescript",
+        "migrate_data_bulk_load",
+    ]:
+        setattr(Migrator, name, timer.wrap("data", getattr(Migrator, name)))
+
+
+class ChainBuilder:
+    """
+    Append n plans of one kind after the base plan, writing the plan files
+    directly, make reads every plan for each new one.
+    """
+
+    def __init__(self, cli):
+        from migration import migration_plan as mp
+
+        self.mp = mp
+        self.cli = cli
+        self.mpm = cli.read_migration_plans()
+
+    def data_change(self, kind: str, i: int):
+        mp = self.mp
+        from migration.env import cli_env
+
+        if kind == "sql":
+            return mp.Change(
+                forward=mp.DataForward(
+                    type=mp.DataChangeType.SQL,
+                    sql=f"insert into testtable (id, name) values ({i}, 'x')",
+                ),
+                backward=mp.DataBackward(
+                    type=mp.DataChangeType.SQL,
+                    sql=f"delete from testtable where id = {i}",
+                ),
+            )
+        if kind == "sql_file":
+            contents = [
+                f"insert into testtable (id, name) values ({i}, 'x');",
+                f"delete from testtable where id = {i};",
+            ]
+            ext = "sql"
+            change_type = mp.DataChangeType.SQL_FILE
+        else:
+            contents = [PYTHON_FORWARD.format(i=i), PYTHON_BACKWARD.format(i=i)]
+            ext = "py"
+            change_type = mp.DataChangeType.PYTHON
+        files = [f"bench_{i}.{ext}", f"bench_{i}_rollback.{ext}"]
+        for file, content in zip(files, contents):
+            with open(
+                os.path.join(cli_env.MIGRATION_CWD, cli_env.DATA_DIR, file), "w"
+            ) as f:
+                f.write(content)
+        return mp.Change(
+            forward=mp.DataForward(type=change_type, file=files[0]),
+            backward=mp.DataBackward(type=change_type, file=files[1]),
+        )
+
+    def build(self, kind: str, n: int):
+        mp = self.mp
+        from migration.env import cli_env
+
+        previous = self.mpm.get_latest_plan()
+        schema_index = self.mpm.get_latest_plan(mp.Type.SCHEMA).change.forward.id
+        sql_files, _, _ = self.cli.read_sql_files()
+        for i in range(1, n + 1):
+            version = self.cli.bump_version(previous.version)
+            if kind == "schema":
+                name = f"bench_t{i}.sql"
+                content = f"create table bench_t{i} (id int primary key);"
+                with open(
+                    os.path.join(cli_env.MIGRATION_CWD, cli_env.SCHEMA_DIR, name), "w"
+                ) as f:
+                    f.write(content)
+                sql_file = mp.SQLFile(name, content, self.cli.sha1_encode([content]))
+                sql_files.append(sql_file)
+                sql_files.sort(key=lambda x: x.sha1)
+                index_sha1 = self.cli.sha1_encode([f.sha1 for f in sql_files])
+                self.cli.write_schema_store_index(
+                    index_sha1,
+                    "\n".join([f"{f.sha1}:{f.name}" for f in sql_files]),
+                    [sql_file],
+                )
+                change = mp.Change(
+                    forward=mp.SchemaForward(id=index_sha1),
+                    backward=mp.SchemaBackward(id=schema_index),
+                )
+                schema_index = index_sha1
+                plan_type = mp.Type.SCHEMA
+            else:
+                change = self.data_change(kind, i)
+                plan_type = mp.Type.DATA
+            previous = mp.MigrationPlan(
+                version=version,
+                name=f"bench_{kind}_{i}",
+                author="bench",
+                type=plan_type,
+                change=change,
+                dependencies=[previous.sig()],
+            )
+            previous.save()
+
+
+def measure(timer: PhaseTimer, n: int, func: Callable[[], None]) -> Dict:
+    timer.reset()
+    start = time.perf_counter()
+    func()
+    elapsed = time.perf_counter() - start
+    phases = {k: round(v, 6) for k, v in sorted(timer.seconds.items())}
+    phases["other"] = round(elapsed - sum(timer.seconds.values()), 6)
+    return {
+        "plans": n,
+        "seconds": elapsed,
+        "plans_per_second": n / elapsed if elapsed > 0 else 0,
+        "phases": phases,
+        "calls": dict(sorted(timer.calls.items())),
+    }
+
+
+def run_chain(timer: PhaseTimer, kind: str, n: int) -> Dict:
+    from migration.lib import CLI
+    from tests import testcommon as tc
+
+    tc.init_workspace()
+    tc.make_schema_migration_plan()
+    tc.migrate_dev()
+    ChainBuilder(CLI(args=Namespace())).build(kind, n)
+
+    result = {
+        "migrate": measure(timer, n, lambda: tc.make_cli().migrate()),
+        "rollback": measure(
+            timer,
+            n,
+            lambda: tc.make_cli(
+                {"environment": "dev", "version": BASE_VERSION}
+            ).rollback(),
+        ),
+    }
+    return result
+
+
+def print_results(results: Dict):
+    from tabulate import tabulate
+
+    phases = sorted(
+        {
+            phase
+            for chain in results.values()
+            for op in chain.values()
+            for phase in op["phases"]
+        }
+    )
+    rows = []
+    for name, chain in results.items():
+        for op, r in chain.items():
+            rows.append(
+                [name, op, f"{r['seconds']:.2f}", f"{r['plans_per_second']:.1f}"]
+                + [f"{r['phases'].get(p, 0) / r['seconds'] * 100:.0f}%" for p in phases]
+            )
+    print(
+        tabulate(
+            rows,
+            headers=["chain", "op", "seconds", "plans/s"] + phases,
+            tablefmt="orgtbl",
+        )
+    )
+
+
+def main(argv: List[str] = None) -> int:
+    parser = argparse.ArgumentParser(description="sdm migrate/rollback throughput")
+    parser.add_argument("--sizes", default="10,100,1000")
+    parser.add_argument("--kinds", default=",".join(KINDS))
+    parser.add_argument(
+        "--workspace",
+        default=None,
+        help="directory of the workspace, it is removed before every chain",
+    )
+    parser.add_argument("--output", default=None, help="write results to this file")
+    args = parser.parse_args(sys.argv[1:] if argv is None else argv)
+    sizes = [int(s) for s in args.sizes.split(",")]
+    kinds = args.kinds.split(",")
+    unknown = set(kinds) - set(KINDS)
+    if unknown:
+        raise Exception(f"Unknown kinds {sorted(unknown)}, expected {KINDS}")
+
+    temp_dir = None
+    workspace = args.workspace
+    if workspace is None:
+        temp_dir = tempfile.TemporaryDirectory()
+        workspace = os.path.join(temp_dir.name, "workspace")
+    os.environ[WORKSPACE_ENV] = os.path.abspath(workspace)
+    sys.path.insert(0, REPO_DIR)
+    logging.basicConfig(level=logging.WARNING)
+
+    timer = PhaseTimer()
+    instrument(timer)
+    results = {}
+    try:
+        for kind in kinds:
+            for n in sizes:
+                results[f"{kind}/{n}"] = run_chain(timer, kind, n)
+                for op, r in results[f"{kind}/{n}"].items():
+                    print(f"{kind}/{n} {op}: {r['plans_per_second']:.1f} plans/s")
+    finally:
+        if temp_dir is not None:
+            temp_dir.cleanup()
+
+    print_results(results)
+    if args.output is not None:
+        with open(args.output, "w") as f:
+            json.dump(
+                {
+                    "commit": git_commit(),
+                    "timestamp": datetime.datetime.now(
+                        datetime.timezone.utc
+                    ).isoformat(),
+                    "python": platform.python_version(),
+                    "platform": platform.platform(),
+                    "params": {"sizes": sizes, "kinds": kinds},
+                    "results": results,
+                },
+                f,
+                indent=2,
+            )
+            f.write("\n")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,211 @@
+import os
+import random
+from dataclasses import asdict, dataclass
+from typing import Dict
+
+from migration import helper
+from migration import migration_plan as mp
+from migration.env import cli_env
+
+AUTHOR = "bench"
+COLUMN_TYPES = [
+    "varchar(255) NOT NULL DEFAULT ''",
+    "int NOT NULL DEFAULT '0'",
+    "bigint DEFAULT NULL",
+    "datetime DEFAULT NULL",
+    "decimal(12,2) NOT NULL DEFAULT '0.00'",
+    "text",
+]
+
+
+@dataclass
+class WorkspaceSpec:
+    schema_plans: int = 200
+    data_plans: int = 200
+    repeatable_plans: int = 20
+    tables: int = 50
+    # unreachable objects in .schema_store, left by abandoned migrations
+    garbage: int = 20
+    seed: int = 0
+    # the environment written to schema/.skeema
+    environment: str = "bench"
+    host: str = "127.0.0.1"
+    port: int = 3306
+    user: str = "root"
+    schema: str = "sdm_bench"
+
+    def to_dict(self) -> Dict:
+        return asdict(self)
+
+
+def table_sql(name: str, columns: int) -> str:
+    lines = ["  `id` bigint NOT NULL AUTO_INCREMENT,"]
+    for i in range(columns):
+        lines.append(f"  `c{i}` {COLUMN_TYPES[i % len(COLUMN_TYPES)]},")
+    lines.append("  `created_at` datetime NOT NULL DEFAULT CURRENT_TIMESTAMP,")
+    lines.append("  PRIMARY KEY (`id`),")
+    lines.append("  KEY `idx_created_at` (`created_at`)")
+    return (
+        f"CREATE TABLE `{name}` (\n"
+        + "\n".join(lines)
+        + "\n) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4 COLLATE=utf8mb4_0900_ai_ci;\n"
+    )
+
+
+class WorkspaceGenerator:
+    """
+    Write a synthetic workspace with the layout sdm init and make create:
+    interleaved schema and data plans, repeatable plans, and a .schema_store
+    holding one index per schema plan. Every schema plan adds a column to a
+    random table, so the store grows like a real one.
+    """
+
+    def __init__(self, spec: WorkspaceSpec, path: str = cli_env.MIGRATION_CWD):
+        self.spec = spec
+        self.path = path
+        self.random = random.Random(spec.seed)
+        self.columns: Dict[str, int] = {
+            f"t_{i:04d}": 4 + self.random.randrange(8) for i in range(spec.tables)
+        }
+
+    def generate(self):
+        for d in [cli_env.SCHEMA_DIR, cli_env.DATA_DIR, cli_env.MIGRATION_PLAN_DIR]:
+            os.makedirs(os.path.join(self.path, d), exist_ok=False)
+        for i in range(256):
+            bucket = os.path.join(self.path, cli_env.SCHEMA_STORE_DIR, f"{i:02x}")
+            os.makedirs(bucket, exist_ok=False)
+            with open(os.path.join(bucket, ".gitkeep"), "w") as f:
+                f.write("")
+        self._write_env_ini()
+
+        index_sha1 = self._write_schema_index()
+        previous = self._save_plan(
+            mp.MigrationPlan(
+                version=mp.InitialMigrationSignature.version,
+                name=mp.InitialMigrationSignature.name,
+                author=AUTHOR,
+                type=mp.Type.SCHEMA,
+                change=mp.Change(
+                    forward=mp.SchemaForward(id=index_sha1), backward=None
+                ),
+                dependencies=[],
+            )
+        )
+
+        types = [mp.Type.SCHEMA] * self.spec.schema_plans + [
+            mp.Type.DATA
+        ] * self.spec.data_plans
+        self.random.shuffle(types)
+        for i, plan_type in enumerate(types, start=1):
+            if plan_type == mp.Type.SCHEMA:
+                change = self._schema_change(index_sha1)
+                index_sha1 = change.forward.id
+            else:
+                change = self._data_change(i)
+            previous = self._save_plan(
+                mp.MigrationPlan(
+                    version=str(i).zfill(4),
+                    name=f"{plan_type}_{i}",
+                    author=AUTHOR,
+                    type=plan_type,
+                    change=change,
+                    dependencies=[previous.sig()],
+                )
+            )
+
+        for i in range(self.spec.repeatable_plans):
+            file = f"repeatable_{i}.sql"
+            self._write_data_file(file, self._dml(i))
+            self._save_plan(
+                mp.MigrationPlan(
+                    version=mp.RepeatableVersion,
+                    name=f"repeatable_{i}",
+                    author=AUTHOR,
+                    type=mp.Type.REPEATABLE,
+                    change=mp.Change(
+                        forward=mp.DataForward(
+                            type=mp.DataChangeType.SQL_FILE, file=file
+                        ),
+                        backward=None,
+                    ),
+                    dependencies=[],
+                )
+            )
+
+        for name, columns in self.columns.items():
+            with open(
+                os.path.join(self.path, cli_env.SCHEMA_DIR, f"{name}.sql"), "w"
+            ) as f:
+                f.write(table_sql(name, columns))
+        for i in range(self.spec.garbage):
+            self._write_store_object(table_sql(f"garbage_{i}", 4))
+
+    def _write_env_ini(self):
+        spec = self.spec
+        with open(os.path.join(self.path, cli_env.ENV_INI_FILE), "w") as f:
+            f.write(
+                "default-character-set=utf8mb4\n"
+                "default-collation=utf8mb4_0900_ai_ci\n"
+                f"schema={spec.schema}\n\n"
+                f"[{spec.environment}]\n"
+                "flavor=mysql:8.0\n"
+                f"host={spec.host}\n"
+                f"port={spec.port}\n"
+                f"user={spec.user}\n"
+                f"ignore-table={cli_env.TABLE_MIGRATION_HISTORY}\n"
+            )
+
+    def _write_store_object(self, content: str, sha1: str = None) -> str:
+        # an index is named by the sha1 of its sql files, not of its content
+        sha1 = sha1 or helper.sha1_encode([content])
+        path = os.path.join(self.path, cli_env.SCHEMA_STORE_DIR, sha1[:2], sha1[2:])
+        if not os.path.exists(path):
+            with open(path, "w") as f:
+                f.write(content)
+        return sha1
+
+    def _write_schema_index(self) -> str:
+        sql_files = sorted(
+            (self._write_store_object(table_sql(name, columns)), f"{name}.sql")
+            for name, columns in self.columns.items()
+        )
+        index_sha1 = helper.sha1_encode([sha1 for sha1, _ in sql_files])
+        index_content = "\n".join(f"{sha1}:{name}" for sha1, name in sql_files)
+        return self._write_store_object(index_content, sha1=index_sha1)
+
+    def _schema_change(self, previous_index_sha1: str) -> mp.Change:
+        table = self.random.choice(list(self.columns))
+        self.columns[table] += 1
+        return mp.Change(
+            forward=mp.SchemaForward(id=self._write_schema_index()),
+            backward=mp.SchemaBackward(id=previous_index_sha1),
+        )
+
+    def _dml(self, i: int) -> str:
+        table = self.random.choice(list(self.columns))
+        return f"UPDATE `{table}` SET `c0` = `c0` WHERE `id` = {i};"
+
+    def _data_change(self, i: int) -> mp.Change:
+        if i % 2 == 0:
+            return mp.Change(
+                forward=mp.DataForward(type=mp.DataChangeType.SQL, sql=self._dml(i)),
+                backward=mp.DataBackward(type=mp.DataChangeType.SQL, sql=self._dml(-i)),
+            )
+        file = f"data_{i}.sql"
+        self._write_data_file(file, self._dml(i))
+        return mp.Change(
+            forward=mp.DataForward(type=mp.DataChangeType.SQL_FILE, file=file),
+            backward=None,
+        )
+
+    def _write_data_file(self, file: str, content: str):
+        with open(os.path.join(self.path, cli_env.DATA_DIR, file), "w") as f:
+            f.write(content)
+
+    def _save_plan(self, plan: mp.MigrationPlan) -> mp.MigrationPlan:
+        filepath = os.path.join(
+            self.path, cli_env.MIGRATION_PLAN_DIR, f"{plan.version}_{plan.name}.json"
+        )
+        with open(filepath, "w") as f:
+            f.write(plan.to_json_str())
+        return plan
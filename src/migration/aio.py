@@ -0,0 +1,165 @@
+"""
+asyncio execution of the commands that run against many environments. They
+wait on MySQL round trips and subprocesses, e.g. skeema, so they overlap:
+    subprocesses are run with asyncio.create_subprocess_exec
+    the synchronous work of an environment, e.g. the history DAO, runs in a
+    worker thread, mysqlclient releases the GIL while it waits for MySQL
+    at most ASYNC_HOST_CONCURRENCY environments of one MySQL host are worked
+    on at a time
+The synchronous commands run a coroutine of this module with run.
+"""
+import asyncio
+import concurrent.futures
+import contextvars
+import inspect
+import logging
+import os
+import shlex
+import subprocess
+from contextlib import asynccontextmanager
+from dataclasses import dataclass
+from typing import (Any, AsyncIterator, Awaitable, Callable, Coroutine, Dict,
+                    List, Optional, Tuple, TypeVar, Union)
+
+from . import helper, tracing
+from .env import cli_env
+
+logger = logging.getLogger(__name__)
+
+T = TypeVar("T")
+
+
+def host_of(environment: str) -> Tuple[str, str]:
+    section = helper.get_env_ini_section(environment)
+    return (section["host"], section["port"])
+
+
+class HostLimiter:
+    """
+    Bound the environments worked on at a time per MySQL host
+    """
+
+    def __init__(
+        self,
+        per_host: int = cli_env.ASYNC_HOST_CONCURRENCY,
+        host_of: Callable[[str], Tuple[str, str]] = host_of,
+    ):
+        self.per_host = per_host
+        self.host_of = host_of
+        self._semaphores: Dict[Tuple[str, str], asyncio.Semaphore] = {}
+
+    @asynccontextmanager
+    async def hold(self, environment: str) -> AsyncIterator[None]:
+        host = self.host_of(environment)
+        if host not in self._semaphores:
+            self._semaphores[host] = asyncio.Semaphore(self.per_host)
+        async with self._semaphores[host]:
+            yield
+
+
+@dataclass
+class Outcome:
+    environment: str
+    result: Any = None
+    error: Optional[BaseException] = None
+
+
+async def run_subprocess(
+    cmd: List[str], cwd: Optional[str] = None, env: Optional[Dict[str, str]] = None
+):
+    """
+    run cmd like subprocess.check_call, the output goes to the stdout and
+    stderr of this process
+    """
+    exe = os.path.basename(cmd[0]) if cmd else ""
+    s = tracing.start_span(
+        f"subprocess {exe}",
+        {"process.executable.name": exe, "process.command_args": " ".join(cmd)},
+        detached=True,
+    )
+    try:
+        process = await asyncio.create_subprocess_exec(*cmd, cwd=cwd, env=env)
+        try:
+            returncode = await process.wait()
+        except asyncio.CancelledError:
+            process.kill()
+            await process.wait()
+            raise
+        if returncode != 0:
+            raise subprocess.CalledProcessError(returncode, cmd)
+    except BaseException as e:
+        tracing.end_span(s, e)
+        raise
+    tracing.end_span(s)
+
+
+async def call_skeema(
+    raw_args: List[str],
+    cwd: str = cli_env.MIGRATION_CWD,
+    env: Optional[Dict[str, str]] = None,
+):
+    """
+    helper.call_skeema, without blocking the event loop
+    """
+    cmd = f"{cli_env.SKEEMA_CMD_PATH} " + " ".join(raw_args)
+    logger.info("Run %s", cmd)
+    await run_subprocess(shlex.split(cmd), cwd=cwd, env=env)
+
+
+async def for_each_environment(
+    environments: List[str],
+    func: Callable[[str], Union[T, Awaitable[T]]],
+    limiter: Optional[HostLimiter] = None,
+) -> List[Outcome]:
+    """
+    call func with each environment at the same time, bounded by limiter. A
+    synchronous func runs in a worker thread of its own, the default executor
+    of asyncio has a few threads only. The outcomes are in the order of
+    environments, an error of one environment does not stop the others
+    """
+    limiter = limiter or HostLimiter()
+    loop = asyncio.get_running_loop()
+    executor = None
+    if not inspect.iscoroutinefunction(func):
+        executor = concurrent.futures.ThreadPoolExecutor(
+            max_workers=max(len(environments), 1), thread_name_prefix="sdm-env"
+        )
+
+    async def call(environment: str) -> Outcome:
+        try:
+            async with limiter.hold(environment):
+                if executor is None:
+                    result = await func(environment)
+                else:
+                    # like asyncio.to_thread, with the context of the caller
+                    context = contextvars.copy_context()
+                    result = await loop.run_in_executor(
+                        executor, context.run, func, environment
+                    )
+            return Outcome(environment, result=result)
+        except Exception as e:
+            logger.debug("Failed in %s: %s", environment, e)
+            return Outcome(environment, error=e)
+
+    try:
+        return list(await asyncio.gather(*[call(e) for e in environments]))
+    finally:
+        if executor is not None:
+            executor.shutdown(wait=False, cancel_futures=True)
+
+
+def run(coro: Coroutine[Any, Any, T]) -> T:
+    """
+    run coro from synchronous code, in a new event loop. When the caller runs
+    in an event loop already, e.g. a service embedding the library, the new
+    loop runs in a thread and the caller's loop is blocked until it is done,
+    such callers should await the coroutines, e.g. for_each_environment
+    """
+    try:
+        asyncio.get_running_loop()
+    except RuntimeError:
+        return asyncio.run(coro)
+    # asyncio.run refuses to run in the thread of a running loop
+    context = contextvars.copy_context()
+    with concurrent.futures.ThreadPoolExecutor(max_workers=1) as executor:
+        return executor.submit(context.run, asyncio.run, coro).result()
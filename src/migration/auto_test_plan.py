@@ -1,5 +1,7 @@
+import csv
+import json
 import random
-from typing import List, Tuple
+from typing import Iterator, List, Tuple
 
 import networkx as nx
 
@@ -45,6 +47,25 @@ class PlanGenerator:
         important_nodes: List[int] = [],
         non_important_nodes: List[int] = [],
     ) -> List[int]:
+        return list(
+            self.iter_monkey(
+                walk_len=walk_len,
+                start_node=start_node,
+                important_nodes=important_nodes,
+                non_important_nodes=non_important_nodes,
+            )
+        )
+
+    def iter_monkey(
+        self,
+        walk_len: int = None,
+        start_node: int = 0,
+        important_nodes: List[int] = [],
+        non_important_nodes: List[int] = [],
+    ) -> Iterator[int]:
+        """
+        yield the nodes of a random walk as they are visited
+        """
         G = self.graph.copy()
 
         if walk_len is None:
@@ -64,11 +85,9 @@ class PlanGenerator:
             if i < j and not G.has_edge(j, i):
                 G[i][j]["weight"] -= 1
 
-        result: List[int] = []
-
         curr = start_node
         for _ in range(walk_len):
-            result.append(curr)
+            yield curr
             succ = list(G.succ[curr])
             if len(succ) == 0:
                 break
@@ -81,7 +100,22 @@ class PlanGenerator:
                 G[curr][next_curr]["weight"] -= 1
             curr = next_curr
 
-        return result
+
+# the column of the plans in a jsonl or csv test plan
+TEST_PLAN_HEADER = "plan"
+
+
+def read_test_plan_file(path: str) -> List[str]:
+    """
+    read a test plan written by sdm test gen, the format is told by the
+    extension, .jsonl, .csv or json otherwise
+    """
+    with open(path, "r") as f:
+        if path.endswith(".jsonl"):
+            return [json.loads(line)[TEST_PLAN_HEADER] for line in f if line.strip()]
+        if path.endswith(".csv"):
+            return [row[TEST_PLAN_HEADER] for row in csv.DictReader(f)]
+        return json.load(f)
 
 
 class AutoTestPlan:
@@ -121,13 +155,34 @@ class AutoTestPlan:
         important: str = "",
         non_important: str = "",
     ) -> List[str]:
+        return list(
+            self.iter_gen(
+                test_type,
+                walk_len=walk_len,
+                start=start,
+                important=important,
+                non_important=non_important,
+            )
+        )
+
+    def iter_gen(
+        self,
+        test_type: str,
+        walk_len: int = None,
+        start: str = "",
+        important: str = "",
+        non_important: str = "",
+    ) -> Iterator[str]:
+        """
+        yield the plans of the test plan as they are generated
+        """
         match test_type:
             case consts.TEST_TYPE_SIMPLE_FORWARD:
-                test_plan = self.gen_simple_forward()
+                idx_plan = self.tpg.gen_simple_forward()
             case consts.TEST_TYPE_STEP_FORWARD:
-                test_plan = self.gen_step_by_step_forward()
+                idx_plan = self.tpg.gen_step_by_step_forward()
             case consts.TEST_TYPE_STEP_BACKWARD:
-                test_plan = self.gen_step_by_step_forward_and_backward()
+                idx_plan = self.tpg.gen_step_by_step_forward_and_backward()
             case consts.TEST_TYPE_MONKEY:
                 if not start:
                     start_node = 0
@@ -143,7 +198,7 @@ class AutoTestPlan:
                     non_important_nodes = self._parse_str_plan_to_idx(
                         non_important.split(",")
                     )
-                test_plan = self.gen_monkey(
+                idx_plan = self.tpg.iter_monkey(
                     walk_len=walk_len,
                     start_node=start_node,
                     important_nodes=important_nodes,
@@ -151,7 +206,9 @@ class AutoTestPlan:
                 )
             case _:
                 raise Exception(f"Unknown test type: {test_type}")
-        return test_plan
+        plans = self.mpm.get_plans()
+        for idx in idx_plan:
+            yield str(plans[idx].sig())
 
     def gen_simple_forward(self) -> List[str]:
         idx_plan = self.tpg.gen_simple_forward()
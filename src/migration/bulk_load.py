@@ -0,0 +1,204 @@
+import csv
+import logging
+import time
+from enum import StrEnum
+from typing import Any, Dict, Iterator, List, Optional, Tuple
+
+from sqlalchemy import Connection, Engine, create_engine, exc, text
+
+from . import err
+from .env import cli_env
+
+logger = logging.getLogger(__name__)
+
+SUPPORTED_EXTENSIONS = (".csv", ".parquet")
+# the client or the server does not allow LOAD DATA LOCAL INFILE
+LOCAL_INFILE_DISABLED_ERRORS = (1148, 2068, 3948)
+
+
+class BulkLoadMethod(StrEnum):
+    AUTO = "auto"  # LOAD DATA for csv files if allowed, INSERT otherwise
+    LOAD_DATA = "load_data"
+    INSERT = "insert"
+
+
+def map_columns(
+    header: List[str], columns: Optional[Dict[str, str]]
+) -> List[Tuple[int, str]]:
+    """
+    return (index in the file, table column) of the loaded columns
+    """
+    if columns is None:
+        return list(enumerate(header))
+    missing = [c for c in columns if c not in header]
+    if missing:
+        raise err.BulkLoadError(
+            f"Columns {missing} not found in the data file, header={header}"
+        )
+    return [(header.index(c), table_column) for c, table_column in columns.items()]
+
+
+def read_csv(path: str) -> Tuple[List[str], Iterator[List[Optional[str]]]]:
+    """
+    return the header and the rows of a csv file, empty values are NULL
+    """
+    f = open(path, newline="", encoding="utf-8-sig")
+    reader = csv.reader(f)
+    header = next(reader, None)
+    if header is None:
+        f.close()
+        raise err.BulkLoadError(f"Data file {path} is empty")
+
+    def rows() -> Iterator[List[Optional[str]]]:
+        with f:
+            for row in reader:
+                yield [v if v != "" else None for v in row]
+
+    return header, rows()
+
+
+def read_parquet(
+    path: str, batch_size: int
+) -> Tuple[List[str], Iterator[List[Optional[Any]]]]:
+    try:
+        import pyarrow.parquet as pq
+    except ImportError:
+        raise err.BulkLoadError(
+            "pyarrow is required to load parquet files, install it with"
+            " `pip install schema-data-migration[parquet]`"
+        )
+    parquet_file = pq.ParquetFile(path)
+    header = parquet_file.schema_arrow.names
+
+    def rows() -> Iterator[List[Optional[Any]]]:
+        for batch in parquet_file.iter_batches(batch_size=batch_size):
+            columns = [column.to_pylist() for column in batch.columns]
+            yield from (list(row) for row in zip(*columns))
+
+    return header, rows()
+
+
+class BulkLoader:
+    """
+    Load a csv or parquet file into a table in one transaction, with LOAD DATA
+    LOCAL INFILE or with multi-row INSERTs of batch_size rows.
+    """
+
+    def __init__(
+        self,
+        engine: Engine,
+        path: str,
+        table: str,
+        columns: Optional[Dict[str, str]] = None,
+        batch_size: int = cli_env.BULK_LOAD_BATCH_SIZE,
+        method: str = cli_env.BULK_LOAD_METHOD,
+    ):
+        if not path.endswith(SUPPORTED_EXTENSIONS):
+            raise err.BulkLoadError(f"Unsupported data file {path}")
+        self.engine = engine
+        self.path = path
+        self.table = table
+        self.columns = columns
+        self.batch_size = batch_size
+        self.method = BulkLoadMethod(method)
+
+    def run(self) -> int:
+        """
+        return the number of loaded rows
+        """
+        start = time.perf_counter()
+        rows = None
+        if self.path.endswith(".csv") and self.method != BulkLoadMethod.INSERT:
+            try:
+                rows = self._load_data()
+            except exc.OperationalError as e:
+                if (
+                    self.method == BulkLoadMethod.LOAD_DATA
+                    or e.orig.args[0] not in LOCAL_INFILE_DISABLED_ERRORS
+                ):
+                    raise
+                logger.warning(
+                    "LOAD DATA LOCAL INFILE is not allowed, fall back to INSERT,"
+                    " error=%s",
+                    e.orig,
+                )
+        if rows is None:
+            rows = self._insert()
+        elapsed = time.perf_counter() - start
+        logger.info(
+            "Loaded %d rows of %s into %s in %.1fs, %.0f rows/s",
+            rows,
+            self.path,
+            self.table,
+            elapsed,
+            rows / elapsed if elapsed > 0 else 0,
+        )
+        return rows
+
+    def _insert(self) -> int:
+        if self.path.endswith(".csv"):
+            header, rows = read_csv(self.path)
+        else:
+            header, rows = read_parquet(self.path, self.batch_size)
+        mapping = map_columns(header, self.columns)
+        column_list = ", ".join(f"`{column}`" for _, column in mapping)
+        values = ", ".join(f":c{i}" for i in range(len(mapping)))
+        # executemany of mysqlclient sends the batch as one multi-row INSERT
+        stmt = text(f"INSERT INTO `{self.table}` ({column_list}) VALUES ({values})")
+
+        total = 0
+        with self.engine.begin() as conn:
+            batch = []
+            for row in rows:
+                batch.append({f"c{i}": row[idx] for i, (idx, _) in enumerate(mapping)})
+                if len(batch) >= self.batch_size:
+                    total += self._insert_batch(conn, stmt, batch)
+                    batch = []
+            if batch:
+                total += self._insert_batch(conn, stmt, batch)
+        return total
+
+    def _insert_batch(self, conn: Connection, stmt, batch: List[Dict]) -> int:
+        conn.execute(stmt, batch)
+        logger.debug("Inserted %d rows into %s", len(batch), self.table)
+        return len(batch)
+
+    def _load_data(self) -> int:
+        with open(self.path, "rb") as f:
+            first_line = f.readline()
+            header = next(csv.reader([first_line.decode("utf-8-sig")]), [])
+        if not header:
+            raise err.BulkLoadError(f"Data file {self.path} is empty")
+        mapping = map_columns(header, self.columns)
+        # file columns that are not loaded are read into a variable left unused
+        variables = ", ".join(f"@c{i}" for i in range(len(header)))
+        assignments = ", ".join(
+            f"`{column}` = NULLIF(@c{idx}, '')" for idx, column in mapping
+        )
+        line_end = "\\r\\n" if first_line.endswith(b"\r\n") else "\\n"
+        stmt = text(
+            f"LOAD DATA LOCAL INFILE :path INTO TABLE `{self.table}` CHARACTER SET"
+            " utf8mb4 FIELDS TERMINATED BY ',' OPTIONALLY ENCLOSED BY '\"' ESCAPED"
+            f" BY '' LINES TERMINATED BY '{line_end}' IGNORE 1 LINES ({variables})"
+            f" SET {assignments}"
+        )
+
+        engine = create_engine(
+            self.engine.url,
+            echo=self.engine.echo,
+            connect_args={"local_infile": 1},
+        )
+        try:
+            with engine.begin() as conn:
+                rows = conn.execute(stmt, {"path": self.path}).rowcount
+                # LOCAL turns errors like duplicate keys into warnings,
+                #   fail like INSERT would
+                warnings = conn.execute(text("SHOW WARNINGS LIMIT 5")).all()
+                if warnings:
+                    raise err.BulkLoadError(
+                        f"LOAD DATA of {self.path} into {self.table} has warnings,"
+                        f" rollbacked: {[tuple(w) for w in warnings]}"
+                    )
+        finally:
+            engine.dispose()
+        return rows
@@ -0,0 +1,91 @@
+"""
+Entry point of sdm. With DAEMON_FORWARD=1 the command is run by sdm serve of
+the workspace if it is running, see daemon.py, otherwise by this process.
+Only the standard library is imported before forwarding, so a forwarded
+command does not pay for SQLAlchemy and the plans.
+"""
+import json
+import logging
+import os
+import socket
+import sys
+from typing import Dict, List, Optional
+
+from migration import __version__
+
+from .env import cli_env
+
+logger = logging.getLogger(__name__)
+
+SERVE_COMMAND = "serve"
+# a request is one json line, sent with the stdin, stdout and stderr of the
+#   client, which the command of sdm serve writes to
+STDIO_FDS = [0, 1, 2]
+MAX_REQUEST_SIZE = 1024 * 1024
+# variables set by the shell or for the client only, the rest of the
+#   environment must be the one sdm serve runs with
+CLIENT_ONLY_ENVIRON = {"DAEMON_FORWARD", "PWD", "OLDPWD", "SHLVL", "_"}
+
+
+def comparable_environ(environ: Dict[str, str]) -> Dict[str, str]:
+    return {k: v for k, v in environ.items() if k not in CLIENT_ONLY_ENVIRON}
+
+
+def make_request(raw_args: List[str]) -> bytes:
+    return (
+        json.dumps(
+            {
+                "argv": raw_args,
+                "cwd": cli_env.MIGRATION_CWD,
+                "version": __version__,
+                "environ": comparable_environ(os.environ),
+            }
+        ).encode()
+        + b"\n"
+    )
+
+
+def read_response(sock: socket.socket) -> Optional[Dict]:
+    with sock.makefile("rb") as f:
+        line = f.readline()
+    return json.loads(line) if line else None
+
+
+def forward(
+    raw_args: List[str], socket_path: str = cli_env.DAEMON_SOCKET
+) -> Optional[int]:
+    """
+    run the command by sdm serve and return its exit code, None if sdm serve
+    is not running or does not run the command
+    """
+    if raw_args and raw_args[0] == SERVE_COMMAND:
+        return None
+    sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    with sock:
+        try:
+            sock.connect(socket_path)
+        except OSError as e:
+            logger.debug("sdm serve is not running on %s: %s", socket_path, e)
+            return None
+        sys.stdout.flush()
+        sys.stderr.flush()
+        socket.send_fds(sock, [make_request(raw_args)], STDIO_FDS)
+        response = read_response(sock)
+    if response is None:
+        # the command may have run partly
+        raise Exception(f"sdm serve on {socket_path} closed the connection")
+    if "rejected" in response:
+        logger.info("sdm serve did not run the command: %s", response["rejected"])
+        return None
+    return response["exit"]
+
+
+def run():
+    if cli_env.DAEMON_FORWARD:
+        code = forward(sys.argv[1:])
+        if code is not None:
+            sys.exit(code)
+    # imported only when the command runs here
+    from .main import run as run_here
+
+    run_here()
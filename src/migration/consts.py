@@ -12,6 +12,22 @@ ALL_TEST_TYPE = [
 ]
 ALL_GEN_TEST_TYPE = ALL_TEST_TYPE[:-1]  # Remove the custom
 
+# https://dev.mysql.com/doc/mysql-errors/8.0/en/server-error-reference.html
+ER_NO_SUCH_TABLE = 1146
+
 ENV_SDM_EXPECTED = "SDM_EXPECTED"
 ENV_SDM_CHECKSUM_MATCH = "SDM_CHECKSUM_MATCH"
 ENV_SDM_DATA_DIR = "SDM_DATA_DIR"
+# a callable in the args of python migrations, waits for the replicas
+ENV_SDM_THROTTLE = "SDM_THROTTLE"
+# a callable in the args of python migrations, maps a function over worker processes
+ENV_SDM_FAN_OUT = "SDM_FAN_OUT"
+
+# --format of the commands that print a report
+OUTPUT_FORMAT_TABLE = "table"
+OUTPUT_FORMAT_JSON = "json"
+# a row per line, written as the rows are read, see report.py
+OUTPUT_FORMAT_JSONL = "jsonl"
+OUTPUT_FORMAT_CSV = "csv"
+STREAM_OUTPUT_FORMAT = [OUTPUT_FORMAT_JSONL, OUTPUT_FORMAT_CSV]
+ALL_OUTPUT_FORMAT = [OUTPUT_FORMAT_TABLE, OUTPUT_FORMAT_JSON] + STREAM_OUTPUT_FORMAT
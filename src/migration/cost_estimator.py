@@ -0,0 +1,302 @@
+import logging
+import os
+import re
+from dataclasses import dataclass
+from enum import StrEnum
+from typing import Dict, List, Optional, Tuple
+
+from sqlalchemy import Connection, Engine, text
+
+from . import helper
+from . import migration_plan as mp
+from .db.hist_dao import Direction
+from .env import cli_env
+
+logger = logging.getLogger(__name__)
+
+KEY_PREFIXES = (
+    "PRIMARY KEY",
+    "KEY",
+    "INDEX",
+    "UNIQUE",
+    "FULLTEXT",
+    "SPATIAL",
+    "CONSTRAINT",
+    "FOREIGN KEY",
+)
+DML_KEYWORDS = ("UPDATE", "DELETE", "INSERT", "REPLACE")
+
+
+class AlterAlgorithm(StrEnum):
+    # ordered from the cheapest
+    INSTANT = "INSTANT"
+    INPLACE = "INPLACE"
+    COPY = "COPY"
+
+
+ALGORITHM_ORDER = list(AlterAlgorithm)
+
+
+@dataclass
+class TableStats:
+    rows: int
+    avg_row_length: int
+    data_length: int
+    index_length: int
+
+
+@dataclass
+class PlanCostDTO:
+    # the most expensive ALTER algorithm of a schema plan
+    algorithm: Optional[AlterAlgorithm]
+    # rows rewritten or affected, None if unknown
+    rows: Optional[int]
+    bytes_rewritten: int
+    seconds: float
+
+
+def split_top_level(s: str, sep: str) -> List[str]:
+    """
+    split by sep outside of parentheses and quotes
+    """
+    parts = []
+    depth = 0
+    quote = None
+    start = 0
+    for i, c in enumerate(s):
+        if quote is not None:
+            if c == quote and s[i - 1] != "\\":
+                quote = None
+        elif c in "'\"`":
+            quote = c
+        elif c == "(":
+            depth += 1
+        elif c == ")":
+            depth -= 1
+        elif c == sep and depth == 0:
+            parts.append(s[start:i])
+            start = i + 1
+    parts.append(s[start:])
+    return [p.strip() for p in parts if p.strip()]
+
+
+def _normalize(s: str) -> str:
+    return " ".join(s.split())
+
+
+def parse_create_table(sql: str) -> Tuple[List[Tuple[str, str]], List[str], str]:
+    """
+    return (columns as (name, definition), keys, table options)
+    """
+    start = sql.index("(")
+    end = sql.rindex(")")
+    columns = []
+    keys = []
+    for definition in split_top_level(sql[start + 1 : end], ","):
+        definition = _normalize(definition)
+        if definition.upper().startswith(KEY_PREFIXES):
+            keys.append(definition)
+        else:
+            name = definition.split(" ")[0].strip("`")
+            columns.append((name, definition))
+    return columns, keys, _normalize(sql[end + 1 :].strip().rstrip(";"))
+
+
+def classify_alter(
+    old_sql: Optional[str], new_sql: Optional[str]
+) -> Tuple[AlterAlgorithm, int]:
+    """
+    return the algorithm MySQL would use to alter the table from old_sql to
+    new_sql, and the number of changed keys.
+    changes that rebuild the table are treated as COPY, a rebuild by INPLACE
+    rewrites as much data
+    """
+    if old_sql is None or new_sql is None:
+        # create or drop table
+        return AlterAlgorithm.INSTANT, 0
+    old_columns, old_keys, old_options = parse_create_table(old_sql)
+    new_columns, new_keys, new_options = parse_create_table(new_sql)
+    if old_options != new_options:
+        return AlterAlgorithm.COPY, 0
+    old_pk = [k for k in old_keys if k.upper().startswith("PRIMARY KEY")]
+    new_pk = [k for k in new_keys if k.upper().startswith("PRIMARY KEY")]
+    if old_pk != new_pk:
+        return AlterAlgorithm.COPY, 0
+    # columns can only be added instantly at the end, changing or dropping
+    #   existing columns rebuilds the table
+    if new_columns[: len(old_columns)] != old_columns:
+        return AlterAlgorithm.COPY, 0
+    changed_keys = len(set(old_keys) ^ set(new_keys))
+    if changed_keys > 0:
+        return AlterAlgorithm.INPLACE, changed_keys
+    return AlterAlgorithm.INSTANT, 0
+
+
+def read_schema_index(sha1: str) -> Dict[str, str]:
+    """
+    return table sql by table name of a schema index
+    """
+    path = helper.sha1_to_path(sha1)
+    if not os.path.exists(path):
+        return {}
+    tables = {}
+    with open(path, "r") as f:
+        for line in f.readlines():
+            if not line.strip():
+                continue
+            sql_sha1, filename = line.split(":")[0], line.split(":")[1].strip()
+            with open(helper.sha1_to_path(sql_sha1), "r") as sql_file:
+                tables[re.sub(r"\.sql$", "", filename)] = sql_file.read()
+    return tables
+
+
+def format_bytes(n: int) -> str:
+    for unit in ["B", "KiB", "MiB", "GiB"]:
+        if n < 1024:
+            return f"{n:.0f}{unit}" if unit == "B" else f"{n:.1f}{unit}"
+        n /= 1024
+    return f"{n:.1f}TiB"
+
+
+class CostEstimator:
+    """
+    Estimate how long a plan takes from the table statistics of the
+    environment: bytes rewritten by ALTER TABLE, rows affected by DML
+    (from EXPLAIN), and the recorded execution time of the plan.
+    """
+
+    def __init__(
+        self,
+        engine: Engine,
+        timings: Optional[Dict[Tuple[str, str, str], float]] = None,
+        bytes_per_second: int = cli_env.ESTIMATE_BYTES_PER_SECOND,
+        rows_per_second: int = cli_env.ESTIMATE_ROWS_PER_SECOND,
+    ):
+        self.engine = engine
+        self.timings = timings if timings is not None else {}
+        self.bytes_per_second = bytes_per_second
+        self.rows_per_second = rows_per_second
+        self._stats: Optional[Dict[str, TableStats]] = None
+
+    def table_stats(self) -> Dict[str, TableStats]:
+        if self._stats is None:
+            with self.engine.connect() as conn:
+                rows = conn.execute(
+                    text(
+                        "SELECT TABLE_NAME, TABLE_ROWS, AVG_ROW_LENGTH, DATA_LENGTH,"
+                        " INDEX_LENGTH FROM information_schema.TABLES WHERE"
+                        " TABLE_SCHEMA = DATABASE()"
+                    )
+                ).all()
+            self._stats = {
+                row[0]: TableStats(
+                    rows=row[1] or 0,
+                    avg_row_length=row[2] or 0,
+                    data_length=row[3] or 0,
+                    index_length=row[4] or 0,
+                )
+                for row in rows
+            }
+        return self._stats
+
+    def estimate(self, plan: mp.MigrationPlan, is_migrate: bool) -> PlanCostDTO:
+        change = plan.change.forward if is_migrate else plan.change.backward
+        if change is None:
+            cost = PlanCostDTO(algorithm=None, rows=0, bytes_rewritten=0, seconds=0)
+        elif plan.type == mp.Type.SCHEMA:
+            if is_migrate:
+                backward = plan.change.backward
+                from_id = backward.id if backward is not None else None
+            else:
+                from_id = plan.change.forward.id
+            cost = self.estimate_schema(from_id, change.id)
+        elif change.type == mp.DataChangeType.SQL:
+            cost = self.estimate_sql(change.sql)
+        elif change.type == mp.DataChangeType.SQL_FILE:
+            with open(
+                os.path.join(cli_env.MIGRATION_CWD, cli_env.DATA_DIR, change.file)
+            ) as f:
+                cost = self.estimate_sql(f.read())
+        else:
+            # python, shell and typescript can not be explained
+            cost = PlanCostDTO(algorithm=None, rows=None, bytes_rewritten=0, seconds=0)
+
+        direction = Direction.FORWARD if is_migrate else Direction.BACKWARD
+        recorded = self.timings.get((plan.version, plan.name, direction))
+        if recorded is not None:
+            cost.seconds = max(cost.seconds, recorded)
+        return cost
+
+    def estimate_schema(self, from_id: Optional[str], to_id: str) -> PlanCostDTO:
+        from_tables = read_schema_index(from_id) if from_id else {}
+        to_tables = read_schema_index(to_id)
+        stats = self.table_stats()
+        algorithm = AlterAlgorithm.INSTANT
+        rows = 0
+        bytes_rewritten = 0
+        for table in from_tables.keys() | to_tables.keys():
+            old_sql, new_sql = from_tables.get(table), to_tables.get(table)
+            if old_sql == new_sql:
+                continue
+            table_algorithm, changed_keys = classify_alter(old_sql, new_sql)
+            algorithm = max(algorithm, table_algorithm, key=ALGORITHM_ORDER.index)
+            table_stats = stats.get(table)
+            if table_stats is None:
+                # created by an earlier plan of the same run
+                continue
+            if table_algorithm == AlterAlgorithm.COPY:
+                rows += table_stats.rows
+                bytes_rewritten += table_stats.data_length + table_stats.index_length
+            elif table_algorithm == AlterAlgorithm.INPLACE:
+                # an index is estimated as large as one column of the table
+                columns, _, _ = parse_create_table(old_sql)
+                rows += table_stats.rows
+                bytes_rewritten += (
+                    table_stats.data_length // max(len(columns), 1) * changed_keys
+                )
+        return PlanCostDTO(
+            algorithm=algorithm,
+            rows=rows,
+            bytes_rewritten=bytes_rewritten,
+            seconds=bytes_rewritten / self.bytes_per_second,
+        )
+
+    def estimate_sql(self, sql: str) -> PlanCostDTO:
+        rows = 0
+        bytes_rewritten = 0
+        with self.engine.connect() as conn:
+            for stmt in split_top_level(sql, ";"):
+                if not stmt.upper().startswith(DML_KEYWORDS):
+                    continue
+                explained = self._explain(conn, stmt)
+                if explained is None:
+                    return PlanCostDTO(
+                        algorithm=None, rows=None, bytes_rewritten=0, seconds=0
+                    )
+                table, stmt_rows = explained
+                rows += stmt_rows
+                table_stats = self.table_stats().get(table)
+                if table_stats is not None:
+                    bytes_rewritten += stmt_rows * table_stats.avg_row_length
+        return PlanCostDTO(
+            algorithm=None,
+            rows=rows,
+            bytes_rewritten=bytes_rewritten,
+            seconds=rows / self.rows_per_second,
+        )
+
+    def _explain(self, conn: Connection, stmt: str) -> Optional[Tuple[str, int]]:
+        """
+        return (target table, estimated rows), None if the statement can not
+        be explained, e.g. its table is created by an earlier plan of the run
+        """
+        try:
+            result = conn.execute(text(f"EXPLAIN {stmt}")).mappings().all()
+        except Exception as e:
+            logger.debug("Failed to explain %s, error=%s", stmt, e)
+            return None
+        if len(result) == 0:
+            return None
+        first = result[0]
+        rows = int((first["rows"] or 0) * float(first["filtered"] or 100) / 100)
+        return first["table"], rows
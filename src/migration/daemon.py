@@ -0,0 +1,431 @@
+"""
+sdm serve runs the commands of one workspace in a long-lived process, and
+keeps between them:
+    the migration plans, with the checksums computed so far
+    the integrity checks passed
+    an engine per environment, see helper.enable_engine_pool
+The plans and integrity checks are dropped when migration_plan, data or
+.schema_store change, which is watched with inotify, or by scanning the
+directories where inotify is not available.
+"""
+import copy
+import ctypes
+import ctypes.util
+import errno
+import json
+import logging
+import os
+import signal
+import socket
+import socketserver
+import struct
+import sys
+import threading
+from contextlib import contextmanager
+from typing import Callable, Dict, Iterator, List, Optional, Set, Tuple
+
+from migration import __version__
+
+from . import err, helper
+from . import migration_plan as mp
+from .client import (MAX_REQUEST_SIZE, SERVE_COMMAND, STDIO_FDS,
+                     comparable_environ)
+from .env import cli_env, log_env
+from .log import setting
+
+logger = logging.getLogger(__name__)
+
+# https://man7.org/linux/man-pages/man7/inotify.7.html
+IN_MODIFY = 0x00000002
+IN_ATTRIB = 0x00000004
+IN_CLOSE_WRITE = 0x00000008
+IN_MOVED_FROM = 0x00000040
+IN_MOVED_TO = 0x00000080
+IN_CREATE = 0x00000100
+IN_DELETE = 0x00000200
+IN_DELETE_SELF = 0x00000400
+IN_MOVE_SELF = 0x00000800
+IN_Q_OVERFLOW = 0x00004000
+IN_IGNORED = 0x00008000
+IN_ISDIR = 0x40000000
+# struct inotify_event without the name
+INOTIFY_EVENT = struct.Struct("iIII")
+
+
+def watched_dirs() -> List[str]:
+    return [
+        os.path.join(cli_env.MIGRATION_CWD, d)
+        for d in [
+            cli_env.MIGRATION_PLAN_DIR,
+            cli_env.DATA_DIR,
+            cli_env.SCHEMA_STORE_DIR,
+        ]
+    ]
+
+
+class PollingWatcher:
+    """
+    Find the changed roots by comparing the mtime and size of everything
+    under them with the previous scan.
+    """
+
+    def __init__(self, roots: List[str]):
+        self.roots = roots
+        self._snapshots = {root: self._scan(root) for root in roots}
+
+    @staticmethod
+    def _scan(root: str) -> Dict[str, Tuple[int, int]]:
+        snapshot = {}
+        for dirpath, _, files in os.walk(root):
+            for path in [dirpath] + [os.path.join(dirpath, f) for f in files]:
+                try:
+                    st = os.stat(path)
+                except FileNotFoundError:
+                    continue
+                snapshot[path] = (st.st_mtime_ns, st.st_size)
+        return snapshot
+
+    def changed(self) -> Set[str]:
+        changed = set()
+        for root in self.roots:
+            snapshot = self._scan(root)
+            if snapshot != self._snapshots[root]:
+                changed.add(root)
+                self._snapshots[root] = snapshot
+        return changed
+
+    def close(self):
+        pass
+
+
+class InotifyWatcher:
+    """
+    Watch every directory under the roots with inotify, new directories are
+    watched as they are created. A root that does not exist is watched once
+    it is created.
+    """
+
+    MASK = (
+        IN_MODIFY
+        | IN_ATTRIB
+        | IN_CLOSE_WRITE
+        | IN_MOVED_FROM
+        | IN_MOVED_TO
+        | IN_CREATE
+        | IN_DELETE
+        | IN_DELETE_SELF
+        | IN_MOVE_SELF
+    )
+
+    def __init__(self, roots: List[str]):
+        self.roots = roots
+        self._libc = ctypes.CDLL(ctypes.util.find_library("c"), use_errno=True)
+        self._fd = self._libc.inotify_init1(os.O_NONBLOCK | os.O_CLOEXEC)
+        if self._fd < 0:
+            e = ctypes.get_errno()
+            raise OSError(e, f"inotify_init1: {os.strerror(e)}")
+        # watch descriptor to (root, directory)
+        self._watches: Dict[int, Tuple[str, str]] = {}
+        self._missing: Set[str] = set()
+        for root in roots:
+            self._watch_tree(root, root)
+
+    def _watch_tree(self, root: str, path: str):
+        if not os.path.isdir(path):
+            if path == root:
+                self._missing.add(root)
+            return
+        for dirpath, _, _ in os.walk(path):
+            wd = self._libc.inotify_add_watch(self._fd, os.fsencode(dirpath), self.MASK)
+            if wd >= 0:
+                self._watches[wd] = (root, dirpath)
+                continue
+            e = ctypes.get_errno()
+            # removed since the walk
+            if e not in (errno.ENOENT, errno.ENOTDIR):
+                raise OSError(e, f"inotify_add_watch {dirpath}: {os.strerror(e)}")
+
+    def _read_events(self) -> Iterator[Tuple[int, int, bytes]]:
+        while True:
+            try:
+                data = os.read(self._fd, 64 * 1024)
+            except BlockingIOError:
+                return
+            offset = 0
+            while offset < len(data):
+                wd, mask, _, length = INOTIFY_EVENT.unpack_from(data, offset)
+                offset += INOTIFY_EVENT.size
+                name = data[offset : offset + length].rstrip(b"\0")
+                offset += length
+                yield wd, mask, name
+
+    def changed(self) -> Set[str]:
+        changed = set()
+        for root in list(self._missing):
+            if os.path.isdir(root):
+                self._missing.remove(root)
+                self._watch_tree(root, root)
+                changed.add(root)
+        for wd, mask, name in self._read_events():
+            if mask & IN_Q_OVERFLOW:
+                # events are lost
+                changed.update(self.roots)
+                continue
+            if wd not in self._watches:
+                continue
+            root, path = self._watches[wd]
+            changed.add(root)
+            if mask & IN_IGNORED:
+                # the directory is removed
+                del self._watches[wd]
+                if path == root:
+                    self._missing.add(root)
+            elif mask & IN_ISDIR and mask & (IN_CREATE | IN_MOVED_TO):
+                self._watch_tree(root, os.path.join(path, os.fsdecode(name)))
+        return changed
+
+    def close(self):
+        os.close(self._fd)
+
+
+def make_watcher(roots: List[str]):
+    try:
+        return InotifyWatcher(roots)
+    except (OSError, AttributeError) as e:
+        logger.info("inotify is not available, scan for changes instead: %s", e)
+        return PollingWatcher(roots)
+
+
+class WarmState:
+    """
+    The plans and the integrity checks of the workspace, kept until the
+    watched directories change. A generation counts the changes.
+    """
+
+    def __init__(self, watcher):
+        self.watcher = watcher
+        self.generation = 0
+        self._mpm: Optional[mp.MigrationPlanManager] = None
+        # the fast flags of the integrity checks passed in this generation
+        self._integrity: Set[bool] = set()
+        self._mutex = threading.Lock()
+
+    def refresh(self) -> int:
+        with self._mutex:
+            changed = self.watcher.changed()
+            if not changed:
+                return self.generation
+            self.generation += 1
+            self._integrity = set()
+            # checksums of data plans include the files in data
+            plan_dirs = {
+                os.path.join(cli_env.MIGRATION_CWD, cli_env.MIGRATION_PLAN_DIR),
+                os.path.join(cli_env.MIGRATION_CWD, cli_env.DATA_DIR),
+            }
+            if changed & plan_dirs:
+                self._mpm = None
+            logger.debug("Changed %s, generation %d", sorted(changed), self.generation)
+            return self.generation
+
+    def plans(self) -> mp.MigrationPlanManager:
+        """
+        return a copy of the plans, which share the plan objects and their
+        checksums
+        """
+        self.refresh()
+        with self._mutex:
+            if self._mpm is None:
+                self._mpm = mp.MigrationPlanManager()
+            mpm = copy.copy(self._mpm)
+        mpm.plans = list(mpm.plans)
+        mpm.repeatable_plans = list(mpm.repeatable_plans)
+        for plan in mpm.plans + mpm.repeatable_plans:
+            plan.set_checksum_match(None)
+        return mpm
+
+    def integrity_checked(self, fast: bool) -> bool:
+        self.refresh()
+        with self._mutex:
+            # a full check covers the fast one
+            return False in self._integrity or fast in self._integrity
+
+    def set_integrity_checked(self, fast: bool, generation: int):
+        with self._mutex:
+            if generation == self.generation:
+                self._integrity.add(fast)
+
+    def close(self):
+        self.watcher.close()
+
+
+# the state of sdm serve, None in other processes
+_current: Optional[WarmState] = None
+
+
+def current() -> Optional[WarmState]:
+    return _current
+
+
+@contextmanager
+def redirect_stdio(fds: List[int]) -> Iterator[None]:
+    """
+    point stdin, stdout and stderr of this process, and so of the child
+    processes, to the fds of a client
+    """
+    sys.stdout.flush()
+    sys.stderr.flush()
+    saved = [os.dup(target) for target in STDIO_FDS]
+    try:
+        for target, fd in zip(STDIO_FDS, fds):
+            os.dup2(fd, target)
+        yield
+    finally:
+        sys.stdout.flush()
+        sys.stderr.flush()
+        for target, fd in zip(STDIO_FDS, saved):
+            os.dup2(fd, target)
+            os.close(fd)
+
+
+def run_to_exit_code(run_command: Callable[[List[str]], None], argv: List[str]):
+    """
+    run the command like main.run does, but return the exit code
+    """
+    try:
+        run_command(argv)
+        logger.info("Done")
+        return 0
+    except SystemExit as e:
+        # argparse exits on --help and invalid args
+        if e.code is None or isinstance(e.code, int):
+            return e.code or 0
+        print(e.code, file=sys.stderr)
+        return 1
+    except Exception as e:
+        if log_env.LOG_LEVEL == log_env.LEVEL_DEBUG:
+            logger.exception(e)
+        else:
+            logger.error(e)
+        return 1
+
+
+class CommandHandler(socketserver.BaseRequestHandler):
+    server: "DaemonServer"
+
+    def handle(self):
+        msg, fds, _, _ = socket.recv_fds(self.request, MAX_REQUEST_SIZE, len(STDIO_FDS))
+        try:
+            request = json.loads(msg)
+            reason = self.server.reject_reason(request, fds)
+            if reason is not None:
+                response = {"rejected": reason}
+            else:
+                response = {"exit": self.server.execute(request["argv"], fds)}
+            self.request.sendall(json.dumps(response).encode() + b"\n")
+        finally:
+            for fd in fds:
+                os.close(fd)
+
+
+class DaemonServer(socketserver.ThreadingMixIn, socketserver.UnixStreamServer):
+    """
+    Serve the commands forwarded by client.forward on a unix socket, one
+    command at a time. run_command is main.main, called with the args of
+    the client.
+    """
+
+    daemon_threads = True
+
+    def __init__(
+        self,
+        socket_path: str,
+        run_command: Callable[[List[str]], None],
+        watcher=None,
+    ):
+        self.socket_path = socket_path
+        self.run_command = run_command
+        self.warm = WarmState(watcher or make_watcher(watched_dirs()))
+        # cli_env and the checksums of the plans are read from it
+        self.environ = comparable_environ(os.environ)
+        self._command_mutex = threading.Lock()
+        self._remove_stale_socket()
+        os.makedirs(os.path.dirname(os.path.abspath(socket_path)), exist_ok=True)
+        # only the owner can connect
+        umask = os.umask(0o177)
+        try:
+            super().__init__(socket_path, CommandHandler)
+        finally:
+            os.umask(umask)
+
+    def _remove_stale_socket(self):
+        if not os.path.exists(self.socket_path):
+            return
+        with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as sock:
+            try:
+                sock.connect(self.socket_path)
+            except OSError:
+                # left by a process that is gone
+                os.remove(self.socket_path)
+                return
+        raise err.DaemonError(f"sdm serve is running on {self.socket_path} already")
+
+    def reject_reason(self, request: Dict, fds: List[int]) -> Optional[str]:
+        if len(fds) != len(STDIO_FDS):
+            return "stdin, stdout and stderr are not received"
+        if request.get("version") != __version__:
+            return f"sdm serve runs version {__version__}"
+        if request.get("cwd") != cli_env.MIGRATION_CWD:
+            return f"sdm serve runs in {cli_env.MIGRATION_CWD}"
+        environ = request.get("environ") or {}
+        if environ != self.environ:
+            # only the names, the values may be secrets
+            differ = {
+                k
+                for k in set(environ) | set(self.environ)
+                if environ.get(k) != self.environ.get(k)
+            }
+            return "sdm serve runs with other environment variables: " + ", ".join(
+                sorted(differ)
+            )
+        argv = request.get("argv") or []
+        if argv[:1] == [SERVE_COMMAND]:
+            return "sdm serve is running"
+        return None
+
+    def execute(self, argv: List[str], fds: List[int]) -> int:
+        with self._command_mutex:
+            with redirect_stdio(fds):
+                try:
+                    return run_to_exit_code(self.run_command, argv)
+                finally:
+                    # --format may move the logs to stderr
+                    setting.set_console_stream(sys.stdout)
+
+    def serve(self):
+        """
+        serve until SIGTERM or SIGINT
+        """
+        global _current
+
+        def stop(signum, frame):
+            raise KeyboardInterrupt()
+
+        signal.signal(signal.SIGTERM, stop)
+        _current = self.warm
+        helper.enable_engine_pool()
+        logger.info(
+            "Serving %s on %s, pid %d",
+            cli_env.MIGRATION_CWD,
+            self.socket_path,
+            os.getpid(),
+        )
+        try:
+            self.serve_forever()
+        except KeyboardInterrupt:
+            logger.info("Stopped serving")
+        finally:
+            _current = None
+            self.server_close()
+            os.remove(self.socket_path)
+            helper.dispose_engine_pool()
+            self.warm.close()
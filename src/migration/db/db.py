@@ -1,12 +1,15 @@
+import importlib.util
 import urllib.parse
+from typing import Dict, Optional
 
-from sqlalchemy import create_engine
+from sqlalchemy import Engine, create_engine
+from sqlalchemy.ext.asyncio import AsyncEngine, create_async_engine
 from sqlalchemy.orm import Session, sessionmaker
 
-from . import model
+from . import model, upgrade
 
 
-def make_session(
+def make_engine(
     host: str,
     port: int,
     user: str,
@@ -14,14 +17,77 @@ def make_session(
     schema: str,
     echo: bool = False,
     create_all_tables: bool = True,
-) -> Session:
+    pool_size: Optional[int] = None,
+) -> Engine:
     encoded_password = urllib.parse.quote_plus(password)
     engine = create_engine(
         f"mysql+mysqldb://{user}:{encoded_password}@{host}:{port}/{schema}",
         echo=echo,
         pool_pre_ping=True,
+        **pool_options(pool_size),
     )
     if create_all_tables:
-        model.Base.metadata.create_all(engine)
+        create_tables(engine)
+    return engine
+
+
+def pool_options(pool_size: Optional[int]) -> Dict[str, int]:
+    # the default pool of SQLAlchemy, 5 connections and 10 more on demand
+    if pool_size is None:
+        return {}
+    return {"pool_size": pool_size, "max_overflow": 0}
+
+
+def async_driver_available() -> bool:
+    """
+    asyncmy is an optional dependency, pip install schema-data-migration[async]
+    """
+    return importlib.util.find_spec("asyncmy") is not None
+
+
+def make_async_engine(
+    host: str,
+    port: int,
+    user: str,
+    password: str,
+    schema: str,
+    echo: bool = False,
+    pool_size: Optional[int] = None,
+) -> AsyncEngine:
+    """
+    an engine for coroutines, it only reads: the tables are not created
+    """
+    encoded_password = urllib.parse.quote_plus(password)
+    return create_async_engine(
+        f"mysql+asyncmy://{user}:{encoded_password}@{host}:{port}/{schema}",
+        echo=echo,
+        pool_pre_ping=True,
+        **pool_options(pool_size),
+    )
+
+
+def create_tables(engine: Engine):
+    model.Base.metadata.create_all(engine)
+    upgrade.upgrade_tables(engine)
+
+
+def make_session(
+    host: str,
+    port: int,
+    user: str,
+    password: str,
+    schema: str,
+    echo: bool = False,
+    create_all_tables: bool = True,
+) -> Session:
+    engine = make_engine(
+        host=host,
+        port=port,
+        user=user,
+        password=password,
+        schema=schema,
+        echo=echo,
+        create_all_tables=create_all_tables,
+    )
     Session = sessionmaker(bind=engine)
     return Session()
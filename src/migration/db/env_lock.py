@@ -0,0 +1,170 @@
+import datetime
+import logging
+import os
+import socket
+import threading
+from dataclasses import dataclass
+from typing import Optional
+
+from sqlalchemy import Connection, Engine, select, text, update
+from sqlalchemy.dialects.mysql import insert
+
+from migration import err
+from migration.env import cli_env
+
+from . import model
+
+logger = logging.getLogger(__name__)
+
+
+@dataclass
+class LockStatusDTO:
+    name: str
+    locked: bool
+    # connection id of the session holding the lock, None if not locked
+    owner_connection_id: Optional[int]
+    # the last holder recorded in the lock table
+    holder: Optional[str]
+    holder_connection_id: Optional[int]
+    acquired: Optional[datetime.datetime]
+    heartbeat: Optional[datetime.datetime]
+
+    def is_holder_alive(self) -> bool:
+        return self.locked and self.owner_connection_id == self.holder_connection_id
+
+
+def default_holder(operator: str = "") -> str:
+    holder = f"{socket.gethostname()}:{os.getpid()}"
+    if operator:
+        holder = f"{operator}@{holder}"
+    return holder
+
+
+class EnvironmentLock:
+    """
+    Advisory lock (GET_LOCK) on an environment, held by a dedicated connection
+    for the whole run. The holder identity and a heartbeat are recorded in the
+    lock table, the heartbeat also keeps the connection from idling out,
+    which would release the lock.
+    """
+
+    def __init__(
+        self,
+        engine: Engine,
+        holder: str = "",
+        timeout: int = cli_env.LOCK_TIMEOUT,
+        heartbeat_interval: int = cli_env.LOCK_HEARTBEAT_INTERVAL,
+    ):
+        self.engine = engine
+        self.name = f"sdm:{engine.url.database}"[:64]
+        self.holder = holder or default_holder()
+        self.timeout = timeout
+        self.heartbeat_interval = heartbeat_interval
+        self._conn: Optional[Connection] = None
+        self._conn_mutex = threading.Lock()
+        self._stop = threading.Event()
+        self._heartbeat_thread: Optional[threading.Thread] = None
+
+    def acquire(self):
+        conn = self.engine.connect()
+        acquired = conn.execute(
+            text("SELECT GET_LOCK(:name, :timeout)"),
+            {"name": self.name, "timeout": self.timeout},
+        ).scalar()
+        if acquired != 1:
+            conn.close()
+            status = self.status()
+            raise err.LockTimeoutError(
+                f"Timeout waiting for environment lock, name={self.name},"
+                f" holder={status.holder}, acquired={status.acquired},"
+                f" heartbeat={status.heartbeat}"
+            )
+        connection_id = conn.execute(text("SELECT CONNECTION_ID()")).scalar()
+        now = datetime.datetime.utcnow()
+        stmt = insert(model.MigrationLock).values(
+            name=self.name,
+            holder=self.holder,
+            connection_id=connection_id,
+            acquired=now,
+            heartbeat=now,
+        )
+        conn.execute(
+            stmt.on_duplicate_key_update(
+                holder=stmt.inserted.holder,
+                connection_id=stmt.inserted.connection_id,
+                acquired=stmt.inserted.acquired,
+                heartbeat=stmt.inserted.heartbeat,
+            )
+        )
+        conn.commit()
+        self._conn = conn
+        logger.info(
+            "Acquired environment lock, name=%s, holder=%s", self.name, self.holder
+        )
+
+        self._stop.clear()
+        self._heartbeat_thread = threading.Thread(
+            target=self._heartbeat_loop, name="sdm-lock-heartbeat", daemon=True
+        )
+        self._heartbeat_thread.start()
+
+    def _heartbeat_loop(self):
+        while not self._stop.wait(self.heartbeat_interval):
+            try:
+                self.heartbeat()
+            except Exception as e:
+                logger.warning("Environment lock heartbeat failed, error=%s", e)
+
+    def heartbeat(self):
+        with self._conn_mutex:
+            if self._conn is None:
+                return
+            self._conn.execute(
+                update(model.MigrationLock)
+                .where(model.MigrationLock.name == self.name)
+                .values(heartbeat=datetime.datetime.utcnow())
+            )
+            self._conn.commit()
+
+    def release(self):
+        self._stop.set()
+        if self._heartbeat_thread is not None:
+            self._heartbeat_thread.join()
+            self._heartbeat_thread = None
+        with self._conn_mutex:
+            if self._conn is None:
+                return
+            try:
+                self._conn.execute(
+                    text("SELECT RELEASE_LOCK(:name)"), {"name": self.name}
+                )
+                self._conn.commit()
+            finally:
+                self._conn.close()
+                self._conn = None
+        logger.info("Released environment lock, name=%s", self.name)
+
+    def status(self) -> LockStatusDTO:
+        with self.engine.connect() as conn:
+            owner = conn.execute(
+                text("SELECT IS_USED_LOCK(:name)"), {"name": self.name}
+            ).scalar()
+            row = conn.execute(
+                select(model.MigrationLock).where(model.MigrationLock.name == self.name)
+            ).one_or_none()
+        return LockStatusDTO(
+            name=self.name,
+            locked=owner is not None,
+            owner_connection_id=owner,
+            holder=row.holder if row is not None else None,
+            holder_connection_id=row.connection_id if row is not None else None,
+            acquired=row.acquired if row is not None else None,
+            heartbeat=row.heartbeat if row is not None else None,
+        )
+
+    def __enter__(self) -> "EnvironmentLock":
+        self.acquire()
+        return self
+
+    def __exit__(self, *args):
+        self.release()
@@ -1,14 +1,40 @@
+import datetime
 import json
+import logging
 from enum import StrEnum
-from typing import List, Optional
+from typing import Any, Callable, Dict, Iterator, List, Optional, Tuple
 
-from sqlalchemy import select
+from sqlalchemy import Select, bindparam, delete, event, func, select, text
+from sqlalchemy.dialects.mysql import insert
+from sqlalchemy.ext.asyncio import AsyncConnection
 from sqlalchemy.orm import Session
 
+from migration import helper
 from migration import migration_plan as mp
+from migration import tracing
+from migration.env import cli_env
 
 from . import model
 
+logger = logging.getLogger(__name__)
+
+
+def trace_transactions(session: Session):
+    """
+    record a span for every transaction of the session, savepoints and
+    subtransactions are part of the span of their root transaction
+    """
+    spans = {}
+
+    @event.listens_for(session, "after_transaction_create")
+    def on_create(_, transaction):
+        if transaction.parent is None:
+            spans[transaction] = tracing.start_span("dao.transaction")
+
+    @event.listens_for(session, "after_transaction_end")
+    def on_end(_, transaction):
+        tracing.end_span(spans.pop(transaction, None))
+
 
 class Operation(StrEnum):
     CREATE = "create"
@@ -18,14 +44,71 @@ class Operation(StrEnum):
     UPDATE_PROCESSING = "update_processing"  # only for repeatable migration
 
 
+class Direction(StrEnum):
+    FORWARD = "forward"
+    BACKWARD = "backward"
+
+
 VERSIONED_TYPE_CRITERION = (model.MigrationHistory.type == mp.Type.DATA) | (
     model.MigrationHistory.type == mp.Type.SCHEMA
 )
 
+# the columns of MigrationHistoryDTO, in order, to read the histories
+# without building ORM objects
+DTO_COLUMNS = (
+    model.MigrationHistory.ver,
+    model.MigrationHistory.name,
+    model.MigrationHistory.type,
+    model.MigrationHistory.state,
+    model.MigrationHistory.created,
+    model.MigrationHistory.updated,
+    model.MigrationHistory.checksum,
+)
+
+
+def select_dto_stmt(versioned: bool = False) -> Select:
+    stmt = select(*DTO_COLUMNS).order_by(model.MigrationHistory.id.asc())
+    if versioned:
+        stmt = stmt.where(VERSIONED_TYPE_CRITERION)
+    return stmt
+
+
+async def select_dto_async(
+    conn: AsyncConnection, versioned: bool = False
+) -> List[model.MigrationHistoryDTO]:
+    """
+    MigrationHistoryDAO.select_dto for coroutines, in one round trip
+    """
+    result = await conn.execute(select_dto_stmt(versioned))
+    return [model.MigrationHistoryDTO(*row) for row in result]
+
+
+PARTITION_MAXVALUE = "pmax"
+
+
+def month_partitions(
+    start: datetime.date, end: datetime.date
+) -> List[Tuple[str, datetime.date]]:
+    """
+    return (name, less than) of the monthly partitions from start to end,
+    e.g. p202610 holds the rows created before 2026-11-01
+    """
+    partitions = []
+    month = start.replace(day=1)
+    while month <= end:
+        next_month = (month + datetime.timedelta(days=32)).replace(day=1)
+        partitions.append((f"p{month:%Y%m}", next_month))
+        month = next_month
+    return partitions
+
 
 class MigrationHistoryDAO:
+    # history reads are plain snapshot reads, concurrent runs against the same
+    #   environment are serialized by env_lock.EnvironmentLock instead
     def __init__(self, session: Session) -> None:
         self.session = session
+        if tracing.enabled():
+            trace_transactions(session)
 
     def add_one(
         self, plan: mp.MigrationPlan, operator: str = "", fake: bool = False
@@ -45,7 +128,7 @@ class MigrationHistoryDAO:
             hist_id=hist.id,
             operation=Operation.CREATE,
             operator=operator,
-            snapshot=self._gen_snapshot_log(plan, fake),
+            snapshot_id=self._save_snapshot(plan, fake),
         )
         self.session.add(log)
 
@@ -88,6 +171,22 @@ class MigrationHistoryDAO:
             plan_for_log.update({"fake": fake})
         return json.dumps(plan_for_log)
 
+    def _gen_snapshot(self, plan: mp.MigrationPlan, fake: bool) -> Tuple[str, str]:
+        """
+        return (checksum, snapshot), the snapshot is stored once per checksum
+        """
+        snapshot = self._gen_snapshot_log(plan, fake)
+        return helper.sha1_encode([snapshot]), snapshot
+
+    def _save_snapshot(self, plan: mp.MigrationPlan, fake: bool) -> str:
+        checksum, snapshot = self._gen_snapshot(plan, fake)
+        self.session.execute(
+            insert(model.MigrationHistorySnapshot)
+            .prefix_with("IGNORE")
+            .values(checksum=checksum, snapshot=snapshot)
+        )
+        return checksum
+
     def _update(
         self,
         plan: mp.MigrationPlan,
@@ -113,10 +212,239 @@ class MigrationHistoryDAO:
             hist_id=hist.id,
             operation=operation,
             operator=operator,
-            snapshot=self._gen_snapshot_log(plan, fake),
+            snapshot_id=self._save_snapshot(plan, fake),
         )
         self.session.add(log)
 
+    def update_succ_and_add_next(
+        self,
+        plan: mp.MigrationPlan,
+        next_plan: Optional[mp.MigrationPlan],
+        operator: str = "",
+        fake: bool = False,
+    ) -> None:
+        """
+        Mark the latest versioned history (PROCESSING) as SUCCESSFUL and create
+        the history of the next plan in one batch of statements,
+        equals to get_latest_versioned + update_succ + add_one
+        """
+        self._transition(
+            plan,
+            model.MigrationState.PROCESSING,
+            model.MigrationState.SUCCESSFUL,
+            Operation.UPDATE_SUCC,
+            next_plan,
+            Operation.CREATE,
+            operator=operator,
+            fake=fake,
+        )
+
+    def delete_and_rollback_next(
+        self,
+        plan: mp.MigrationPlan,
+        next_plan: Optional[mp.MigrationPlan],
+        operator: str = "",
+        fake: bool = False,
+    ) -> None:
+        """
+        Delete the latest versioned history (ROLLBACKING) and mark the history
+        of the next plan to rollback as ROLLBACKING in one batch of statements,
+        equals to get_latest_versioned + delete + update_rollback
+        """
+        self._transition(
+            plan,
+            model.MigrationState.ROLLBACKING,
+            None,
+            Operation.DELETE,
+            next_plan,
+            Operation.UPDATE_ROLLBACK,
+            operator=operator,
+            fake=fake,
+        )
+
+    def _transition(
+        self,
+        plan: mp.MigrationPlan,
+        from_state: model.MigrationState,
+        to_state: Optional[model.MigrationState],
+        operation: Operation,
+        next_plan: Optional[mp.MigrationPlan],
+        next_operation: Operation,
+        operator: str = "",
+        fake: bool = False,
+    ) -> None:
+        """
+        The statements are sent in one round trip (mysqlclient enables
+        multi statements by default). Every write is guarded by @sdm_hist_id,
+        so nothing is written if the latest versioned history does not match.
+        """
+        hist_table = model.MigrationHistory.__tablename__
+        snapshot_table = model.MigrationHistorySnapshot.__tablename__
+        now = datetime.datetime.utcnow()
+        stmts: List[Tuple[str, List[Any]]] = []
+
+        # store the snapshots first, they are content addressed
+        #   so it does not matter if the transition itself does not happen
+        snapshot_ids = {}
+        for p in [plan, next_plan]:
+            if p is None:
+                continue
+            checksum, snapshot = self._gen_snapshot(p, fake)
+            snapshot_ids[p.sig()] = checksum
+            stmts.append(
+                (
+                    (
+                        f"INSERT IGNORE INTO `{snapshot_table}` (checksum, snapshot)"
+                        " VALUES (%s, %s)"
+                    ),
+                    [checksum, snapshot],
+                )
+            )
+
+        # find the latest versioned history
+        stmts.append(("SET @sdm_hist_id = NULL", []))
+        stmts.append(
+            (
+                (
+                    f"SET @sdm_hist_id = (SELECT id FROM `{hist_table}` WHERE ver = %s"
+                    " AND name = %s AND checksum = %s AND state = %s AND id = (SELECT"
+                    f" MAX(id) FROM `{hist_table}` WHERE type IN %s))"
+                ),
+                [
+                    plan.version,
+                    plan.name,
+                    plan.get_checksum(),
+                    from_state.name,
+                    tuple(str(t) for t in mp.VERSIONED_TYPES),
+                ],
+            )
+        )
+        if to_state is None:
+            stmts.append((f"DELETE FROM `{hist_table}` WHERE id = @sdm_hist_id", []))
+        else:
+            stmts.append(
+                (
+                    (
+                        f"UPDATE `{hist_table}` SET state = %s, updated = %s"
+                        " WHERE id = @sdm_hist_id"
+                    ),
+                    [to_state.name, now],
+                )
+            )
+        stmts.append(
+            self._insert_log_stmt(
+                plan, operation, operator, snapshot_ids[plan.sig()], now
+            )
+        )
+
+        if next_plan is not None:
+            if next_operation == Operation.CREATE:
+                stmts.append(
+                    (
+                        (
+                            f"INSERT INTO `{hist_table}` (ver, name, type, state,"
+                            " checksum, created, updated) SELECT %s, %s, %s, %s, %s,"
+                            " %s, %s FROM DUAL WHERE @sdm_hist_id IS NOT NULL"
+                        ),
+                        [
+                            next_plan.version,
+                            next_plan.name,
+                            str(next_plan.type),
+                            model.MigrationState.PROCESSING.name,
+                            next_plan.get_checksum(),
+                            now,
+                            now,
+                        ],
+                    )
+                )
+            else:
+                stmts.append(
+                    (
+                        (
+                            f"UPDATE `{hist_table}` SET state = %s, checksum = %s,"
+                            " updated = %s WHERE ver = %s AND name = %s AND"
+                            " @sdm_hist_id IS NOT NULL"
+                        ),
+                        [
+                            model.MigrationState.ROLLBACKING.name,
+                            next_plan.get_checksum(),
+                            now,
+                            next_plan.version,
+                            next_plan.name,
+                        ],
+                    )
+                )
+            stmts.append(
+                self._insert_log_stmt(
+                    next_plan,
+                    next_operation,
+                    operator,
+                    snapshot_ids[next_plan.sig()],
+                    now,
+                )
+            )
+        stmts.append(("SELECT @sdm_hist_id", []))
+
+        sql = ";\n".join(stmt for stmt, _ in stmts)
+        params = [param for _, stmt_params in stmts for param in stmt_params]
+        # the batch is executed by the DBAPI cursor directly,
+        #   because all result sets have to be consumed
+        dbapi_conn = self.session.connection().connection.dbapi_connection
+        cursor = dbapi_conn.cursor()
+        try:
+            cursor.execute(sql, params)
+            hist_id = None
+            while True:
+                if cursor.description is not None:
+                    row = cursor.fetchone()
+                    hist_id = row[0] if row is not None else None
+                if not cursor.nextset():
+                    break
+        finally:
+            cursor.close()
+        # the ORM objects loaded before may be stale now
+        self.session.expire_all()
+
+        if hist_id is None:
+            latest_hist = self.get_latest_versioned()
+            if latest_hist is None:
+                raise Exception("Latest migration history not found")
+            raise Exception(
+                "Unexpected migration history,"
+                f" version={latest_hist.ver}, name={latest_hist.name},"
+                f" checksum={latest_hist.checksum}, state={latest_hist.state},"
+                f" expected_version={plan.version}, expected_name={plan.name},"
+                f" expected_state={from_state}"
+            )
+
+    def _insert_log_stmt(
+        self,
+        plan: mp.MigrationPlan,
+        operation: Operation,
+        operator: str,
+        snapshot_id: str,
+        now: datetime.datetime,
+    ) -> Tuple[str, List[Any]]:
+        hist_table = model.MigrationHistory.__tablename__
+        log_table = model.MigrationHistoryLog.__tablename__
+        if operation == Operation.DELETE:
+            hist_id_expr, params = "@sdm_hist_id", []
+        elif operation == Operation.CREATE:
+            hist_id_expr, params = "LAST_INSERT_ID()", []
+        else:
+            hist_id_expr = (
+                f"(SELECT id FROM `{hist_table}` WHERE ver = %s AND name = %s)"
+            )
+            params = [plan.version, plan.name]
+        return (
+            (
+                f"INSERT INTO `{log_table}` (hist_id, operation, operator,"
+                f" snapshot_id, created) SELECT {hist_id_expr}, %s, %s, %s, %s"
+                " FROM DUAL WHERE @sdm_hist_id IS NOT NULL"
+            ),
+            params + [str(operation), operator, snapshot_id, now],
+        )
+
     def delete(
         self, plan: mp.MigrationPlan, operator: str = "", fake: bool = False
     ) -> None:
@@ -136,7 +464,7 @@ class MigrationHistoryDAO:
             hist_id=hist.id,
             operation=Operation.DELETE,
             operator=operator,
-            snapshot=self._gen_snapshot_log(plan, fake),
+            snapshot_id=self._save_snapshot(plan, fake),
         )
         self.session.add(log)
 
@@ -144,28 +472,40 @@ class MigrationHistoryDAO:
         return (
             self.session.query(model.MigrationHistory)
             .order_by(model.MigrationHistory.id.asc())
-            .with_for_update()
             .all()
         )
 
+    def select_dto(
+        self, versioned: bool = False, batch_size: Optional[int] = None
+    ) -> Iterator[model.MigrationHistoryDTO]:
+        """
+        yield the migration histories from a projection of their columns, no
+        ORM object is built nor kept by the session. With batch_size, the rows
+        are fetched batch_size at a time from a server side cursor
+        """
+        stmt = select_dto_stmt(versioned)
+        if batch_size is not None:
+            stmt = stmt.execution_options(yield_per=batch_size)
+        for row in self.session.execute(stmt):
+            yield model.MigrationHistoryDTO(*row)
+
     def get_all_dto(self) -> List[model.MigrationHistoryDTO]:
-        hists = (
-            self.session.query(model.MigrationHistory)
-            .order_by(model.MigrationHistory.id.asc())
-            .all()
-        )
-        dtos = [hist.to_dto() for hist in hists]
+        dtos = list(self.select_dto())
         self.commit()
         return dtos
 
+    def iter_dto(
+        self, batch_size: int = 1000, versioned: bool = False
+    ) -> Iterator[model.MigrationHistoryDTO]:
+        """
+        yield the migration histories as they are fetched, batch_size rows at
+        a time from a server side cursor
+        """
+        yield from self.select_dto(versioned=versioned, batch_size=batch_size)
+        self.commit()
+
     def get_all_versioned_dto(self) -> List[model.MigrationHistoryDTO]:
-        hists = (
-            self.session.query(model.MigrationHistory)
-            .filter(VERSIONED_TYPE_CRITERION)
-            .order_by(model.MigrationHistory.id.asc())
-            .all()
-        )
-        dtos = [hist.to_dto() for hist in hists]
+        dtos = list(self.select_dto(versioned=True))
         self.commit()
         return dtos
 
@@ -174,7 +514,6 @@ class MigrationHistoryDAO:
             self.session.query(model.MigrationHistory)
             .filter(VERSIONED_TYPE_CRITERION)
             .order_by(model.MigrationHistory.id.asc())
-            .with_for_update()
             .all()
         )
 
@@ -182,7 +521,6 @@ class MigrationHistoryDAO:
         return (
             self.session.query(model.MigrationHistory)
             .order_by(model.MigrationHistory.id.desc())
-            .with_for_update()
             .first()
         )
 
@@ -191,7 +529,6 @@ class MigrationHistoryDAO:
             self.session.query(model.MigrationHistory)
             .filter(VERSIONED_TYPE_CRITERION)
             .order_by(model.MigrationHistory.id.desc())
-            .with_for_update()
             .first()
         )
 
@@ -204,7 +541,6 @@ class MigrationHistoryDAO:
                 model.MigrationHistory.ver == sig.version,
                 model.MigrationHistory.name == sig.name,
             )
-            .with_for_update()
             .one_or_none()
         )
 
@@ -223,6 +559,284 @@ class MigrationHistoryDAO:
         self.commit()
         return hist_dto
 
+    def delete_rollbacked(
+        self, plans: List[mp.MigrationPlan], operator: str = "", fake: bool = False
+    ) -> None:
+        """
+        Delete the histories of plans rollbacked at once, with one delete log
+        per history. The history of the last plan must be ROLLBACKING and the
+        others SUCCESSFUL, and they must be the latest versioned histories.
+        """
+        if len(plans) == 0:
+            return
+        hists: List[model.MigrationHistory] = self.session.scalars(
+            select(model.MigrationHistory)
+            .where(VERSIONED_TYPE_CRITERION)
+            .order_by(model.MigrationHistory.id.desc())
+            .limit(len(plans))
+            .with_for_update()
+        ).all()
+        hists.reverse()
+        if len(hists) != len(plans):
+            raise Exception(
+                f"Unexpected migration history, len(hists)={len(hists)},"
+                f" len(plans)={len(plans)}"
+            )
+        expected_states = [model.MigrationState.SUCCESSFUL] * (len(plans) - 1) + [
+            model.MigrationState.ROLLBACKING
+        ]
+        for plan, hist, state in zip(plans, hists, expected_states):
+            if not hist.can_match(plan.version, plan.name, plan.get_checksum()):
+                raise Exception(
+                    f"Unexpected migration history, hist={hist.to_dto()}, plan={plan}"
+                )
+            if hist.state != state:
+                raise Exception(
+                    f"Unexpected migration history state, hist={hist.to_dto()},"
+                    f" expected={state}"
+                )
+
+        snapshots = {}
+        logs = []
+        now = datetime.datetime.utcnow()
+        # log in the order of a step by step rollback, the latest first
+        for plan, hist in reversed(list(zip(plans, hists))):
+            checksum, snapshot = self._gen_snapshot(plan, fake)
+            snapshots[checksum] = snapshot
+            logs.append(
+                {
+                    "hist_id": hist.id,
+                    "operation": Operation.DELETE,
+                    "operator": operator,
+                    "snapshot_id": checksum,
+                    "created": now,
+                }
+            )
+        self.session.execute(
+            insert(model.MigrationHistorySnapshot)
+            .prefix_with("IGNORE")
+            .values(
+                [
+                    {"checksum": checksum, "snapshot": snapshot}
+                    for checksum, snapshot in snapshots.items()
+                ]
+            )
+        )
+        self.session.execute(insert(model.MigrationHistoryLog), logs)
+        self.session.execute(
+            delete(model.MigrationHistory).where(
+                model.MigrationHistory.id.in_([hist.id for hist in hists])
+            )
+        )
+        self.session.expire_all()
+
+    def record_timing(
+        self, plan: mp.MigrationPlan, direction: Direction, seconds: float
+    ) -> None:
+        stmt = insert(model.MigrationTiming).values(
+            ver=plan.version,
+            name=plan.name,
+            direction=direction,
+            runs=1,
+            total_seconds=seconds,
+            last_seconds=seconds,
+            updated=datetime.datetime.utcnow(),
+        )
+        self.session.execute(
+            stmt.on_duplicate_key_update(
+                runs=model.MigrationTiming.runs + 1,
+                total_seconds=model.MigrationTiming.total_seconds
+                + stmt.inserted.total_seconds,
+                last_seconds=stmt.inserted.last_seconds,
+                updated=stmt.inserted.updated,
+            )
+        )
+
+    def get_timings(self) -> Dict[Tuple[str, str, str], float]:
+        """
+        return average seconds by (ver, name, direction)
+        """
+        rows = self.session.execute(
+            select(
+                model.MigrationTiming.ver,
+                model.MigrationTiming.name,
+                model.MigrationTiming.direction,
+                model.MigrationTiming.total_seconds / model.MigrationTiming.runs,
+            ).where(model.MigrationTiming.runs > 0)
+        ).all()
+        return {(ver, name, direction): avg for ver, name, direction, avg in rows}
+
+    def compact_snapshots(self, batch_size: int = 1000) -> int:
+        """
+        Move inline snapshots of log rows written before the snapshot table
+        existed into the snapshot table, one batch per transaction.
+        return the number of compacted log rows
+        """
+        total = 0
+        while True:
+            with self.session.begin():
+                logs: List[model.MigrationHistoryLog] = (
+                    self.session.query(model.MigrationHistoryLog)
+                    .filter(
+                        model.MigrationHistoryLog.snapshot_id.is_(None),
+                        model.MigrationHistoryLog.snapshot != "",
+                    )
+                    .order_by(model.MigrationHistoryLog.id.asc())
+                    .limit(batch_size)
+                    .all()
+                )
+                if len(logs) == 0:
+                    break
+                snapshots = {}
+                for log in logs:
+                    checksum = helper.sha1_encode([log.snapshot])
+                    snapshots[checksum] = log.snapshot
+                    log.snapshot_id = checksum
+                    log.snapshot = ""
+                self.session.execute(
+                    insert(model.MigrationHistorySnapshot)
+                    .prefix_with("IGNORE")
+                    .values(
+                        [
+                            {"checksum": checksum, "snapshot": snapshot}
+                            for checksum, snapshot in snapshots.items()
+                        ]
+                    )
+                )
+                self.commit()
+            total += len(logs)
+            logger.info("Compacted %d migration history logs", total)
+        return total
+
+    def archive_logs(
+        self,
+        before: datetime.datetime,
+        batch_size: int = 1000,
+        throttle: Optional[Callable[[], None]] = None,
+    ) -> int:
+        """
+        Move log rows created before the given time to the archive table,
+        one batch per transaction, so that only the rows of a batch are locked.
+        throttle is called between the batches.
+        return the number of archived log rows
+        """
+        log_table = model.MigrationHistoryLog.__tablename__
+        archive_table = cli_env.TABLE_MIGRATION_HISTORY_LOG_ARCHIVE
+        columns = ", ".join(
+            f"`{c.name}`" for c in model.MigrationHistoryLog.__table__.columns
+        )
+        with self.session.begin():
+            self.session.execute(
+                text(f"CREATE TABLE IF NOT EXISTS `{archive_table}` LIKE `{log_table}`")
+            )
+        copy_stmt = text(
+            f"INSERT INTO `{archive_table}` ({columns}) SELECT {columns} FROM"
+            f" `{log_table}` WHERE `id` IN :ids"
+        ).bindparams(bindparam("ids", expanding=True))
+
+        total = 0
+        while True:
+            with self.session.begin():
+                ids = self.session.scalars(
+                    select(model.MigrationHistoryLog.id)
+                    .where(model.MigrationHistoryLog.created < before)
+                    .order_by(model.MigrationHistoryLog.id.asc())
+                    .limit(batch_size)
+                ).all()
+                if len(ids) == 0:
+                    break
+                self.session.execute(copy_stmt, {"ids": ids})
+                self.session.execute(
+                    delete(model.MigrationHistoryLog).where(
+                        model.MigrationHistoryLog.id.in_(ids)
+                    )
+                )
+                self.commit()
+            total += len(ids)
+            logger.info("Archived %d migration history logs", total)
+            if throttle is not None:
+                throttle()
+        return total
+
+    def get_log_partitions(self) -> List[str]:
+        return self.session.scalars(
+            text(
+                "SELECT PARTITION_NAME FROM information_schema.PARTITIONS WHERE"
+                " TABLE_SCHEMA = DATABASE() AND TABLE_NAME = :table AND"
+                " PARTITION_NAME IS NOT NULL ORDER BY PARTITION_ORDINAL_POSITION"
+            ),
+            {"table": model.MigrationHistoryLog.__tablename__},
+        ).all()
+
+    def partition_logs(self, months_ahead: int = 3) -> List[str]:
+        """
+        Partition the log table by month of created, or add the partitions of
+        the coming months if it is already partitioned.
+        return the names of the added partitions
+        """
+        log_table = model.MigrationHistoryLog.__tablename__
+        today = datetime.datetime.utcnow().date()
+        end = today
+        for _ in range(months_ahead):
+            end = (end.replace(day=1) + datetime.timedelta(days=32)).replace(day=1)
+        existing = self.get_log_partitions()
+        maxvalue = f"PARTITION {PARTITION_MAXVALUE} VALUES LESS THAN (MAXVALUE)"
+
+        if len(existing) == 0:
+            oldest = self.session.scalar(
+                select(func.min(model.MigrationHistoryLog.created))
+            )
+            partitions = month_partitions(oldest.date() if oldest else today, end)
+            definitions = [
+                f"PARTITION {name} VALUES LESS THAN ('{less_than}')"
+                for name, less_than in partitions
+            ]
+            # every unique key of a partitioned table must contain the
+            #   partitioning column
+            self.session.execute(
+                text(
+                    f"ALTER TABLE `{log_table}` DROP PRIMARY KEY,"
+                    " ADD PRIMARY KEY (`id`, `created`)"
+                )
+            )
+            self.session.execute(
+                text(
+                    f"ALTER TABLE `{log_table}` PARTITION BY RANGE COLUMNS(`created`)"
+                    f" ({', '.join(definitions + [maxvalue])})"
+                )
+            )
+        else:
+            last = max(
+                (name for name in existing if name != PARTITION_MAXVALUE), default=""
+            )
+            partitions = [p for p in month_partitions(today, end) if p[0] > last]
+            if len(partitions) == 0:
+                return []
+            definitions = [
+                f"PARTITION {name} VALUES LESS THAN ('{less_than}')"
+                for name, less_than in partitions
+            ]
+            # only rows in pmax are moved, which are the rows of future months
+            self.session.execute(
+                text(
+                    f"ALTER TABLE `{log_table}` REORGANIZE PARTITION"
+                    f" {PARTITION_MAXVALUE} INTO"
+                    f" ({', '.join(definitions + [maxvalue])})"
+                )
+            )
+        names = [name for name, _ in partitions]
+        logger.info("Added partitions %s to %s", names, log_table)
+        return names
+
+    def get_log_snapshot(self, log: model.MigrationHistoryLog) -> str:
+        if log.snapshot_id is None:
+            return log.snapshot
+        return self.session.scalars(
+            select(model.MigrationHistorySnapshot.snapshot).where(
+                model.MigrationHistorySnapshot.checksum == log.snapshot_id
+            )
+        ).one()
+
     def clear_all(self) -> None:
         self.session.query(model.MigrationHistory).delete()
 
@@ -1,10 +1,11 @@
 import datetime
 import enum
 from dataclasses import dataclass
+from typing import Optional
 
-from sqlalchemy import BIGINT, Integer, String, Text
+from sqlalchemy import BIGINT, Float, Integer, String, Text
 from sqlalchemy.orm import DeclarativeBase, Mapped, mapped_column
-from sqlalchemy.schema import UniqueConstraint
+from sqlalchemy.schema import Index, UniqueConstraint
 from sqlalchemy.types import DateTime
 
 from migration.env import cli_env
@@ -32,7 +33,7 @@ class MigrationState(enum.Enum):
 TABLE_ARGS = {"mysql_charset": "utf8mb4", "mysql_collate": "utf8mb4_unicode_ci"}
 
 
-@dataclass
+@dataclass(slots=True)
 class MigrationHistoryDTO:
     ver: str
     name: str
@@ -83,13 +84,68 @@ class MigrationHistory(Base):
 
 class MigrationHistoryLog(Base):
     __tablename__ = cli_env.TABLE_MIGRATION_HISTORY_LOG
-    __table_args__ = TABLE_ARGS
+    __table_args__ = (
+        Index("idx_hist_id_created", "hist_id", "created"),
+        TABLE_ARGS,
+    )
 
     id: Mapped[int] = mapped_column(primary_key=True)
     hist_id: Mapped[int] = mapped_column(Integer)
     operation: Mapped[str] = mapped_column(String(255))
+    # inline snapshot, only set by log rows written before the snapshot table
     snapshot: Mapped[str] = mapped_column(Text(), default="")
+    # checksum of the row in the snapshot table
+    snapshot_id: Mapped[Optional[str]] = mapped_column(String(40), default=None)
     operator: Mapped[str] = mapped_column(String(255), default="")
     created: Mapped[DateTime] = mapped_column(
         DateTime, default=datetime.datetime.utcnow
     )
+
+
+class MigrationHistorySnapshot(Base):
+    """
+    plan snapshots of the history log, stored once per checksum
+    """
+
+    __tablename__ = cli_env.TABLE_MIGRATION_HISTORY_SNAPSHOT
+    __table_args__ = TABLE_ARGS
+
+    checksum: Mapped[str] = mapped_column(String(40), primary_key=True)
+    snapshot: Mapped[str] = mapped_column(Text())
+    created: Mapped[DateTime] = mapped_column(
+        DateTime, default=datetime.datetime.utcnow
+    )
+
+
+class MigrationLock(Base):
+    __tablename__ = cli_env.TABLE_MIGRATION_HISTORY_LOCK
+    __table_args__ = TABLE_ARGS
+
+    name: Mapped[str] = mapped_column(String(64), primary_key=True)
+    holder: Mapped[str] = mapped_column(String(255), default="")
+    connection_id: Mapped[int] = mapped_column(BIGINT, default=0)
+    acquired: Mapped[DateTime] = mapped_column(
+        DateTime, default=datetime.datetime.utcnow
+    )
+    heartbeat: Mapped[DateTime] = mapped_column(
+        DateTime, default=datetime.datetime.utcnow
+    )
+
+
+class MigrationTiming(Base):
+    """
+    recorded execution time of a plan, per direction
+    """
+
+    __tablename__ = cli_env.TABLE_MIGRATION_HISTORY_TIMING
+    __table_args__ = TABLE_ARGS
+
+    ver: Mapped[str] = mapped_column(String(255), primary_key=True)
+    name: Mapped[str] = mapped_column(String(255), primary_key=True)
+    direction: Mapped[str] = mapped_column(String(16), primary_key=True)
+    runs: Mapped[int] = mapped_column(Integer, default=0)
+    total_seconds: Mapped[float] = mapped_column(Float, default=0)
+    last_seconds: Mapped[float] = mapped_column(Float, default=0)
+    updated: Mapped[DateTime] = mapped_column(
+        DateTime, default=datetime.datetime.utcnow, onupdate=datetime.datetime.utcnow
+    )
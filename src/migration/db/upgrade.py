@@ -0,0 +1,44 @@
+import logging
+from typing import Set
+
+from sqlalchemy import Engine, inspect, text
+
+from . import model
+
+logger = logging.getLogger(__name__)
+
+# engines (by url) whose tables have been checked in this process
+_upgraded: Set[str] = set()
+
+
+def upgrade_tables(engine: Engine):
+    """
+    Add the columns and indexes introduced after a table was created,
+    create_all only creates missing tables
+    """
+    key = engine.url.render_as_string(hide_password=True)
+    if key in _upgraded:
+        return
+    log_table = model.MigrationHistoryLog.__tablename__
+    inspector = inspect(engine)
+    columns = {c["name"] for c in inspector.get_columns(log_table)}
+    if "snapshot_id" not in columns:
+        logger.info("Adding column snapshot_id to %s", log_table)
+        with engine.begin() as conn:
+            conn.execute(
+                text(
+                    f"ALTER TABLE `{log_table}` ADD COLUMN `snapshot_id` VARCHAR(40)"
+                    " NULL"
+                )
+            )
+    indexes = {i["name"] for i in inspector.get_indexes(log_table)}
+    if "idx_hist_id_created" not in indexes:
+        logger.info("Adding index idx_hist_id_created to %s", log_table)
+        with engine.begin() as conn:
+            conn.execute(
+                text(
+                    f"ALTER TABLE `{log_table}` ADD INDEX `idx_hist_id_created`"
+                    " (`hist_id`, `created`), ALGORITHM=INPLACE, LOCK=NONE"
+                )
+            )
+    _upgraded.add(key)
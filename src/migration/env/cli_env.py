@@ -32,6 +32,7 @@ ALLOW_UNSAFE = int(load.getenv("ALLOW_UNSAFE", default="0", required=False))
 ALLOW_ECHO_SQL = int(load.getenv("ALLOW_ECHO_SQL", default="0", required=False))
 
 SKEEMA_CMD_PATH = load.getenv("SKEEMA_CMD_PATH", default="skeema", required=False)
+SDM_CMD_PATH = load.getenv("SDM_CMD_PATH", default="sdm", required=False)
 NODE_CMD_PATH = load.getenv("NODE_CMD_PATH", default="node", required=False)
 NPM_CMD_PATH = load.getenv("NPM_CMD_PATH", default="npm", required=False)
 
@@ -39,10 +40,12 @@ SCHEMA_DIR = "schema"
 DATA_DIR = "data"
 MIGRATION_PLAN_DIR = "migration_plan"
 SCHEMA_STORE_DIR = ".schema_store"
+SCRATCH_DIR = "tmp"
 ENV_INI_FILE = os.path.join(SCHEMA_DIR, ".skeema")
 
 SDM_SCHEMA_DIR = os.path.abspath(os.path.join(MIGRATION_CWD, SCHEMA_DIR))
 SDM_DATA_DIR = os.path.abspath(os.path.join(MIGRATION_CWD, DATA_DIR))
+SDM_SCRATCH_DIR = os.path.abspath(os.path.join(MIGRATION_CWD, SCRATCH_DIR))
 
 TABLE_MIGRATION_HISTORY = load.getenv(
     "TABLE_MIGRATION_HISTORY", default="_migration_history", required=False
@@ -50,6 +53,106 @@ TABLE_MIGRATION_HISTORY = load.getenv(
 TABLE_MIGRATION_HISTORY_LOG = load.getenv(
     "TABLE_MIGRATION_HISTORY", default="_migration_history_log", required=False
 )
+# prefixed by the history table name, so they are covered by skeema --ignore-table
+TABLE_MIGRATION_HISTORY_LOCK = f"{TABLE_MIGRATION_HISTORY}_lock"
+TABLE_MIGRATION_HISTORY_SNAPSHOT = f"{TABLE_MIGRATION_HISTORY}_snapshot"
+TABLE_MIGRATION_HISTORY_LOG_ARCHIVE = f"{TABLE_MIGRATION_HISTORY}_log_archive"
+TABLE_MIGRATION_HISTORY_TIMING = f"{TABLE_MIGRATION_HISTORY}_timing"
+
+LOCK_TIMEOUT = int(load.getenv("LOCK_TIMEOUT", default="60", required=False))
+LOCK_HEARTBEAT_INTERVAL = int(
+    load.getenv("LOCK_HEARTBEAT_INTERVAL", default="10", required=False)
+)
+
+# ALTERs of tables at least this large are run by `sdm osc`, e.g. 1g, 0 disables it
+ONLINE_ALTER_MIN_SIZE = load.getenv(
+    "ONLINE_ALTER_MIN_SIZE", default="0", required=False
+)
+ONLINE_ALTER_CHUNK_SIZE = int(
+    load.getenv("ONLINE_ALTER_CHUNK_SIZE", default="1000", required=False)
+)
+
+# data migrations pause while a replica lags more seconds than this, see throttle.py
+REPLICA_MAX_LAG = float(load.getenv("REPLICA_MAX_LAG", default="10", required=False))
+REPLICA_CHECK_INTERVAL = float(
+    load.getenv("REPLICA_CHECK_INTERVAL", default="1", required=False)
+)
+# seconds to wait for the replicas to catch up before failing, 0 waits forever
+REPLICA_LAG_TIMEOUT = float(
+    load.getenv("REPLICA_LAG_TIMEOUT", default="0", required=False)
+)
+
+# repeatable plans of one parallel_group run on at most this many threads
+REPEATABLE_MIGRATION_WORKERS = int(
+    load.getenv("REPEATABLE_MIGRATION_WORKERS", default="4", required=False)
+)
+
+# inprocess or process, see python_runner.py
+PYTHON_MIGRATION_BACKEND = load.getenv(
+    "PYTHON_MIGRATION_BACKEND", default="inprocess", required=False
+)
+# limits of the process backend, 0 disables them
+PYTHON_MIGRATION_TIMEOUT = float(
+    load.getenv("PYTHON_MIGRATION_TIMEOUT", default="0", required=False)
+)
+PYTHON_MIGRATION_MAX_RSS = load.getenv(
+    "PYTHON_MIGRATION_MAX_RSS", default="0", required=False
+)
+# processes of the fan out helper given to python migrations
+PYTHON_MIGRATION_WORKERS = int(
+    load.getenv(
+        "PYTHON_MIGRATION_WORKERS", default=str(os.cpu_count() or 1), required=False
+    )
+)
+
+# auto, load_data or insert, see bulk_load.py
+BULK_LOAD_METHOD = load.getenv("BULK_LOAD_METHOD", default="auto", required=False)
+# rows per INSERT of bulk_load, unless the plan sets batch_size
+BULK_LOAD_BATCH_SIZE = int(
+    load.getenv("BULK_LOAD_BATCH_SIZE", default="1000", required=False)
+)
+
+# throughput assumed by the dry run cost estimate
+ESTIMATE_BYTES_PER_SECOND = int(
+    load.getenv(
+        "ESTIMATE_BYTES_PER_SECOND", default=str(50 * 1024 * 1024), required=False
+    )
+)
+ESTIMATE_ROWS_PER_SECOND = int(
+    load.getenv("ESTIMATE_ROWS_PER_SECOND", default="10000", required=False)
+)
+
+# spans of every run are appended to this file as OTLP/JSON lines, see
+#   tracing.py, empty disables tracing
+TRACE_FILE = load.getenv("TRACE_FILE", default="", required=False)
+
+# output of sdm --profile, see profiling.py
+PROFILE_DIR = load.getenv(
+    "PROFILE_DIR", default=os.path.join(SDM_SCRATCH_DIR, "profile"), required=False
+)
+PROFILE_TOP_N = int(load.getenv("PROFILE_TOP_N", default="30", required=False))
+# seconds between the stack samples of --profile=wall
+PROFILE_INTERVAL = float(
+    load.getenv("PROFILE_INTERVAL", default="0.005", required=False)
+)
+
+# unix socket of sdm serve, see daemon.py
+DAEMON_SOCKET = load.getenv(
+    "DAEMON_SOCKET", default=os.path.join(SDM_SCRATCH_DIR, "sdm.sock"), required=False
+)
+# 1 forwards commands to sdm serve if it is running, see client.py
+DAEMON_FORWARD = int(load.getenv("DAEMON_FORWARD", default="0", required=False))
+
+# commands run at the same time against the environments on one MySQL
+#   host, see aio.py
+ASYNC_HOST_CONCURRENCY = int(
+    load.getenv("ASYNC_HOST_CONCURRENCY", default="4", required=False)
+)
+# histories read at the same time per MySQL host by info --all-envs, a read is
+#   one short query, so a host of shard schemas is read in one round
+INFO_HOST_CONCURRENCY = int(
+    load.getenv("INFO_HOST_CONCURRENCY", default="64", required=False)
+)
 
 SAMPLE_PYTHON_FILE = """from sqlalchemy.orm import Session
 from sqlalchemy import Column, String
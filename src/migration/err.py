@@ -9,3 +9,27 @@ class ConditionCheckFailedError(CustomError):
 # Define integrity exception
 class IntegrityError(CustomError):
     pass
+
+
+class LockTimeoutError(CustomError):
+    pass
+
+
+class OnlineAlterError(CustomError):
+    pass
+
+
+class ReplicaLagError(CustomError):
+    pass
+
+
+class PythonMigrationError(CustomError):
+    pass
+
+
+class BulkLoadError(CustomError):
+    pass
+
+
+class DaemonError(CustomError):
+    pass
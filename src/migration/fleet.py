@@ -0,0 +1,157 @@
+from dataclasses import dataclass, field
+from typing import Dict, List, Optional, Tuple
+
+from . import helper
+from . import migration_plan as mp
+from .db import model
+
+# cells of the matrix of sdm info --all-envs
+CELL_APPLIED = "+"
+CELL_MISSING = "."
+CELL_ERROR = "?"
+STATE_CELLS = {
+    model.MigrationState.SUCCESSFUL: CELL_APPLIED,
+    model.MigrationState.PROCESSING: "P",
+    model.MigrationState.ROLLBACKING: "R",
+}
+# versions shown in the matrix, the latest drifting ones
+MAX_MATRIX_VERSIONS = 12
+
+
+@dataclass
+class EnvironmentStatus:
+    environment: str
+    # state of the versioned plans in the migration history, by version
+    states: Dict[str, model.MigrationState] = field(default_factory=dict)
+    # version of the latest successful plan
+    head: Optional[str] = None
+    # PROCESSING or ROLLBACKING, the state of the latest history if it is not
+    #   SUCCESSFUL
+    pending: Optional[model.MigrationState] = None
+    # plans not applied successfully
+    behind: int = 0
+    # versions in the history that are not plans of the workspace
+    unknown: List[str] = field(default_factory=list)
+    error: Optional[str] = None
+
+    def cell(self, version: str) -> str:
+        if self.error is not None:
+            return CELL_ERROR
+        if version not in self.states:
+            return CELL_MISSING
+        return STATE_CELLS[self.states[version]]
+
+
+def status_of(
+    environment: str,
+    plans: List[mp.MigrationPlan],
+    histories: List[model.MigrationHistoryDTO],
+) -> EnvironmentStatus:
+    """
+    histories are the versioned migration histories of environment, in the
+    order they are created
+    """
+    status = EnvironmentStatus(environment)
+    versions = {plan.version for plan in plans}
+    for hist in histories:
+        status.states[hist.ver] = hist.state
+        if hist.state == model.MigrationState.SUCCESSFUL:
+            status.head = hist.ver
+        if hist.ver not in versions:
+            status.unknown.append(hist.ver)
+    if histories and histories[-1].state != model.MigrationState.SUCCESSFUL:
+        status.pending = histories[-1].state
+    status.behind = sum(
+        1
+        for plan in plans
+        if status.states.get(plan.version) != model.MigrationState.SUCCESSFUL
+    )
+    return status
+
+
+def failed(environment: str, error: BaseException) -> EnvironmentStatus:
+    return EnvironmentStatus(environment, error=str(error))
+
+
+def drift_versions(
+    plans: List[mp.MigrationPlan], statuses: List[EnvironmentStatus]
+) -> List[str]:
+    """
+    return the versions whose state differs between the environments, or is
+    not SUCCESSFUL in one of them, in the order of the plans
+    """
+    reachable = [s for s in statuses if s.error is None]
+    if not reachable:
+        return []
+    versions = [plan.version for plan in plans]
+    known = set(versions)
+    for s in reachable:
+        versions.extend(v for v in s.unknown if v not in known)
+        known.update(s.unknown)
+    drift = []
+    for version in versions:
+        cells = {s.cell(version) for s in reachable}
+        if len(cells) > 1 or cells - {CELL_APPLIED, CELL_MISSING}:
+            drift.append(version)
+    return drift
+
+
+def matrix(
+    plans: List[mp.MigrationPlan],
+    statuses: List[EnvironmentStatus],
+    max_versions: int = MAX_MATRIX_VERSIONS,
+) -> Tuple[List[str], List[List[str]], int]:
+    """
+    return (headers, rows, hidden), a row per environment with its head and
+    the cells of the latest drifting versions. hidden is the number of the
+    older drifting versions not shown
+    """
+    drift = drift_versions(plans, statuses)
+    shown = drift[-max_versions:] if max_versions > 0 else []
+    headers = ["environment", "head", "behind", "pending"] + shown
+    rows = []
+    for s in statuses:
+        if s.error is not None:
+            row = [s.environment, CELL_ERROR, "", helper.truncate_str(s.error)]
+        else:
+            row = [
+                s.environment,
+                s.head or "",
+                str(s.behind),
+                s.pending.name if s.pending is not None else "",
+            ]
+        rows.append(row + [s.cell(version) for version in shown])
+    return headers, rows, len(drift) - len(shown)
+
+
+# a row per environment of jsonl and csv
+STATUS_HEADERS = ["environment", "head", "behind", "pending", "error"]
+
+
+def status_row(s: EnvironmentStatus) -> List:
+    return [
+        s.environment,
+        s.head,
+        s.behind if s.error is None else None,
+        s.pending.name if s.pending is not None else None,
+        s.error,
+    ]
+
+
+def to_json(plans: List[mp.MigrationPlan], statuses: List[EnvironmentStatus]) -> Dict:
+    return {
+        "latest": plans[-1].version if plans else None,
+        "drift": drift_versions(plans, statuses),
+        "environments": [
+            {
+                "environment": s.environment,
+                "head": s.head,
+                "behind": s.behind,
+                "pending": s.pending.name if s.pending is not None else None,
+                "unknown": s.unknown,
+                "states": {ver: state.name for ver, state in s.states.items()},
+                "error": s.error,
+            }
+            for s in statuses
+        ],
+    }
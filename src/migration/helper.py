@@ -4,11 +4,15 @@ import logging
 import os
 import shlex
 import subprocess
-from typing import Dict, List
+import threading
+from typing import Dict, List, Optional, Set, Tuple
 
+from sqlalchemy import Engine
+from sqlalchemy.ext.asyncio import AsyncEngine
 from sqlalchemy.orm import Session
 
-from .db.db import make_session
+from . import tracing
+from .db.db import create_tables, make_async_engine, make_engine, make_session
 from .env import cli_env
 
 logger = logging.getLogger(__name__)
@@ -28,6 +32,12 @@ class SHA1Helper:
                 data = f.read()
             self.sha1.update(data.encode())
 
+    def update_binary_file(self, file_list: List[str]):
+        for file in file_list:
+            with open(file, "rb") as f:
+                for chunk in iter(lambda: f.read(1024 * 1024), b""):
+                    self.sha1.update(chunk)
+
     def hexdigest(self) -> str:
         return self.sha1.hexdigest()
 
@@ -88,12 +98,94 @@ def get_env_ini_section(env: str) -> configparser.SectionProxy:
 
 def get_env_with_update(update_env: Dict[str, str]) -> Dict[str, str]:
     os_env = os.environ.copy()
+    # child processes can continue the trace
+    os_env.update(tracing.traceparent_env())
     os_env.update(update_env)
     return os_env
 
 
-def build_session_from_env(env: str, echo: bool = False) -> Session:
+# engines by connection, kept between commands by sdm serve, None creates an
+#   engine for every session
+_engine_pool: Optional[Dict[Tuple, Engine]] = None
+# keys of the pooled engines whose tables are created
+_engine_pool_tables: Set[Tuple] = set()
+_engine_pool_mutex = threading.Lock()
+
+
+def enable_engine_pool():
+    global _engine_pool
+    with _engine_pool_mutex:
+        if _engine_pool is None:
+            _engine_pool = {}
+
+
+def engine_pool_enabled() -> bool:
+    return _engine_pool is not None
+
+
+def dispose_engine_pool():
+    global _engine_pool
+    with _engine_pool_mutex:
+        engines, _engine_pool = _engine_pool, None
+        _engine_pool_tables.clear()
+    for engine in (engines or {}).values():
+        engine.dispose()
+
+
+def _pooled_engine(
+    section: configparser.SectionProxy, echo: bool, create_all_tables: bool = True
+) -> Engine:
+    # the key changes with .skeema, e.g. a new host gets a new engine
+    key = (section["host"], section["port"], section["user"], section["schema"], echo)
+    with _engine_pool_mutex:
+        engine = _engine_pool.get(key)
+        if engine is None:
+            engine = make_engine(
+                host=section["host"],
+                port=int(section["port"]),
+                user=section["user"],
+                password=cli_env.MYSQL_PWD,
+                schema=section["schema"],
+                echo=echo,
+                create_all_tables=False,
+            )
+            _engine_pool[key] = engine
+        if create_all_tables and key not in _engine_pool_tables:
+            create_tables(engine)
+            _engine_pool_tables.add(key)
+        return engine
+
+
+def forget_engine_tables(engine: Engine):
+    """
+    have the tables of a pooled engine created again by its next session,
+    e.g. after they are dropped
+    """
+    with _engine_pool_mutex:
+        for key, pooled in (_engine_pool or {}).items():
+            if pooled is engine:
+                _engine_pool_tables.discard(key)
+
+
+def release_engine(engine: Engine):
+    """
+    dispose an engine of build_engine_from_env, unless it is pooled
+    """
+    if _engine_pool is not None and engine in _engine_pool.values():
+        return
+    engine.dispose()
+
+
+def build_session_from_env(
+    env: str, echo: bool = False, create_all_tables: bool = True
+) -> Session:
+    """
+    without create_all_tables the session only reads, the history tables are
+    not created or upgraded
+    """
     section = get_env_ini_section(env)
+    if _engine_pool is not None:
+        return Session(bind=_pooled_engine(section, echo, create_all_tables))
     return make_session(
         host=section["host"],
         port=int(section["port"]),
@@ -101,6 +193,77 @@ def build_session_from_env(env: str, echo: bool = False) -> Session:
         password=cli_env.MYSQL_PWD,
         schema=section["schema"],
         echo=echo,
+        create_all_tables=create_all_tables,
+    )
+
+
+def build_engine_from_env(env: str, echo: bool = False) -> Engine:
+    section = get_env_ini_section(env)
+    if _engine_pool is not None:
+        return _pooled_engine(section, echo)
+    return make_engine(
+        host=section["host"],
+        port=int(section["port"]),
+        user=section["user"],
+        password=cli_env.MYSQL_PWD,
+        schema=section["schema"],
+        echo=echo,
+    )
+
+
+def build_async_engine_from_env(env: str, echo: bool = False) -> AsyncEngine:
+    """
+    not pooled, an async engine belongs to the event loop it is used in
+    """
+    section = get_env_ini_section(env)
+    return make_async_engine(
+        host=section["host"],
+        port=int(section["port"]),
+        user=section["user"],
+        password=cli_env.MYSQL_PWD,
+        schema=section["schema"],
+        echo=echo,
+    )
+
+
+def host_key_of(env: str) -> Tuple[str, str, str]:
+    """
+    the environments with the same key can share a host engine
+    """
+    section = get_env_ini_section(env)
+    return (section["host"], section["port"], section["user"])
+
+
+def build_host_engine_from_env(env: str, pool_size: int, echo: bool = False) -> Engine:
+    """
+    an engine without a default schema, shared by the environments of a host
+    to read their histories, see Environment.read_versioned_history
+    """
+    section = get_env_ini_section(env)
+    return make_engine(
+        host=section["host"],
+        port=int(section["port"]),
+        user=section["user"],
+        password=cli_env.MYSQL_PWD,
+        schema="",
+        echo=echo,
+        create_all_tables=False,
+        pool_size=pool_size,
+    )
+
+
+def build_async_host_engine_from_env(
+    env: str, pool_size: int, echo: bool = False
+) -> AsyncEngine:
+    section = get_env_ini_section(env)
+    return make_async_engine(
+        host=section["host"],
+        port=int(section["port"]),
+        user=section["user"],
+        password=cli_env.MYSQL_PWD,
+        schema="",
+        echo=echo,
+        pool_size=pool_size,
     )
 
 
@@ -108,7 +271,10 @@ def call_skeema(raw_args: List[str], cwd: str = cli_env.MIGRATION_CWD, env=None)
     # https://stackoverflow.com/questions/39872088/executing-interactive-shell-script-in-python
     cmd = f"{cli_env.SKEEMA_CMD_PATH} " + " ".join(raw_args)
     logger.info("Run %s", cmd)
-    subprocess.check_call(shlex.split(cmd), cwd=cwd, env=env)
+    split = shlex.split(cmd)
+    with tracing.span("skeema", {"skeema.command": raw_args[0] if raw_args else ""}):
+        with tracing.subprocess_span(split):
+            subprocess.check_call(split, cwd=cwd, env=env)
 
 
 def files_under_dir(dir_path: str, ends_with: str) -> Dict[str, str]:
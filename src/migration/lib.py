@@ -1,3 +1,8 @@
+import asyncio
+import datetime
+import functools
+import inspect
+import itertools
 import json
 import logging
 import os
@@ -5,1212 +10,1988 @@ import shlex
 import shutil
 import subprocess
 import tempfile
+import time
 from argparse import Namespace
-from typing import Dict, List, Optional, Set, Tuple
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
+from typing import Any, Callable, Dict, Iterator, List, Optional, Set, Tuple
 
-from sqlalchemy import text
+from sqlalchemy import Engine, exc, text
+from sqlalchemy.ext.asyncio import AsyncEngine
+from sqlalchemy.orm import Session
 from tabulate import tabulate
 
-from . import auto_test_plan, consts, err, helper
+from . import (aio, auto_test_plan, bulk_load, consts, cost_estimator, daemon,
+               err, fleet, helper)
 from . import migration_plan as mp
-from .db import hist_dao, model
+from . import online_alter, report, route_planner, store_gc, throttle, tracing
+from .db import db, env_lock, hist_dao, model
 from .env import cli_env
 from .migrator import Migrator
 
 logger = logging.getLogger(__name__)
 
 
-class CLI:
-    def __init__(self, args: Namespace = None, migrator: Migrator = Migrator()):
-        self.args = args
-        self.mpm: mp.MigrationPlanManager = None
-        self.dao: hist_dao.MigrationHistoryDAO = None
-        self.migrator = migrator
+def is_no_such_table(e: exc.DBAPIError) -> bool:
+    # e.g. the history table of an environment never migrated
+    return e.orig is not None and e.orig.args[:1] == (consts.ER_NO_SUCH_TABLE,)
 
-    def build_dao(self) -> hist_dao.MigrationHistoryDAO:
-        session = helper.build_session_from_env(
-            self.args.environment, echo=cli_env.ALLOW_ECHO_SQL
-        )
-        self.dao = hist_dao.MigrationHistoryDAO(session)
-        return self.dao
 
-    def _check_migration_histories(
-        self, migration_histories: List[model.MigrationHistory], fix: bool = False
-    ):
-        if len(migration_histories) > self.mpm.count():
-            raise Exception(
-                "Unexpected migration history,"
-                f" len(migration_histories)={len(migration_histories)},"
-                f" len(migration_plans)={self.mpm.count()}"
-            )
-        # the history and migration plans should match
-        for idx, hist in enumerate(migration_histories):
-            if hist.state != model.MigrationState.SUCCESSFUL:
-                # if fix mode, the last history can be PROCESSING or ROLLBACKING
-                if fix and idx == len(migration_histories) - 1:
-                    if (
-                        hist.state == model.MigrationState.PROCESSING
-                        or hist.state == model.MigrationState.ROLLBACKING
-                    ):
-                        continue
-                raise Exception(
-                    f"Migration is not successful, version={hist.ver}, name={hist.name}"
-                )
-            plan = self.mpm.get_plan_by_index(idx)
-            if not hist.can_match(plan.version, plan.name, plan.get_checksum()):
-                raise Exception(
-                    f"Unexpected migration history, version={hist.ver},"
-                    f" name={hist.name}, checksum={hist.checksum}"
-                )
+def with_env_lock(func):
+    """
+    hold the environment lock while running the decorated Environment method,
+    by its operator and dry_run keyword arguments. The python migration
+    modules loaded by the run are dropped after it
+    """
 
-    def _get_and_check_versioned_migration_histories(
-        self, fix: bool = False
-    ) -> List[model.MigrationHistory]:
-        migration_histories = self.dao.get_all_versioned()
-        self._check_migration_histories(migration_histories, fix=fix)
-        return migration_histories
+    @functools.wraps(func)
+    def wrapper(self: "Environment", *args, **kwargs):
+        # e.g. goto and test run call migrate and rollback
+        outermost = self._env_lock is None
+        try:
+            with self.hold_env_lock(
+                operator=kwargs.get("operator", ""),
+                dry_run=kwargs.get("dry_run", False),
+            ):
+                return func(self, *args, **kwargs)
+        finally:
+            if outermost:
+                self.migrator.clear_python_modules()
 
-    def fix_rollback(self):
-        self.fix_migrate(forward=False)
+    return wrapper
 
-    def fix_migrate(self, forward: bool = True):
-        self.read_migration_plans()
-        fake = self.args.fake if "fake" in self.args else False
-        operator = self.args.operator if "operator" in self.args else ""
 
-        dao = self.build_dao()
-        with dao.session.begin():
-            migration_histories = self._get_and_check_versioned_migration_histories(
-                fix=True
-            )
-            if (
-                len(migration_histories) == 0
-                or migration_histories[-1].state == model.MigrationState.SUCCESSFUL
-            ):
-                logger.info("No need to fix migration")
-                return
-            target_plan = self.mpm.get_plan_by_index(len(migration_histories) - 1)
-            if forward:
-                if not fake:
-                    self.migrator.forward(target_plan, self.args)
-                dao.update_succ(target_plan, operator=operator, fake=fake)
-            else:
-                if not fake:
-                    self.migrator.backward(target_plan, self.args)
-                dao.delete(target_plan, operator=operator, fake=fake)
-            dao.commit()
+class Workspace:
+    """
+    The migration plans and schema store of the workspace in MIGRATION_CWD,
+    and its environments. The typed methods can be called repeatedly in one
+    process. With cache, the plans and integrity checks are kept until the
+    workspace changes and the engines are pooled, like sdm serve does.
+    """
 
-    def print_dry_run(self, plans: List[mp.MigrationPlan], is_migrate: bool):
-        new_plans = plans if is_migrate else reversed(plans)
-        print(
-            tabulate(
-                [
-                    [
-                        p.version,
-                        p.name,
-                        p.type,
-                        (
-                            p.change.forward.to_str_for_print()
-                            if p.change.forward is not None
-                            else None
-                        ),
-                        (
-                            p.change.backward.to_str_for_print()
-                            if p.change.backward is not None
-                            else None
-                        ),
-                    ]
-                    for p in new_plans
-                ],
-                headers=[
-                    "ver",
-                    "name",
-                    "type",
-                    "forward",
-                    "backward",
-                ],
-                tablefmt="orgtbl",
-            )
-        )
+    def __init__(self, migrator: Optional[Migrator] = None, cache: bool = False):
+        self.mpm: mp.MigrationPlanManager = None
+        # not shared with the other workspaces of the process, e.g. of sdm serve
+        self.migrator = migrator or Migrator()
+        self._environments: Dict[str, "Environment"] = {}
+        self._warm: Optional[daemon.WarmState] = None
+        if cache:
+            self._warm = daemon.WarmState(daemon.make_watcher(daemon.watched_dirs()))
+            helper.enable_engine_pool()
+
+    def warm_state(self) -> Optional[daemon.WarmState]:
+        return self._warm if self._warm is not None else daemon.current()
+
+    def environment(self, name: str) -> "Environment":
+        if name not in self._environments:
+            self._environments[name] = Environment(self, name)
+        return self._environments[name]
+
+    def for_each_environment(
+        self,
+        environments: List[str],
+        func: Callable[["Environment"], Any],
+        limiter: Optional[aio.HostLimiter] = None,
+    ) -> List[aio.Outcome]:
+        """
+        call func with each environment at the same time, see
+        aio.for_each_environment, func can be a coroutine function
+        """
+        envs = {name: self.environment(name) for name in environments}
+        if inspect.iscoroutinefunction(func):
 
-    def _migrate_versioned(
-        self, ver: str, name: str, fake: bool, dry_run: bool, operator: str = ""
-    ) -> Tuple[List[mp.MigrationPlan], List[mp.MigrationPlan]]:
+            async def call(name: str) -> Any:
+                return await func(envs[name])
+
+        else:
+
+            def call(name: str) -> Any:
+                return func(envs[name])
+
+        return aio.run(aio.for_each_environment(environments, call, limiter))
+
+    def info_all_envs(
+        self,
+        environments: Optional[List[str]] = None,
+        output_format: str = consts.OUTPUT_FORMAT_TABLE,
+        host_concurrency: int = cli_env.INFO_HOST_CONCURRENCY,
+    ) -> List[fleet.EnvironmentStatus]:
         """
-        Apply versioned migration plans
-        return applied plans, to execute plans
+        show the migration status of environments side by side, all of
+        .skeema by default. The histories are read at the same time, at most
+        host_concurrency of a MySQL host, through one engine per host
         """
-        dao = self.build_dao()
-        applied_plans: List[mp.MigrationPlan] = []
-        with dao.session.begin():
-            versioned_migration_histories = (
-                self._get_and_check_versioned_migration_histories()
+        self.read_migration_plans()
+        plans = self.mpm.get_plans()
+        if environments is None:
+            environments = helper.parse_env_ini().sections()
+        outcomes = aio.run(
+            self._read_versioned_histories(environments, host_concurrency)
+        )
+        statuses = [
+            (
+                fleet.failed(o.environment, o.error)
+                if o.error is not None
+                else fleet.status_of(o.environment, plans, o.result)
             )
-            len_applied_versioned = len(versioned_migration_histories)
-            applied_plans = self.mpm.get_plans()[:len_applied_versioned]
-
-            # versioned migration has been applied
-            if len_applied_versioned == self.mpm.count():
-                return applied_plans, []
-            # create new migration history if needed
-            next_plan_index = len_applied_versioned
-            if ver is None:
-                new_plans = self.mpm.must_get_plan_between(next_plan_index, None)
-            else:
-                new_plans = self.mpm.must_get_plan_between(
-                    next_plan_index,
-                    mp.MigrationSignature(version=ver, name=name),
+            for o in outcomes
+        ]
+        if output_format == consts.OUTPUT_FORMAT_JSON:
+            print(json.dumps(fleet.to_json(plans, statuses), indent=2))
+        elif output_format in consts.STREAM_OUTPUT_FORMAT:
+            with report.RowWriter(output_format, fleet.STATUS_HEADERS) as writer:
+                for status in statuses:
+                    writer.write(fleet.status_row(status))
+        else:
+            headers, rows, hidden = fleet.matrix(plans, statuses)
+            prompt = (
+                f"Migration status, latest={plans[-1].version if plans else None},"
+                f" {fleet.CELL_APPLIED} applied, {fleet.CELL_MISSING} not applied:"
+            )
+            if hidden > 0:
+                prompt += f" {hidden} older drifting versions are not shown"
+            self._print_info_as_table(prompt, rows, headers)
+        failed = [s.environment for s in statuses if s.error is not None]
+        if failed:
+            logger.warning(
+                "Failed to read the migration history of %s", ", ".join(failed)
+            )
+        return statuses
+
+    async def _read_versioned_histories(
+        self, environments: List[str], host_concurrency: int
+    ) -> List[aio.Outcome]:
+        limiter = aio.HostLimiter(per_host=host_concurrency)
+        envs = {name: self.environment(name) for name in environments}
+        use_async = db.async_driver_available()
+        if not use_async and helper.engine_pool_enabled():
+            # sdm serve keeps a warm engine per environment
+
+            def read_pooled(name: str) -> List[model.MigrationHistoryDTO]:
+                return envs[name].read_versioned_history()
+
+            return await aio.for_each_environment(environments, read_pooled, limiter)
+
+        # the environments of a host share the connections of one engine
+        build = (
+            helper.build_async_host_engine_from_env
+            if use_async
+            else helper.build_host_engine_from_env
+        )
+        host_engines: Dict[Tuple[str, str, str], Any] = {}
+        for name in environments:
+            try:
+                key = helper.host_key_of(name)
+            except Exception:
+                # reported as the outcome of the environment by its read
+                continue
+            if key not in host_engines:
+                host_engines[key] = build(
+                    name, pool_size=host_concurrency, echo=cli_env.ALLOW_ECHO_SQL
                 )
-            if len(new_plans) > 0:
-                if dry_run:
-                    return applied_plans, new_plans
-                dao.add_one(new_plans[0], operator=operator, fake=fake)
-                dao.commit()
+        try:
+            if use_async:
 
-        dry_run_plans = new_plans[:]
-        while len(new_plans) > 0:
-            # migrate operation
-            if not fake:
-                self.migrator.forward(new_plans[0], self.args)
-            # update migration history and create new migration history if needed
-            with dao.session.begin():
-                latest_hist = dao.get_latest_versioned()
-                if latest_hist is None:
-                    raise Exception("Latest migration history not found")
-                if not latest_hist.can_match(
-                    new_plans[0].version, new_plans[0].name, new_plans[0].get_checksum()
-                ):
-                    raise Exception(
-                        f"Unexpected migration history, version={latest_hist.ver},"
-                        f" name={latest_hist.name}, checksum={latest_hist.checksum}"
+                async def read(name: str) -> List[model.MigrationHistoryDTO]:
+                    return await envs[name].read_versioned_history_async(
+                        host_engines[helper.host_key_of(name)]
                     )
-                if latest_hist.state != model.MigrationState.PROCESSING:
-                    raise Exception(
-                        "Unexpected migration history state,"
-                        f" version={latest_hist.ver}, name={latest_hist.name},"
-                        f" state={latest_hist.state}"
+
+            else:
+                # in worker threads, mysqlclient releases the GIL while it waits
+                def read(name: str) -> List[model.MigrationHistoryDTO]:
+                    return envs[name].read_versioned_history(
+                        host_engines[helper.host_key_of(name)]
                     )
-                dao.update_succ(new_plans[0], operator=operator, fake=fake)
-                applied_plans.append(new_plans[0])
-                new_plans = new_plans[1:]
-                if len(new_plans) > 0:
-                    dao.add_one(new_plans[0], operator=operator, fake=fake)
-                dao.commit()
 
-        return applied_plans, dry_run_plans
+            return await aio.for_each_environment(environments, read, limiter)
+        finally:
+            for engine in host_engines.values():
+                if use_async:
+                    await engine.dispose()
+                else:
+                    engine.dispose()
 
-    def migrate(self):
-        ver = (
-            self.args.version.zfill(4)
-            if ("version" in self.args) and (self.args.version is not None)
-            else None
+    def close(self):
+        for environment in self._environments.values():
+            environment.close()
+        self._environments = {}
+        if self._warm is not None:
+            helper.dispose_engine_pool()
+            self._warm.close()
+            self._warm = None
+
+    def __enter__(self) -> "Workspace":
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+    def osc(
+        self,
+        host: str,
+        port: int,
+        user: str,
+        schema: str,
+        table: str,
+        alter: str,
+        chunk_size: int = cli_env.ONLINE_ALTER_CHUNK_SIZE,
+        environment: Optional[str] = None,
+    ):
+        """
+        alter a table online, waiting for the replicas of environment between
+        chunks
+        """
+        engine = db.make_engine(
+            host=host,
+            port=port,
+            user=user,
+            password=cli_env.MYSQL_PWD,
+            schema=schema,
+            echo=cli_env.ALLOW_ECHO_SQL,
+            create_all_tables=False,
         )
-        name = self.args.name if "name" in self.args else None
-        fake = self.args.fake if "fake" in self.args else False
-        dry_run = self.args.dry_run if "dry_run" in self.args else False
-        operator = self.args.operator if "operator" in self.args else ""
+        replica_throttle = None
+        if environment:
+            replica_throttle = throttle.build_throttle_from_env(environment)
+        logger.info("Altering %s online: %s", table, alter)
+        try:
+            online_alter.OnlineAlter(
+                engine,
+                table,
+                alter,
+                chunk_size=chunk_size,
+                throttle=replica_throttle,
+            ).run()
+        finally:
+            if replica_throttle is not None:
+                replica_throttle.close()
+            engine.dispose()
 
-        if dry_run:
-            logger.info("Running in dry run mode, no migration will be executed")
+    def read_migration_plans(self) -> mp.MigrationPlanManager:
+        with tracing.span("plan.load") as s:
+            warm = self.warm_state()
+            self.mpm = mp.MigrationPlanManager() if warm is None else warm.plans()
+            if s is not None:
+                s.set("sdm.plans", self.mpm.count())
+                s.set("sdm.repeatable_plans", len(self.mpm.get_repeatable_plans()))
+        return self.mpm
 
-        self.read_migration_plans()
-        self._check_integrity()
+    def clean_cwd(self):
+        shutil.rmtree(cli_env.MIGRATION_CWD, ignore_errors=True)
 
-        logger.debug(
-            f"Migrate options: ver={ver}, name={name}, fake={fake}, dry_run={dry_run}"
+    def add_environment(
+        self, name: str, host: str = "127.0.0.1", port: int = 3306, user: str = "root"
+    ):
+        helper.call_skeema(
+            [
+                "add-environment",
+                name,
+                "--host",
+                host,
+                "--port",
+                str(port),
+                "--user",
+                user,
+                "-d",
+                cli_env.SCHEMA_DIR,
+                "--ignore-table",
+                cli_env.TABLE_MIGRATION_HISTORY,
+            ]
         )
 
-        # versioned migration
-        (applied_plans, dry_run_plans) = self._migrate_versioned(
-            ver, name, fake, dry_run, operator=operator
+    def _init_migration_plan_dir(self):
+        os.makedirs(
+            os.path.join(cli_env.MIGRATION_CWD, cli_env.MIGRATION_PLAN_DIR),
+            exist_ok=False,
         )
-        # repeatable migration
-        dry_run_repeatable_plans = self._migrate_repeatable(
-            applied_plans, ver, name, fake, dry_run, operator=operator
+
+    def _init_schema_dir(self, host: str, port: int, user: str, schema: str):
+        # init schema dir
+        helper.call_skeema(
+            [
+                "init",
+                "--host",
+                host,
+                "--port",
+                str(port),
+                "--user",
+                user,
+                "--schema",
+                schema,
+                "-d",
+                cli_env.SCHEMA_DIR,
+                "--ignore-table",
+                cli_env.TABLE_MIGRATION_HISTORY,
+            ]
         )
 
-        if dry_run:
-            logger.info("Migration plans to execute:")
-            self.print_dry_run(
-                dry_run_plans + dry_run_repeatable_plans, is_migrate=True
+    def _init_schema_store_dir(self):
+        os.makedirs(
+            os.path.join(cli_env.MIGRATION_CWD, cli_env.SCHEMA_STORE_DIR),
+            exist_ok=False,
+        )
+        hex_list = [format(i, "02x") for i in range(256)]
+        for hex in hex_list:
+            hex_dir_path = os.path.join(
+                cli_env.MIGRATION_CWD, cli_env.SCHEMA_STORE_DIR, hex
+            )
+            os.makedirs(
+                hex_dir_path,
+                exist_ok=False,
             )
+            with open(os.path.join(hex_dir_path, ".gitkeep"), "w") as f:
+                f.write("")
 
-    def _migrate_repeatable(
-        self,
-        applied_histories: List[model.MigrationHistory],
-        ver: str,
-        name: str,
-        fake: bool,
-        dry_run: bool,
-        operator: str = "",
-    ) -> List[mp.MigrationPlan]:
-        if fake:
-            # no need to execute repeatable migration in fake mode
-            return []
+    def _init_file_existence_check(self):
+        helper.check_file_existence(
+            [
+                os.path.join(cli_env.MIGRATION_CWD, cli_env.SCHEMA_DIR),
+                os.path.join(cli_env.MIGRATION_CWD, cli_env.MIGRATION_PLAN_DIR),
+                os.path.join(cli_env.MIGRATION_CWD, cli_env.DATA_DIR),
+                os.path.join(cli_env.MIGRATION_CWD, cli_env.SCHEMA_STORE_DIR),
+                os.path.join(cli_env.MIGRATION_CWD, ".gitignore"),
+                os.path.join(cli_env.MIGRATION_CWD, "pre-commit"),
+                os.path.join(cli_env.MIGRATION_CWD, "package.json"),
+                os.path.join(cli_env.MIGRATION_CWD, "tsconfig.json"),
+                os.path.join(cli_env.MIGRATION_CWD, ".env"),
+            ]
+        )
 
-        if dry_run:
-            # since it's dry_run, assume the target version is the latest version
-            if ver is not None:
-                applied_plans = self.mpm.must_get_plan_between(
-                    0, mp.MigrationSignature(version=ver, name=name)
-                )
-            else:
-                applied_plans = self.mpm.get_plans()
-            to_execute_plans = self._get_to_execute_repeatable_plans(applied_plans)
-            return to_execute_plans
+    def init(
+        self,
+        schema: str,
+        host: str = "127.0.0.1",
+        port: int = 3306,
+        user: str = "root",
+        author: str = "",
+    ):
+        self._init_file_existence_check()
+        self._init_migration_plan_dir()
+        self._init_schema_dir(host, port, user, schema)
+        self._init_schema_store_dir()
 
-        to_execute_plans = self._get_to_execute_repeatable_plans(applied_histories)
-        if len(to_execute_plans) == 0:
-            logger.debug("No valid repeatable migration to execute")
-            return []
+        # move schema files to schema store
+        sql_files, index_sha1, index_content = self.read_sql_files()
+        self.write_schema_store_index(index_sha1, index_content, sql_files)
 
-        dao = self.dao
-        for plan in to_execute_plans:
-            # try get the migration history
-            with dao.session.begin():
-                hist = dao.get_by_sig(plan.sig())
-                if hist is None:
-                    dao.add_one(plan, operator=operator, fake=fake)
-                else:
-                    # no need to check if state is SUCCESSFUL,
-                    #   because it is repeatable migration
-                    # just treat updating PROCESSING to PROCESSING
-                    #   as retry the migration
-                    dao.update_processing(plan, operator=operator, fake=fake)
-                dao.commit()
-            # execute the migration
-            self.migrator.forward(plan, self.args)
+        # init first migration plan
+        init_plan = mp.MigrationPlan(
+            version=mp.InitialMigrationSignature.version,
+            name=mp.InitialMigrationSignature.name,
+            author=author,
+            type=mp.Type.SCHEMA,
+            change=mp.Change(forward=mp.SchemaForward(id=index_sha1), backward=None),
+            dependencies=[],
+        )
+        init_plan.save()
 
-            with dao.session.begin():
-                dao.update_succ(plan, operator=operator, fake=fake)
-                dao.commit()
-        return to_execute_plans
+        # make data dir
+        os.makedirs(os.path.join(cli_env.MIGRATION_CWD, cli_env.DATA_DIR))
 
-    def _get_to_execute_repeatable_plans(
-        self, applied_plans: List[mp.MigrationPlan]
-    ) -> List[mp.MigrationPlan]:
-        # get repeatable migration plans
-        plans = self.mpm.get_repeatable_plans()
-        # check if repeatable migration can be executed
-        to_execute_plans: List[mp.MigrationPlan] = []
-        for p in plans:
-            if p.dependencies is not None and len(p.dependencies) > 0:
-                dep_sig = p.dependencies[0]
-                # check if dep_sig is in applied_histories
-                if not any(ap.match(dep_sig) for ap in applied_plans):
-                    logger.warning(
-                        "repeatable migration %s is not executed because dependency %s"
-                        " is not applied",
-                        p,
-                        dep_sig,
-                    )
-                    continue
+        # create gitignore
+        with open(os.path.join(cli_env.MIGRATION_CWD, ".gitignore"), "w") as f:
+            f.write(cli_env.SAMPLE_GIT_IGNORE)
 
-            if p.ignore_after is not None:
-                ignore_sig = p.ignore_after
-                # check if ignore_sig is in applied_histories
-                if any(ap.match(ignore_sig) for ap in applied_plans):
-                    logger.debug(
-                        "Repeatable migration %s is not executed because ignore_after"
-                        " %s is applied",
-                        p,
-                        ignore_sig,
+        # create pre-commit hook
+        with open(os.path.join(cli_env.MIGRATION_CWD, "pre-commit"), "w") as f:
+            f.write(cli_env.SAMPLE_PRE_COMMIT)
+
+        # create dot env file
+        dot_env_file_path = os.path.join(cli_env.MIGRATION_CWD, ".env")
+        with open(dot_env_file_path, "w") as f:
+            f.write(cli_env.SAMPLE_DOT_ENV % cli_env.MYSQL_PWD)
+            logger.info("MYSQL_WD is saved in .env file, path=%s", dot_env_file_path)
+
+        # create package.json
+        with open(os.path.join(cli_env.MIGRATION_CWD, "package.json"), "w") as f:
+            f.write(cli_env.SAMPLE_PCKAGE_JSON)
+
+        # create tsconfig.json
+        with open(os.path.join(cli_env.MIGRATION_CWD, "tsconfig.json"), "w") as f:
+            f.write(cli_env.SAMPLE_TSCONFIG_JSON)
+
+    def read_sql_files(self) -> Tuple[List[mp.SQLFile], str, str]:
+        """
+        read sql files from schema dir, and return the index sha1 and content
+        """
+        sql_files: List[mp.SQLFile] = []
+        for file in os.listdir(os.path.join(cli_env.MIGRATION_CWD, cli_env.SCHEMA_DIR)):
+            if file.endswith(".sql"):
+                with open(
+                    os.path.join(cli_env.MIGRATION_CWD, cli_env.SCHEMA_DIR, file)
+                ) as f:
+                    content = f.read()
+                    sha1 = self.sha1_encode(content)
+                    sql_files.append(mp.SQLFile(file, content, sha1))
+        sql_files.sort(key=lambda x: x.sha1)
+        index_sha1 = self.sha1_encode([sql_file.sha1 for sql_file in sql_files])
+        index_content = "\n".join([f"{f.sha1}:{f.name}" for f in sql_files])
+        return sql_files, index_sha1, index_content
+
+    def make_repeatable_migration(
+        self,
+        name: str,
+        data_change_type: str,
+        author: str = "",
+        parallel_group: Optional[str] = None,
+        conflicts_with: Optional[List[str]] = None,
+    ) -> str:
+        if not mp.DataChangeType.is_valid(data_change_type):
+            raise Exception(f"Invalid type {data_change_type}")
+        self.read_migration_plans()
+        if self.mpm.count() == 0:
+            raise Exception(
+                "Initial migration plan is not found, please run init command"
+            )
+        next_plan = mp.MigrationPlan(
+            version=mp.RepeatableVersion,
+            name=name,
+            author=author,
+            type=mp.Type.REPEATABLE,
+            change=mp.Change(
+                forward=mp.DataForward(type=data_change_type),
+                backward=None,
+            ),
+            dependencies=[],
+            ignore_after=None,
+            parallel_group=parallel_group,
+            conflicts_with=conflicts_with or None,
+        )
+
+        match data_change_type:
+            case mp.DataChangeType.SQL:
+                next_plan.change.forward.sql = (
+                    "INSERT INTO `testtable` (`id`, `name`) VALUES (1, 'foo.bar') ON"
+                    " DUPLICATE KEY UPDATE `name` = 'foo.bar';"
+                )
+            case mp.DataChangeType.SQL_FILE:
+                next_plan.change.forward.file = "your_sql_file.sql"
+            case mp.DataChangeType.PYTHON:
+                next_plan.change.forward.file = "your_python_file.py"
+                logger.info("Sample python file:\n%s", cli_env.SAMPLE_PYTHON_FILE)
+            case mp.DataChangeType.SHELL:
+                next_plan.change.forward.file = "your_shell_file.sh"
+                logger.info("Sample shell file:\n%s", cli_env.SAMPLE_SHELL_FILE)
+            case mp.DataChangeType.TYPESCRIPT:
+                next_plan.change.forward.file = "your_typescript_file.ts"
+                logger.info("Sample typescript file:\n%s", cli_env.SAMPLE_MIGRATION_TS)
+            case mp.DataChangeType.BULK_LOAD:
+                next_plan.change.forward.file = "your_data_file.csv"
+                next_plan.change.forward.table = "testtable"
+
+        return next_plan.save()
+
+    def make_data_migration(
+        self, name: str, data_change_type: str, author: str = ""
+    ) -> str:
+        if not mp.DataChangeType.is_valid(data_change_type):
+            raise Exception(f"Invalid type {data_change_type}")
+        self.read_migration_plans()
+        if self.mpm.count() == 0:
+            raise Exception(
+                "Initial migration plan is not found, please run init command"
+            )
+        latest_plan = self.mpm.get_latest_plan()
+        next_plan = mp.MigrationPlan(
+            version=self.bump_version(latest_plan.version),
+            name=name,
+            author=author,
+            type=mp.Type.DATA,
+            change=mp.Change(
+                forward=mp.DataForward(type=data_change_type),
+                backward=None,
+            ),
+            dependencies=[
+                mp.MigrationSignature(
+                    version=latest_plan.version, name=latest_plan.name
+                )
+            ],
+        )
+
+        match data_change_type:
+            case mp.DataChangeType.SQL:
+                next_plan.change.forward.sql = (
+                    "INSERT INTO `testtable` (`id`, `name`) VALUES (1, 'foo.bar');"
+                )
+            case mp.DataChangeType.SQL_FILE:
+                next_plan.change.forward.file = "your_sql_file.sql"
+            case mp.DataChangeType.PYTHON:
+                next_plan.change.forward.file = "your_python_file.py"
+                logger.info("Sample python file:\n%s", cli_env.SAMPLE_PYTHON_FILE)
+            case mp.DataChangeType.SHELL:
+                next_plan.change.forward.file = "your_shell_file.sh"
+                logger.info("Sample shell file:\n%s", cli_env.SAMPLE_SHELL_FILE)
+            case mp.DataChangeType.TYPESCRIPT:
+                next_plan.change.forward.file = "your_typescript_file.ts"
+                logger.info("Sample typescript file:\n%s", cli_env.SAMPLE_MIGRATION_TS)
+            case mp.DataChangeType.BULK_LOAD:
+                next_plan.change.forward.file = "your_data_file.csv"
+                next_plan.change.forward.table = "testtable"
+
+        return next_plan.save()
+
+    def bump_version(self, version: str):
+        next_version = int(version) + 1
+        return str(next_version).zfill(4)
+
+    def make_schema_migration(self, name: str, author: str = "") -> str:
+        self.read_migration_plans()
+        if self.mpm.count() == 0:
+            raise Exception(
+                "Initial migration plan is not found, please run init command"
+            )
+        latest_plan = self.mpm.get_latest_plan()
+        latest_schema_plan = self.mpm.get_latest_plan(mp.Type.SCHEMA)
+
+        latest_schema_index_sha1 = latest_schema_plan.change.forward.id
+        sql_files, index_sha1, index_content = self.read_sql_files()
+        if latest_schema_index_sha1 == index_sha1:
+            logger.info("No schema change")
+            return
+        new_plan = mp.MigrationPlan(
+            version=self.bump_version(latest_plan.version),
+            name=name,
+            author=author,
+            type=mp.Type.SCHEMA,
+            change=mp.Change(
+                forward=mp.SchemaForward(id=index_sha1),
+                backward=mp.SchemaBackward(id=latest_schema_index_sha1),
+            ),
+            dependencies=[
+                mp.MigrationSignature(
+                    version=latest_plan.version, name=latest_plan.name
+                )
+            ],
+        )
+        # hold the store lock until the plan referencing the new objects is saved,
+        #   otherwise a concurrent clean store may collect them
+        with store_gc.store_lock():
+            self.write_schema_store_index(index_sha1, index_content, sql_files)
+            return new_plan.save()
+
+    def write_schema_store(self, sha1: str, content: str):
+        helper.write_sha1_file(sha1, content)
+
+    def write_schema_store_index(
+        self, index_sha1: str, index_content: str, sql_files: List[mp.SQLFile]
+    ):
+        self.write_schema_store(index_sha1, index_content)
+        for f in sql_files:
+            self.write_schema_store(f.sha1, f.content)
+        gc = store_gc.SchemaStoreGC()
+        gc.record_written(index_sha1, [f.sha1 for f in sql_files])
+        gc.save_state()
+
+    def sha1_encode(self, str_list: List[str]):
+        return helper.sha1_encode(str_list=str_list)
+
+    def skeema(self, raw_args: List[str], cwd: str = cli_env.SDM_SCHEMA_DIR):
+        # https://stackoverflow.com/questions/39872088/executing-interactive-shell-script-in-python
+        return helper.call_skeema(raw_args, cwd)
+
+    def _print_info_as_table(
+        self, prompt: str, output: List[List[str]], headers: List[str]
+    ):
+        if len(output) == 0:
+            return
+        logger.info(
+            prompt
+            + "\n"
+            + tabulate(
+                output,
+                headers=headers,
+                tablefmt="orgtbl",
+            )
+        )
+
+    def pull(self, env_or_version: str):
+        self.read_migration_plans()
+        argtype = self._get_diff_type(env_or_version)
+        if argtype == mp.DiffItemType.ENVIRONMENT:
+            self.skeema(["pull", env_or_version])
+            return
+        if argtype == mp.DiffItemType.VERSION:
+            schema_dir_path = os.path.join(cli_env.MIGRATION_CWD, cli_env.SCHEMA_DIR)
+            schema_dir_files = helper.files_under_dir(schema_dir_path, ".sql")
+
+            with tempfile.TemporaryDirectory() as temp_dir:
+                self.dump_schema(env_or_version, argtype, temp_dir, mkdir=False)
+                ver_files = helper.files_under_dir(temp_dir, ".sql")
+
+                # move file under temp_dir to schema dir
+                for filename, filepath in ver_files.items():
+                    shutil.move(
+                        filepath,
+                        os.path.join(schema_dir_path, filename),
                     )
-                    continue
+                    logger.info("Updated %s", os.path.join(schema_dir_path, filename))
 
-            hist_dto = self.dao.get_by_sig_dto(p.sig())
-            if (
-                hist_dto is not None
-                and hist_dto.checksum == p.get_checksum()
-                and hist_dto.state == model.MigrationState.SUCCESSFUL
-                and (
-                    p.change.forward.precheck is None
-                    or p.change.forward.precheck.type == mp.DataChangeType.SQL
-                    or p.change.forward.precheck.type == mp.DataChangeType.SQL_FILE
+                # delete files in schema dir that are not in temp_dir
+                to_delete_files = set(schema_dir_files.keys()) - set(ver_files.keys())
+                for filename in to_delete_files:
+                    os.remove(schema_dir_files[filename])
+                    logger.info("Deleted %s", schema_dir_files[filename])
+
+        else:
+            raise Exception(
+                f"Invalid argument, {env_or_version} is neither environment nor version"
+            )
+
+    def diff(self, left: str, right: str, verbose: bool = False):
+        """
+        raise if the schema of left and right differ, they are HEAD, a
+        version or an environment
+        """
+        if left == right:
+            return
+        self.read_migration_plans()
+        left_type = self._get_diff_type(left)
+        right_type = self._get_diff_type(right)
+
+        with tempfile.TemporaryDirectory() as temp_dir:
+            left_dump_dir_path = os.path.join(temp_dir, "left")
+            right_dump_dir_path = os.path.join(temp_dir, "right")
+
+            async def dump_both():
+                # the pulls of environments overlap
+                await asyncio.gather(
+                    self.dump_schema_async(left, left_type, left_dump_dir_path),
+                    self.dump_schema_async(right, right_type, right_dump_dir_path),
                 )
-            ):
-                logger.debug(
-                    "Repeatable migration %s is not executed because it has been"
-                    " executed",
-                    p,
+
+            aio.run(dump_both())
+
+            has_diff = False
+            if not verbose:
+                cmd = shlex.split("diff --recursive --brief left right")
+            else:
+                cmd = shlex.split("diff --color -Nr -U4 left right")
+            try:
+                with tracing.subprocess_span(cmd):
+                    subprocess.check_call(cmd, cwd=temp_dir)
+            except subprocess.CalledProcessError:
+                has_diff = True
+
+            if has_diff:
+                raise Exception(f"Difference found between {left} and {right}")
+
+    def dump_schema(
+        self,
+        diff_arg: str,
+        diff_type: mp.DiffItemType,
+        dump_dir_path: str,
+        mkdir: bool = True,
+    ):
+        aio.run(self.dump_schema_async(diff_arg, diff_type, dump_dir_path, mkdir))
+
+    async def dump_schema_async(
+        self,
+        diff_arg: str,
+        diff_type: mp.DiffItemType,
+        dump_dir_path: str,
+        mkdir: bool = True,
+    ):
+        if mkdir:
+            os.makedirs(dump_dir_path, exist_ok=False)
+
+        if diff_type == mp.DiffItemType.HEAD:
+            original_path = os.path.join(cli_env.MIGRATION_CWD, cli_env.SCHEMA_DIR)
+            for file in os.listdir(original_path):
+                if file.endswith(".sql"):
+                    shutil.copy(
+                        os.path.join(original_path, file),
+                        os.path.join(dump_dir_path, file),
+                    )
+            return
+        if diff_type == mp.DiffItemType.VERSION:
+            if diff_arg.isdigit():
+                diff_arg = diff_arg.zfill(4)
+                target_plan, _ = self.mpm.must_get_plan_by_signature(
+                    mp.MigrationSignature(diff_arg, None)
+                )
+            else:
+                split = diff_arg.split("_")
+                ver = split[0]
+                name = "_".join(split[1:])
+                target_plan, _ = self.mpm.must_get_plan_by_signature(
+                    mp.MigrationSignature(ver, name)
+                )
+
+            if target_plan.type != mp.Type.SCHEMA:
+                raise Exception(f"Not schema migration plan, version={diff_arg}")
+            index_sha1 = target_plan.change.forward.id
+            self.copy_schema_by_index(index_sha1, dump_dir_path)
+            return
+        if diff_type == mp.DiffItemType.ENVIRONMENT:
+            env_ini = helper.parse_env_ini()
+            env = diff_arg
+            if not env_ini.has_section(env):
+                raise Exception(f"Environment not found, name={env}")
+            skeema_file_path = os.path.join(
+                cli_env.MIGRATION_CWD, cli_env.SCHEMA_DIR, ".skeema"
+            )
+            shutil.copy(skeema_file_path, dump_dir_path)
+            await aio.call_skeema(["pull", env], cwd=dump_dir_path)
+            os.remove(os.path.join(dump_dir_path, ".skeema"))
+            return
+
+    def _get_diff_type(self, name: str) -> mp.DiffItemType:
+        if name == "HEAD":
+            return mp.DiffItemType.HEAD
+        if name.isdigit():
+            return mp.DiffItemType.VERSION
+        split = name.split("_")
+        if len(split) > 1 and split[0].isdigit():
+            return mp.DiffItemType.VERSION
+        else:
+            return mp.DiffItemType.ENVIRONMENT
+
+    def read_schema_index(
+        self, sha1: str, check_sha: bool = False
+    ) -> List[Tuple[str, str]]:
+        index_file = helper.sha1_to_path(sha1)
+        with open(index_file, "r") as f:
+            lines = f.readlines()
+        if check_sha:
+            actual_sha1 = self.sha1_encode([x.split(":")[0] for x in lines])
+            if actual_sha1 != sha1:
+                raise err.IntegrityError(
+                    f"schema index sha1 not match, actual_sha1={actual_sha1},"
+                    f" expected_sha1={sha1}"
                 )
-                continue
+        return [
+            (line.split(":")[0], line.split(":")[1].strip()) for line in lines
+        ]  # sha1, filename
 
-            p.set_checksum_match(
-                hist_dto.checksum == p.get_checksum()
-                if hist_dto is not None and hist_dto.checksum is not None
-                else False
+    def copy_schema_by_index(self, sha1: str, temp_dir: str):
+        for sha1, sql_filename in self.read_schema_index(sha1):
+            sql_filepath = helper.sha1_to_path(sha1)
+            shutil.copy(
+                sql_filepath,
+                os.path.join(temp_dir, sql_filename),
             )
-            to_execute_plans.append(p)
-        return to_execute_plans
 
-    def _rollback_repeatable_migration(
+    def clean_schema_store(
         self,
-        to_rollback_plan: mp.MigrationPlan,
-        inverse_dependencies: Dict[mp.MigrationSignature, List[mp.MigrationSignature]],
-        fake: bool = False,
-        operator: str = "",
-    ):
-        if to_rollback_plan.sig() not in inverse_dependencies:
-            return
-        dao = self.dao
-        for sig in inverse_dependencies[to_rollback_plan.sig()]:
-            plan = self.mpm.must_get_repeatable_plan_by_signature(sig)
-            with dao.session.begin():
-                hist = dao.get_by_sig(sig)
-                if hist is None:
-                    logger.debug(f"Migration history not found, so skip rollback {sig}")
-                    continue
-                # no need to check if state is SUCCESSFUL,
-                #   because it is repeatable migration
-                dao.update_rollback(plan, operator=operator, fake=fake)
-                dao.commit()
-            # execute the migration
-            if not fake:
-                self.migrator.backward(plan, self.args)
-
-            with dao.session.begin():
-                dao.delete(plan, operator=operator, fake=fake)
-                dao.commit()
-
-    def rollback(self):
+        dry_run: bool = False,
+        skip_integrity: bool = False,
+        max_time: Optional[float] = None,
+    ) -> List[str]:
         self.read_migration_plans()
-        self._check_integrity()
-        ver = self.args.version.zfill(4)
-        name = self.args.name if "name" in self.args else None
-        fake = self.args.fake if "fake" in self.args else False
-        dry_run = self.args.dry_run if "dry_run" in self.args else False
-        operator = self.args.operator if "operator" in self.args else ""
-        _, target_migration_plan_index = self.mpm.must_get_plan_by_signature(
-            mp.MigrationSignature(ver, name)
+        if not skip_integrity:
+            self._check_integrity()
+        return self._clean_schema_store(dry_run=dry_run, max_time=max_time)
+
+    def _clean_schema_store(
+        self, dry_run: bool, max_time: Optional[float] = None
+    ) -> List[str]:
+        schema_store_path = os.path.join(
+            cli_env.MIGRATION_CWD, cli_env.SCHEMA_STORE_DIR
         )
 
-        dao = self.build_dao()
-        with dao.session.begin():
-            migration_histories = self._get_and_check_versioned_migration_histories()
+        # get all valid index sha1s in schema store
+        schema_plans = self.mpm.get_plans_by_type(mp.Type.SCHEMA)
+        valid_index_sha1s = set()
+        for plan in schema_plans:
+            if plan.change.forward is not None:
+                valid_index_sha1s.add(plan.change.forward.id)
+            if plan.change.backward is not None:
+                valid_index_sha1s.add(plan.change.backward.id)
 
-            latest_migration_plan_index = len(migration_histories) - 1
+        with store_gc.store_lock():
+            gc = store_gc.SchemaStoreGC()
+            unexpected_paths = gc.collect(
+                valid_index_sha1s, dry_run=dry_run, max_time=max_time
+            )
 
-            if target_migration_plan_index > latest_migration_plan_index:
-                raise Exception("Target migration plan is not applied yet")
-            elif target_migration_plan_index == latest_migration_plan_index:
+        if dry_run:
+            for p in unexpected_paths:
+                logger.warning(
+                    "Unexpected file: %s", os.path.join(schema_store_path, p)
+                )
+        return unexpected_paths
+
+    # This method performs a basic check on the integrity of the migration plans.
+    # It reads the migration plans and checks that:
+    #   - For schema migrations, the index file and linked SQL file exist.
+    #       If not in fast mode, it also checks that the SHA1 is correct.
+    #   - For data migrations, check the sql is not empty or the file exist.
+    def check_integrity(self, fast: bool = False):
+        self.read_migration_plans()
+        self._check_integrity(fast=fast)
+
+    def _check_integrity(self, fast: bool = False):
+        warm = self.warm_state()
+        if warm is not None:
+            if warm.integrity_checked(fast):
+                logger.info("Integrity is checked, the workspace has not changed since")
                 return
+            generation = warm.generation
+        with tracing.span("integrity.check", {"sdm.fast": fast}):
+            checked_schema_index_sha = set()
+            for plan in self.mpm.get_plans():
+                if plan.type == mp.Type.SCHEMA:
+                    self._check_schema_migration(
+                        plan,
+                        fast=fast,
+                        checked_schema_index_sha=checked_schema_index_sha,
+                    )
+                elif plan.type == mp.Type.DATA:
+                    self._check_data_migration(plan)
+                else:
+                    raise err.IntegrityError(f"unknown type, type={plan.type}")
+            for plan in self.mpm.get_repeatable_plans():
+                self._check_data_migration(plan)
+        if warm is not None:
+            warm.set_integrity_checked(fast, generation)
 
-            to_rollback_versioned_plans = self.mpm.must_get_plan_between(
-                target_migration_plan_index + 1, latest_migration_plan_index
-            )
+    def _check_schema_migration(
+        self,
+        plan: mp.MigrationPlan,
+        fast: bool = False,
+        checked_schema_index_sha: Set[str] = None,
+    ):
+        if plan.change.forward is None:
+            raise err.IntegrityError(f"forward is None, {plan}")
 
-            # get repeatable migration plans to rollback
-            to_rollback_plans_dry_run_print: List[mp.MigrationPlan] = []
-            inverse_dependencies = self.mpm.get_repeatable_plan_inverse_dependencies()
-            for trp in to_rollback_versioned_plans:
-                to_rollback_plans_dry_run_print.append(trp)
-                if trp.sig() in inverse_dependencies:
-                    # check if the repeatable migration has been applied
-                    if dao.get_by_sig(trp.sig()) is not None:
-                        for sig in inverse_dependencies[trp.sig()]:
-                            to_rollback_plans_dry_run_print.append(
-                                self.mpm.must_get_repeatable_plan_by_signature(sig)
-                            )
+        index_sha1 = plan.change.forward.id
+        self._check_schema_by_index(index_sha1, plan, check_sha=not fast)
 
-            if len(to_rollback_versioned_plans) > 0:
-                if dry_run:
-                    logger.info("Migration plans to rollback:")
-                    self.print_dry_run(
-                        to_rollback_plans_dry_run_print,
-                        is_migrate=False,
-                    )
-                    return
+        if plan.match(mp.InitialMigrationSignature):
+            return
 
-                dao.update_rollback(
-                    to_rollback_versioned_plans[-1], operator=operator, fake=fake
+        if plan.change.backward is None:
+            raise err.IntegrityError(f"backward is None, {plan}")
+        index_sha1 = plan.change.backward.id
+        if index_sha1 in checked_schema_index_sha:
+            return
+        self._check_schema_by_index(index_sha1, plan, check_sha=not fast)
+
+    def _check_schema_by_index(
+        self, index_sha1: str, plan: mp.MigrationPlan, check_sha: bool = True
+    ):
+        try:
+            sql_files = self.read_schema_index(index_sha1, check_sha=check_sha)
+        except FileNotFoundError:
+            raise err.IntegrityError(
+                f"index file not found, {plan}, missing file:"
+                f" {helper.sha1_to_path(index_sha1)}"
+            )
+        # check sql file exist
+        for sql_sha1, sql_filename in sql_files:
+            sql_file_path = helper.sha1_to_path(sql_sha1)
+            if not os.path.exists(sql_file_path):
+                raise err.IntegrityError(
+                    f"sql file not found, {plan},"
+                    f" id={sql_sha1}, original filename={sql_filename}"
                 )
-                dao.commit()
+            if check_sha:
+                with open(sql_file_path, "r") as f:
+                    content = f.read()
+                    actual_sha1 = self.sha1_encode([content])
+                    if actual_sha1 != sql_sha1:
+                        raise err.IntegrityError(
+                            f"sql file SHA1 not match, {plan},"
+                            f" original filename={sql_filename},"
+                            f" expected_sha1={sql_sha1}, actual_sha1={actual_sha1},"
+                            f" file={sql_file_path}"
+                        )
 
-        while len(to_rollback_versioned_plans) > 0:
-            # before rollback versioned migration
-            # check if repeatable migration which dependents on it should be rollbacked
-            self._rollback_repeatable_migration(
-                to_rollback_versioned_plans[-1],
-                inverse_dependencies,
-                fake=fake,
-                operator=operator,
+    def _check_data_migration(self, plan: mp.MigrationPlan):
+        if plan.match(mp.InitialMigrationSignature):
+            raise err.IntegrityError(
+                f"initial migration plan should not be data migration, {plan}"
             )
 
-            # rollback operation
-            if not fake:
-                self.migrator.backward(to_rollback_versioned_plans[-1], self.args)
+        if plan.change.forward is None:
+            raise err.IntegrityError(f"forward is None, {plan}")
 
-            with dao.session.begin():
-                latest_hist = dao.get_latest_versioned()
-                if latest_hist is None:
-                    raise Exception("Latest migration history not found")
-                if not latest_hist.can_match(
-                    to_rollback_versioned_plans[-1].version,
-                    to_rollback_versioned_plans[-1].name,
-                    to_rollback_versioned_plans[-1].get_checksum(),
-                ):
-                    raise Exception(
-                        f"Unexpected migration history, version={latest_hist.ver},"
-                        f" name={latest_hist.name}, checksum={latest_hist.checksum}"
-                    )
-                if latest_hist.state != model.MigrationState.ROLLBACKING:
-                    raise Exception(
-                        "Unexpected migration history state,"
-                        f" version={latest_hist.ver}, name={latest_hist.name},"
-                        f" state={latest_hist.state}"
-                    )
-                dao.delete(
-                    to_rollback_versioned_plans[-1], operator=operator, fake=fake
+        def check_data_file(file: str):
+            if file is None or file == "":
+                raise err.IntegrityError(
+                    f"data migration file is empty, file={file}, {plan}"
                 )
-                to_rollback_versioned_plans = to_rollback_versioned_plans[:-1]
-                if len(to_rollback_versioned_plans) > 0:
-                    dao.update_rollback(
-                        to_rollback_versioned_plans[-1], operator=operator, fake=fake
-                    )
-                dao.commit()
-
-    def _clear(self):
-        logger.warning("Clearing database...")
-        dao = self.build_dao()
-        schema = dao.session.bind.url.database
-        with dao.session.begin():
-            dao.session.execute(text("SET FOREIGN_KEY_CHECKS=0;"))
-            rows = dao.session.execute(
-                text(
-                    "select table_name from information_schema.tables where"
-                    f" TABLE_SCHEMA = '{schema}';"
+            if not os.path.exists(
+                os.path.join(cli_env.MIGRATION_CWD, cli_env.DATA_DIR, file)
+            ):
+                raise err.IntegrityError(
+                    f"data migration file not found, file={file}, {plan}"
                 )
-            ).all()
-            for [table_name] in rows:
-                dao.session.execute(text(f"drop table `{table_name}`;"))
-            dao.session.execute(text("SET FOREIGN_KEY_CHECKS=1;"))
-            dao.commit()
-        logger.warning("Database cleared")
 
-    def read_migration_plans(self) -> mp.MigrationPlanManager:
-        self.mpm = mp.MigrationPlanManager()
-        return self.mpm
+        def check_forward_or_backward(
+            change: Optional[mp.DataForward | mp.DataBackward],
+        ):
+            if change.type == mp.DataChangeType.SQL:
+                if change.sql is None or change.sql == "":
+                    raise err.IntegrityError(f"sql is empty, {plan}")
 
-    def clean_cwd(self):
-        shutil.rmtree(cli_env.MIGRATION_CWD, ignore_errors=True)
+            if (
+                change.type == mp.DataChangeType.SQL_FILE
+                or change.type == mp.DataChangeType.PYTHON
+                or change.type == mp.DataChangeType.SHELL
+                or change.type == mp.DataChangeType.TYPESCRIPT
+            ):
+                check_data_file(change.file)
 
-    def add_environment(self):
-        helper.call_skeema(
-            [
-                "add-environment",
-                self.args.environment,
-                "--host",
-                self.args.host,
-                "--port",
-                str(self.args.port),
-                "--user",
-                self.args.user,
-                "-d",
-                cli_env.SCHEMA_DIR,
-                "--ignore-table",
-                cli_env.TABLE_MIGRATION_HISTORY,
-            ]
-        )
+            if change.type == mp.DataChangeType.BULK_LOAD:
+                check_data_file(change.file)
+                if not change.table:
+                    raise err.IntegrityError(f"bulk load table is empty, {plan}")
+                if not change.file.endswith(bulk_load.SUPPORTED_EXTENSIONS):
+                    raise err.IntegrityError(
+                        f"bulk load file must be csv or parquet, file={change.file},"
+                        f" {plan}"
+                    )
+
+        check_forward_or_backward(plan.change.forward)
 
-    def _init_migration_plan_dir(self):
-        os.makedirs(
-            os.path.join(cli_env.MIGRATION_CWD, cli_env.MIGRATION_PLAN_DIR),
-            exist_ok=False,
-        )
+        if plan.change.backward is not None:
+            check_forward_or_backward(plan.change.backward)
 
-    def _init_schema_dir(self):
-        # init schema dir
-        helper.call_skeema(
-            [
-                "init",
-                "--host",
-                self.args.host,
-                "--port",
-                str(self.args.port),
-                "--user",
-                self.args.user,
-                "--schema",
-                self.args.schema,
-                "-d",
-                cli_env.SCHEMA_DIR,
-                "--ignore-table",
-                cli_env.TABLE_MIGRATION_HISTORY,
-            ]
-        )
+    def test_gen(
+        self,
+        test_type: str,
+        output_file_path: str = "test_plan.json",
+        walk_len: Optional[int] = None,
+        start: str = "",
+        important: str = "",
+        non_important: str = "",
+        output_format: str = consts.OUTPUT_FORMAT_JSON,
+    ):
+        """
+        write the test plan to output_file_path, with jsonl or csv a plan per
+        line as they are generated
+        """
+        atp = auto_test_plan.AutoTestPlan()
 
-    def _init_schema_store_dir(self):
-        os.makedirs(
-            os.path.join(cli_env.MIGRATION_CWD, cli_env.SCHEMA_STORE_DIR),
-            exist_ok=False,
+        test_plan = atp.iter_gen(
+            test_type=test_type,
+            walk_len=walk_len,
+            start=start,
+            important=important,
+            non_important=non_important,
         )
-        hex_list = [format(i, "02x") for i in range(256)]
-        for hex in hex_list:
-            hex_dir_path = os.path.join(
-                cli_env.MIGRATION_CWD, cli_env.SCHEMA_STORE_DIR, hex
+        if output_format in consts.STREAM_OUTPUT_FORMAT:
+            with open(output_file_path, "w") as f:
+                with report.RowWriter(
+                    output_format, [auto_test_plan.TEST_PLAN_HEADER], f
+                ) as writer:
+                    for plan in test_plan:
+                        writer.write([plan])
+            logger.info(
+                "Test plan of %d steps is saved to %s", writer.count, output_file_path
             )
-            os.makedirs(
-                hex_dir_path,
-                exist_ok=False,
-            )
-            with open(os.path.join(hex_dir_path, ".gitkeep"), "w") as f:
-                f.write("")
+            return
 
-    def _init_file_existence_check(self):
-        helper.check_file_existence(
-            [
-                os.path.join(cli_env.MIGRATION_CWD, cli_env.SCHEMA_DIR),
-                os.path.join(cli_env.MIGRATION_CWD, cli_env.MIGRATION_PLAN_DIR),
-                os.path.join(cli_env.MIGRATION_CWD, cli_env.DATA_DIR),
-                os.path.join(cli_env.MIGRATION_CWD, cli_env.SCHEMA_STORE_DIR),
-                os.path.join(cli_env.MIGRATION_CWD, ".gitignore"),
-                os.path.join(cli_env.MIGRATION_CWD, "pre-commit"),
-                os.path.join(cli_env.MIGRATION_CWD, "package.json"),
-                os.path.join(cli_env.MIGRATION_CWD, "tsconfig.json"),
-                os.path.join(cli_env.MIGRATION_CWD, ".env"),
-            ]
-        )
+        plan_str = json.dumps(list(test_plan), indent=4)
+        logger.info("Test plan:\n%s", plan_str)
+        with open(output_file_path, "w") as f:
+            f.write(plan_str + "\n")
+        logger.info("Test plan is saved to %s", output_file_path)
 
-    def init(self):
-        author = self.args.author if "author" in self.args else ""
-        self._init_file_existence_check()
-        self._init_migration_plan_dir()
-        self._init_schema_dir()
-        self._init_schema_store_dir()
 
-        # move schema files to schema store
-        sql_files, index_sha1, index_content = self.read_sql_files()
-        self.write_schema_store(index_sha1, index_content)
-        for f in sql_files:
-            self.write_schema_store(f.sha1, f.content)
+class Environment:
+    """
+    The commands run against one environment of a Workspace, with the plans
+    it has read
+    """
 
-        # init first migration plan
-        init_plan = mp.MigrationPlan(
-            version=mp.InitialMigrationSignature.version,
-            name=mp.InitialMigrationSignature.name,
-            author=author,
-            type=mp.Type.SCHEMA,
-            change=mp.Change(forward=mp.SchemaForward(id=index_sha1), backward=None),
-            dependencies=[],
+    def __init__(self, workspace: Workspace, name: str):
+        self.workspace = workspace
+        self.name = name
+        self.dao: hist_dao.MigrationHistoryDAO = None
+        self._env_lock: Optional[env_lock.EnvironmentLock] = None
+
+    @property
+    def mpm(self) -> mp.MigrationPlanManager:
+        return self.workspace.mpm
+
+    @property
+    def migrator(self) -> Migrator:
+        return self.workspace.migrator
+
+    @property
+    def schema(self) -> str:
+        return helper.get_env_ini_section(self.name)["schema"]
+
+    def close(self):
+        if self.dao is not None:
+            self.dao.session.close()
+            self.dao = None
+
+    @contextmanager
+    def hold_env_lock(
+        self, operator: str = "", dry_run: bool = False
+    ) -> Iterator[Optional[env_lock.EnvironmentLock]]:
+        if dry_run or self._env_lock is not None:
+            # dry run does not change anything, or the lock is already held
+            yield self._env_lock
+            return
+        engine = helper.build_engine_from_env(self.name, echo=cli_env.ALLOW_ECHO_SQL)
+        try:
+            lock = env_lock.EnvironmentLock(
+                engine, holder=env_lock.default_holder(operator)
+            )
+            with lock:
+                self._env_lock = lock
+                try:
+                    yield lock
+                finally:
+                    self._env_lock = None
+        finally:
+            # also when the run or acquiring the lock fails
+            helper.release_engine(engine)
+
+    def lock_status(self) -> env_lock.LockStatusDTO:
+        engine = helper.build_engine_from_env(self.name, echo=cli_env.ALLOW_ECHO_SQL)
+        try:
+            status = env_lock.EnvironmentLock(engine).status()
+        finally:
+            helper.release_engine(engine)
+        self.workspace._print_info_as_table(
+            "Environment lock:",
+            [
+                [
+                    status.name,
+                    "locked" if status.locked else "free",
+                    status.owner_connection_id,
+                    status.holder,
+                    status.holder_connection_id,
+                    status.acquired,
+                    status.heartbeat,
+                ]
+            ],
+            [
+                "name",
+                "state",
+                "owner_conn",
+                "holder",
+                "holder_conn",
+                "acquired",
+                "heartbeat",
+            ],
         )
-        init_plan.save()
+        if status.locked and not status.is_holder_alive():
+            logger.warning(
+                "The lock is held by connection %s, which is not the recorded holder",
+                status.owner_connection_id,
+            )
+        return status
 
-        # make data dir
-        os.makedirs(os.path.join(cli_env.MIGRATION_CWD, cli_env.DATA_DIR))
+    def build_dao(self) -> hist_dao.MigrationHistoryDAO:
+        session = helper.build_session_from_env(self.name, echo=cli_env.ALLOW_ECHO_SQL)
+        self.dao = hist_dao.MigrationHistoryDAO(session)
+        return self.dao
 
-        # create gitignore
-        with open(os.path.join(cli_env.MIGRATION_CWD, ".gitignore"), "w") as f:
-            f.write(cli_env.SAMPLE_GIT_IGNORE)
+    def _check_migration_histories(
+        self, migration_histories: List[model.MigrationHistoryDTO], fix: bool = False
+    ):
+        if len(migration_histories) > self.mpm.count():
+            raise Exception(
+                "Unexpected migration history,"
+                f" len(migration_histories)={len(migration_histories)},"
+                f" len(migration_plans)={self.mpm.count()}"
+            )
+        # the history and migration plans should match
+        for idx, hist in enumerate(migration_histories):
+            if hist.state != model.MigrationState.SUCCESSFUL:
+                # if fix mode, the last history can be PROCESSING or ROLLBACKING
+                if fix and idx == len(migration_histories) - 1:
+                    if (
+                        hist.state == model.MigrationState.PROCESSING
+                        or hist.state == model.MigrationState.ROLLBACKING
+                    ):
+                        continue
+                raise Exception(
+                    f"Migration is not successful, version={hist.ver}, name={hist.name}"
+                )
+            plan = self.mpm.get_plan_by_index(idx)
+            if not hist.can_match(plan.version, plan.name, plan.get_checksum()):
+                raise Exception(
+                    f"Unexpected migration history, version={hist.ver},"
+                    f" name={hist.name}, checksum={hist.checksum}"
+                )
 
-        # create pre-commit hook
-        with open(os.path.join(cli_env.MIGRATION_CWD, "pre-commit"), "w") as f:
-            f.write(cli_env.SAMPLE_PRE_COMMIT)
+    def _get_and_check_versioned_migration_histories(
+        self, fix: bool = False
+    ) -> List[model.MigrationHistoryDTO]:
+        # in the transaction of the caller, not committed
+        migration_histories = list(self.dao.select_dto(versioned=True))
+        self._check_migration_histories(migration_histories, fix=fix)
+        return migration_histories
 
-        # create dot env file
-        dot_env_file_path = os.path.join(cli_env.MIGRATION_CWD, ".env")
-        with open(dot_env_file_path, "w") as f:
-            f.write(cli_env.SAMPLE_DOT_ENV % cli_env.MYSQL_PWD)
-            logger.info("MYSQL_WD is saved in .env file, path=%s", dot_env_file_path)
+    def fix_rollback(self, fake: bool = False, operator: str = ""):
+        self.fix_migrate(forward=False, fake=fake, operator=operator)
 
-        # create package.json
-        with open(os.path.join(cli_env.MIGRATION_CWD, "package.json"), "w") as f:
-            f.write(cli_env.SAMPLE_PCKAGE_JSON)
+    @with_env_lock
+    def fix_migrate(
+        self, forward: bool = True, *, fake: bool = False, operator: str = ""
+    ):
+        self.workspace.read_migration_plans()
 
-        # create tsconfig.json
-        with open(os.path.join(cli_env.MIGRATION_CWD, "tsconfig.json"), "w") as f:
-            f.write(cli_env.SAMPLE_TSCONFIG_JSON)
+        dao = self.build_dao()
+        with dao.session.begin():
+            migration_histories = self._get_and_check_versioned_migration_histories(
+                fix=True
+            )
+            if (
+                len(migration_histories) == 0
+                or migration_histories[-1].state == model.MigrationState.SUCCESSFUL
+            ):
+                logger.info("No need to fix migration")
+                return
+            target_plan = self.mpm.get_plan_by_index(len(migration_histories) - 1)
+            if forward:
+                if not fake:
+                    self.migrator.forward(target_plan, self.name)
+                dao.update_succ(target_plan, operator=operator, fake=fake)
+            else:
+                if not fake:
+                    self.migrator.backward(target_plan, self.name)
+                dao.delete(target_plan, operator=operator, fake=fake)
+            dao.commit()
 
-    def read_sql_files(self) -> Tuple[List[mp.SQLFile], str, str]:
+    def _estimate_costs(
+        self, plans: List[mp.MigrationPlan], is_migrate: bool
+    ) -> Iterator[cost_estimator.PlanCostDTO]:
         """
-        read sql files from schema dir, and return the index sha1 and content
+        yield the cost of each plan as it is estimated
         """
-        sql_files: List[mp.SQLFile] = []
-        for file in os.listdir(os.path.join(cli_env.MIGRATION_CWD, cli_env.SCHEMA_DIR)):
-            if file.endswith(".sql"):
-                with open(
-                    os.path.join(cli_env.MIGRATION_CWD, cli_env.SCHEMA_DIR, file)
-                ) as f:
-                    content = f.read()
-                    sha1 = self.sha1_encode(content)
-                    sql_files.append(mp.SQLFile(file, content, sha1))
-        sql_files.sort(key=lambda x: x.sha1)
-        index_sha1 = self.sha1_encode([sql_file.sha1 for sql_file in sql_files])
-        index_content = "\n".join([f"{f.sha1}:{f.name}" for f in sql_files])
-        return sql_files, index_sha1, index_content
-
-    def make_repeatable_migration(self) -> str:
-        name = self.args.name
-        author = self.args.author if "author" in self.args else ""
-        data_change_type = self.args.type
-        if not mp.DataChangeType.is_valid(data_change_type):
-            raise Exception(f"Invalid type {data_change_type}")
-        self.read_migration_plans()
-        if self.mpm.count() == 0:
-            raise Exception(
-                "Initial migration plan is not found, please run init command"
+        engine = helper.build_engine_from_env(self.name, echo=cli_env.ALLOW_ECHO_SQL)
+        try:
+            dao = hist_dao.MigrationHistoryDAO(Session(engine))
+            with dao.session.begin():
+                timings = dao.get_timings()
+            estimator = cost_estimator.CostEstimator(engine, timings)
+            for p in plans:
+                yield estimator.estimate(p, is_migrate)
+        finally:
+            helper.release_engine(engine)
+
+    def print_dry_run(
+        self,
+        plans: List[mp.MigrationPlan],
+        is_migrate: bool,
+        output_format: str = consts.OUTPUT_FORMAT_TABLE,
+    ):
+        new_plans = list(plans if is_migrate else reversed(plans))
+        total_seconds, total_bytes = 0.0, 0
+        rows = []
+        writer = None
+        if output_format != consts.OUTPUT_FORMAT_TABLE:
+            writer = report.RowWriter(
+                output_format,
+                [
+                    "ver",
+                    "name",
+                    "type",
+                    "forward",
+                    "backward",
+                    "algorithm",
+                    "rows",
+                    "bytes_rewritten",
+                    "est_seconds",
+                ],
             )
-        next_plan = mp.MigrationPlan(
-            version=mp.RepeatableVersion,
-            name=name,
-            author=author,
-            type=mp.Type.REPEATABLE,
-            change=mp.Change(
-                forward=mp.DataForward(type=data_change_type),
-                backward=None,
-            ),
-            dependencies=[],
-            ignore_after=None,
-        )
-
-        match data_change_type:
-            case mp.DataChangeType.SQL:
-                next_plan.change.forward.sql = (
-                    "INSERT INTO `testtable` (`id`, `name`) VALUES (1, 'foo.bar') ON"
-                    " DUPLICATE KEY UPDATE `name` = 'foo.bar';"
+        for p, cost in zip(new_plans, self._estimate_costs(new_plans, is_migrate)):
+            total_seconds += cost.seconds
+            total_bytes += cost.bytes_rewritten
+            row = [
+                p.version,
+                p.name,
+                p.type,
+                (
+                    p.change.forward.to_str_for_print()
+                    if p.change.forward is not None
+                    else None
+                ),
+                (
+                    p.change.backward.to_str_for_print()
+                    if p.change.backward is not None
+                    else None
+                ),
+                cost.algorithm,
+                cost.rows,
+            ]
+            if writer is not None:
+                writer.write(row + [cost.bytes_rewritten, round(cost.seconds, 1)])
+            else:
+                rows.append(
+                    row
+                    + [
+                        cost_estimator.format_bytes(cost.bytes_rewritten),
+                        f"{cost.seconds:.1f}",
+                    ]
                 )
-            case mp.DataChangeType.SQL_FILE:
-                next_plan.change.forward.file = "your_sql_file.sql"
-            case mp.DataChangeType.PYTHON:
-                next_plan.change.forward.file = "your_python_file.py"
-                logger.info("Sample python file:\n%s", cli_env.SAMPLE_PYTHON_FILE)
-            case mp.DataChangeType.SHELL:
-                next_plan.change.forward.file = "your_shell_file.sh"
-                logger.info("Sample shell file:\n%s", cli_env.SAMPLE_SHELL_FILE)
-            case mp.DataChangeType.TYPESCRIPT:
-                next_plan.change.forward.file = "your_typescript_file.ts"
-                logger.info("Sample typescript file:\n%s", cli_env.SAMPLE_MIGRATION_TS)
+        if writer is not None:
+            writer.close()
+        else:
+            print(
+                tabulate(
+                    rows,
+                    headers=[
+                        "ver",
+                        "name",
+                        "type",
+                        "forward",
+                        "backward",
+                        "algorithm",
+                        "rows",
+                        "bytes rewritten",
+                        "est seconds",
+                    ],
+                    tablefmt="orgtbl",
+                )
+            )
+        if len(new_plans) > 0:
+            logger.info(
+                "Projected %.1f seconds, %s rewritten",
+                total_seconds,
+                cost_estimator.format_bytes(total_bytes),
+            )
+
+    def _migrate_versioned(
+        self,
+        ver: str,
+        name: str,
+        fake: bool,
+        dry_run: bool,
+        operator: str = "",
+        coalesce: bool = False,
+    ) -> Tuple[List[mp.MigrationPlan], List[mp.MigrationPlan]]:
+        """
+        Apply versioned migration plans, with coalesce the plans must all be
+        schema plans and are applied by pushing the schema of the last one
+        return applied plans, to execute plans
+        """
+        dao = self.build_dao()
+        applied_plans: List[mp.MigrationPlan] = []
+        with dao.session.begin():
+            versioned_migration_histories = (
+                self._get_and_check_versioned_migration_histories()
+            )
+            len_applied_versioned = len(versioned_migration_histories)
+            applied_plans = self.mpm.get_plans()[:len_applied_versioned]
 
-        return next_plan.save()
+            # versioned migration has been applied
+            if len_applied_versioned == self.mpm.count():
+                return applied_plans, []
+            # create new migration history if needed
+            next_plan_index = len_applied_versioned
+            if ver is None:
+                new_plans = self.mpm.must_get_plan_between(next_plan_index, None)
+            else:
+                new_plans = self.mpm.must_get_plan_between(
+                    next_plan_index,
+                    mp.MigrationSignature(version=ver, name=name),
+                )
+            if len(new_plans) > 0:
+                if dry_run:
+                    return applied_plans, new_plans
+                dao.add_one(new_plans[0], operator=operator, fake=fake)
+                dao.commit()
 
-    def make_data_migration(self) -> str:
-        name = self.args.name
-        author = self.args.author if "author" in self.args else ""
-        data_change_type = self.args.type
-        if not mp.DataChangeType.is_valid(data_change_type):
-            raise Exception(f"Invalid type {data_change_type}")
-        self.read_migration_plans()
-        if self.mpm.count() == 0:
-            raise Exception(
-                "Initial migration plan is not found, please run init command"
+        dry_run_plans = new_plans[:]
+        if coalesce and not fake and len(new_plans) > 0:
+            for plan in new_plans:
+                if not route_planner.can_coalesce_forward(plan):
+                    raise Exception(f"Can not coalesce {plan} into one schema push")
+            logger.info(
+                "Migrating %d schema migration plans by moving schema to %s",
+                len(new_plans),
+                new_plans[-1].change.forward.id,
             )
-        latest_plan = self.mpm.get_latest_plan()
-        next_plan = mp.MigrationPlan(
-            version=self.bump_version(latest_plan.version),
-            name=name,
-            author=author,
-            type=mp.Type.DATA,
-            change=mp.Change(
-                forward=mp.DataForward(type=data_change_type),
-                backward=None,
-            ),
-            dependencies=[
-                mp.MigrationSignature(
-                    version=latest_plan.version, name=latest_plan.name
+            self.migrator.move_schema_to(new_plans[-1].change.forward.id, self.name)
+        while len(new_plans) > 0:
+            # migrate operation
+            elapsed = None
+            if not fake and not coalesce:
+                start = time.perf_counter()
+                self.migrator.forward(new_plans[0], self.name)
+                elapsed = time.perf_counter() - start
+            # update migration history and create new migration history if needed
+            with dao.session.begin():
+                dao.update_succ_and_add_next(
+                    new_plans[0],
+                    new_plans[1] if len(new_plans) > 1 else None,
+                    operator=operator,
+                    fake=fake,
                 )
-            ],
-        )
+                if elapsed is not None:
+                    dao.record_timing(new_plans[0], hist_dao.Direction.FORWARD, elapsed)
+                dao.commit()
+            applied_plans.append(new_plans[0])
+            new_plans = new_plans[1:]
 
-        match data_change_type:
-            case mp.DataChangeType.SQL:
-                next_plan.change.forward.sql = (
-                    "INSERT INTO `testtable` (`id`, `name`) VALUES (1, 'foo.bar');"
-                )
-            case mp.DataChangeType.SQL_FILE:
-                next_plan.change.forward.file = "your_sql_file.sql"
-            case mp.DataChangeType.PYTHON:
-                next_plan.change.forward.file = "your_python_file.py"
-                logger.info("Sample python file:\n%s", cli_env.SAMPLE_PYTHON_FILE)
-            case mp.DataChangeType.SHELL:
-                next_plan.change.forward.file = "your_shell_file.sh"
-                logger.info("Sample shell file:\n%s", cli_env.SAMPLE_SHELL_FILE)
-            case mp.DataChangeType.TYPESCRIPT:
-                next_plan.change.forward.file = "your_typescript_file.ts"
-                logger.info("Sample typescript file:\n%s", cli_env.SAMPLE_MIGRATION_TS)
+        return applied_plans, dry_run_plans
 
-        return next_plan.save()
+    @with_env_lock
+    def migrate(
+        self,
+        version: Optional[str] = None,
+        name: Optional[str] = None,
+        *,
+        fake: bool = False,
+        dry_run: bool = False,
+        operator: str = "",
+        coalesce: bool = False,
+        output_format: str = consts.OUTPUT_FORMAT_TABLE,
+    ):
+        """
+        migrate to the plan of version and name, the latest plan by default,
+        output_format is of the dry run
+        """
+        ver = version.zfill(4) if version is not None else None
+        if dry_run:
+            logger.info("Running in dry run mode, no migration will be executed")
 
-    def bump_version(self, version: str):
-        next_version = int(version) + 1
-        return str(next_version).zfill(4)
+        self.workspace.read_migration_plans()
+        self.workspace._check_integrity()
 
-    def make_schema_migration(self) -> str:
-        name = self.args.name
-        author = self.args.author if "author" in self.args else ""
-        self.read_migration_plans()
-        if self.mpm.count() == 0:
-            raise Exception(
-                "Initial migration plan is not found, please run init command"
-            )
-        latest_plan = self.mpm.get_latest_plan()
-        latest_schema_plan = self.mpm.get_latest_plan(mp.Type.SCHEMA)
+        logger.debug(
+            f"Migrate options: ver={ver}, name={name}, fake={fake}, dry_run={dry_run}"
+        )
 
-        latest_schema_index_sha1 = latest_schema_plan.change.forward.id
-        sql_files, index_sha1, index_content = self.read_sql_files()
-        if latest_schema_index_sha1 == index_sha1:
-            logger.info("No schema change")
-            return
-        self.write_schema_store(index_sha1, index_content)
-        for f in sql_files:
-            self.write_schema_store(f.sha1, f.content)
-        new_plan = mp.MigrationPlan(
-            version=self.bump_version(latest_plan.version),
-            name=name,
-            author=author,
-            type=mp.Type.SCHEMA,
-            change=mp.Change(
-                forward=mp.SchemaForward(id=index_sha1),
-                backward=mp.SchemaBackward(id=latest_schema_index_sha1),
-            ),
-            dependencies=[
-                mp.MigrationSignature(
-                    version=latest_plan.version, name=latest_plan.name
-                )
-            ],
+        # versioned migration
+        (applied_plans, dry_run_plans) = self._migrate_versioned(
+            ver, name, fake, dry_run, operator=operator, coalesce=coalesce
+        )
+        # repeatable migration
+        dry_run_repeatable_plans = self._migrate_repeatable(
+            applied_plans, ver, name, fake, dry_run, operator=operator
         )
-        return new_plan.save()
 
-    def write_schema_store(self, sha1: str, content: str):
-        helper.write_sha1_file(sha1, content)
+        if dry_run:
+            logger.info("Migration plans to execute:")
+            self.print_dry_run(
+                dry_run_plans + dry_run_repeatable_plans,
+                is_migrate=True,
+                output_format=output_format,
+            )
 
-    def sha1_encode(self, str_list: List[str]):
-        return helper.sha1_encode(str_list=str_list)
+    def _migrate_repeatable(
+        self,
+        applied_histories: List[model.MigrationHistory],
+        ver: str,
+        name: str,
+        fake: bool,
+        dry_run: bool,
+        operator: str = "",
+    ) -> List[mp.MigrationPlan]:
+        if fake:
+            # no need to execute repeatable migration in fake mode
+            return []
 
-    def skeema(self, raw_args: List[str], cwd: str = cli_env.SDM_SCHEMA_DIR):
-        # https://stackoverflow.com/questions/39872088/executing-interactive-shell-script-in-python
-        return helper.call_skeema(raw_args, cwd)
+        if dry_run:
+            # since it's dry_run, assume the target version is the latest version
+            if ver is not None:
+                applied_plans = self.mpm.must_get_plan_between(
+                    0, mp.MigrationSignature(version=ver, name=name)
+                )
+            else:
+                applied_plans = self.mpm.get_plans()
+            to_execute_plans = self._get_to_execute_repeatable_plans(applied_plans)
+            return to_execute_plans
 
-    def _print_info_as_table(
-        self, prompt: str, output: List[List[str]], headers: List[str]
+        to_execute_plans = self._get_to_execute_repeatable_plans(applied_histories)
+        if len(to_execute_plans) == 0:
+            logger.debug("No valid repeatable migration to execute")
+            return []
+
+        for batch in mp.group_parallel_plans(to_execute_plans):
+            if len(batch) == 1 or cli_env.REPEATABLE_MIGRATION_WORKERS <= 1:
+                for plan in batch:
+                    self._migrate_repeatable_plan(self.dao, plan, fake, operator)
+            else:
+                self._migrate_repeatable_in_parallel(batch, fake, operator)
+        return to_execute_plans
+
+    def _migrate_repeatable_plan(
+        self,
+        dao: hist_dao.MigrationHistoryDAO,
+        plan: mp.MigrationPlan,
+        fake: bool,
+        operator: str = "",
     ):
-        if len(output) == 0:
-            return
-        logger.info(
-            prompt
-            + "\n"
-            + tabulate(
-                output,
-                headers=headers,
-                tablefmt="orgtbl",
-            )
-        )
+        # try get the migration history
+        with dao.session.begin():
+            hist = dao.get_by_sig(plan.sig())
+            if hist is None:
+                dao.add_one(plan, operator=operator, fake=fake)
+            else:
+                # no need to check if state is SUCCESSFUL,
+                #   because it is repeatable migration
+                # just treat updating PROCESSING to PROCESSING
+                #   as retry the migration
+                dao.update_processing(plan, operator=operator, fake=fake)
+            dao.commit()
+        # execute the migration
+        self.migrator.forward(plan, self.name)
 
-    def info(self) -> Tuple[bool, int]:
+        with dao.session.begin():
+            dao.update_succ(plan, operator=operator, fake=fake)
+            dao.commit()
+
+    def _migrate_repeatable_in_parallel(
+        self, plans: List[mp.MigrationPlan], fake: bool, operator: str = ""
+    ):
         """
-        return (is_migration_history_consistent, len_applied)
+        Each worker updates the history of its plan with its own session, the
+        plans left running finish before the first error is raised.
         """
-        self.read_migration_plans()
-        dao = self.build_dao()
-        hist_list = dao.get_all_dto()
 
-        def get_rollbackable(hist: model.MigrationHistoryDTO) -> str:
+        def worker(plan: mp.MigrationPlan):
+            session = helper.build_session_from_env(
+                self.name, echo=cli_env.ALLOW_ECHO_SQL
+            )
             try:
-                match hist.type:
-                    case mp.Type.SCHEMA | mp.Type.DATA:
-                        plan, _ = self.mpm.must_get_plan_by_signature(
-                            mp.MigrationSignature(
-                                version=hist.ver,
-                                name=hist.name,
-                            )
-                        )
-                    case mp.Type.REPEATABLE:
-                        plan = self.mpm.must_get_repeatable_plan_by_signature(
-                            mp.MigrationSignature(version=hist.ver, name=hist.name)
-                        )
-                    case _:
-                        return "false"
-            except Exception:
-                return "unknown"
-            return "true" if plan.is_rollbackable() else "false"
+                self._migrate_repeatable_plan(
+                    hist_dao.MigrationHistoryDAO(session), plan, fake, operator
+                )
+            finally:
+                session.close()
+                helper.release_engine(session.get_bind())
 
-        output = [
-            [
-                hist.ver,
-                hist.name,
-                hist.type,
-                hist.state.name,
-                get_rollbackable(hist),
-                hist.created,
-                hist.updated,
-            ]
-            for hist in hist_list
-        ]
-        self._print_info_as_table(
-            "Migration history:",
-            output,
-            ["ver", "name", "type", "state", "rollbackable", "created", "updated"],
+        workers = min(cli_env.REPEATABLE_MIGRATION_WORKERS, len(plans))
+        logger.info(
+            "Migrating %d repeatable migration plans with %d workers: %s",
+            len(plans),
+            workers,
+            ", ".join(str(plan) for plan in plans),
         )
+        with ThreadPoolExecutor(
+            max_workers=workers, thread_name_prefix="sdm-repeatable"
+        ) as executor:
+            futures = [executor.submit(worker, plan) for plan in plans]
+        errors = []
+        for plan, future in zip(plans, futures):
+            if future.exception() is not None:
+                logger.error("Failed to migrate %s: %s", plan, future.exception())
+                errors.append(future.exception())
+        if errors:
+            raise errors[0]
 
-        return True, len(hist_list)
-
-    def pull(self):
-        env_or_version = self.args.env_or_version
-        self.read_migration_plans()
-        argtype = self._get_diff_type(env_or_version)
-        if argtype == mp.DiffItemType.ENVIRONMENT:
-            self.skeema(["pull", env_or_version])
-            return
-        if argtype == mp.DiffItemType.VERSION:
-            schema_dir_path = os.path.join(cli_env.MIGRATION_CWD, cli_env.SCHEMA_DIR)
-            schema_dir_files = helper.files_under_dir(schema_dir_path, ".sql")
-
-            with tempfile.TemporaryDirectory() as temp_dir:
-                self.dump_schema(env_or_version, argtype, temp_dir, mkdir=False)
-                ver_files = helper.files_under_dir(temp_dir, ".sql")
+    def _get_to_execute_repeatable_plans(
+        self, applied_plans: List[mp.MigrationPlan]
+    ) -> List[mp.MigrationPlan]:
+        # get repeatable migration plans
+        plans = self.mpm.get_repeatable_plans()
+        # check if repeatable migration can be executed
+        to_execute_plans: List[mp.MigrationPlan] = []
+        for p in plans:
+            if p.dependencies is not None and len(p.dependencies) > 0:
+                dep_sig = p.dependencies[0]
+                # check if dep_sig is in applied_histories
+                if not any(ap.match(dep_sig) for ap in applied_plans):
+                    logger.warning(
+                        "repeatable migration %s is not executed because dependency %s"
+                        " is not applied",
+                        p,
+                        dep_sig,
+                    )
+                    continue
 
-                # move file under temp_dir to schema dir
-                for filename, filepath in ver_files.items():
-                    shutil.move(
-                        filepath,
-                        os.path.join(schema_dir_path, filename),
+            if p.ignore_after is not None:
+                ignore_sig = p.ignore_after
+                # check if ignore_sig is in applied_histories
+                if any(ap.match(ignore_sig) for ap in applied_plans):
+                    logger.debug(
+                        "Repeatable migration %s is not executed because ignore_after"
+                        " %s is applied",
+                        p,
+                        ignore_sig,
                     )
-                    logger.info("Updated %s", os.path.join(schema_dir_path, filename))
+                    continue
 
-                # delete files in schema dir that are not in temp_dir
-                to_delete_files = set(schema_dir_files.keys()) - set(ver_files.keys())
-                for filename in to_delete_files:
-                    os.remove(schema_dir_files[filename])
-                    logger.info("Deleted %s", schema_dir_files[filename])
+            hist_dto = self.dao.get_by_sig_dto(p.sig())
+            if (
+                hist_dto is not None
+                and hist_dto.checksum == p.get_checksum()
+                and hist_dto.state == model.MigrationState.SUCCESSFUL
+                and (
+                    p.change.forward.precheck is None
+                    or p.change.forward.precheck.type == mp.DataChangeType.SQL
+                    or p.change.forward.precheck.type == mp.DataChangeType.SQL_FILE
+                )
+            ):
+                logger.debug(
+                    "Repeatable migration %s is not executed because it has been"
+                    " executed",
+                    p,
+                )
+                continue
 
-        else:
-            raise Exception(
-                f"Invalid argument, {env_or_version} is neither environment nor version"
+            p.set_checksum_match(
+                hist_dto.checksum == p.get_checksum()
+                if hist_dto is not None and hist_dto.checksum is not None
+                else False
             )
+            to_execute_plans.append(p)
+        return to_execute_plans
 
-    def diff(self):
-        left = self.args.left
-        right = self.args.right
-        verbose = self.args.verbose if "verbose" in self.args else False
-        if left == right:
+    def _rollback_repeatable_migration(
+        self,
+        to_rollback_plan: mp.MigrationPlan,
+        inverse_dependencies: Dict[mp.MigrationSignature, List[mp.MigrationSignature]],
+        fake: bool = False,
+        operator: str = "",
+    ):
+        if to_rollback_plan.sig() not in inverse_dependencies:
             return
-        self.read_migration_plans()
-        left_type = self._get_diff_type(left)
-        right_type = self._get_diff_type(right)
-
-        with tempfile.TemporaryDirectory() as temp_dir:
-            left_dump_dir_path = os.path.join(temp_dir, "left")
-            right_dump_dir_path = os.path.join(temp_dir, "right")
-            self.dump_schema(left, left_type, left_dump_dir_path)
-            self.dump_schema(right, right_type, right_dump_dir_path)
-
-            has_diff = False
-            if not verbose:
-                try:
-                    subprocess.check_call(
-                        shlex.split("diff --recursive --brief left right"),
-                        cwd=temp_dir,
-                    )
-                except subprocess.CalledProcessError:
-                    has_diff = True
-            else:
-                try:
-                    subprocess.check_call(
-                        shlex.split("diff --color -Nr -U4 left right"),
-                        cwd=temp_dir,
-                    )
-                except subprocess.CalledProcessError:
-                    has_diff = True
+        dao = self.dao
+        for sig in inverse_dependencies[to_rollback_plan.sig()]:
+            plan = self.mpm.must_get_repeatable_plan_by_signature(sig)
+            with dao.session.begin():
+                hist = dao.get_by_sig(sig)
+                if hist is None:
+                    logger.debug(f"Migration history not found, so skip rollback {sig}")
+                    continue
+                # no need to check if state is SUCCESSFUL,
+                #   because it is repeatable migration
+                dao.update_rollback(plan, operator=operator, fake=fake)
+                dao.commit()
+            # execute the migration
+            if not fake:
+                self.migrator.backward(plan, self.name)
 
-            if has_diff:
-                raise Exception(f"Difference found between {left} and {right}")
+            with dao.session.begin():
+                dao.delete(plan, operator=operator, fake=fake)
+                dao.commit()
 
-    def dump_schema(
+    @with_env_lock
+    def rollback(
         self,
-        diff_arg: str,
-        diff_type: mp.DiffItemType,
-        dump_dir_path: str,
-        mkdir: bool = True,
+        version: str,
+        name: Optional[str] = None,
+        *,
+        fake: bool = False,
+        dry_run: bool = False,
+        operator: str = "",
+        jump: bool = False,
+        output_format: str = consts.OUTPUT_FORMAT_TABLE,
     ):
-        if mkdir:
-            os.makedirs(dump_dir_path, exist_ok=False)
-
-        if diff_type == mp.DiffItemType.HEAD:
-            original_path = os.path.join(cli_env.MIGRATION_CWD, cli_env.SCHEMA_DIR)
-            for file in os.listdir(original_path):
-                if file.endswith(".sql"):
-                    shutil.copy(
-                        os.path.join(original_path, file),
-                        os.path.join(dump_dir_path, file),
-                    )
-            return
-        if diff_type == mp.DiffItemType.VERSION:
-            if diff_arg.isdigit():
-                diff_arg = diff_arg.zfill(4)
-                target_plan, _ = self.mpm.must_get_plan_by_signature(
-                    mp.MigrationSignature(diff_arg, None)
-                )
-            else:
-                split = diff_arg.split("_")
-                ver = split[0]
-                name = "_".join(split[1:])
-                target_plan, _ = self.mpm.must_get_plan_by_signature(
-                    mp.MigrationSignature(ver, name)
-                )
+        """
+        rollback the plans applied after the plan of version and name,
+        output_format is of the dry run
+        """
+        self.workspace.read_migration_plans()
+        self.workspace._check_integrity()
+        ver = version.zfill(4)
+        _, target_migration_plan_index = self.mpm.must_get_plan_by_signature(
+            mp.MigrationSignature(ver, name)
+        )
 
-            if target_plan.type != mp.Type.SCHEMA:
-                raise Exception(f"Not schema migration plan, version={diff_arg}")
-            index_sha1 = target_plan.change.forward.id
-            self.copy_schema_by_index(index_sha1, dump_dir_path)
-            return
-        if diff_type == mp.DiffItemType.ENVIRONMENT:
-            env_ini = helper.parse_env_ini()
-            env = diff_arg
-            if not env_ini.has_section(env):
-                raise Exception(f"Environment not found, name={env}")
-            skeema_file_path = os.path.join(
-                cli_env.MIGRATION_CWD, cli_env.SCHEMA_DIR, ".skeema"
-            )
-            shutil.copy(skeema_file_path, dump_dir_path)
-            helper.call_skeema(["pull", env], cwd=dump_dir_path)
-            os.remove(os.path.join(dump_dir_path, ".skeema"))
-            return
+        dao = self.build_dao()
+        with dao.session.begin():
+            migration_histories = self._get_and_check_versioned_migration_histories()
 
-    def _get_diff_type(self, name: str) -> mp.DiffItemType:
-        if name == "HEAD":
-            return mp.DiffItemType.HEAD
-        if name.isdigit():
-            return mp.DiffItemType.VERSION
-        split = name.split("_")
-        if len(split) > 1 and split[0].isdigit():
-            return mp.DiffItemType.VERSION
-        else:
-            return mp.DiffItemType.ENVIRONMENT
+            latest_migration_plan_index = len(migration_histories) - 1
 
-    def read_schema_index(
-        self, sha1: str, check_sha: bool = False
-    ) -> List[Tuple[str, str]]:
-        index_file = helper.sha1_to_path(sha1)
-        with open(index_file, "r") as f:
-            lines = f.readlines()
-        if check_sha:
-            actual_sha1 = self.sha1_encode([x.split(":")[0] for x in lines])
-            if actual_sha1 != sha1:
-                raise err.IntegrityError(
-                    f"schema index sha1 not match, actual_sha1={actual_sha1},"
-                    f" expected_sha1={sha1}"
-                )
-        return [
-            (line.split(":")[0], line.split(":")[1].strip()) for line in lines
-        ]  # sha1, filename
+            if target_migration_plan_index > latest_migration_plan_index:
+                raise Exception("Target migration plan is not applied yet")
+            elif target_migration_plan_index == latest_migration_plan_index:
+                return
 
-    def copy_schema_by_index(self, sha1: str, temp_dir: str):
-        for sha1, sql_filename in self.read_schema_index(sha1):
-            sql_filepath = helper.sha1_to_path(sha1)
-            shutil.copy(
-                sql_filepath,
-                os.path.join(temp_dir, sql_filename),
+            to_rollback_versioned_plans = self.mpm.must_get_plan_between(
+                target_migration_plan_index + 1, latest_migration_plan_index
             )
 
-    def clean_schema_store(self) -> List[str]:
-        dry_run = self.args.dry_run if "dry_run" in self.args else False
-        skip_integrity = (
-            self.args.skip_integrity if "skip_integrity" in self.args else False
-        )
-        self.read_migration_plans()
-        if not skip_integrity:
-            self._check_integrity()
-        return self._clean_schema_store(delete_unexpected=dry_run)
-
-    def _clean_schema_store(self, delete_unexpected: bool) -> List[str]:
-        schema_store_path = os.path.join(
-            cli_env.MIGRATION_CWD, cli_env.SCHEMA_STORE_DIR
-        )
+            # get repeatable migration plans to rollback
+            to_rollback_plans_dry_run_print: List[mp.MigrationPlan] = []
+            inverse_dependencies = self.mpm.get_repeatable_plan_inverse_dependencies()
+            for trp in to_rollback_versioned_plans:
+                to_rollback_plans_dry_run_print.append(trp)
+                if trp.sig() in inverse_dependencies:
+                    # check if the repeatable migration has been applied
+                    if dao.get_by_sig(trp.sig()) is not None:
+                        for sig in inverse_dependencies[trp.sig()]:
+                            to_rollback_plans_dry_run_print.append(
+                                self.mpm.must_get_repeatable_plan_by_signature(sig)
+                            )
 
-        # get all valid paths in schema store
-        schema_plans = self.mpm.get_plans_by_type(mp.Type.SCHEMA)
-        valid_index_sha1s = set()
-        valid_sql_sha1s = set()
-        for plan in schema_plans:
-            if plan.change.forward is not None:
-                valid_index_sha1s.add(plan.change.forward.id)
-            if plan.change.backward is not None:
-                valid_index_sha1s.add(plan.change.backward.id)
-        for index_sha1 in valid_index_sha1s:
-            for sql_sha1, _ in self.read_schema_index(index_sha1):
-                valid_sql_sha1s.add(sql_sha1)
-        valid_paths = set()
-        for sha1 in valid_index_sha1s.union(valid_sql_sha1s):
-            valid_paths.add(
-                os.path.join(
-                    sha1[:2],
-                    sha1[2:],
+            if jump:
+                reason = self._check_schema_jump(
+                    to_rollback_versioned_plans, to_rollback_plans_dry_run_print
                 )
-            )
+                if reason is not None:
+                    logger.warning(
+                        "Can not jump to the target schema directly, %s,"
+                        " rollback step by step",
+                        reason,
+                    )
+                    jump = False
 
-        # get all paths in schema store
-        all_paths = set()
-        for root, dirs, files in os.walk(schema_store_path):
-            for file in files:
-                if not file.endswith(".gitkeep"):
-                    all_paths.add(
-                        os.path.join(root, file).removeprefix(schema_store_path + "/")
+            if len(to_rollback_versioned_plans) > 0:
+                if dry_run:
+                    if jump:
+                        logger.info(
+                            "Rollback by moving schema to %s directly",
+                            self._get_schema_jump_target(to_rollback_versioned_plans),
+                        )
+                    logger.info("Migration plans to rollback:")
+                    self.print_dry_run(
+                        to_rollback_plans_dry_run_print,
+                        is_migrate=False,
+                        output_format=output_format,
                     )
+                    return
 
-        # log the unexpected paths
-        # if not dry run delete those files
-        unexpected_paths = all_paths - valid_paths
-        for p in unexpected_paths:
-            full_path = os.path.join(schema_store_path, p)
-            if delete_unexpected:
-                logger.warning("Unexpected file: %s", full_path)
-            else:
-                os.remove(full_path)
-                logger.warning("Deleted %s", full_path)
+                dao.update_rollback(
+                    to_rollback_versioned_plans[-1], operator=operator, fake=fake
+                )
+                dao.commit()
 
-        return list(unexpected_paths)
+        if jump:
+            self._rollback_by_schema_jump(
+                to_rollback_versioned_plans, fake=fake, operator=operator
+            )
+            return
 
-    # This method performs a basic check on the integrity of the migration plans.
-    # It reads the migration plans and checks that:
-    #   - For schema migrations, the index file and linked SQL file exist.
-    #       If not in fast mode, it also checks that the SHA1 is correct.
-    #   - For data migrations, check the sql is not empty or the file exist.
-    def check_integrity(self):
-        fast = self.args.fast if "fast" in self.args else False
-        self.read_migration_plans()
-        self._check_integrity(fast=fast)
+        while len(to_rollback_versioned_plans) > 0:
+            # before rollback versioned migration
+            # check if repeatable migration which dependents on it should be rollbacked
+            self._rollback_repeatable_migration(
+                to_rollback_versioned_plans[-1],
+                inverse_dependencies,
+                fake=fake,
+                operator=operator,
+            )
 
-    def _check_integrity(self, fast: bool = False):
-        checked_schema_index_sha = set()
-        for plan in self.mpm.get_plans():
-            if plan.type == mp.Type.SCHEMA:
-                self._check_schema_migration(
-                    plan, fast=fast, checked_schema_index_sha=checked_schema_index_sha
+            # rollback operation
+            elapsed = None
+            if not fake:
+                start = time.perf_counter()
+                self.migrator.backward(to_rollback_versioned_plans[-1], self.name)
+                elapsed = time.perf_counter() - start
+
+            with dao.session.begin():
+                dao.delete_and_rollback_next(
+                    to_rollback_versioned_plans[-1],
+                    (
+                        to_rollback_versioned_plans[-2]
+                        if len(to_rollback_versioned_plans) > 1
+                        else None
+                    ),
+                    operator=operator,
+                    fake=fake,
                 )
-            elif plan.type == mp.Type.DATA:
-                self._check_data_migration(plan)
-            else:
-                raise err.IntegrityError(f"unknown type, type={plan.type}")
-        for plan in self.mpm.get_repeatable_plans():
-            self._check_data_migration(plan)
+                if elapsed is not None:
+                    dao.record_timing(
+                        to_rollback_versioned_plans[-1],
+                        hist_dao.Direction.BACKWARD,
+                        elapsed,
+                    )
+                dao.commit()
+            to_rollback_versioned_plans = to_rollback_versioned_plans[:-1]
 
-    def _check_schema_migration(
+    def _check_schema_jump(
+        self,
+        versioned_plans: List[mp.MigrationPlan],
+        rollback_plans: List[mp.MigrationPlan],
+    ) -> Optional[str]:
+        """
+        return why the plans can not be rollbacked by one schema push,
+        None if they can
+        """
+        if len(rollback_plans) > len(versioned_plans):
+            return "repeatable migrations depend on the plans to rollback"
+        for plan in versioned_plans:
+            if not route_planner.can_skip_backward(plan):
+                return f"{plan} has a backward data change or condition checks"
+        return None
+
+    def _get_schema_jump_target(
+        self, versioned_plans: List[mp.MigrationPlan]
+    ) -> Optional[str]:
+        # a step by step rollback ends with the backward of the earliest
+        #   schema plan that has one
+        for plan in versioned_plans:
+            if plan.type == mp.Type.SCHEMA and plan.change.backward is not None:
+                return plan.change.backward.id
+        return None
+
+    def _rollback_by_schema_jump(
         self,
-        plan: mp.MigrationPlan,
-        fast: bool = False,
-        checked_schema_index_sha: Set[str] = None,
+        versioned_plans: List[mp.MigrationPlan],
+        fake: bool = False,
+        operator: str = "",
     ):
-        if plan.change.forward is None:
-            raise err.IntegrityError(f"forward is None, {plan}")
+        sha1 = self._get_schema_jump_target(versioned_plans)
+        if not fake and sha1 is not None:
+            logger.info(
+                "Rollbacking %d migration plans by moving schema to %s",
+                len(versioned_plans),
+                sha1,
+            )
+            self.migrator.move_schema_to(sha1, self.name, allow_unsafe=True)
+        with self.dao.session.begin():
+            self.dao.delete_rollbacked(versioned_plans, operator=operator, fake=fake)
+            self.dao.commit()
 
-        index_sha1 = plan.change.forward.id
-        self._check_schema_by_index(index_sha1, plan, check_sha=not fast)
+    @with_env_lock
+    def goto(
+        self,
+        version: str,
+        name: Optional[str] = None,
+        *,
+        dry_run: bool = False,
+        operator: str = "",
+    ) -> List[route_planner.RouteStep]:
+        """
+        migrate or rollback to the plan of version and name by the cheapest
+        route
+        """
+        ver = version.zfill(4)
+        self.workspace.read_migration_plans()
+        self.workspace._check_integrity()
+        plans = self.mpm.get_plans()
+        _, target = self.mpm.must_get_plan_by_signature(
+            mp.MigrationSignature(ver, name)
+        )
 
-        if plan.match(mp.InitialMigrationSignature):
-            return
+        dao = self.build_dao()
+        with dao.session.begin():
+            current = len(self._get_and_check_versioned_migration_histories()) - 1
+            timings = dao.get_timings()
+        inverse_dependencies = self.mpm.get_repeatable_plan_inverse_dependencies()
+        planner = route_planner.RoutePlanner(
+            plans,
+            timings,
+            pinned={
+                idx
+                for idx, plan in enumerate(plans)
+                if plan.sig() in inverse_dependencies
+            },
+        )
+        route = planner.plan(current, target)
+        self.workspace._print_info_as_table(
+            "Route:",
+            [
+                [
+                    step.type,
+                    (
+                        # -1 means no plan is applied yet
+                        str(plans[step.start].sig())
+                        if step.start >= 0
+                        else None
+                    ),
+                    str(plans[step.end].sig()),
+                    abs(step.end - step.start),
+                    f"{step.cost:.1f}",
+                ]
+                for step in route
+            ],
+            ["step", "from", "to", "plans", "estimated seconds"],
+        )
+        logger.info("Estimated %.1f seconds in total", sum(step.cost for step in route))
+        if dry_run:
+            return route
+
+        # consecutive steps of the same type are run together
+        for step_type, steps in itertools.groupby(route, key=lambda step: step.type):
+            end_plan = plans[list(steps)[-1].end]
+            if step_type in (
+                route_planner.StepType.FORWARD,
+                route_planner.StepType.SCHEMA_PUSH,
+            ):
+                self.migrate(
+                    end_plan.version,
+                    end_plan.name,
+                    operator=operator,
+                    coalesce=step_type == route_planner.StepType.SCHEMA_PUSH,
+                )
+            else:
+                self.rollback(
+                    end_plan.version,
+                    end_plan.name,
+                    operator=operator,
+                    jump=step_type == route_planner.StepType.SCHEMA_JUMP,
+                )
+        return route
 
-        if plan.change.backward is None:
-            raise err.IntegrityError(f"backward is None, {plan}")
-        index_sha1 = plan.change.backward.id
-        if index_sha1 in checked_schema_index_sha:
-            return
-        self._check_schema_by_index(index_sha1, plan, check_sha=not fast)
+    def _clear(self):
+        logger.warning("Clearing database...")
+        dao = self.build_dao()
+        schema = dao.session.bind.url.database
+        with dao.session.begin():
+            dao.session.execute(text("SET FOREIGN_KEY_CHECKS=0;"))
+            rows = dao.session.execute(
+                text(
+                    "select table_name from information_schema.tables where"
+                    f" TABLE_SCHEMA = '{schema}';"
+                )
+            ).all()
+            for [table_name] in rows:
+                if table_name == cli_env.TABLE_MIGRATION_HISTORY_LOCK:
+                    # the lock may be held by this run
+                    continue
+                dao.session.execute(text(f"drop table `{table_name}`;"))
+            dao.session.execute(text("SET FOREIGN_KEY_CHECKS=1;"))
+            dao.commit()
+        # the history tables are dropped too
+        helper.forget_engine_tables(dao.session.get_bind())
+        logger.warning("Database cleared")
 
-    def _check_schema_by_index(
-        self, index_sha1: str, plan: mp.MigrationPlan, check_sha: bool = True
-    ):
-        try:
-            sql_files = self.read_schema_index(index_sha1, check_sha=check_sha)
-        except FileNotFoundError:
-            raise err.IntegrityError(
-                f"index file not found, {plan}, missing file:"
-                f" {helper.sha1_to_path(index_sha1)}"
+    def read_versioned_history(
+        self, host_engine: Optional[Engine] = None
+    ) -> List[model.MigrationHistoryDTO]:
+        """
+        read the versioned migration histories in one query, without creating
+        the history tables, an environment never migrated has none. With
+        host_engine, see helper.build_host_engine_from_env, the schema of the
+        environment is read through a connection of the engine of its host
+        """
+        if host_engine is None:
+            session = helper.build_session_from_env(
+                self.name, echo=cli_env.ALLOW_ECHO_SQL, create_all_tables=False
             )
-        # check sql file exist
-        for sql_sha1, sql_filename in sql_files:
-            sql_file_path = helper.sha1_to_path(sql_sha1)
-            if not os.path.exists(sql_file_path):
-                raise err.IntegrityError(
-                    f"sql file not found, {plan},"
-                    f" id={sql_sha1}, original filename={sql_filename}"
+        else:
+            session = Session(
+                bind=host_engine.execution_options(
+                    schema_translate_map={None: self.schema}
                 )
-            if check_sha:
-                with open(sql_file_path, "r") as f:
-                    content = f.read()
-                    actual_sha1 = self.sha1_encode([content])
-                    if actual_sha1 != sql_sha1:
-                        raise err.IntegrityError(
-                            f"sql file SHA1 not match, {plan},"
-                            f" original filename={sql_filename},"
-                            f" expected_sha1={sql_sha1}, actual_sha1={actual_sha1},"
-                            f" file={sql_file_path}"
-                        )
-
-    def _check_data_migration(self, plan: mp.MigrationPlan):
-        if plan.match(mp.InitialMigrationSignature):
-            raise err.IntegrityError(
-                f"initial migration plan should not be data migration, {plan}"
             )
+        try:
+            return hist_dao.MigrationHistoryDAO(session).get_all_versioned_dto()
+        except exc.DBAPIError as e:
+            if not is_no_such_table(e):
+                raise
+            return []
+        finally:
+            session.close()
+            if host_engine is None:
+                helper.release_engine(session.get_bind())
+
+    async def read_versioned_history_async(
+        self, host_engine: Optional[AsyncEngine] = None
+    ) -> List[model.MigrationHistoryDTO]:
+        """
+        read_versioned_history on an asyncmy engine, without a worker thread
+        """
+        engine = host_engine or helper.build_async_engine_from_env(
+            self.name, echo=cli_env.ALLOW_ECHO_SQL
+        )
+        try:
+            async with engine.connect() as conn:
+                if host_engine is not None:
+                    conn = await conn.execution_options(
+                        schema_translate_map={None: self.schema}
+                    )
+                return await hist_dao.select_dto_async(conn, versioned=True)
+        except exc.DBAPIError as e:
+            if not is_no_such_table(e):
+                raise
+            return []
+        finally:
+            if host_engine is None:
+                await engine.dispose()
 
-        if plan.change.forward is None:
-            raise err.IntegrityError(f"forward is None, {plan}")
-
-        def check_data_file(file: str):
-            if file is None or file == "":
-                raise err.IntegrityError(
-                    f"data migration file is empty, file={file}, {plan}"
-                )
-            if not os.path.exists(
-                os.path.join(cli_env.MIGRATION_CWD, cli_env.DATA_DIR, file)
-            ):
-                raise err.IntegrityError(
-                    f"data migration file not found, file={file}, {plan}"
-                )
+    def info(self, output_format: str = consts.OUTPUT_FORMAT_TABLE) -> Tuple[bool, int]:
+        """
+        return (is_migration_history_consistent, len_applied)
+        """
+        self.workspace.read_migration_plans()
+        dao = self.build_dao()
 
-        def check_forward_or_backward(
-            change: Optional[mp.DataForward | mp.DataBackward],
-        ):
-            if change.type == mp.DataChangeType.SQL:
-                if change.sql is None or change.sql == "":
-                    raise err.IntegrityError(f"sql is empty, {plan}")
+        def get_rollbackable(hist: model.MigrationHistoryDTO) -> str:
+            try:
+                match hist.type:
+                    case mp.Type.SCHEMA | mp.Type.DATA:
+                        plan, _ = self.mpm.must_get_plan_by_signature(
+                            mp.MigrationSignature(
+                                version=hist.ver,
+                                name=hist.name,
+                            )
+                        )
+                    case mp.Type.REPEATABLE:
+                        plan = self.mpm.must_get_repeatable_plan_by_signature(
+                            mp.MigrationSignature(version=hist.ver, name=hist.name)
+                        )
+                    case _:
+                        return "false"
+            except Exception:
+                return "unknown"
+            return "true" if plan.is_rollbackable() else "false"
 
-            if (
-                change.type == mp.DataChangeType.SQL_FILE
-                or change.type == mp.DataChangeType.PYTHON
-                or change.type == mp.DataChangeType.SHELL
-                or change.type == mp.DataChangeType.TYPESCRIPT
-            ):
-                check_data_file(change.file)
+        def to_row(hist: model.MigrationHistoryDTO) -> List:
+            return [
+                hist.ver,
+                hist.name,
+                hist.type,
+                hist.state.name,
+                get_rollbackable(hist),
+                hist.created,
+                hist.updated,
+            ]
 
-        check_forward_or_backward(plan.change.forward)
+        headers = ["ver", "name", "type", "state", "rollbackable", "created", "updated"]
+        if output_format == consts.OUTPUT_FORMAT_TABLE:
+            hist_list = dao.get_all_dto()
+            self.workspace._print_info_as_table(
+                "Migration history:", [to_row(hist) for hist in hist_list], headers
+            )
+            return True, len(hist_list)
 
-        if plan.change.backward is not None:
-            check_forward_or_backward(plan.change.backward)
+        # streamed from a server side cursor
+        with report.RowWriter(output_format, headers) as writer:
+            for hist in dao.iter_dto():
+                writer.write(to_row(hist))
+        return True, writer.count
 
-    def test_gen(self):
-        test_type = self.args.type
-        output_file_path = self.args.output
-        walk_len = self.args.walk_len if "walk_len" in self.args else None
-        start = self.args.start if "start" in self.args else ""
-        important = self.args.important if "important" in self.args else ""
-        non_important = self.args.non_important if "non_important" in self.args else ""
-        atp = auto_test_plan.AutoTestPlan()
+    def compact_history(self, batch_size: int = 1000) -> int:
+        dao = self.build_dao()
+        total = dao.compact_snapshots(batch_size=batch_size)
+        logger.info("Compacted %d migration history logs in total", total)
+        return total
 
-        test_plan = atp.gen(
-            test_type=test_type,
-            walk_len=walk_len,
-            start=start,
-            important=important,
-            non_important=non_important,
+    def archive_history(self, before: datetime.datetime, batch_size: int = 1000) -> int:
+        dao = self.build_dao()
+        replica_throttle = throttle.build_throttle_from_env(self.name)
+        try:
+            total = dao.archive_logs(
+                before, batch_size=batch_size, throttle=replica_throttle
+            )
+        finally:
+            if replica_throttle is not None:
+                replica_throttle.close()
+        logger.info(
+            "Archived %d migration history logs created before %s to %s",
+            total,
+            before,
+            cli_env.TABLE_MIGRATION_HISTORY_LOG_ARCHIVE,
         )
+        return total
 
-        plan_str = json.dumps(test_plan, indent=4)
-        logger.info("Test plan:\n%s", plan_str)
-        with open(output_file_path, "w") as f:
-            f.write(plan_str + "\n")
-        logger.info("Test plan is saved to %s", output_file_path)
+    @with_env_lock
+    def partition_history(
+        self, months_ahead: int = 3, *, operator: str = ""
+    ) -> List[str]:
+        dao = self.build_dao()
+        with dao.session.begin():
+            return dao.partition_logs(months_ahead=months_ahead)
 
-    def test_run(self):
-        test_type = self.args.type
-        clear = self.args.clear if "clear" in self.args else False
-        walk_len = self.args.walk_len if "walk_len" in self.args else None
-        start = self.args.start if "start" in self.args else ""
-        important = self.args.important if "important" in self.args else ""
-        non_important = self.args.non_important if "non_important" in self.args else ""
-        input_file_path = self.args.input
+    @with_env_lock
+    def test_run(
+        self,
+        test_type: str,
+        input_file_path: str = "test_plan.json",
+        *,
+        clear: bool = False,
+        walk_len: Optional[int] = None,
+        start: str = "",
+        important: str = "",
+        non_important: str = "",
+        operator: str = "",
+    ):
+        """
+        walk the plans by the generated test plan, or the custom one of
+        input_file_path
+        """
         atp = auto_test_plan.AutoTestPlan()
 
         if test_type == consts.TEST_TYPE_CUSTOM:
-            with open(input_file_path, "r") as f:
-                test_plan = json.load(f)
+            test_plan = auto_test_plan.read_test_plan_file(input_file_path)
         else:
             test_plan = atp.gen(
                 test_type=test_type,
@@ -1228,15 +2009,193 @@ class CLI:
             self._clear()
 
         for idx, tp in enumerate(test_miration_plans):
-            self.args.version = tp[0].version
-            self.args.name = tp[0].name
+            plan = tp[0]
+            if idx == 0 or tp[1] > test_miration_plans[idx - 1][1]:
+                self.migrate(plan.version, plan.name, operator=operator)
+            else:
+                self.rollback(plan.version, plan.name, operator=operator)
 
-            if idx == 0:
-                self.migrate()
-                continue
 
-            prev_tp = test_miration_plans[idx - 1]
-            if tp[1] > prev_tp[1]:
-                self.migrate()
-            else:
-                self.rollback()
+class CLI(Workspace):
+    """
+    The sdm commands, which read their options from args and run the typed
+    methods of Workspace and Environment
+    """
+
+    def __init__(self, args: Namespace = None, migrator: Optional[Migrator] = None):
+        super().__init__(migrator=migrator)
+        self.args = args
+
+    def env(self) -> Environment:
+        return self.environment(self.args.environment)
+
+    @property
+    def dao(self) -> hist_dao.MigrationHistoryDAO:
+        return self.env().dao
+
+    def _options(self, *names: str, **defaults) -> Dict:
+        """
+        return the options of names in args, and the ones of defaults with
+        the defaults when they are not in args
+        """
+        options = {name: getattr(self.args, name) for name in names}
+        for name, default in defaults.items():
+            options[name] = getattr(self.args, name) if name in self.args else default
+        return options
+
+    def hold_env_lock(self) -> Iterator[Optional[env_lock.EnvironmentLock]]:
+        return self.env().hold_env_lock(**self._options(operator="", dry_run=False))
+
+    def lock_status(self):
+        return self.env().lock_status()
+
+    def build_dao(self) -> hist_dao.MigrationHistoryDAO:
+        return self.env().build_dao()
+
+    def _clear(self):
+        self.env()._clear()
+
+    def fix_migrate(self):
+        self.env().fix_migrate(**self._options(fake=False, operator=""))
+
+    def fix_rollback(self):
+        self.env().fix_rollback(**self._options(fake=False, operator=""))
+
+    def migrate(self):
+        self.env().migrate(
+            **self._options(
+                version=None,
+                name=None,
+                fake=False,
+                dry_run=False,
+                operator="",
+                coalesce=False,
+                output_format=consts.OUTPUT_FORMAT_TABLE,
+            )
+        )
+
+    def rollback(self):
+        self.env().rollback(
+            **self._options(
+                "version",
+                name=None,
+                fake=False,
+                dry_run=False,
+                operator="",
+                jump=False,
+                output_format=consts.OUTPUT_FORMAT_TABLE,
+            )
+        )
+
+    def goto(self) -> List[route_planner.RouteStep]:
+        return self.env().goto(
+            **self._options("version", name=None, dry_run=False, operator="")
+        )
+
+    def osc(self):
+        super().osc(
+            **self._options(
+                "host",
+                "port",
+                "user",
+                "schema",
+                "table",
+                "alter",
+                chunk_size=cli_env.ONLINE_ALTER_CHUNK_SIZE,
+                environment=None,
+            )
+        )
+
+    def add_environment(self):
+        super().add_environment(
+            self.args.environment, **self._options("host", "port", "user")
+        )
+
+    def init(self):
+        super().init(**self._options("host", "port", "user", "schema", author=""))
+
+    def make_repeatable_migration(self) -> str:
+        conflicts_with = (
+            self.args.conflicts_with if "conflicts_with" in self.args else None
+        )
+        return super().make_repeatable_migration(
+            self.args.name,
+            self.args.type,
+            conflicts_with=conflicts_with.split(",") if conflicts_with else None,
+            **self._options(author="", parallel_group=None),
+        )
+
+    def make_data_migration(self) -> str:
+        return super().make_data_migration(
+            self.args.name, self.args.type, **self._options(author="")
+        )
+
+    def make_schema_migration(self) -> str:
+        return super().make_schema_migration(self.args.name, **self._options(author=""))
+
+    def info(self) -> Tuple[bool, int]:
+        if "all_envs" in self.args and self.args.all_envs:
+            statuses = self.info_all_envs(
+                **self._options(
+                    output_format=consts.OUTPUT_FORMAT_TABLE,
+                    host_concurrency=cli_env.INFO_HOST_CONCURRENCY,
+                )
+            )
+            return True, len(statuses)
+        if self.args.environment is None:
+            raise Exception("Environment is required without --all-envs")
+        return self.env().info(
+            **self._options(output_format=consts.OUTPUT_FORMAT_TABLE)
+        )
+
+    def compact_history(self) -> int:
+        return self.env().compact_history(**self._options(batch_size=1000))
+
+    def archive_history(self) -> int:
+        return self.env().archive_history(**self._options("before", batch_size=1000))
+
+    def partition_history(self) -> List[str]:
+        return self.env().partition_history(
+            **self._options(months_ahead=3, operator="")
+        )
+
+    def pull(self):
+        super().pull(self.args.env_or_version)
+
+    def diff(self):
+        super().diff(**self._options("left", "right", verbose=False))
+
+    def clean_schema_store(self) -> List[str]:
+        return super().clean_schema_store(
+            **self._options(dry_run=False, skip_integrity=False, max_time=None)
+        )
+
+    def check_integrity(self):
+        super().check_integrity(**self._options(fast=False))
+
+    def test_gen(self):
+        super().test_gen(
+            self.args.type,
+            self.args.output,
+            **self._options(
+                walk_len=None,
+                start="",
+                important="",
+                non_important="",
+                output_format=consts.OUTPUT_FORMAT_JSON,
+            ),
+        )
+
+    def test_run(self):
+        self.env().test_run(
+            self.args.type,
+            self.args.input,
+            **self._options(
+                clear=False,
+                walk_len=None,
+                start="",
+                important="",
+                non_important="",
+                operator="",
+            ),
+        )
@@ -1,5 +1,6 @@
 import logging
 import sys
+from typing import TextIO
 
 from migration.env import log_env
 
@@ -21,3 +22,14 @@ def set_log() -> None:
         level=logging._nameToLevel.get(log_env.LOG_LEVEL),
         force=True,
     )
+
+
+def set_console_stream(stream: TextIO) -> None:
+    """
+    write the console logs to stream, e.g. to stderr to leave stdout to a
+    machine readable output
+    """
+    for h in logging.getLogger().handlers:
+        # the file handler is a StreamHandler too
+        if type(h) is logging.StreamHandler:
+            h.setStream(stream)
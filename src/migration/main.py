@@ -1,14 +1,19 @@
 import argparse
+import datetime
 import logging
 import os
 import sys
 from enum import StrEnum
+from typing import List
 
 from migration import __version__
 
-from . import consts
-from .env import log_env
+from . import consts, daemon
+from . import migration_plan as mp
+from . import profiling, tracing
+from .env import cli_env, log_env
 from .lib import CLI
+from .log import setting
 
 logger = logging.getLogger(__name__)
 
@@ -36,6 +41,27 @@ def add_mysql_args(parser: argparse.ArgumentParser):
     )
 
 
+def add_format_arg(
+    parser: argparse.ArgumentParser,
+    choices: List[str],
+    default: str,
+    help: str,
+    to_stdout: bool = True,
+):
+    """
+    without to_stdout the output is written to a file, and the logs stay on
+    stdout whatever the format
+    """
+    parser.add_argument(
+        "--format",
+        dest="output_format",
+        choices=choices,
+        default=default,
+        help=help,
+    )
+    parser.set_defaults(output_to_stdout=to_stdout)
+
+
 def parse_test_sub_args(parser_gen: argparse.ArgumentParser):
     parser_gen.add_argument(
         "--walk-len",
@@ -81,6 +107,13 @@ def parse_test_args(parser: argparse.ArgumentParser):
         required=False,
         default="test_plan.json",
     )
+    add_format_arg(
+        parser_gen,
+        [consts.OUTPUT_FORMAT_JSON] + consts.STREAM_OUTPUT_FORMAT,
+        consts.OUTPUT_FORMAT_JSON,
+        "format of the output file, jsonl and csv are written as they are generated",
+        to_stdout=False,
+    )
     parse_test_sub_args(parser_gen)
 
     parser_run = subparsers.add_parser(
@@ -105,6 +138,37 @@ def parse_test_args(parser: argparse.ArgumentParser):
     parse_test_sub_args(parser_run)
 
 
+def parse_osc_args(parser: argparse.ArgumentParser):
+    add_mysql_args(parser)
+    parser.add_argument(
+        "--schema",
+        required=True,
+        help="MySQL schema",
+    )
+    parser.add_argument(
+        "--table",
+        required=True,
+        help="table to alter",
+    )
+    parser.add_argument(
+        "--alter",
+        required=True,
+        help="ALTER TABLE clauses",
+    )
+    parser.add_argument(
+        "--chunk-size",
+        required=False,
+        type=int,
+        default=cli_env.ONLINE_ALTER_CHUNK_SIZE,
+        help="number of rows copied per statement",
+    )
+    parser.add_argument(
+        "--environment",
+        required=False,
+        help="environment whose replicas are waited for between chunks",
+    )
+
+
 def parse_clean_args(parser: argparse.ArgumentParser):
     subparsers = parser.add_subparsers(
         title="subcommand", dest="subcommand", required=True
@@ -122,6 +186,89 @@ def parse_clean_args(parser: argparse.ArgumentParser):
         action="store_true",
         help="skip integrity check before clean",
     )
+    parse_schema_store.add_argument(
+        "--max-time",
+        required=False,
+        type=float,
+        default=None,
+        help=(
+            "time budget in seconds, sweep part of the schema store and continue"
+            " from there next time"
+        ),
+    )
+
+
+def parse_lock_args(parser: argparse.ArgumentParser):
+    subparsers = parser.add_subparsers(
+        title="subcommand", dest="subcommand", required=True
+    )
+    parser_status = subparsers.add_parser(
+        Command.LOCK_STATUS, help="show the holder of the environment lock"
+    )
+    parser_status.add_argument(
+        "environment",
+        help="environment name",
+    )
+
+
+def parse_history_args(parser: argparse.ArgumentParser):
+    subparsers = parser.add_subparsers(
+        title="subcommand", dest="subcommand", required=True
+    )
+    parser_compact = subparsers.add_parser(
+        Command.HISTORY_COMPACT,
+        help="move inline snapshots of old history logs to the snapshot table",
+    )
+    parser_compact.add_argument(
+        "environment",
+        help="environment name",
+    )
+    parser_compact.add_argument(
+        "--batch-size",
+        required=False,
+        type=int,
+        default=1000,
+        help="number of log rows per transaction",
+    )
+    parser_archive = subparsers.add_parser(
+        Command.HISTORY_ARCHIVE,
+        help="move old history logs to the archive table",
+    )
+    parser_archive.add_argument(
+        "environment",
+        help="environment name",
+    )
+    parser_archive.add_argument(
+        "--before",
+        required=True,
+        type=datetime.datetime.fromisoformat,
+        help="archive logs created before this UTC date, e.g. 2024-01-01",
+    )
+    parser_archive.add_argument(
+        "--batch-size",
+        required=False,
+        type=int,
+        default=1000,
+        help="number of log rows per transaction",
+    )
+    parser_partition = subparsers.add_parser(
+        Command.HISTORY_PARTITION,
+        help=(
+            "partition the history log table by month, or add the partitions of"
+            " the coming months"
+        ),
+    )
+    parser_partition.add_argument(
+        "environment",
+        help="environment name",
+    )
+    parser_partition.add_argument(
+        "--months-ahead",
+        required=False,
+        type=int,
+        default=3,
+        help="number of months to create partitions for ahead of now",
+    )
 
 
 def parse_pull_args(parser: argparse.ArgumentParser):
@@ -177,13 +324,43 @@ def parse_diff_args(parser: argparse.ArgumentParser):
 def parse_info_args(parser: argparse.ArgumentParser):
     parser.add_argument(
         "environment",
-        default="production",
+        nargs="?",
+        default=None,
         help="environment name",
     )
+    parser.add_argument(
+        "--all-envs",
+        action="store_true",
+        help="show the status of every environment side by side",
+    )
+    parser.add_argument(
+        "--host-concurrency",
+        type=int,
+        default=cli_env.INFO_HOST_CONCURRENCY,
+        help="with --all-envs, the histories read at the same time per MySQL host",
+    )
+    add_format_arg(
+        parser,
+        consts.ALL_OUTPUT_FORMAT,
+        consts.OUTPUT_FORMAT_TABLE,
+        "output format, jsonl and csv are written as the history is read",
+    )
 
 
 def parse_make_repeatable_migration_args(parser: argparse.ArgumentParser):
     parse_make_data_migration_args(parser)
+    parser.add_argument(
+        "--parallel-group",
+        required=False,
+        default=None,
+        help="run concurrently with the other plans of the group",
+    )
+    parser.add_argument(
+        "--conflicts-with",
+        required=False,
+        default=None,
+        help="comma separated names of plans never run concurrently with it",
+    )
 
 
 def parse_make_data_migration_args(parser: argparse.ArgumentParser):
@@ -193,10 +370,7 @@ def parse_make_data_migration_args(parser: argparse.ArgumentParser):
     )
     parser.add_argument(
         "type",
-        help=(
-            "available types:"
-            f" {','.join(['sql', 'sql_file', 'python', 'shell', 'typescript'])}"
-        ),
+        help=f"available types: {','.join([str(t) for t in mp.DataChangeType])}",
     )
     parser.add_argument(
         "--author",
@@ -272,11 +446,55 @@ def parse_rollback_args(parser: argparse.ArgumentParser):
         action="store_true",
         help="fake rollback without executing sql",
     )
+    parser.add_argument(
+        "--jump",
+        required=False,
+        action="store_true",
+        help=(
+            "push the target schema once instead of rollbacking plans one by one,"
+            " if the plans to rollback only change schema"
+        ),
+    )
     parser.add_argument(
         "--dry-run",
         action="store_true",
         help="dry run",
     )
+    add_format_arg(
+        parser,
+        [consts.OUTPUT_FORMAT_TABLE] + consts.STREAM_OUTPUT_FORMAT,
+        consts.OUTPUT_FORMAT_TABLE,
+        "output format of the dry run",
+    )
+    parser.add_argument(
+        "-o",
+        "--operator",
+        required=False,
+        default="",
+        help="migration plan name",
+    )
+
+
+def parse_goto_args(parser: argparse.ArgumentParser):
+    parser.add_argument(
+        "environment",
+        help="environment name",
+    )
+    parser.add_argument(
+        "version",
+        help="integer version",
+    )
+    parser.add_argument(
+        "-n",
+        "--name",
+        required=False,
+        help="migration plan name",
+    )
+    parser.add_argument(
+        "--dry-run",
+        action="store_true",
+        help="print the route and its estimated cost",
+    )
     parser.add_argument(
         "-o",
         "--operator",
@@ -314,6 +532,12 @@ def parse_migrate_args(parser: argparse.ArgumentParser):
         action="store_true",
         help="dry run",
     )
+    add_format_arg(
+        parser,
+        [consts.OUTPUT_FORMAT_TABLE] + consts.STREAM_OUTPUT_FORMAT,
+        consts.OUTPUT_FORMAT_TABLE,
+        "output format of the dry run",
+    )
     parser.add_argument(
         "-o",
         "--operator",
@@ -339,6 +563,15 @@ def parse_skeema_args(parser: argparse.ArgumentParser):
     )
 
 
+def parse_serve_args(parser: argparse.ArgumentParser):
+    parser.add_argument(
+        "--socket",
+        required=False,
+        default=cli_env.DAEMON_SOCKET,
+        help="unix socket to listen on",
+    )
+
+
 def parse_init_args(parser: argparse.ArgumentParser):
     add_mysql_args(parser)
     parser.add_argument(
@@ -369,6 +602,10 @@ class Command(StrEnum):
     ROLLBACK = "rollback"
     ALIAS_ROLLBACK = "r"
 
+    GOTO = "goto"
+
+    OSC = "osc"
+
     MAKE_SCHEMA = "make-schema"
     ALIAS_MAKE_SCHEMA = "ms"
 
@@ -392,6 +629,16 @@ class Command(StrEnum):
     CLEAN = "clean"
     CLEAN_SCHEMA_STORE = "store"
 
+    LOCK = "lock"
+    LOCK_STATUS = "status"
+
+    HISTORY = "history"
+    HISTORY_COMPACT = "compact"
+    HISTORY_ARCHIVE = "archive"
+    HISTORY_PARTITION = "partition"
+
+    SERVE = "serve"
+
     TEST = "test"
     ALIAS_TEST = "t"
     TEST_GEN = "gen"
@@ -410,6 +657,16 @@ def parse_args(args):
         action="version",
         version=f"sdm {__version__}",
     )
+    parent_parser.add_argument(
+        "--profile",
+        nargs="?",
+        const=profiling.ProfileMode.CPROFILE,
+        choices=list(profiling.ProfileMode),
+        help=(
+            "profile the command, written to PROFILE_DIR, use --profile=wall for"
+            " sampled wall clock stacks and a speedscope file"
+        ),
+    )
     subparsers = parent_parser.add_subparsers(
         title="command", dest="command", required=True
     )
@@ -442,6 +699,20 @@ def parse_args(args):
     )
     parse_rollback_args(parser_migrate)
 
+    # goto
+    parser_goto = subparsers.add_parser(
+        Command.GOTO,
+        help="migrate or rollback to a version by the cheapest route",
+    )
+    parse_goto_args(parser_goto)
+
+    # online schema change, run by skeema as alter-wrapper
+    parser_osc = subparsers.add_parser(
+        Command.OSC,
+        help="alter a table by copying it to an altered shadow table",
+    )
+    parse_osc_args(parser_osc)
+
     # fix migrate/rollback
     parser_fix = subparsers.add_parser(Command.FIX, help="fix migration history")
     parse_fix_args(parser_fix)
@@ -501,6 +772,23 @@ def parse_args(args):
     parser_clean = subparsers.add_parser(Command.CLEAN, help="clean schema store")
     parse_clean_args(parser_clean)
 
+    parser_lock = subparsers.add_parser(Command.LOCK, help="environment lock")
+    parse_lock_args(parser_lock)
+
+    parser_history = subparsers.add_parser(
+        Command.HISTORY, help="maintain migration history tables"
+    )
+    parse_history_args(parser_history)
+
+    parser_serve = subparsers.add_parser(
+        Command.SERVE,
+        help=(
+            "run the commands forwarded with DAEMON_FORWARD=1, keeping plans,"
+            " integrity checks and engines warm"
+        ),
+    )
+    parse_serve_args(parser_serve)
+
     parser_test = subparsers.add_parser(Command.TEST, help="test migration plans")
     parse_test_args(parser_test)
 
@@ -508,7 +796,35 @@ def parse_args(args):
 
 
 def main(raw_args):
+    mode, raw_args = profiling.split_profile_args(raw_args)
+    if mode is not None:
+        label = raw_args[0] if raw_args and not raw_args[0].startswith("-") else "sdm"
+        with profiling.Profiler(mode, label=label):
+            return main(raw_args)
     args = parse_args(raw_args)
+    if args.command == Command.SERVE:
+        # every command served is traced on its own
+        daemon.DaemonServer(args.socket, run_command=main).serve()
+        return
+    if (
+        getattr(args, "output_to_stdout", False)
+        and args.output_format != consts.OUTPUT_FORMAT_TABLE
+    ):
+        # leave stdout to the machine readable output
+        setting.set_console_stream(sys.stderr)
+    with tracing.export_to_file(cli_env.TRACE_FILE):
+        with tracing.span(
+            f"sdm {args.command}",
+            {
+                "sdm.command": args.command,
+                "sdm.subcommand": args.subcommand if "subcommand" in args else None,
+                "sdm.environment": args.environment if "environment" in args else None,
+            },
+        ):
+            dispatch(args, raw_args)
+
+
+def dispatch(args: argparse.Namespace, raw_args):
     cli = CLI(args)
 
     match args.command:
@@ -522,6 +838,10 @@ def main(raw_args):
             cli.migrate()
         case Command.ROLLBACK | Command.ALIAS_ROLLBACK:
             cli.rollback()
+        case Command.GOTO:
+            cli.goto()
+        case Command.OSC:
+            cli.osc()
         case Command.FIX:
             match args.subcommand:
                 case Command.MIGRATE | Command.ALIAS_MIGRATE:
@@ -557,6 +877,18 @@ def main(raw_args):
                             "Found %d unexpected files in schema store"
                             % len(unexpected_files)
                         )
+        case Command.LOCK:
+            match args.subcommand:
+                case Command.LOCK_STATUS:
+                    cli.lock_status()
+        case Command.HISTORY:
+            match args.subcommand:
+                case Command.HISTORY_COMPACT:
+                    cli.compact_history()
+                case Command.HISTORY_ARCHIVE:
+                    cli.archive_history()
+                case Command.HISTORY_PARTITION:
+                    cli.partition_history()
         case Command.TEST:
             match args.subcommand:
                 case Command.TEST_GEN:
@@ -32,6 +32,7 @@ class DataChangeType(StrEnum):
     PYTHON = "python"
     SHELL = "shell"
     TYPESCRIPT = "typescript"
+    BULK_LOAD = "bulk_load"
 
     @classmethod
     def is_valid(cls, x):
@@ -41,6 +42,7 @@ class DataChangeType(StrEnum):
             or x == cls.PYTHON
             or x == cls.SHELL
             or x == cls.TYPESCRIPT
+            or x == cls.BULK_LOAD
         )
 
 
@@ -98,6 +100,11 @@ class DataForward:
     precheck: Optional[ConditionCheck | None] = None
     postcheck: Optional[ConditionCheck | None] = None
     envs: Optional[List[str] | None] = None
+    # bulk_load: the target table, the table column by file column (default
+    #   the file columns as they are) and the rows per INSERT
+    table: Optional[str | None] = None
+    columns: Optional[Dict[str, str] | None] = None
+    batch_size: Optional[int | None] = None
 
     def to_dict(self) -> Dict:
         obj = {
@@ -113,6 +120,13 @@ class DataForward:
                 | DataChangeType.TYPESCRIPT
             ):
                 obj["file"] = self.file
+            case DataChangeType.BULK_LOAD:
+                obj["file"] = self.file
+                obj["table"] = self.table
+                if self.columns is not None:
+                    obj["columns"] = self.columns
+                if self.batch_size is not None:
+                    obj["batch_size"] = self.batch_size
         if self.precheck is not None:
             obj["precheck"] = self.precheck.to_dict()
         if self.postcheck is not None:
@@ -132,6 +146,8 @@ class DataForward:
             or self.type == DataChangeType.TYPESCRIPT
         ):
             return self.file
+        elif self.type == DataChangeType.BULK_LOAD:
+            return f"{self.file} -> {self.table}"
         else:
             raise Exception(f"Invalid type {self.type}")
 
@@ -237,6 +253,10 @@ class MigrationPlan:
     change: Change
     dependencies: List[MigrationSignature]
     ignore_after: Optional[MigrationSignature | None] = None
+    # repeatable plans of the same group can run concurrently,
+    #   except with the plans named in conflicts_with
+    parallel_group: Optional[str] = None
+    conflicts_with: Optional[List[str]] = None
 
     _checksum: Optional[str | None] = None  # the value is not saved to file
     _checksum_match: Optional[bool | None] = None  # the value is not saved to file
@@ -261,8 +281,17 @@ class MigrationPlan:
         }
         if self.ignore_after is not None:
             obj["ignore_after"] = self.ignore_after.to_dict()
+        if self.parallel_group is not None:
+            obj["parallel_group"] = self.parallel_group
+        if self.conflicts_with:
+            obj["conflicts_with"] = self.conflicts_with
         return obj
 
+    def conflicts(self, other: "MigrationPlan") -> bool:
+        return other.name in (self.conflicts_with or []) or self.name in (
+            other.conflicts_with or []
+        )
+
     def is_rollbackable(self) -> bool:
         return (self.change is not None) and (self.change.backward is not None)
 
@@ -284,6 +313,8 @@ class MigrationPlan:
                         | DataChangeType.TYPESCRIPT
                     ):
                         sha1.update_file([os.path.join(data_dir, forward.file)])
+                    case DataChangeType.BULK_LOAD:
+                        sha1.update_binary_file([os.path.join(data_dir, forward.file)])
                 if forward.envs is not None:
                     for key in forward.envs:
                         sha1.update_str([f"{key}={os.getenv(key, default='')}"])
@@ -296,6 +327,10 @@ class MigrationPlan:
                             | DataChangeType.TYPESCRIPT
                         ):
                             sha1.update_file([os.path.join(data_dir, backward.file)])
+                        case DataChangeType.BULK_LOAD:
+                            sha1.update_binary_file(
+                                [os.path.join(data_dir, backward.file)]
+                            )
                     if backward.envs is not None:
                         for key in backward.envs:
                             sha1.update_str([f"{key}={os.getenv(key, default='')}"])
@@ -330,6 +365,33 @@ class MigrationPlan:
         return self.version == sig.version and self.name == sig.name
 
 
+def group_parallel_plans(plans: List[MigrationPlan]) -> List[List[MigrationPlan]]:
+    """
+    Split repeatable plans into batches run one after another, the plans of a
+    batch share a parallel_group and do not conflict with each other.
+    a plan only joins the latest batch of its group, and a plan without
+    parallel_group or a conflict closes the open batches, so no plan runs
+    before a plan declared ahead of it that it must wait for
+    """
+    batches: List[List[MigrationPlan]] = []
+    open_batches: Dict[str, List[MigrationPlan]] = {}
+    for plan in plans:
+        if plan.parallel_group is None:
+            open_batches.clear()
+            batches.append([plan])
+            continue
+        batch = open_batches.get(plan.parallel_group)
+        if batch is not None and not any(plan.conflicts(other) for other in batch):
+            batch.append(plan)
+            continue
+        if batch is not None:
+            open_batches.clear()
+        batch = [plan]
+        open_batches[plan.parallel_group] = batch
+        batches.append(batch)
+    return batches
+
+
 @dataclass
 class SQLFile:
     name: str
@@ -1,59 +1,96 @@
-import importlib.util
 import logging
 import os
 import shlex
 import shutil
-import subprocess
 import tempfile
-from argparse import Namespace
-from typing import Optional
+import threading
+from types import ModuleType
+from typing import Dict, List, Optional
 
 from sqlalchemy import text
 
-from . import consts, err, helper
+from . import aio, bulk_load, consts, err, helper
 from . import migration_plan as mp
+from . import python_runner, throttle, tracing
 from .env import cli_env
+from .schema_workdir import SchemaWorkdirCache
 
 logger = logging.getLogger(__name__)
 
 
+def plan_attributes(plan: mp.MigrationPlan) -> Dict[str, str]:
+    return {
+        "sdm.plan.version": plan.version,
+        "sdm.plan.name": plan.name,
+        "sdm.plan.type": str(plan.type),
+    }
+
+
 class Migrator:
+    def __init__(self, schema_workdir_cache: SchemaWorkdirCache = None):
+        self.schema_workdir_cache = schema_workdir_cache or SchemaWorkdirCache()
+        # python migration modules by sha1 of the file, so a file used by the
+        #   precheck, change and postcheck of a plan is executed once per run,
+        #   see clear_python_modules
+        self._python_modules: Dict[str, ModuleType] = {}
+        self._python_modules_mutex = threading.Lock()
+
     def check_condition(
         self,
         condition: mp.ConditionCheck,
-        args: Namespace,
+        environment: str,
+        checksum_match: Optional[bool] = None,
+    ) -> bool:
+        with tracing.span(
+            "migrator.check_condition", {"sdm.condition.type": str(condition.type)}
+        ) as s:
+            result = self._check_condition(condition, environment, checksum_match)
+            if s is not None:
+                s.set("sdm.condition.result", bool(result))
+            return result
+
+    def _check_condition(
+        self,
+        condition: mp.ConditionCheck,
+        environment: str,
         checksum_match: Optional[bool] = None,
     ) -> bool:
         match condition.type:
             case mp.DataChangeType.SQL:
-                return self.check_condition_sql(condition.sql, condition.expected, args)
+                return self.check_condition_sql(
+                    condition.sql, condition.expected, environment
+                )
             case mp.DataChangeType.SQL_FILE:
                 return self.check_condition_sql_file(
-                    condition.file, condition.expected, args
+                    condition.file, condition.expected, environment
                 )
             case mp.DataChangeType.PYTHON:
                 return self.check_condition_python(
                     condition.file,
                     condition.expected,
-                    args,
+                    environment,
                     checksum_match=checksum_match,
                 )
             case mp.DataChangeType.SHELL:
                 return self.check_condition_shell(
                     condition.file,
                     condition.expected,
-                    args,
+                    environment,
                     checksum_match=checksum_match,
                 )
             case mp.DataChangeType.TYPESCRIPT:
                 return self.check_condition_typescript(
                     condition.file,
                     condition.expected,
-                    args,
+                    environment,
                     checksum_match=checksum_match,
                 )
 
-    def forward(self, migration_plan: mp.MigrationPlan, args: Namespace):
+    def forward(self, migration_plan: mp.MigrationPlan, environment: str):
+        with tracing.span("migrator.forward", plan_attributes(migration_plan)):
+            self._forward(migration_plan, environment)
+
+    def _forward(self, migration_plan: mp.MigrationPlan, environment: str):
         logger.info(f"Executing {migration_plan}")
         forward = migration_plan.change.forward
 
@@ -61,7 +98,7 @@ class Migrator:
         if forward.precheck is not None:
             if not self.check_condition(
                 forward.precheck,
-                args,
+                environment,
                 checksum_match=migration_plan.get_checksum_match(),
             ):
                 raise err.ConditionCheckFailedError(
@@ -70,27 +107,34 @@ class Migrator:
 
         if migration_plan.type == mp.Type.SCHEMA:
             sha1 = forward.id
-            self.move_schema_to(sha1, args)
+            self.move_schema_to(sha1, environment)
         if migration_plan.type in [mp.Type.DATA, mp.Type.REPEATABLE]:
+            self.wait_for_replicas(environment)
             if forward.type == mp.DataChangeType.SQL:
-                self.migrate_data_sql(forward.sql, args)
+                self.migrate_data_sql(forward.sql, environment)
             if forward.type == mp.DataChangeType.SQL_FILE:
-                self.migrate_data_sql_file(forward.file, args)
+                self.migrate_data_sql_file(forward.file, environment)
             if forward.type == mp.DataChangeType.PYTHON:
-                self.migrate_data_python(forward.file, args)
+                self.migrate_data_python(forward.file, environment)
             if forward.type == mp.DataChangeType.SHELL:
-                self.migrate_data_shell(forward.file, args)
+                self.migrate_data_shell(forward.file, environment)
             if forward.type == mp.DataChangeType.TYPESCRIPT:
-                self.migrate_data_typescript(forward.file, args)
+                self.migrate_data_typescript(forward.file, environment)
+            if forward.type == mp.DataChangeType.BULK_LOAD:
+                self.migrate_data_bulk_load(forward, environment)
 
         # postcheck
         if forward.postcheck is not None:
-            if not self.check_condition(forward.postcheck, args):
+            if not self.check_condition(forward.postcheck, environment):
                 raise err.ConditionCheckFailedError(
                     f"postcheck failed for {migration_plan}"
                 )
 
-    def backward(self, migration_plan: mp.MigrationPlan, args: Namespace):
+    def backward(self, migration_plan: mp.MigrationPlan, environment: str):
+        with tracing.span("migrator.backward", plan_attributes(migration_plan)):
+            self._backward(migration_plan, environment)
+
+    def _backward(self, migration_plan: mp.MigrationPlan, environment: str):
         logger.info(f"Rollbacking {migration_plan}")
         backward = migration_plan.change.backward
         if backward is None:
@@ -99,43 +143,53 @@ class Migrator:
 
         # precheck
         if backward.precheck is not None:
-            if not self.check_condition(backward.precheck, args):
+            if not self.check_condition(backward.precheck, environment):
                 raise err.ConditionCheckFailedError(
                     f"precheck failed for {migration_plan}"
                 )
 
         if migration_plan.type == mp.Type.SCHEMA:
             sha1 = backward.id
-            self.move_schema_to(sha1, args, allow_unsafe=True)
+            self.move_schema_to(sha1, environment, allow_unsafe=True)
         if migration_plan.type in [mp.Type.DATA, mp.Type.REPEATABLE]:
+            self.wait_for_replicas(environment)
             if backward.type == mp.DataChangeType.SQL:
-                self.migrate_data_sql(backward.sql, args)
+                self.migrate_data_sql(backward.sql, environment)
             if backward.type == mp.DataChangeType.SQL_FILE:
-                self.migrate_data_sql_file(backward.file, args)
+                self.migrate_data_sql_file(backward.file, environment)
             if backward.type == mp.DataChangeType.PYTHON:
-                self.migrate_data_python(backward.file, args)
+                self.migrate_data_python(backward.file, environment)
             if backward.type == mp.DataChangeType.SHELL:
-                self.migrate_data_shell(backward.file, args)
+                self.migrate_data_shell(backward.file, environment)
             if backward.type == mp.DataChangeType.TYPESCRIPT:
-                self.migrate_data_typescript(backward.file, args)
+                self.migrate_data_typescript(backward.file, environment)
+            if backward.type == mp.DataChangeType.BULK_LOAD:
+                self.migrate_data_bulk_load(backward, environment)
 
         # postcheck
         if backward.postcheck is not None:
-            if not self.check_condition(backward.postcheck, args):
+            if not self.check_condition(backward.postcheck, environment):
                 raise err.ConditionCheckFailedError(
                     f"postcheck failed for {migration_plan}"
                 )
 
+    def wait_for_replicas(self, environment: str):
+        replica_throttle = throttle.build_throttle_from_env(environment)
+        if replica_throttle is None:
+            return
+        with replica_throttle:
+            replica_throttle.wait()
+
     def check_condition_shell(
         self,
         shell_file: str,
         expected: int,
-        args: Namespace,
+        environment: str,
         checksum_match: Optional[bool] = None,
     ):
         try:
             self.migrate_data_shell(
-                shell_file, args, expected, checksum_match=checksum_match
+                shell_file, environment, expected, checksum_match=checksum_match
             )
         except Exception:
             return False
@@ -144,14 +198,14 @@ class Migrator:
     def migrate_data_shell(
         self,
         shell_file: str,
-        args: Namespace,
+        environment: str,
         expected: Optional[int] = None,
         checksum_match: Optional[bool] = None,
     ):
         shell_file_path = os.path.join(
             cli_env.MIGRATION_CWD, cli_env.DATA_DIR, shell_file
         )
-        section = helper.get_env_ini_section(args.environment)
+        section = helper.get_env_ini_section(environment)
         cmd = f"sh {shell_file_path}"
         env = helper.get_env_with_update(
             {
@@ -167,22 +221,20 @@ class Migrator:
             env[consts.ENV_SDM_EXPECTED] = str(expected)
         if checksum_match is not None:
             env[consts.ENV_SDM_CHECKSUM_MATCH] = "1" if checksum_match else "0"
-        subprocess.check_call(
-            shlex.split(cmd),
-            cwd=cli_env.MIGRATION_CWD,
-            env=env,
+        aio.run(
+            aio.run_subprocess(shlex.split(cmd), cwd=cli_env.MIGRATION_CWD, env=env)
         )
 
     def check_condition_typescript(
         self,
         ts_file: str,
         expected: int,
-        args: Namespace,
+        environment: str,
         checksum_match: Optional[bool] = None,
     ):
         try:
             self.migrate_data_typescript(
-                ts_file, args, expected, checksum_match=checksum_match
+                ts_file, environment, expected, checksum_match=checksum_match
             )
         except Exception:
             return False
@@ -191,11 +243,11 @@ class Migrator:
     def migrate_data_typescript(
         self,
         ts_file: str,
-        args: Namespace,
+        environment: str,
         expected: Optional[int] = None,
         checksum_match: Optional[bool] = None,
     ) -> int:
-        section = helper.get_env_ini_section(args.environment)
+        section = helper.get_env_ini_section(environment)
         ts_file_path = os.path.join(cli_env.MIGRATION_CWD, cli_env.DATA_DIR, ts_file)
         # create temporary directory under migration cwd/tmp
         with tempfile.TemporaryDirectory(dir=cli_env.MIGRATION_CWD) as temp_dir:
@@ -212,9 +264,8 @@ class Migrator:
                 os.path.join(src_path, "migration.ts"),  # import by index.ts
             )
             # build js file
-            subprocess.check_call(
-                shlex.split(f"{cli_env.NPM_CMD_PATH} run build"), cwd=temp_dir
-            )
+            build = shlex.split(f"{cli_env.NPM_CMD_PATH} run build")
+            aio.run(aio.run_subprocess(build, cwd=temp_dir))
             env = helper.get_env_with_update(
                 {
                     "MYSQL_PWD": cli_env.MYSQL_PWD,
@@ -231,52 +282,91 @@ class Migrator:
                 env[consts.ENV_SDM_CHECKSUM_MATCH] = "1" if checksum_match else "0"
 
             # run js file
-            subprocess.check_call(
-                [cli_env.NODE_CMD_PATH, "src/index.js"],
-                cwd=temp_dir,
-                env=env,
-            )
+            run = [cli_env.NODE_CMD_PATH, "src/index.js"]
+            aio.run(aio.run_subprocess(run, cwd=temp_dir, env=env))
             return 0
 
     def check_condition_python(
         self,
         python_file: str,
         expected: int,
-        args: Namespace,
+        environment: str,
         checksum_match: Optional[bool] = None,
     ):
         result = self.migrate_data_python(
-            python_file, args, checksum_match=checksum_match
+            python_file, environment, checksum_match=checksum_match
         )
         return result == expected
 
     def migrate_data_python(
-        self, python_file: str, args: Namespace, checksum_match: Optional[bool] = None
+        self, python_file: str, environment: str, checksum_match: Optional[bool] = None
     ) -> int:
         python_file_path = os.path.join(
             cli_env.MIGRATION_CWD, cli_env.DATA_DIR, python_file
         )
-        spec = importlib.util.spec_from_file_location("run_python", python_file_path)
-        module = importlib.util.module_from_spec(spec)
-        spec.loader.exec_module(module)
-        session = helper.build_session_from_env(
-            args.environment, echo=cli_env.ALLOW_ECHO_SQL
-        )
         obj = {
             consts.ENV_SDM_DATA_DIR: cli_env.SDM_DATA_DIR,
         }
         if checksum_match is not None:
             obj[consts.ENV_SDM_CHECKSUM_MATCH] = "1" if checksum_match else "0"
-        return module.run(session, args=obj)
+        if cli_env.PYTHON_MIGRATION_BACKEND == python_runner.PythonBackend.PROCESS:
+            return python_runner.ProcessRunner().run(python_file_path, environment, obj)
+
+        module = self.load_python_module(python_file_path)
+        session = helper.build_session_from_env(
+            environment, echo=cli_env.ALLOW_ECHO_SQL
+        )
+        obj[consts.ENV_SDM_FAN_OUT] = python_runner.fan_out
+        replica_throttle = throttle.build_throttle_from_env(environment)
+        if replica_throttle is None:
+            return module.run(session, args=obj)
+        # long running migrations call it between their batches
+        obj[consts.ENV_SDM_THROTTLE] = replica_throttle.wait
+        with replica_throttle:
+            return module.run(session, args=obj)
+
+    def load_python_module(self, python_file_path: str) -> ModuleType:
+        sha1_helper = helper.SHA1Helper()
+        sha1_helper.update_file([python_file_path])
+        sha1 = sha1_helper.hexdigest()
+        with self._python_modules_mutex:
+            module = self._python_modules.get(sha1)
+            if module is not None:
+                logger.debug("Reuse loaded python module of %s", python_file_path)
+                return module
+            module = python_runner.load_module(python_file_path)
+            self._python_modules[sha1] = module
+            return module
+
+    def clear_python_modules(self):
+        """
+        drop the loaded python modules, with their module level state, when a
+        run ends
+        """
+        with self._python_modules_mutex:
+            self._python_modules.clear()
 
-    def migrate_data_sql_file(self, sql_file: str, args: Namespace):
+    def migrate_data_bulk_load(self, change: mp.DataForward, environment: str) -> int:
+        engine = helper.build_engine_from_env(environment, echo=cli_env.ALLOW_ECHO_SQL)
+        try:
+            return bulk_load.BulkLoader(
+                engine,
+                os.path.join(cli_env.MIGRATION_CWD, cli_env.DATA_DIR, change.file),
+                change.table,
+                columns=change.columns,
+                batch_size=change.batch_size or cli_env.BULK_LOAD_BATCH_SIZE,
+            ).run()
+        finally:
+            helper.release_engine(engine)
+
+    def migrate_data_sql_file(self, sql_file: str, environment: str):
         with open(os.path.join(cli_env.MIGRATION_CWD, cli_env.DATA_DIR, sql_file)) as f:
             sql = f.read()
-        self.migrate_data_sql(sql, args)
+        self.migrate_data_sql(sql, environment)
 
-    def migrate_data_sql(self, sql: str, args: Namespace):
+    def migrate_data_sql(self, sql: str, environment: str):
         session = helper.build_session_from_env(
-            args.environment, echo=cli_env.ALLOW_ECHO_SQL
+            environment, echo=cli_env.ALLOW_ECHO_SQL
         )
         with session.begin():
             result = session.execute(text(sql))
@@ -286,15 +376,15 @@ class Migrator:
             )
 
     def check_condition_sql_file(
-        self, sql_file: str, expected: int, args: Namespace
+        self, sql_file: str, expected: int, environment: str
     ) -> bool:
         with open(os.path.join(cli_env.MIGRATION_CWD, cli_env.DATA_DIR, sql_file)) as f:
             sql = f.read()
-        return self.check_condition_sql(sql, expected, args)
+        return self.check_condition_sql(sql, expected, environment)
 
-    def check_condition_sql(self, sql: str, expected: int, args: Namespace) -> bool:
+    def check_condition_sql(self, sql: str, expected: int, environment: str) -> bool:
         session = helper.build_session_from_env(
-            args.environment, echo=cli_env.ALLOW_ECHO_SQL
+            environment, echo=cli_env.ALLOW_ECHO_SQL
         )
         with session.begin():
             result = session.execute(text(sql)).one_or_none()
@@ -304,28 +394,29 @@ class Migrator:
             )
             return result[0] == expected
 
-    def move_schema_to(self, sha1: str, args: Namespace, allow_unsafe: bool = False):
-        index_file = helper.sha1_to_path(sha1)
-        with open(index_file, "r") as f:
-            lines = f.readlines()
-        with tempfile.TemporaryDirectory() as temp_dir:
-            os.makedirs(os.path.join(temp_dir, cli_env.SCHEMA_DIR), exist_ok=False)
-            shutil.copy(
-                os.path.join(cli_env.MIGRATION_CWD, cli_env.SCHEMA_DIR, ".skeema"),
-                os.path.join(temp_dir, cli_env.SCHEMA_DIR, ".skeema"),
-            )
-            for line in lines:
-                [sha1, sql_filename] = line.split(":")
-                sql_filepath = helper.sha1_to_path(sha1)
-                shutil.copy(
-                    sql_filepath,
-                    os.path.join(temp_dir, cli_env.SCHEMA_DIR, sql_filename.strip()),
-                )
+    def move_schema_to(self, sha1: str, environment: str, allow_unsafe: bool = False):
+        with self.schema_workdir_cache.acquire(sha1) as workdir:
             skeema_args = [
                 "push",
-                args.environment,
+                environment,
             ]
             if cli_env.ALLOW_UNSAFE or allow_unsafe:
                 skeema_args.extend(["--allow-unsafe"])
-            helper.call_skeema(raw_args=skeema_args, cwd=temp_dir)
-        pass
+            if cli_env.ONLINE_ALTER_MIN_SIZE != "0":
+                skeema_args.extend(self.online_alter_args())
+            helper.call_skeema(raw_args=skeema_args, cwd=workdir)
+
+    def online_alter_args(self) -> List[str]:
+        """
+        let skeema run the ALTERs of large tables through `sdm osc`,
+        the variables in the wrapper are escaped by skeema
+        """
+        wrapper = (
+            f"{cli_env.SDM_CMD_PATH} osc --host {{HOST}} --port {{PORT}}"
+            " --user {USER} --schema {SCHEMA} --table {TABLE} --alter {CLAUSES}"
+            " --environment {ENVIRONMENT}"
+        )
+        return [
+            f"--alter-wrapper={shlex.quote(wrapper)}",
+            f"--alter-wrapper-min-size={cli_env.ONLINE_ALTER_MIN_SIZE}",
+        ]
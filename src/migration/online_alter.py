@@ -0,0 +1,275 @@
+import logging
+import re
+import time
+from typing import Callable, List, Optional
+
+from sqlalchemy import Connection, Engine, text
+
+from . import err
+from .env import cli_env
+
+logger = logging.getLogger(__name__)
+
+# clauses whose data can not be copied by column name
+UNSUPPORTED_CLAUSES = re.compile(
+    r"\b(CHANGE|RENAME)\b|\bDROP\s+PRIMARY\s+KEY\b", re.IGNORECASE
+)
+
+
+class OnlineAlter:
+    """
+    ALTER a table without blocking writes to it, for the ALTERs that would
+    rebuild a large table with the COPY algorithm.
+
+    The ALTER is applied to an empty shadow table, the rows are copied in
+    primary key chunks while triggers replay concurrent writes into the
+    shadow table, then the tables are swapped with one atomic RENAME.
+    """
+
+    def __init__(
+        self,
+        engine: Engine,
+        table: str,
+        clauses: str,
+        chunk_size: int = cli_env.ONLINE_ALTER_CHUNK_SIZE,
+        progress_interval: float = 10,
+        throttle: Optional[Callable[[], None]] = None,
+    ):
+        self.engine = engine
+        self.table = table
+        self.clauses = clauses
+        self.chunk_size = chunk_size
+        self.progress_interval = progress_interval
+        # called between chunks, e.g. to wait for replicas to catch up
+        self.throttle = throttle
+        self.shadow_table = f"_{table}_new"[:64]
+        self.old_table = f"_{table}_old"[:64]
+        self.triggers = [
+            f"sdm_{table}"[:60] + suffix for suffix in ["_ins", "_upd", "_del"]
+        ]
+        self.copied_rows = 0
+
+    def run(self):
+        with self.engine.connect().execution_options(
+            isolation_level="AUTOCOMMIT"
+        ) as conn:
+            pk = self._check(conn)
+            try:
+                self._create_shadow_table(conn)
+                columns = self._get_common_columns(conn)
+                self._create_triggers(conn, pk, columns)
+                self._copy(conn, pk, columns)
+                self._swap(conn)
+            except Exception:
+                self._cleanup(conn)
+                raise
+            conn.execute(text(f"DROP TABLE IF EXISTS `{self.old_table}`"))
+
+    def _check(self, conn: Connection) -> str:
+        """
+        return the primary key column
+        """
+        if UNSUPPORTED_CLAUSES.search(self.clauses):
+            raise err.OnlineAlterError(
+                f"Unsupported clauses for online alter of {self.table}: {self.clauses}"
+            )
+        pk = (
+            conn.execute(
+                text(
+                    "SELECT COLUMN_NAME FROM information_schema.KEY_COLUMN_USAGE WHERE"
+                    " TABLE_SCHEMA = DATABASE() AND TABLE_NAME = :table AND"
+                    " CONSTRAINT_NAME = 'PRIMARY' ORDER BY ORDINAL_POSITION"
+                ),
+                {"table": self.table},
+            )
+            .scalars()
+            .all()
+        )
+        if len(pk) != 1:
+            raise err.OnlineAlterError(
+                f"Online alter needs a single column primary key, table={self.table},"
+                f" primary_key={pk}"
+            )
+        # CREATE TABLE LIKE does not copy foreign keys, and the RENAME would
+        #   leave the foreign keys of other tables on the old table
+        foreign_keys = conn.execute(
+            text(
+                "SELECT COUNT(*) FROM information_schema.KEY_COLUMN_USAGE WHERE"
+                " TABLE_SCHEMA = DATABASE() AND REFERENCED_TABLE_NAME IS NOT NULL"
+                " AND (TABLE_NAME = :table OR REFERENCED_TABLE_NAME = :table)"
+            ),
+            {"table": self.table},
+        ).scalar()
+        if foreign_keys > 0:
+            raise err.OnlineAlterError(
+                f"Online alter does not support foreign keys, table={self.table}"
+            )
+        for table in [self.shadow_table, self.old_table]:
+            if self._table_exists(conn, table):
+                raise err.OnlineAlterError(
+                    f"Table {table} exists, it may be left by a failed online alter"
+                )
+        return pk[0]
+
+    def _table_exists(self, conn: Connection, table: str) -> bool:
+        return (
+            conn.execute(
+                text(
+                    "SELECT COUNT(*) FROM information_schema.TABLES WHERE"
+                    " TABLE_SCHEMA = DATABASE() AND TABLE_NAME = :table"
+                ),
+                {"table": table},
+            ).scalar()
+            > 0
+        )
+
+    def _create_shadow_table(self, conn: Connection):
+        conn.execute(text(f"CREATE TABLE `{self.shadow_table}` LIKE `{self.table}`"))
+        conn.execute(text(f"ALTER TABLE `{self.shadow_table}` {self.clauses}"))
+
+    def _get_columns(self, conn: Connection, table: str) -> List[str]:
+        # generated columns can not be written
+        return (
+            conn.execute(
+                text(
+                    "SELECT COLUMN_NAME FROM information_schema.COLUMNS WHERE"
+                    " TABLE_SCHEMA = DATABASE() AND TABLE_NAME = :table AND"
+                    " EXTRA NOT LIKE '%GENERATED%' ORDER BY ORDINAL_POSITION"
+                ),
+                {"table": table},
+            )
+            .scalars()
+            .all()
+        )
+
+    def _get_common_columns(self, conn: Connection) -> List[str]:
+        shadow_columns = set(self._get_columns(conn, self.shadow_table))
+        return [c for c in self._get_columns(conn, self.table) if c in shadow_columns]
+
+    def _create_triggers(self, conn: Connection, pk: str, columns: List[str]):
+        column_list = ", ".join(f"`{c}`" for c in columns)
+        new_values = ", ".join(f"NEW.`{c}`" for c in columns)
+        replace_new = (
+            f"REPLACE INTO `{self.shadow_table}` ({column_list}) VALUES ({new_values})"
+        )
+        delete_old = (
+            f"DELETE IGNORE FROM `{self.shadow_table}` WHERE `{pk}` <=> OLD.`{pk}`"
+        )
+        ins, upd, dele = self.triggers
+        conn.execute(
+            text(
+                f"CREATE TRIGGER `{ins}` AFTER INSERT ON `{self.table}` FOR EACH ROW"
+                f" {replace_new}"
+            )
+        )
+        conn.execute(
+            text(
+                f"CREATE TRIGGER `{upd}` AFTER UPDATE ON `{self.table}` FOR EACH ROW"
+                f" BEGIN {delete_old} AND NOT (OLD.`{pk}` <=> NEW.`{pk}`);"
+                f" {replace_new}; END"
+            )
+        )
+        conn.execute(
+            text(
+                f"CREATE TRIGGER `{dele}` AFTER DELETE ON `{self.table}` FOR EACH ROW"
+                f" {delete_old}"
+            )
+        )
+
+    def _copy(self, conn: Connection, pk: str, columns: List[str]):
+        column_list = ", ".join(f"`{c}`" for c in columns)
+        estimated_rows = (
+            conn.execute(
+                text(
+                    "SELECT TABLE_ROWS FROM information_schema.TABLES WHERE"
+                    " TABLE_SCHEMA = DATABASE() AND TABLE_NAME = :table"
+                ),
+                {"table": self.table},
+            ).scalar()
+            or 0
+        )
+        # rows inserted after this point are copied by the triggers
+        max_pk = conn.execute(text(f"SELECT MAX(`{pk}`) FROM `{self.table}`")).scalar()
+        if max_pk is None:
+            return
+
+        start = time.perf_counter()
+        last_report = start
+        lower = None
+        while True:
+            params = {"offset": self.chunk_size - 1}
+            lower_cond = ""
+            if lower is not None:
+                params["lower"] = lower
+                lower_cond = f"`{pk}` > :lower AND"
+            upper = conn.execute(
+                text(
+                    f"SELECT `{pk}` FROM `{self.table}` WHERE {lower_cond} TRUE"
+                    f" ORDER BY `{pk}` LIMIT 1 OFFSET :offset"
+                ),
+                params,
+            ).scalar()
+            if upper is None or upper > max_pk:
+                upper = max_pk
+            del params["offset"]
+            params["upper"] = upper
+            result = conn.execute(
+                text(
+                    f"INSERT LOW_PRIORITY IGNORE INTO `{self.shadow_table}`"
+                    f" ({column_list}) SELECT {column_list} FROM `{self.table}`"
+                    f" FORCE INDEX (PRIMARY) WHERE {lower_cond} `{pk}` <= :upper"
+                ),
+                params,
+            )
+            self.copied_rows += result.rowcount
+            lower = upper
+
+            now = time.perf_counter()
+            if now - last_report >= self.progress_interval:
+                self._report_progress(estimated_rows, now - start)
+                last_report = now
+            if upper >= max_pk:
+                break
+            if self.throttle is not None:
+                self.throttle()
+
+        elapsed = time.perf_counter() - start
+        logger.info(
+            "Copied %d rows of %s in %.1fs, %.0f rows/s",
+            self.copied_rows,
+            self.table,
+            elapsed,
+            self.copied_rows / elapsed if elapsed > 0 else 0,
+        )
+
+    def _report_progress(self, estimated_rows: int, elapsed: float):
+        rows_per_second = self.copied_rows / elapsed if elapsed > 0 else 0
+        # the estimate of information_schema can be lower than the copied rows
+        total = max(estimated_rows, self.copied_rows)
+        eta = (total - self.copied_rows) / rows_per_second if rows_per_second else 0
+        logger.info(
+            "Copied %d/%d rows of %s (%.1f%%), %.0f rows/s, eta %.0fs",
+            self.copied_rows,
+            total,
+            self.table,
+            self.copied_rows / total * 100 if total else 100,
+            rows_per_second,
+            eta,
+        )
+
+    def _swap(self, conn: Connection):
+        conn.execute(
+            text(
+                f"RENAME TABLE `{self.table}` TO `{self.old_table}`,"
+                f" `{self.shadow_table}` TO `{self.table}`"
+            )
+        )
+        # the triggers moved with the old table, which is not written anymore
+        for trigger in self.triggers:
+            conn.execute(text(f"DROP TRIGGER IF EXISTS `{trigger}`"))
+        logger.info("Swapped %s with the altered table", self.table)
+
+    def _cleanup(self, conn: Connection):
+        for trigger in self.triggers:
+            conn.execute(text(f"DROP TRIGGER IF EXISTS `{trigger}`"))
+        conn.execute(text(f"DROP TABLE IF EXISTS `{self.shadow_table}`"))
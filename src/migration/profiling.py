@@ -0,0 +1,296 @@
+import cProfile
+import datetime
+import io
+import itertools
+import json
+import logging
+import os
+import pstats
+import sys
+import threading
+import time
+from enum import StrEnum
+from typing import Dict, List, Optional, Tuple
+
+from . import tracing
+from .env import cli_env
+
+logger = logging.getLogger(__name__)
+
+PROFILE_OPTION = "--profile"
+SPEEDSCOPE_SCHEMA = "https://www.speedscope.app/file-format-schema.json"
+
+# (filename, first line, function name), the key of pstats
+FrameKey = Tuple[str, int, str]
+
+
+class ProfileMode(StrEnum):
+    CPROFILE = "cprofile"  # deterministic, every python call
+    WALL = "wall"  # sampled stacks of every thread, includes waiting
+
+
+def split_profile_args(
+    raw_args: List[str],
+) -> Tuple[Optional[ProfileMode], List[str]]:
+    """
+    return the mode of --profile[=mode] given before the command, and the
+    other args
+    """
+    mode = None
+    idx = 0
+    while idx < len(raw_args) and raw_args[idx].startswith(PROFILE_OPTION):
+        option, _, value = raw_args[idx].partition("=")
+        if option != PROFILE_OPTION:
+            break
+        mode = ProfileMode(value or ProfileMode.CPROFILE)
+        idx += 1
+    return mode, raw_args[idx:]
+
+
+# the profiler of this process, only one can run at a time
+_active: Optional["Profiler"] = None
+# numbers the profiles of this process, e.g. the commands of sdm serve run in
+#   the same second
+_sequence = itertools.count(1)
+
+
+class StackSampler:
+    """
+    Sample the python stacks of all threads every interval seconds. A sample
+    is weighted by the time since the previous one, so a late sample does
+    not shrink the profile.
+    """
+
+    def __init__(self, interval: float = cli_env.PROFILE_INTERVAL):
+        self.interval = interval
+        # weighted stacks by thread name, a stack is listed from the root
+        self.samples: Dict[str, List[Tuple[Tuple[FrameKey, ...], float]]] = {}
+        self._stop = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+
+    def start(self):
+        self._thread = threading.Thread(
+            target=self._run, name="sdm-profile-sampler", daemon=True
+        )
+        self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join()
+
+    def _run(self):
+        me = threading.get_ident()
+        last = time.perf_counter()
+        while not self._stop.wait(self.interval):
+            now = time.perf_counter()
+            weight, last = now - last, now
+            names = {t.ident: t.name for t in threading.enumerate()}
+            for ident, frame in sys._current_frames().items():
+                if ident == me:
+                    continue
+                stack = []
+                while frame is not None:
+                    code = frame.f_code
+                    stack.append((code.co_filename, code.co_firstlineno, code.co_name))
+                    frame = frame.f_back
+                thread = names.get(ident, str(ident))
+                self.samples.setdefault(thread, []).append(
+                    (tuple(reversed(stack)), weight)
+                )
+
+    def to_stats(self) -> pstats.Stats:
+        """
+        return the samples as pstats, with the sample counts as call counts
+        """
+        raw: Dict[FrameKey, list] = {}
+        for samples in self.samples.values():
+            for stack, weight in samples:
+                for key in set(stack):
+                    entry = raw.setdefault(key, [0, 0, 0.0, 0.0, {}])
+                    entry[0] += 1
+                    entry[1] += 1
+                    entry[3] += weight
+                raw[stack[-1]][2] += weight
+                for caller, callee in zip(stack, stack[1:]):
+                    callers = raw[callee][4]
+                    n, _, tt, ct = callers.get(caller, (0, 0, 0.0, 0.0))
+                    callers[caller] = (n + 1, n + 1, tt, ct + weight)
+        stats = pstats.Stats()
+        stats.stats = {key: tuple(entry) for key, entry in raw.items()}
+        stats.get_top_level_stats()
+        return stats
+
+    def to_speedscope(
+        self, name: str, spans: List[tracing.Span], started_ns: int, duration: float
+    ) -> Dict:
+        frames: List[Dict] = []
+        frame_index: Dict[Tuple, int] = {}
+
+        def index(key: Tuple) -> int:
+            if key not in frame_index:
+                frame_index[key] = len(frames)
+                file, line, func = key
+                frame = {"name": func}
+                if file:
+                    frame.update(file=file, line=line)
+                frames.append(frame)
+            return frame_index[key]
+
+        profiles = []
+        for thread, samples in self.samples.items():
+            profiles.append(
+                {
+                    "type": "sampled",
+                    "name": thread,
+                    "unit": "seconds",
+                    "startValue": 0,
+                    "endValue": duration,
+                    "samples": [[index(k) for k in stack] for stack, _ in samples],
+                    "weights": [weight for _, weight in samples],
+                }
+            )
+        # spans of a thread are sequential or nested, as speedscope expects
+        for thread in sorted({s.thread for s in spans}):
+            events = []
+            for s in spans:
+                if s.thread != thread:
+                    continue
+                frame = index(("", 0, s.name))
+                start = (s.start_ns - started_ns) / 1e9
+                events.append((start, 1, -s.duration, {"type": "O", "frame": frame}))
+                events.append(
+                    (start + s.duration, 0, s.duration, {"type": "C", "frame": frame})
+                )
+            # at the same time, close before open, outer opens first and
+            #   closes last
+            events.sort(key=lambda e: e[:3])
+            profiles.append(
+                {
+                    "type": "evented",
+                    "name": f"{thread} spans",
+                    "unit": "seconds",
+                    "startValue": 0,
+                    "endValue": duration,
+                    "events": [dict(e, at=at) for at, _, _, e in events],
+                }
+            )
+        return {
+            "$schema": SPEEDSCOPE_SCHEMA,
+            "name": name,
+            "exporter": "sdm",
+            "activeProfileIndex": 0,
+            "shared": {"frames": frames},
+            "profiles": profiles,
+        }
+
+
+class Profiler:
+    """
+    Profile a block with cProfile, or with sampled wall clock stacks, and
+    write to output_dir:
+        <name>.pstats, readable by pstats and snakeviz
+        <name>.txt, the top_n functions by cumulative time and the spans
+        <name>.speedscope.json, wall mode only, for speedscope.app
+    The tracing spans of the block, e.g. of subprocesses, are recorded in
+    both modes.
+    """
+
+    def __init__(
+        self,
+        mode: ProfileMode,
+        label: str = "sdm",
+        output_dir: str = cli_env.PROFILE_DIR,
+        top_n: int = cli_env.PROFILE_TOP_N,
+        interval: float = cli_env.PROFILE_INTERVAL,
+    ):
+        self.mode = ProfileMode(mode)
+        now = datetime.datetime.now().strftime("%Y%m%d-%H%M%S")
+        self.name = f"sdm-{label}-{now}-{os.getpid()}-{next(_sequence)}"
+        self.output_dir = output_dir
+        self.top_n = top_n
+        self.interval = interval
+        self.spans: List[tracing.Span] = []
+        self.started = 0.0
+        self.started_ns = 0
+        self.duration = 0.0
+        self.paths: List[str] = []
+        self._mutex = threading.Lock()
+        self._profile: Optional[cProfile.Profile] = None
+        self._sampler: Optional[StackSampler] = None
+
+    def add_span(self, s: tracing.Span):
+        with self._mutex:
+            self.spans.append(s)
+
+    def __enter__(self) -> "Profiler":
+        global _active
+        if _active is not None:
+            raise Exception("sdm is profiled already")
+        _active = self
+        tracing.add_listener(self.add_span)
+        self.started = time.perf_counter()
+        self.started_ns = time.time_ns()
+        if self.mode == ProfileMode.CPROFILE:
+            self._profile = cProfile.Profile()
+            self._profile.enable()
+        else:
+            self._sampler = StackSampler(self.interval)
+            self._sampler.start()
+        return self
+
+    def __exit__(self, *args):
+        global _active
+        if self._profile is not None:
+            self._profile.disable()
+        else:
+            self._sampler.stop()
+        self.duration = time.perf_counter() - self.started
+        tracing.remove_listener(self.add_span)
+        _active = None
+        self.save()
+
+    def stats(self) -> pstats.Stats:
+        if self._profile is not None:
+            return pstats.Stats(self._profile)
+        return self._sampler.to_stats()
+
+    def summary(self, stats: pstats.Stats) -> str:
+        out = io.StringIO()
+        out.write(f"{self.mode} profile, {self.duration:.3f}s\n")
+        stats.stream = out
+        stats.sort_stats(pstats.SortKey.CUMULATIVE).print_stats(self.top_n)
+        totals: Dict[str, Tuple[int, float]] = {}
+        for s in self.spans:
+            count, seconds = totals.get(s.name, (0, 0.0))
+            totals[s.name] = (count + 1, seconds + s.duration)
+        if totals:
+            out.write("spans:\n")
+            for name, (count, seconds) in sorted(
+                totals.items(), key=lambda item: -item[1][1]
+            ):
+                out.write(
+                    f"  {name}: {count} calls, {seconds:.3f}s"
+                    f" ({seconds / self.duration * 100 if self.duration else 0:.1f}%)\n"
+                )
+        return out.getvalue()
+
+    def save(self):
+        os.makedirs(self.output_dir, exist_ok=True)
+        base = os.path.join(self.output_dir, self.name)
+        stats = self.stats()
+        stats.dump_stats(f"{base}.pstats")
+        self.paths = [f"{base}.pstats", f"{base}.txt"]
+        summary = self.summary(stats)
+        with open(f"{base}.txt", "w") as f:
+            f.write(summary)
+        if self._sampler is not None:
+            self.paths.append(f"{base}.speedscope.json")
+            with open(f"{base}.speedscope.json", "w") as f:
+                json.dump(
+                    self._sampler.to_speedscope(
+                        self.name, self.spans, self.started_ns, self.duration
+                    ),
+                    f,
+                )
+        logger.info("%s\nProfile saved to %s", summary, ", ".join(self.paths))
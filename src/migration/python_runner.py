@@ -0,0 +1,276 @@
+import importlib.util
+import logging
+import logging.handlers
+import multiprocessing
+import os
+import signal
+import time
+import traceback
+from concurrent.futures import ProcessPoolExecutor
+from enum import StrEnum
+from multiprocessing.connection import Connection
+from types import ModuleType
+from typing import Any, Callable, Dict, Iterable, List, Optional, Tuple
+
+from . import consts, err, helper, throttle, tracing
+from .env import cli_env
+
+logger = logging.getLogger(__name__)
+
+SIZE_UNITS = {"k": 1024, "m": 1024**2, "g": 1024**3}
+# seconds the child has to exit after sending the result, before it is killed
+EXIT_GRACE_PERIOD = 5
+
+
+class PythonBackend(StrEnum):
+    IN_PROCESS = "inprocess"  # run in the sdm process
+    PROCESS = "process"  # run in a child process, see ProcessRunner
+
+
+def parse_size(size: str) -> int:
+    """
+    parse a size like 512m or 2g to bytes
+    """
+    size = size.strip().lower()
+    if size and size[-1] in SIZE_UNITS:
+        return int(float(size[:-1]) * SIZE_UNITS[size[-1]])
+    return int(size or 0)
+
+
+def load_module(python_file_path: str) -> ModuleType:
+    spec = importlib.util.spec_from_file_location("run_python", python_file_path)
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    return module
+
+
+def _descendants(pid: int) -> List[int]:
+    """
+    return the pids of the children of the process, recursively
+    """
+    pids = []
+    try:
+        with open(f"/proc/{pid}/task/{pid}/children") as f:
+            children = [int(p) for p in f.read().split()]
+    except OSError:
+        return pids
+    for child in children:
+        pids.append(child)
+        pids.extend(_descendants(child))
+    return pids
+
+
+def _rss(pid: int) -> int:
+    try:
+        with open(f"/proc/{pid}/status") as f:
+            for line in f:
+                if line.startswith("VmRSS:"):
+                    return int(line.split()[1]) * 1024
+    except OSError:
+        pass
+    return 0
+
+
+def process_tree_rss(pid: int) -> int:
+    """
+    return the resident memory of the process and its children in bytes,
+    0 where /proc is not available
+    """
+    return sum(_rss(p) for p in [pid] + _descendants(pid))
+
+
+_fan_out_func: Optional[Callable[[Any], Any]] = None
+
+
+def _init_fan_out_worker(python_file_path: str, func_name: str):
+    global _fan_out_func
+    _fan_out_func = getattr(load_module(python_file_path), func_name)
+
+
+def _call_fan_out(item: Any) -> Any:
+    return _fan_out_func(item)
+
+
+def fan_out(
+    func: Callable[[Any], Any],
+    items: Iterable[Any],
+    workers: int = cli_env.PYTHON_MIGRATION_WORKERS,
+    chunksize: int = 1,
+) -> List[Any]:
+    """
+    Call func on every item in worker processes, return the results in the
+    order of items. func must be a module level function of the python
+    migration file, each worker imports the file once; items and results are
+    pickled, so pass plain data rather than sessions or ORM objects.
+    """
+    python_file_path = func.__globals__.get("__file__")
+    if python_file_path is None or func.__qualname__ != func.__name__:
+        raise Exception(
+            f"{func.__qualname__} must be a module level function of a python file"
+        )
+    with ProcessPoolExecutor(
+        max_workers=workers,
+        mp_context=multiprocessing.get_context("spawn"),
+        initializer=_init_fan_out_worker,
+        initargs=(python_file_path, func.__name__),
+    ) as executor:
+        return list(executor.map(_call_fan_out, items, chunksize=chunksize))
+
+
+class _LogForwarder(logging.Handler):
+    """
+    handle the log records of a child process as if they were logged here
+    """
+
+    def emit(self, record: logging.LogRecord):
+        logging.getLogger(record.name).handle(record)
+
+
+def _run_in_worker(
+    python_file_path: str,
+    environment: str,
+    args: Dict[str, str],
+    settings: Dict[str, Any],
+    log_queue: multiprocessing.Queue,
+    conn: Connection,
+):
+    root = logging.getLogger()
+    for handler in root.handlers:
+        handler.close()
+    root.handlers = [logging.handlers.QueueHandler(log_queue)]
+    root.setLevel(settings.pop("LOG_LEVEL"))
+    os.environ.update(settings.pop("TRACE_ENV"))
+    for key, value in settings.items():
+        setattr(cli_env, key, value)
+
+    with tracing.export_to_file(cli_env.TRACE_FILE):
+        with tracing.span("python.run", {"code.filepath": python_file_path}):
+            _run_module(python_file_path, environment, args, conn)
+
+
+def _run_module(
+    python_file_path: str,
+    environment: str,
+    args: Dict[str, str],
+    conn: Connection,
+):
+    try:
+        module = load_module(python_file_path)
+        session = helper.build_session_from_env(
+            environment, echo=cli_env.ALLOW_ECHO_SQL
+        )
+        obj = dict(args)
+        obj[consts.ENV_SDM_FAN_OUT] = fan_out
+        replica_throttle = throttle.build_throttle_from_env(environment)
+        if replica_throttle is None:
+            result = module.run(session, args=obj)
+        else:
+            obj[consts.ENV_SDM_THROTTLE] = replica_throttle.wait
+            with replica_throttle:
+                result = module.run(session, args=obj)
+        conn.send(("ok", result))
+    except BaseException:
+        conn.send(("error", traceback.format_exc()))
+    finally:
+        conn.close()
+
+
+class ProcessRunner:
+    """
+    Run a python migration in a child process with its own engine, so a CPU
+    bound or leaking migration does not block or inflate the sdm process.
+
+    The child is killed, with the workers it started, when it runs longer than
+    timeout seconds or its processes use more than max_rss bytes. Its log
+    records are handled by the loggers of the sdm process.
+    """
+
+    def __init__(
+        self,
+        timeout: float = cli_env.PYTHON_MIGRATION_TIMEOUT,
+        max_rss: int = parse_size(cli_env.PYTHON_MIGRATION_MAX_RSS),
+        poll_interval: float = 0.2,
+    ):
+        # 0 disables the limit
+        self.timeout = timeout
+        self.max_rss = max_rss
+        self.poll_interval = poll_interval
+
+    def run(self, python_file_path: str, environment: str, args: Dict[str, str]) -> Any:
+        ctx = multiprocessing.get_context("spawn")
+        log_queue = ctx.Queue()
+        parent_conn, child_conn = ctx.Pipe(duplex=False)
+        settings = {
+            "MIGRATION_CWD": cli_env.MIGRATION_CWD,
+            "MYSQL_PWD": cli_env.MYSQL_PWD,
+            "ALLOW_ECHO_SQL": cli_env.ALLOW_ECHO_SQL,
+            "LOG_LEVEL": logging.getLogger().getEffectiveLevel(),
+            "TRACE_FILE": cli_env.TRACE_FILE,
+            # the spans of the child continue the current span
+            "TRACE_ENV": tracing.traceparent_env(),
+        }
+        # not a daemon, so the migration can start worker processes
+        process = ctx.Process(
+            target=_run_in_worker,
+            args=(python_file_path, environment, args, settings, log_queue, child_conn),
+            name=f"sdm-python-{os.path.basename(python_file_path)}",
+        )
+        listener = logging.handlers.QueueListener(log_queue, _LogForwarder())
+        listener.start()
+        process.start()
+        child_conn.close()
+        try:
+            status, value = self._wait(process, parent_conn, python_file_path)
+            # the child flushes its log records while it exits
+            process.join(timeout=EXIT_GRACE_PERIOD)
+        finally:
+            if process.is_alive():
+                self._kill(process.pid)
+            process.join()
+            parent_conn.close()
+            listener.stop()
+        if status != "ok":
+            raise err.PythonMigrationError(
+                f"Python migration {python_file_path} failed:\n{value}"
+            )
+        return value
+
+    def _wait(
+        self,
+        process: multiprocessing.Process,
+        conn: Connection,
+        python_file_path: str,
+    ) -> Tuple[str, Any]:
+        start = time.monotonic()
+        while True:
+            if conn.poll(self.poll_interval):
+                try:
+                    return conn.recv()
+                except EOFError:
+                    # the child exited without sending the result
+                    process.join()
+            if not process.is_alive():
+                raise err.PythonMigrationError(
+                    f"Python migration {python_file_path} exited with code"
+                    f" {process.exitcode}"
+                )
+            elapsed = time.monotonic() - start
+            if self.timeout > 0 and elapsed > self.timeout:
+                raise err.PythonMigrationError(
+                    f"Python migration {python_file_path} timed out after"
+                    f" {self.timeout}s"
+                )
+            if self.max_rss > 0:
+                rss = process_tree_rss(process.pid)
+                if rss > self.max_rss:
+                    raise err.PythonMigrationError(
+                        f"Python migration {python_file_path} used {rss} bytes of"
+                        f" memory, more than {self.max_rss}"
+                    )
+
+    def _kill(self, pid: int):
+        for child in _descendants(pid) + [pid]:
+            try:
+                os.kill(child, signal.SIGKILL)
+            except ProcessLookupError:
+                pass
@@ -0,0 +1,73 @@
+import csv
+import datetime
+import enum
+import json
+import sys
+from typing import Any, List, Optional, TextIO
+
+from . import consts
+
+
+def _plain(value: Any) -> Any:
+    if isinstance(value, (datetime.datetime, datetime.date)):
+        return value.isoformat()
+    if isinstance(value, enum.Enum):
+        return value.name
+    return value
+
+
+def _json_default(value: Any) -> Any:
+    plain = _plain(value)
+    return str(plain) if plain is value else plain
+
+
+class RowWriter:
+    """
+    Write the rows of a report to stream one by one, as they are made, so a
+    long report is neither kept in memory nor waited for:
+        jsonl, an object per line
+        csv, with a header line
+        json, an array of objects
+    """
+
+    def __init__(
+        self, output_format: str, headers: List[str], stream: Optional[TextIO] = None
+    ):
+        if output_format not in consts.STREAM_OUTPUT_FORMAT + [
+            consts.OUTPUT_FORMAT_JSON
+        ]:
+            raise Exception(f"Rows cannot be written as {output_format}")
+        self.output_format = output_format
+        self.headers = headers
+        self.stream = stream or sys.stdout
+        self.count = 0
+        self._csv = None
+        # json.dumps with options makes an encoder per call
+        self._encoder = json.JSONEncoder(default=_json_default)
+        if output_format == consts.OUTPUT_FORMAT_CSV:
+            self._csv = csv.writer(self.stream, lineterminator="\n")
+            self._csv.writerow(headers)
+        elif output_format == consts.OUTPUT_FORMAT_JSON:
+            self.stream.write("[")
+
+    def write(self, row: List[Any]):
+        if self._csv is not None:
+            self._csv.writerow(["" if v is None else _plain(v) for v in row])
+        else:
+            line = self._encoder.encode(dict(zip(self.headers, row)))
+            if self.output_format == consts.OUTPUT_FORMAT_JSON:
+                self.stream.write(("," if self.count else "") + "\n" + line)
+            else:
+                self.stream.write(line + "\n")
+        self.count += 1
+
+    def close(self):
+        if self.output_format == consts.OUTPUT_FORMAT_JSON:
+            self.stream.write("\n]\n" if self.count else "]\n")
+        self.stream.flush()
+
+    def __enter__(self) -> "RowWriter":
+        return self
+
+    def __exit__(self, *args):
+        self.close()
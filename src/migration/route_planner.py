@@ -0,0 +1,162 @@
+from dataclasses import dataclass
+from enum import StrEnum
+from typing import Dict, List, Optional, Set, Tuple
+
+import networkx as nx
+
+from . import migration_plan as mp
+from .db.hist_dao import Direction
+
+# cost of a plan that has never been timed, and no plan of its type either
+DEFAULT_SECONDS = 1.0
+# history bookkeeping and process overhead of every step, it also makes the
+#   route with fewer steps win when the timings are equal
+STEP_OVERHEAD_SECONDS = 0.1
+
+
+class StepType(StrEnum):
+    FORWARD = "forward"  # migrate plans one by one
+    BACKWARD = "backward"  # rollback plans one by one
+    SCHEMA_PUSH = "schema_push"  # migrate schema plans with one push
+    SCHEMA_JUMP = "schema_jump"  # rollback schema plans with one push
+
+
+@dataclass
+class RouteStep:
+    type: StepType
+    # index of the latest applied plan before and after the step
+    start: int
+    end: int
+    cost: float
+
+
+def can_coalesce_forward(plan: mp.MigrationPlan) -> bool:
+    """
+    whether the forward of the plan can be replaced by pushing a later schema
+    """
+    forward = plan.change.forward
+    return (
+        plan.type == mp.Type.SCHEMA
+        and forward.precheck is None
+        and forward.postcheck is None
+    )
+
+
+def can_skip_backward(plan: mp.MigrationPlan) -> bool:
+    """
+    whether the backward of the plan can be replaced by pushing an earlier schema
+    """
+    backward = plan.change.backward
+    if backward is None:
+        return True
+    if backward.precheck is not None or backward.postcheck is not None:
+        return False
+    return plan.type == mp.Type.SCHEMA
+
+
+class RoutePlanner:
+    """
+    Find the cheapest route from the current state to a target state, a state
+    is the index of the latest applied versioned plan.
+
+    Besides the forward and backward steps of the version graph, a span of
+    schema plans can be migrated or rollbacked with one skeema push. The cost
+    of a push is estimated as the slowest recorded push it replaces.
+    """
+
+    def __init__(
+        self,
+        plans: List[mp.MigrationPlan],
+        timings: Dict[Tuple[str, str, str], float],
+        pinned: Optional[Set[int]] = None,
+    ):
+        self.plans = plans
+        self.timings = timings
+        # plans that must be migrated and rollbacked one by one,
+        #   e.g. repeatable plans depend on them
+        self.pinned = pinned if pinned is not None else set()
+        self._default_costs = self._get_default_costs()
+
+    def _get_default_costs(self) -> Dict[Tuple[str, str], float]:
+        """
+        return average seconds by (plan type, direction)
+        """
+        total: Dict[Tuple[str, str], List[float]] = {}
+        for plan in self.plans:
+            for direction in Direction:
+                key = (plan.version, plan.name, direction)
+                if key in self.timings:
+                    total.setdefault((plan.type, direction), []).append(
+                        self.timings[key]
+                    )
+        return {key: sum(v) / len(v) for key, v in total.items()}
+
+    def cost(self, idx: int, direction: Direction) -> float:
+        plan = self.plans[idx]
+        if direction == Direction.BACKWARD and plan.change.backward is None:
+            return 0.0
+        key = (plan.version, plan.name, direction)
+        if key in self.timings:
+            return self.timings[key]
+        return self._default_costs.get((plan.type, direction), DEFAULT_SECONDS)
+
+    def _add_edge(
+        self, G: nx.DiGraph, start: int, end: int, step_type: StepType, cost: float
+    ):
+        cost += STEP_OVERHEAD_SECONDS
+        if G.has_edge(start, end) and G[start][end]["cost"] <= cost:
+            return
+        G.add_edge(start, end, type=step_type, cost=cost)
+
+    def build_graph(self, low: int, high: int) -> nx.DiGraph:
+        G = nx.DiGraph()
+        G.add_nodes_from(range(low, high + 1))
+        for idx in range(low, high):
+            self._add_edge(
+                G, idx, idx + 1, StepType.FORWARD, self.cost(idx + 1, Direction.FORWARD)
+            )
+            self._add_edge(
+                G,
+                idx + 1,
+                idx,
+                StepType.BACKWARD,
+                self.cost(idx + 1, Direction.BACKWARD),
+            )
+
+        # migrate plans start+1..end with one push
+        for start in range(low, high):
+            push_cost = 0.0
+            for end in range(start + 1, high + 1):
+                if end in self.pinned or not can_coalesce_forward(self.plans[end]):
+                    break
+                push_cost = max(push_cost, self.cost(end, Direction.FORWARD))
+                if end > start + 1:
+                    self._add_edge(G, start, end, StepType.SCHEMA_PUSH, push_cost)
+
+        # rollback plans end+1..start with one push
+        for start in range(high, low, -1):
+            push_cost = 0.0
+            for end in range(start - 1, low - 1, -1):
+                idx = end + 1
+                if idx in self.pinned or not can_skip_backward(self.plans[idx]):
+                    break
+                push_cost = max(push_cost, self.cost(idx, Direction.BACKWARD))
+                if end < start - 1:
+                    self._add_edge(G, start, end, StepType.SCHEMA_JUMP, push_cost)
+        return G
+
+    def plan(self, current: int, target: int) -> List[RouteStep]:
+        if current == target:
+            return []
+        # a route never needs to leave the plans between current and target
+        G = self.build_graph(min(current, target), max(current, target))
+        path = nx.shortest_path(G, current, target, weight="cost")
+        return [
+            RouteStep(
+                type=G[start][end]["type"],
+                start=start,
+                end=end,
+                cost=G[start][end]["cost"],
+            )
+            for start, end in zip(path, path[1:])
+        ]
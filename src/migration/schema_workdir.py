@@ -0,0 +1,206 @@
+import fcntl
+import logging
+import os
+import shutil
+import tempfile
+import threading
+from contextlib import contextmanager
+from typing import Dict, Iterator, List, Tuple
+
+from . import helper
+from .env import cli_env
+
+logger = logging.getLogger(__name__)
+
+WORKDIR_CACHE_DIR = "schema_workdir"
+WORKDIR_CACHE_MAX_ENTRIES = 16
+
+
+def link_or_copy(src: str, dst: str):
+    try:
+        os.link(src, dst)
+    except OSError:
+        # e.g. the scratch dir is on another device
+        shutil.copy(src, dst)
+
+
+class SchemaWorkdirCache:
+    """
+    Cache of skeema working directories, one per schema index sha1.
+
+    Each entry is <scratch>/schema_workdir/<sha1>/schema/ with the sql files of
+    the index hard linked from the schema store, so building an entry does not
+    copy any file content and pushing the same index again reuses it.
+
+    An entry in use holds a shared flock on <sha1>.lock, which works as a
+    reference count across processes; eviction only removes entries it can
+    lock exclusively, and removes their lock file with them.
+    """
+
+    def __init__(
+        self, scratch_dir: str = None, max_entries: int = WORKDIR_CACHE_MAX_ENTRIES
+    ):
+        self._scratch_dir = scratch_dir
+        self.max_entries = max_entries
+        self._refs: Dict[str, int] = {}
+        self._mutex = threading.Lock()
+
+    @property
+    def cache_dir(self) -> str:
+        return os.path.join(
+            self._scratch_dir or cli_env.SDM_SCRATCH_DIR, WORKDIR_CACHE_DIR
+        )
+
+    def _entry_path(self, sha1: str) -> str:
+        return os.path.join(self.cache_dir, sha1)
+
+    def _lock_path(self, sha1: str) -> str:
+        return os.path.join(self.cache_dir, f"{sha1}.lock")
+
+    def _read_index(self, sha1: str) -> List[Tuple[str, str]]:
+        with open(helper.sha1_to_path(sha1), "r") as f:
+            lines = f.readlines()
+        return [
+            (line.split(":")[0], line.split(":")[1].strip()) for line in lines
+        ]  # sha1, filename
+
+    def _build(self, sha1: str):
+        entry_path = self._entry_path(sha1)
+        if os.path.isdir(entry_path):
+            return
+        # build in a temporary dir and rename it, so a partially built entry
+        #   is never visible to other processes
+        build_path = tempfile.mkdtemp(dir=self.cache_dir, prefix=f".{sha1}.")
+        try:
+            schema_path = os.path.join(build_path, cli_env.SCHEMA_DIR)
+            os.makedirs(schema_path)
+            for sql_sha1, sql_filename in self._read_index(sha1):
+                link_or_copy(
+                    helper.sha1_to_path(sql_sha1),
+                    os.path.join(schema_path, sql_filename),
+                )
+            try:
+                os.rename(build_path, entry_path)
+                logger.debug("Built schema workdir %s", entry_path)
+            except OSError:
+                # built by another process in the meantime
+                shutil.rmtree(build_path, ignore_errors=True)
+        except Exception:
+            shutil.rmtree(build_path, ignore_errors=True)
+            raise
+
+    def _refresh_skeema_file(self, sha1: str):
+        # .skeema holds the environment config and can change at any time,
+        #   so it is linked again on every acquire
+        schema_path = os.path.join(self._entry_path(sha1), cli_env.SCHEMA_DIR)
+        tmp_path = os.path.join(
+            schema_path, f".skeema.{os.getpid()}.{threading.get_ident()}"
+        )
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+        link_or_copy(
+            os.path.join(cli_env.MIGRATION_CWD, cli_env.SCHEMA_DIR, ".skeema"),
+            tmp_path,
+        )
+        os.replace(tmp_path, os.path.join(schema_path, ".skeema"))
+
+    @contextmanager
+    def _lock(self, sha1: str, operation: int) -> Iterator[None]:
+        """
+        flock <sha1>.lock, the lock file may be removed by an eviction between
+        opening and locking it, then the lock is taken again on the new file
+        """
+        lock_path = self._lock_path(sha1)
+        while True:
+            with open(lock_path, "a+") as lock_file:
+                fcntl.flock(lock_file.fileno(), operation)
+                try:
+                    try:
+                        current = os.stat(lock_path).st_ino
+                    except FileNotFoundError:
+                        current = None
+                    if current != os.fstat(lock_file.fileno()).st_ino:
+                        continue
+                    yield
+                    return
+                finally:
+                    fcntl.flock(lock_file.fileno(), fcntl.LOCK_UN)
+
+    @contextmanager
+    def acquire(self, sha1: str) -> Iterator[str]:
+        """
+        yield a directory containing schema/ with the sql files of the index
+        """
+        os.makedirs(self.cache_dir, exist_ok=True)
+        with self._lock(sha1, fcntl.LOCK_SH):
+            with self._mutex:
+                self._refs[sha1] = self._refs.get(sha1, 0) + 1
+            try:
+                self._build(sha1)
+                self._refresh_skeema_file(sha1)
+                os.utime(self._entry_path(sha1))
+                yield self._entry_path(sha1)
+            finally:
+                with self._mutex:
+                    self._refs[sha1] -= 1
+                    if self._refs[sha1] == 0:
+                        del self._refs[sha1]
+        self.evict()
+
+    def _remove_entry(self, sha1: str) -> bool:
+        with self._mutex:
+            if sha1 in self._refs:
+                return False
+        try:
+            with self._lock(sha1, fcntl.LOCK_EX | fcntl.LOCK_NB):
+                shutil.rmtree(self._entry_path(sha1), ignore_errors=True)
+                # the processes waiting on it lock the next lock file, see _lock
+                os.remove(self._lock_path(sha1))
+        except BlockingIOError:
+            # in use by another process
+            return False
+        logger.debug("Evicted schema workdir %s", self._entry_path(sha1))
+        return True
+
+    def _remove_orphan_locks(self):
+        """
+        remove the lock files left without an entry, e.g. by a failed build
+        """
+        if not os.path.isdir(self.cache_dir):
+            return
+        entries = set(self.entries())
+        for name in os.listdir(self.cache_dir):
+            sha1, ext = os.path.splitext(name)
+            if ext == ".lock" and sha1 not in entries:
+                self._remove_entry(sha1)
+
+    def entries(self) -> List[str]:
+        """
+        return cached index sha1s, least recently used first
+        """
+        if not os.path.isdir(self.cache_dir):
+            return []
+        entries = []
+        with os.scandir(self.cache_dir) as it:
+            for entry in it:
+                if entry.is_dir() and not entry.name.startswith("."):
+                    entries.append((entry.stat().st_mtime_ns, entry.name))
+        return [name for _, name in sorted(entries)]
+
+    def evict(self):
+        """
+        remove least recently used entries that are not in use
+        """
+        entries = self.entries()
+        to_remove = len(entries) - self.max_entries
+        for sha1 in entries:
+            if to_remove <= 0:
+                break
+            if self._remove_entry(sha1):
+                to_remove -= 1
+        self._remove_orphan_locks()
+
+    def clear(self):
+        for sha1 in self.entries():
+            self._remove_entry(sha1)
+        self._remove_orphan_locks()
@@ -0,0 +1,211 @@
+import fcntl
+import json
+import logging
+import os
+import time
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
+from typing import Dict, Iterable, List, Optional, Set
+
+from . import err, helper
+from .env import cli_env
+
+logger = logging.getLogger(__name__)
+
+GC_STATE_FILE = "gc_state.json"
+GC_LOCK_FILE = "schema_store.lock"
+GC_LOCK_TIMEOUT = 30  # seconds
+GC_DELETE_WORKERS = 8
+
+
+@contextmanager
+def store_lock(scratch_dir: str = None, timeout: float = GC_LOCK_TIMEOUT):
+    """
+    exclusive lock on the schema store, shared by make-schema and clean store
+    """
+    scratch_dir = scratch_dir or cli_env.SDM_SCRATCH_DIR
+    os.makedirs(scratch_dir, exist_ok=True)
+    lock_path = os.path.join(scratch_dir, GC_LOCK_FILE)
+    with open(lock_path, "a+") as f:
+        deadline = time.monotonic() + timeout
+        while True:
+            try:
+                fcntl.flock(f.fileno(), fcntl.LOCK_EX | fcntl.LOCK_NB)
+                break
+            except BlockingIOError:
+                if time.monotonic() > deadline:
+                    raise err.LockTimeoutError(
+                        f"Timeout waiting for schema store lock, path={lock_path}"
+                    )
+                time.sleep(0.05)
+        try:
+            yield
+        finally:
+            fcntl.flock(f.fileno(), fcntl.LOCK_UN)
+
+
+class SchemaStoreGC:
+    """
+    Mark-and-sweep garbage collector for the schema store.
+
+    Index files are content addressed and never change, so the sql sha1s an
+    index refers to are cached in the persisted state once they are read.
+    make-schema adds the index it writes to the cache directly, so marking
+    only reads index files that were written outside of sdm.
+
+    The sweep works bucket by bucket (the first 2 hex chars of sha1). A bucket
+    swept clean against the current reachable set is old generation and is
+    skipped until its mtime changes, i.e. until something is written to or
+    removed from it. A sweep over an unchanged store only stats the buckets.
+    """
+
+    def __init__(self, store_dir: str = None, scratch_dir: str = None):
+        self.store_dir = store_dir or os.path.join(
+            cli_env.MIGRATION_CWD, cli_env.SCHEMA_STORE_DIR
+        )
+        self.scratch_dir = scratch_dir or cli_env.SDM_SCRATCH_DIR
+        self.state_path = os.path.join(self.scratch_dir, GC_STATE_FILE)
+        self.state = self._load_state()
+
+    def _load_state(self) -> Dict:
+        state = {"index": {}, "buckets": {}, "cursor": 0}
+        try:
+            with open(self.state_path, "r") as f:
+                state.update(json.load(f))
+        except (FileNotFoundError, json.JSONDecodeError):
+            pass
+        return state
+
+    def save_state(self):
+        os.makedirs(self.scratch_dir, exist_ok=True)
+        tmp_path = self.state_path + ".tmp"
+        with open(tmp_path, "w") as f:
+            json.dump(self.state, f)
+        os.replace(tmp_path, self.state_path)
+
+    def record_written(self, index_sha1: str, sql_sha1s: List[str]):
+        """
+        record objects written by make-schema, so the next mark does not need
+        to read the index file again
+        """
+        self.state["index"][index_sha1] = sorted(set(sql_sha1s))
+
+    def _read_index(self, index_sha1: str) -> List[str]:
+        with open(os.path.join(self.store_dir, index_sha1[:2], index_sha1[2:])) as f:
+            return [line.split(":")[0] for line in f.readlines()]
+
+    def mark(self, index_sha1s: Iterable[str]) -> Set[str]:
+        """
+        return the set of reachable sha1s, reading only uncached index files
+        """
+        cache: Dict[str, List[str]] = self.state["index"]
+        reachable: Set[str] = set()
+        live_indexes = set(index_sha1s)
+        for index_sha1 in live_indexes:
+            if index_sha1 not in cache:
+                cache[index_sha1] = self._read_index(index_sha1)
+            reachable.add(index_sha1)
+            reachable.update(cache[index_sha1])
+        # drop cached indexes that are not referenced anymore
+        for index_sha1 in list(cache.keys()):
+            if index_sha1 not in live_indexes:
+                del cache[index_sha1]
+        return reachable
+
+    def _list_buckets(self) -> List[str]:
+        buckets = []
+        with os.scandir(self.store_dir) as it:
+            for entry in it:
+                if entry.is_dir():
+                    buckets.append(entry.name)
+        return sorted(buckets)
+
+    def _list_root_files(self) -> List[str]:
+        with os.scandir(self.store_dir) as it:
+            return sorted(
+                entry.name
+                for entry in it
+                if not entry.is_dir() and not entry.name.endswith(".gitkeep")
+            )
+
+    def _sweep_bucket(self, bucket: str, reachable: Set[str]) -> List[str]:
+        bucket_path = os.path.join(self.store_dir, bucket)
+        unexpected = []
+        for root, _, files in os.walk(bucket_path):
+            for file in files:
+                if file.endswith(".gitkeep"):
+                    continue
+                rel_path = os.path.join(root, file).removeprefix(self.store_dir + "/")
+                if root != bucket_path or bucket + file not in reachable:
+                    unexpected.append(rel_path)
+        return unexpected
+
+    def _delete(self, rel_paths: List[str]):
+        def remove(rel_path: str):
+            full_path = os.path.join(self.store_dir, rel_path)
+            os.remove(full_path)
+            logger.warning("Deleted %s", full_path)
+
+        with ThreadPoolExecutor(max_workers=GC_DELETE_WORKERS) as executor:
+            list(executor.map(remove, rel_paths))
+
+    def collect(
+        self,
+        index_sha1s: Iterable[str],
+        dry_run: bool = False,
+        max_time: Optional[float] = None,
+    ) -> List[str]:
+        """
+        mark reachable objects from the given index sha1s and sweep the store,
+        return the unexpected paths relative to the store dir.
+        if max_time (seconds) is set, sweep as many buckets as possible within
+        the budget and continue from there on the next call
+        """
+        start = time.monotonic()
+        reachable = self.mark(index_sha1s)
+        digest = helper.sha1_encode(sorted(reachable))
+
+        unexpected = self._list_root_files()
+        buckets = self._list_buckets()
+        bucket_states: Dict[str, List] = self.state["buckets"]
+        for name in list(bucket_states.keys()):
+            if name not in buckets:
+                del bucket_states[name]
+
+        cursor = 0
+        if max_time is not None and len(buckets) > 0:
+            cursor = self.state["cursor"] % len(buckets)
+        swept = 0
+        for i in range(len(buckets)):
+            # always sweep at least one bucket so that the sweep makes progress
+            if (
+                max_time is not None
+                and swept > 0
+                and time.monotonic() - start > max_time
+            ):
+                break
+            bucket = buckets[(cursor + i) % len(buckets)]
+            swept += 1
+            bucket_path = os.path.join(self.store_dir, bucket)
+            mtime = os.stat(bucket_path).st_mtime_ns
+            if bucket_states.get(bucket) == [mtime, digest]:
+                continue
+            bucket_unexpected = self._sweep_bucket(bucket, reachable)
+            unexpected.extend(bucket_unexpected)
+            if not dry_run or len(bucket_unexpected) == 0:
+                if not dry_run:
+                    self._delete(bucket_unexpected)
+                bucket_states[bucket] = [os.stat(bucket_path).st_mtime_ns, digest]
+
+        if not dry_run:
+            self._delete([p for p in unexpected if "/" not in p])
+        if swept < len(buckets):
+            logger.info(
+                "Swept %d of %d schema store buckets within %.3fs",
+                swept,
+                len(buckets),
+                max_time,
+            )
+        self.state["cursor"] = (cursor + swept) % max(len(buckets), 1)
+        self.save_state()
+        return unexpected
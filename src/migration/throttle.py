@@ -0,0 +1,193 @@
+import configparser
+import logging
+import time
+from typing import Dict, List, Optional, Tuple
+
+from sqlalchemy import Connection, Engine, text
+
+from . import err, helper
+from .db.db import make_engine
+from .env import cli_env
+
+logger = logging.getLogger(__name__)
+
+# keys of an environment section in .skeema, skeema ignores unknown options
+#   prefixed by loose-
+OPTION_REPLICAS = "sdm-replicas"
+OPTION_HEARTBEAT_TABLE = "sdm-heartbeat-table"
+OPTION_MAX_REPLICA_LAG = "sdm-max-replica-lag"
+
+DEFAULT_MYSQL_PORT = 3306
+LAG_COLUMNS = ["Seconds_Behind_Source", "Seconds_Behind_Master"]
+
+
+def parse_replicas(value: str) -> List[Tuple[str, int]]:
+    """
+    parse a comma separated list of host[:port]
+    """
+    replicas = []
+    for item in value.split(","):
+        item = item.strip()
+        if not item:
+            continue
+        host, _, port = item.rpartition(":")
+        if not host:
+            host, port = item, ""
+        replicas.append((host, int(port) if port else DEFAULT_MYSQL_PORT))
+    return replicas
+
+
+def get_option(section: configparser.SectionProxy, name: str) -> Optional[str]:
+    return section.get(f"loose-{name}", section.get(name))
+
+
+class ReplicaLagThrottle:
+    """
+    Pause the caller while any replica lags behind the primary by more than
+    max_lag seconds, checked between the batches of a migration.
+
+    The lag is read from SHOW REPLICA STATUS, or from the latest timestamp of
+    a heartbeat table written on the primary, e.g. by pt-heartbeat --utc. A
+    replica whose replication is stopped counts as lagging.
+    """
+
+    def __init__(
+        self,
+        replicas: Dict[str, Engine],
+        max_lag: float = cli_env.REPLICA_MAX_LAG,
+        heartbeat_table: Optional[str] = None,
+        check_interval: float = cli_env.REPLICA_CHECK_INTERVAL,
+        timeout: float = cli_env.REPLICA_LAG_TIMEOUT,
+    ):
+        self.replicas = replicas
+        self.max_lag = max_lag
+        self.heartbeat_table = heartbeat_table
+        self.check_interval = check_interval
+        # 0 waits for the replicas forever
+        self.timeout = timeout
+        self.paused_seconds = 0.0
+        self._last_ok: Optional[float] = None
+        self._status_stmt: Dict[str, str] = {}
+
+    def _get_lag_by_heartbeat(self, conn: Connection) -> Optional[float]:
+        return conn.execute(
+            text(
+                "SELECT TIMESTAMPDIFF(MICROSECOND, MAX(`ts`), UTC_TIMESTAMP(6))"
+                f" / 1000000 FROM {self.heartbeat_table}"
+            )
+        ).scalar()
+
+    def _get_lag_by_status(self, name: str, conn: Connection) -> Optional[float]:
+        rows = None
+        # SHOW REPLICA STATUS is available since MySQL 8.0.22
+        for stmt in [self._status_stmt.get(name), "REPLICA", "SLAVE"]:
+            if stmt is None:
+                continue
+            try:
+                rows = conn.execute(text(f"SHOW {stmt} STATUS")).mappings().all()
+            except Exception as e:
+                logger.debug("SHOW %s STATUS failed on %s, error=%s", stmt, name, e)
+                continue
+            self._status_stmt[name] = stmt
+            break
+        if not rows:
+            raise err.ReplicaLagError(f"{name} is not a replica")
+        lags = []
+        for row in rows:
+            lag = next((row[c] for c in LAG_COLUMNS if c in row), None)
+            if lag is None:
+                return None
+            lags.append(float(lag))
+        return max(lags)
+
+    def get_lags(self) -> Dict[str, Optional[float]]:
+        """
+        return lag seconds by replica, None if the replication is stopped
+        """
+        lags = {}
+        for name, engine in self.replicas.items():
+            with engine.connect() as conn:
+                if self.heartbeat_table:
+                    lags[name] = self._get_lag_by_heartbeat(conn)
+                else:
+                    lags[name] = self._get_lag_by_status(name, conn)
+        return lags
+
+    def wait(self):
+        """
+        return when every replica is within max_lag, the replicas are checked
+        at most once per check_interval while they keep up
+        """
+        now = time.monotonic()
+        if self._last_ok is not None and now - self._last_ok < self.check_interval:
+            return
+        start = now
+        while True:
+            lags = self.get_lags()
+            lagging = {
+                name: lag
+                for name, lag in lags.items()
+                if lag is None or lag > self.max_lag
+            }
+            if not lagging:
+                break
+            waited = time.monotonic() - start
+            if self.timeout > 0 and waited >= self.timeout:
+                raise err.ReplicaLagError(
+                    f"Timeout waiting for replicas to catch up, lags={lagging},"
+                    f" max_lag={self.max_lag}, waited={waited:.1f}s"
+                )
+            logger.info(
+                "Replicas lag behind, lags=%s, max_lag=%s, pausing",
+                lagging,
+                self.max_lag,
+            )
+            time.sleep(self.check_interval)
+
+        self._last_ok = time.monotonic()
+        if self._last_ok - start >= self.check_interval:
+            self.paused_seconds += self._last_ok - start
+            logger.info("Replicas caught up after %.1fs", self._last_ok - start)
+
+    def __call__(self):
+        self.wait()
+
+    def close(self):
+        for engine in self.replicas.values():
+            engine.dispose()
+
+    def __enter__(self) -> "ReplicaLagThrottle":
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+
+def build_throttle_from_env(env: str) -> Optional[ReplicaLagThrottle]:
+    """
+    return None if no replica is configured for the environment
+    """
+    section = helper.get_env_ini_section(env)
+    replicas = parse_replicas(get_option(section, OPTION_REPLICAS) or "")
+    if not replicas:
+        return None
+    engines = {
+        f"{host}:{port}": make_engine(
+            host=host,
+            port=port,
+            user=section["user"],
+            password=cli_env.MYSQL_PWD,
+            schema=section["schema"],
+            echo=cli_env.ALLOW_ECHO_SQL,
+            create_all_tables=False,
+        )
+        for host, port in replicas
+    }
+    max_lag = get_option(section, OPTION_MAX_REPLICA_LAG)
+    return ReplicaLagThrottle(
+        engines,
+        max_lag=float(max_lag) if max_lag else cli_env.REPLICA_MAX_LAG,
+        heartbeat_table=get_option(section, OPTION_HEARTBEAT_TABLE),
+        check_interval=cli_env.REPLICA_CHECK_INTERVAL,
+        timeout=cli_env.REPLICA_LAG_TIMEOUT,
+    )
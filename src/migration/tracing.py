@@ -0,0 +1,275 @@
+import json
+import logging
+import os
+import secrets
+import threading
+import time
+from contextlib import contextmanager
+from dataclasses import dataclass, field
+from typing import Any, Callable, Dict, Iterator, List, Optional
+
+from .env import cli_env
+
+logger = logging.getLogger(__name__)
+
+TRACEPARENT_ENV = "TRACEPARENT"
+SERVICE_NAME = "sdm"
+SCOPE_NAME = "migration"
+# https://opentelemetry.io/docs/specs/otel/trace/api/#set-status
+STATUS_ERROR = 2
+SPAN_KIND_INTERNAL = 1
+
+
+@dataclass
+class Span:
+    name: str
+    trace_id: str
+    span_id: str
+    parent_id: Optional[str]
+    thread: str
+    start_ns: int
+    end_ns: int = 0
+    attributes: Dict[str, Any] = field(default_factory=dict)
+    error: Optional[str] = None
+
+    @property
+    def duration(self) -> float:
+        return (self.end_ns - self.start_ns) / 1e9
+
+    def set(self, key: str, value: Any):
+        self.attributes[key] = value
+
+    def traceparent(self) -> str:
+        return f"00-{self.trace_id}-{self.span_id}-01"
+
+
+_listeners: List[Callable[[Span], None]] = []
+_trace_id: Optional[str] = None
+# parent of the root spans, from TRACEPARENT
+_root_parent_id: Optional[str] = None
+_local = threading.local()
+_main_stack: List[Span] = []
+
+
+def _stack() -> List[Span]:
+    if threading.current_thread() is threading.main_thread():
+        return _main_stack
+    if not hasattr(_local, "stack"):
+        _local.stack = []
+    return _local.stack
+
+
+def _parent_id(stack: List[Span]) -> Optional[str]:
+    # a worker thread continues the span the main thread is in, which
+    #   started the worker in most cases
+    for candidate in [stack, _main_stack]:
+        if candidate:
+            return candidate[-1].span_id
+    return _root_parent_id
+
+
+def enabled() -> bool:
+    return len(_listeners) > 0
+
+
+def add_listener(listener: Callable[[Span], None]):
+    """
+    listener is called with every finished span
+    """
+    global _trace_id, _root_parent_id
+    if _trace_id is None:
+        _trace_id, _root_parent_id = _parse_traceparent(
+            os.environ.get(TRACEPARENT_ENV, "")
+        )
+    _listeners.append(listener)
+
+
+def remove_listener(listener: Callable[[Span], None]):
+    global _trace_id, _root_parent_id
+    _listeners.remove(listener)
+    if not _listeners:
+        _trace_id, _root_parent_id = None, None
+
+
+def _parse_traceparent(value: str):
+    """
+    return the trace id and the parent span id of a W3C traceparent, a new
+    trace if it is not valid
+    """
+    parts = value.strip().split("-")
+    if len(parts) == 4 and len(parts[1]) == 32 and len(parts[2]) == 16:
+        return parts[1], parts[2]
+    return secrets.token_hex(16), None
+
+
+def current_span() -> Optional[Span]:
+    stack = _stack()
+    return stack[-1] if stack else None
+
+
+def start_span(
+    name: str, attributes: Dict[str, Any] = None, detached: bool = False
+) -> Optional[Span]:
+    """
+    start a span, return None if tracing is disabled. Spans started in this
+    thread before end_span are its children, unless the span is detached,
+    e.g. of a coroutine that runs along others in the thread
+    """
+    if not _listeners:
+        return None
+    stack = _stack()
+    s = Span(
+        name=name,
+        trace_id=_trace_id,
+        span_id=secrets.token_hex(8),
+        parent_id=_parent_id(stack),
+        thread=threading.current_thread().name,
+        start_ns=time.time_ns(),
+        attributes=dict(attributes or {}),
+    )
+    if not detached:
+        stack.append(s)
+    return s
+
+
+def end_span(s: Optional[Span], error: Optional[BaseException] = None):
+    if s is None:
+        return
+    s.end_ns = time.time_ns()
+    if error is not None:
+        s.error = f"{type(error).__name__}: {error}"
+    stack = _stack()
+    # spans ended by events, e.g. of a transaction, may end out of order
+    if s in stack:
+        stack.remove(s)
+    for listener in list(_listeners):
+        listener(s)
+
+
+@contextmanager
+def span(name: str, attributes: Dict[str, Any] = None) -> Iterator[Optional[Span]]:
+    s = start_span(name, attributes)
+    try:
+        yield s
+    except BaseException as e:
+        end_span(s, e)
+        raise
+    end_span(s)
+
+
+def subprocess_span(cmd: List[str]) -> Iterator[Optional[Span]]:
+    """
+    span named by the executable of the command, e.g. skeema or node
+    """
+    exe = os.path.basename(cmd[0]) if cmd else ""
+    return span(
+        f"subprocess {exe}",
+        {"process.executable.name": exe, "process.command_args": " ".join(cmd)},
+    )
+
+
+def traceparent_env() -> Dict[str, str]:
+    """
+    return the environment to continue the trace in a child process
+    """
+    s = current_span()
+    if s is None:
+        return {}
+    return {TRACEPARENT_ENV: s.traceparent()}
+
+
+def _otlp_value(value: Any) -> Dict:
+    if isinstance(value, bool):
+        return {"boolValue": value}
+    if isinstance(value, int):
+        # int64 is a string in OTLP JSON
+        return {"intValue": str(value)}
+    if isinstance(value, float):
+        return {"doubleValue": value}
+    return {"stringValue": str(value)}
+
+
+def _otlp_attributes(attributes: Dict[str, Any]) -> List[Dict]:
+    return [
+        {"key": k, "value": _otlp_value(v)}
+        for k, v in attributes.items()
+        if v is not None
+    ]
+
+
+def to_otlp(s: Span, resource: Dict[str, Any]) -> Dict:
+    """
+    return the span as an OTLP/JSON ExportTraceServiceRequest
+    """
+    otlp_span = {
+        "traceId": s.trace_id,
+        "spanId": s.span_id,
+        "name": s.name,
+        "kind": SPAN_KIND_INTERNAL,
+        "startTimeUnixNano": str(s.start_ns),
+        "endTimeUnixNano": str(s.end_ns),
+        "attributes": _otlp_attributes(dict(s.attributes, **{"thread.name": s.thread})),
+    }
+    if s.parent_id is not None:
+        otlp_span["parentSpanId"] = s.parent_id
+    if s.error is not None:
+        otlp_span["status"] = {"code": STATUS_ERROR, "message": s.error}
+    return {
+        "resourceSpans": [
+            {
+                "resource": {"attributes": _otlp_attributes(resource)},
+                "scopeSpans": [{"scope": {"name": SCOPE_NAME}, "spans": [otlp_span]}],
+            }
+        ]
+    }
+
+
+class JsonLinesExporter:
+    """
+    Append finished spans to a file as OTLP/JSON lines, one request per
+    line, the format of the file exporter of the OpenTelemetry collector.
+    Processes of a fleet can share the file, a line is written at once.
+    """
+
+    def __init__(self, path: str, resource: Dict[str, Any] = None):
+        from migration import __version__
+
+        self.path = path
+        self.resource = {
+            "service.name": SERVICE_NAME,
+            "service.version": __version__,
+            "process.pid": os.getpid(),
+            **(resource or {}),
+        }
+        dirname = os.path.dirname(os.path.abspath(path))
+        os.makedirs(dirname, exist_ok=True)
+        self._fd = os.open(path, os.O_WRONLY | os.O_APPEND | os.O_CREAT, 0o644)
+        self._mutex = threading.Lock()
+
+    def __call__(self, s: Span):
+        line = json.dumps(to_otlp(s, self.resource), separators=(",", ":")) + "\n"
+        with self._mutex:
+            os.write(self._fd, line.encode())
+
+    def close(self):
+        os.close(self._fd)
+
+
+@contextmanager
+def export_to_file(
+    path: str = cli_env.TRACE_FILE, resource: Dict[str, Any] = None
+) -> Iterator[None]:
+    """
+    export the spans of the block to path, nothing if path is empty
+    """
+    if not path:
+        yield
+        return
+    exporter = JsonLinesExporter(path, resource)
+    add_listener(exporter)
+    try:
+        yield
+    finally:
+        remove_listener(exporter)
+        exporter.close()
+        logger.debug("Exported spans to %s", path)
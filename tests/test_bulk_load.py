@@ -0,0 +1,96 @@
+import logging
+import os
+
+import pytest
+from sqlalchemy import text
+
+from migration import migration_plan as mp
+from migration.env import cli_env
+
+from . import testcommon as tc
+
+logger = logging.getLogger(__name__)
+
+
+def make_bulk_load_plan(
+    file: str, columns: dict = None, batch_size: int = None
+) -> mp.MigrationPlan:
+    cli = tc.make_cli({"name": "load_testtable", "type": "bulk_load"})
+    cli.make_data_migration()
+    data_plan = cli.read_migration_plans().get_plan_by_index(-1)
+    data_plan.change.forward.file = file
+    data_plan.change.forward.columns = columns
+    data_plan.change.forward.batch_size = batch_size
+    data_plan.change.backward = mp.DataBackward(
+        type="sql", sql="delete from testtable;"
+    )
+    data_plan.save()
+    return data_plan
+
+
+def write_csv(name: str, rows: int):
+    with open(os.path.join(cli_env.MIGRATION_CWD, cli_env.DATA_DIR, name), "w") as f:
+        f.write("name,unused,id\n")
+        for i in range(rows):
+            f.write(f'"name, {i}",x,{i}\n')
+
+
+@pytest.mark.parametrize("method", ["insert", "auto"])
+def test_bulk_load_csv(sort_plan_by_version, monkeypatch, method):
+    logger.info("=== start === test_bulk_load_csv %s", method)
+    monkeypatch.setattr(cli_env, "BULK_LOAD_METHOD", method)
+    tc.init_workspace()
+    tc.make_schema_migration_plan()
+    tc.migrate_dev()
+
+    write_csv("testtable.csv", 2500)
+    make_bulk_load_plan(
+        "testtable.csv", columns={"id": "id", "name": "name"}, batch_size=1000
+    )
+    cli = tc.migrate_dev()
+    tc.check_len_hists_row(cli, len_hists=3, len_row=2500)
+    with cli.dao.session.begin():
+        row = cli.dao.session.execute(
+            text("select name from testtable where id = 42;")
+        ).one()
+        assert row[0] == "name, 42"
+
+    cli = tc.make_cli({"environment": "dev", "version": "1"})
+    cli.rollback()
+    tc.check_len_hists_row(cli, len_hists=2, len_row=0)
+
+
+def test_bulk_load_duplicate_key_fails(sort_plan_by_version):
+    logger.info("=== start === test_bulk_load_duplicate_key_fails")
+    tc.init_workspace()
+    tc.make_schema_migration_plan()
+    tc.migrate_dev()
+
+    with open(
+        os.path.join(cli_env.MIGRATION_CWD, cli_env.DATA_DIR, "dup.csv"), "w"
+    ) as f:
+        f.write("id,name\n1,foo\n1,bar\n")
+    make_bulk_load_plan("dup.csv")
+    with pytest.raises(Exception):
+        tc.migrate_dev()
+    cli = tc.make_cli()
+    cli.build_dao()
+    # loaded in one transaction
+    tc.check_len_hists_row(cli, len_hists=3, len_row=0)
+
+
+def test_bulk_load_parquet(sort_plan_by_version):
+    logger.info("=== start === test_bulk_load_parquet")
+    pa = pytest.importorskip("pyarrow")
+    pq = pytest.importorskip("pyarrow.parquet")
+    tc.init_workspace()
+    tc.make_schema_migration_plan()
+    tc.migrate_dev()
+
+    table = pa.table({"id": list(range(100)), "name": [f"n{i}" for i in range(100)]})
+    pq.write_table(
+        table, os.path.join(cli_env.MIGRATION_CWD, cli_env.DATA_DIR, "t.parquet")
+    )
+    make_bulk_load_plan("t.parquet", batch_size=30)
+    cli = tc.migrate_dev()
+    tc.check_len_hists_row(cli, len_hists=3, len_row=100)
@@ -0,0 +1,48 @@
+import logging
+
+from sqlalchemy import text
+
+from migration import helper
+from migration.cost_estimator import AlterAlgorithm, CostEstimator
+
+from . import testcommon as tc
+
+logger = logging.getLogger(__name__)
+
+
+def test_dry_run_cost(sort_plan_by_version):
+    logger.info("=== start === test_dry_run_cost")
+    tc.init_workspace()
+    tc.make_schema_migration_plan()
+    cli = tc.migrate_dev()
+    with cli.dao.session.begin():
+        cli.dao.session.execute(
+            text(
+                "insert into testtable (id, name) values "
+                + ",".join(f"({i}, 'name_{i}')" for i in range(100))
+            )
+        )
+        cli.dao.session.commit()
+    data_plan = tc.make_data_migration_plan(
+        "update testtable set name = 'foo' where id < 10;",
+        "delete from testtable;",
+    )
+
+    engine = helper.build_engine_from_env("dev")
+    estimator = CostEstimator(engine)
+    cost = estimator.estimate(data_plan, is_migrate=True)
+    assert cost.algorithm is None
+    assert 0 < cost.rows <= 100
+    cost = estimator.estimate(data_plan, is_migrate=False)
+    assert cost.rows > 0
+
+    schema_plan = cli.read_migration_plans().get_plans()[1]
+    cost = estimator.estimate(schema_plan, is_migrate=True)
+    # testtable is created by the plan
+    assert cost.algorithm == AlterAlgorithm.INSTANT
+    assert cost.bytes_rewritten == 0
+    engine.dispose()
+
+    # the cost columns are printed
+    cli = tc.make_cli({"environment": "dev", "dry_run": True})
+    cli.migrate()
@@ -0,0 +1,41 @@
+import logging
+
+import pytest
+
+from migration import err, helper
+from migration.db import env_lock
+
+from . import testcommon as tc
+
+logger = logging.getLogger(__name__)
+
+
+def test_env_lock(sort_plan_by_version):
+    logger.info("=== start === test_env_lock")
+    tc.init_workspace()
+    tc.make_schema_migration_plan()
+
+    cli = tc.make_cli({"environment": "dev", "operator": "alice"})
+    status = cli.lock_status()
+    assert not status.locked
+
+    with cli.hold_env_lock() as lock:
+        status = cli.lock_status()
+        assert status.locked
+        assert status.is_holder_alive()
+        assert status.holder.startswith("alice@")
+
+        # the lock is reentrant within the same CLI
+        cli.migrate()
+
+        # another run cannot acquire the lock
+        engine = helper.build_engine_from_env("dev")
+        with pytest.raises(err.LockTimeoutError):
+            with env_lock.EnvironmentLock(engine, holder="bob", timeout=0):
+                pass
+        lock.heartbeat()
+
+    status = cli.lock_status()
+    assert not status.locked
+    assert status.holder.startswith("alice@")
+    tc.check_len_hists_row(cli, len_hists=2, len_row=0)
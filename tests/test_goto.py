@@ -0,0 +1,65 @@
+import logging
+
+from migration.lib import CLI
+from migration.route_planner import StepType
+
+from . import testcommon as tc
+from .test_rollback_jump import CountingMigrator, list_tables
+
+logger = logging.getLogger(__name__)
+
+
+def test_goto(sort_plan_by_version):
+    logger.info("=== start === test_goto")
+    tc.init_workspace()
+    tc.make_table_migration_plans(4)
+    cli = tc.make_cli({"environment": "dev", "version": "1"})
+    cli.migrate()
+
+    # dry run only prints the route
+    cli = tc.make_cli({"environment": "dev", "version": "4", "dry_run": True})
+    route = cli.goto()
+    assert [step.type for step in route] == [StepType.SCHEMA_PUSH]
+    with cli.dao.session.begin():
+        assert len(cli.dao.get_all()) == 2
+
+    migrator = CountingMigrator()
+    cli = CLI(
+        args=tc.make_args({"environment": "dev", "version": "4"}), migrator=migrator
+    )
+    cli.goto()
+    assert len(migrator.moves) == 1
+    with cli.dao.session.begin():
+        assert [hist.ver for hist in cli.dao.get_all()] == [
+            "0000",
+            "0001",
+            "0002",
+            "0003",
+            "0004",
+        ]
+        assert sorted(list_tables(cli.dao)) == ["t1", "t2", "t3", "t4"]
+
+    migrator = CountingMigrator()
+    cli = CLI(
+        args=tc.make_args({"environment": "dev", "version": "2"}), migrator=migrator
+    )
+    cli.goto()
+    assert len(migrator.moves) == 1
+    with cli.dao.session.begin():
+        assert len(cli.dao.get_all()) == 3
+        assert sorted(list_tables(cli.dao)) == ["t1", "t2"]
+
+
+def test_goto_records_timings(sort_plan_by_version):
+    logger.info("=== start === test_goto_records_timings")
+    tc.init_workspace()
+    tc.make_table_migration_plans(2)
+    cli = tc.migrate_dev()
+    cli = tc.make_cli({"environment": "dev", "version": "1"})
+    cli.rollback()
+
+    dao = cli.dao
+    with dao.session.begin():
+        timings = dao.get_timings()
+    assert ("0002", "add_t2", "forward") in timings
+    assert ("0002", "add_t2", "backward") in timings
@@ -0,0 +1,144 @@
+import logging
+import time
+
+import pytest
+from sqlalchemy import text
+
+from migration import migration_plan as mp
+from migration.db import model
+
+from . import testcommon as tc
+
+logger = logging.getLogger(__name__)
+
+
+def test_transition_mismatch_writes_nothing(sort_plan_by_version):
+    logger.info("=== start === test_transition_mismatch_writes_nothing")
+    tc.init_workspace()
+    tc.make_schema_migration_plan()
+    data_plan = tc.make_data_migration_plan(
+        "insert into testtable (id, name) values (1, 'foo.bar');",
+        "delete from testtable where id = 1;",
+    )
+    cli = tc.migrate_dev()
+    dao = cli.dao
+    with dao.session.begin():
+        len_logs = dao.session.execute(
+            text(f"select count(*) from {model.MigrationHistoryLog.__tablename__}")
+        ).scalar()
+
+    # the latest history is SUCCESSFUL, not PROCESSING
+    with pytest.raises(Exception):
+        with dao.session.begin():
+            dao.update_succ_and_add_next(data_plan, None)
+    with dao.session.begin():
+        hists = dao.get_all()
+        assert len(hists) == 3
+        assert hists[-1].state == model.MigrationState.SUCCESSFUL
+        assert (
+            dao.session.execute(
+                text(f"select count(*) from {model.MigrationHistoryLog.__tablename__}")
+            ).scalar()
+            == len_logs
+        )
+
+
+def test_transition_logs(sort_plan_by_version):
+    logger.info("=== start === test_transition_logs")
+    tc.init_workspace()
+    tc.make_schema_migration_plan()
+    tc.make_data_migration_plan(
+        "insert into testtable (id, name) values (1, 'foo.bar');",
+        "delete from testtable where id = 1;",
+    )
+    cli = tc.migrate_dev()
+    cli = tc.make_cli({"environment": "dev", "version": "0"})
+    cli.rollback()
+
+    dao = cli.dao
+    with dao.session.begin():
+        rows = dao.session.execute(
+            text(
+                "select h.ver, l.operation from"
+                f" {model.MigrationHistoryLog.__tablename__} l left join"
+                f" {model.MigrationHistory.__tablename__} h on l.hist_id = h.id"
+                " order by l.id asc"
+            )
+        ).all()
+        operations = [row[1] for row in rows]
+        assert operations == [
+            # init
+            "create",
+            "update_succ",
+            # migrate 0001, 0002
+            "create",
+            "update_succ",
+            "create",
+            "update_succ",
+            # rollback 0002, 0001
+            "update_rollback",
+            "delete",
+            "update_rollback",
+            "delete",
+        ]
+
+
+@pytest.mark.slow
+def test_versioned_transition_overhead(sort_plan_by_version):
+    logger.info("=== start === test_versioned_transition_overhead")
+    tc.init_workspace()
+    n = 1000
+    mpm = tc.make_cli().read_migration_plans()
+    prev = mpm.get_latest_plan()
+    for i in range(1, n + 1):
+        plan = mp.MigrationPlan(
+            version=str(i).zfill(4),
+            name=f"data_{i}",
+            author="",
+            type=mp.Type.DATA,
+            change=mp.Change(
+                forward=mp.DataForward(type=mp.DataChangeType.SQL, sql="SELECT 1;"),
+                backward=mp.DataBackward(type=mp.DataChangeType.SQL, sql="SELECT 1;"),
+            ),
+            dependencies=[mp.MigrationSignature(version=prev.version, name=prev.name)],
+        )
+        plan.save()
+        prev = plan
+
+    # fake mode skips execution, so only the history bookkeeping is measured
+    cli = tc.make_cli({"environment": "dev", "fake": True})
+    start = time.perf_counter()
+    cli.migrate()
+    elapsed = time.perf_counter() - start
+    logger.info(
+        "Migrated %d plans in %.3fs, %.3fms per plan", n, elapsed, elapsed / n * 1000
+    )
+
+    cli = tc.make_cli({"environment": "dev", "fake": True, "version": "0"})
+    start = time.perf_counter()
+    cli.rollback()
+    elapsed = time.perf_counter() - start
+    logger.info(
+        "Rollbacked %d plans in %.3fs, %.3fms per plan", n, elapsed, elapsed / n * 1000
+    )
+    dao = cli.dao
+    with dao.session.begin():
+        assert len(dao.get_all()) == 1
+
+
+def test_projected_reads_match_orm(sort_plan_by_version):
+    logger.info("=== start === test_projected_reads_match_orm")
+    tc.init_workspace()
+    tc.make_schema_migration_plan()
+    tc.make_repeatable_migration_plan()
+    cli = tc.migrate_dev()
+
+    dao = cli.dao
+    with dao.session.begin():
+        expected = [hist.to_dto() for hist in dao.get_all()]
+        expected_versioned = [hist.to_dto() for hist in dao.get_all_versioned()]
+    assert len(expected) > len(expected_versioned)
+    assert dao.get_all_dto() == expected
+    assert list(dao.iter_dto(batch_size=1)) == expected
+    assert dao.get_all_versioned_dto() == expected_versioned
+    assert list(dao.iter_dto(batch_size=1, versioned=True)) == expected_versioned
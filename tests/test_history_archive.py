@@ -0,0 +1,73 @@
+import datetime
+import logging
+
+from sqlalchemy import text, update
+
+from migration.db import model
+from migration.env import cli_env
+
+from . import testcommon as tc
+
+logger = logging.getLogger(__name__)
+
+
+def count_rows(dao, table: str) -> int:
+    return dao.session.execute(text(f"select count(*) from `{table}`")).scalar()
+
+
+def test_archive_history(sort_plan_by_version):
+    logger.info("=== start === test_archive_history")
+    tc.init_workspace()
+    tc.make_schema_migration_plan()
+    cli = tc.migrate_dev()
+    dao = cli.dao
+    log_table = model.MigrationHistoryLog.__tablename__
+    with dao.session.begin():
+        len_logs = count_rows(dao, log_table)
+        # age the logs of the init plan
+        dao.session.execute(
+            update(model.MigrationHistoryLog)
+            .where(model.MigrationHistoryLog.id <= 2)
+            .values(created=datetime.datetime(2020, 1, 1))
+        )
+        dao.commit()
+
+    cli = tc.make_cli(
+        {
+            "environment": "dev",
+            "before": datetime.datetime(2021, 1, 1),
+            "batch_size": 1,
+        }
+    )
+    assert cli.archive_history() == 2
+    dao = cli.dao
+    with dao.session.begin():
+        assert count_rows(dao, log_table) == len_logs - 2
+        assert count_rows(dao, cli_env.TABLE_MIGRATION_HISTORY_LOG_ARCHIVE) == 2
+
+    # nothing left to archive
+    assert cli.archive_history() == 0
+
+
+def test_partition_history(sort_plan_by_version):
+    logger.info("=== start === test_partition_history")
+    tc.init_workspace()
+    tc.make_schema_migration_plan()
+    tc.migrate_dev()
+
+    cli = tc.make_cli({"environment": "dev", "months_ahead": 2})
+    added = cli.partition_history()
+    # the current month and 2 months ahead
+    assert len(added) == 3
+    dao = cli.dao
+    with dao.session.begin():
+        assert dao.get_log_partitions() == added + ["pmax"]
+
+    cli = tc.make_cli({"environment": "dev", "months_ahead": 3})
+    assert len(cli.partition_history()) == 1
+    # logs are still written to the partitioned table
+    tc.make_data_migration_plan(
+        "insert into testtable (id, name) values (1, 'foo.bar');",
+        "delete from testtable where id = 1;",
+    )
+    tc.migrate_dev()
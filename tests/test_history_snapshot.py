@@ -0,0 +1,110 @@
+import json
+import logging
+
+import pytest
+from sqlalchemy import func, select
+
+from migration.db import model
+
+from . import testcommon as tc
+
+logger = logging.getLogger(__name__)
+
+
+def count_snapshots(dao) -> int:
+    return dao.session.scalar(
+        select(func.count(model.MigrationHistorySnapshot.checksum))
+    )
+
+
+def test_snapshot_stored_once(sort_plan_by_version):
+    logger.info("=== start === test_snapshot_stored_once")
+    tc.init_workspace()
+    tc.make_schema_migration_plan()
+    tc.make_data_migration_plan(
+        "insert into testtable (id, name) values (1, 'foo.bar');",
+        "delete from testtable where id = 1;",
+    )
+    tc.migrate_dev()
+    cli = tc.make_cli({"environment": "dev", "version": "0"})
+    cli.rollback()
+    cli = tc.migrate_dev()
+
+    dao = cli.dao
+    with dao.session.begin():
+        logs = dao.session.query(model.MigrationHistoryLog).all()
+        # init: 2 logs, 0001 and 0002: 6 logs each
+        assert len(logs) == 14
+        assert all(log.snapshot == "" and log.snapshot_id for log in logs)
+        # one snapshot per plan
+        assert count_snapshots(dao) == 3
+        snapshot = json.loads(dao.get_log_snapshot(logs[-1]))
+        assert snapshot["version"] == "0002"
+
+
+def test_compact_snapshots(sort_plan_by_version):
+    logger.info("=== start === test_compact_snapshots")
+    tc.init_workspace()
+    cli = tc.make_cli()
+    dao = cli.build_dao()
+    legacy_snapshot = json.dumps({"version": "0001", "sql": "x" * 1000})
+    with dao.session.begin():
+        for i in range(10):
+            dao.session.add(
+                model.MigrationHistoryLog(
+                    hist_id=100, operation="create", snapshot=legacy_snapshot
+                )
+            )
+        dao.commit()
+    with dao.session.begin():
+        len_snapshots = count_snapshots(dao)
+
+    cli = tc.make_cli({"environment": "dev", "batch_size": 3})
+    assert cli.compact_history() == 10
+    dao = cli.dao
+    with dao.session.begin():
+        logs = (
+            dao.session.query(model.MigrationHistoryLog)
+            .filter(model.MigrationHistoryLog.hist_id == 100)
+            .all()
+        )
+        assert len(logs) == 10
+        for log in logs:
+            assert log.snapshot == ""
+            assert dao.get_log_snapshot(log) == legacy_snapshot
+        assert count_snapshots(dao) == len_snapshots + 1
+
+    # nothing left to compact
+    assert cli.compact_history() == 0
+
+
+@pytest.mark.slow
+def test_snapshot_size_benchmark(sort_plan_by_version):
+    logger.info("=== start === test_snapshot_size_benchmark")
+    tc.init_workspace()
+    tc.make_schema_migration_plan()
+    inline_sql = "insert into testtable (id, name) values " + ",".join(
+        f"({i}, 'name_{i}')" for i in range(2000)
+    )
+    tc.make_data_migration_plan(inline_sql, "delete from testtable;")
+    runs = 10
+    for _ in range(runs):
+        tc.migrate_dev()
+        cli = tc.make_cli({"environment": "dev", "version": "1"})
+        cli.rollback()
+
+    dao = cli.dao
+    with dao.session.begin():
+        logs = dao.session.query(model.MigrationHistoryLog).all()
+        inline_bytes = sum(len(dao.get_log_snapshot(log)) for log in logs)
+        stored_bytes = dao.session.scalar(
+            select(func.sum(func.length(model.MigrationHistorySnapshot.snapshot)))
+        )
+    logger.info(
+        "%d log rows, inline snapshots would take %d bytes, stored %d bytes (%.1fx)",
+        len(logs),
+        inline_bytes,
+        stored_bytes,
+        inline_bytes / stored_bytes,
+    )
+    assert stored_bytes * runs < inline_bytes
@@ -0,0 +1,108 @@
+import logging
+
+import pytest
+from sqlalchemy import text
+
+from migration import err, helper
+from migration.env import cli_env
+from migration.online_alter import OnlineAlter
+
+from . import testcommon as tc
+
+logger = logging.getLogger(__name__)
+
+
+def fill_testtable(engine, n: int):
+    with engine.begin() as conn:
+        conn.execute(
+            text(
+                "insert into testtable (id, name) values "
+                + ",".join(f"({i}, 'name_{i}')" for i in range(1, n + 1))
+            )
+        )
+
+
+def list_tables(conn):
+    return [row[0] for row in conn.execute(text("show tables")).all()]
+
+
+def test_online_alter(sort_plan_by_version):
+    logger.info("=== start === test_online_alter")
+    tc.init_workspace()
+    tc.make_schema_migration_plan()
+    tc.migrate_dev()
+    engine = helper.build_engine_from_env("dev")
+    fill_testtable(engine, 2500)
+
+    written = []
+
+    def write_during_copy():
+        # writes during the copy are replayed by the triggers
+        if written:
+            return
+        written.append(True)
+        with engine.begin() as conn:
+            conn.execute(text("insert into testtable (id, name) values (3000, 'new')"))
+            conn.execute(text("update testtable set name = 'updated' where id = 2"))
+            conn.execute(text("delete from testtable where id = 2400"))
+
+    alter = OnlineAlter(
+        engine,
+        "testtable",
+        "ADD COLUMN `age` int NOT NULL DEFAULT 1, MODIFY COLUMN `name` varchar(512)",
+        chunk_size=1000,
+        throttle=write_during_copy,
+    )
+    alter.run()
+
+    with engine.connect() as conn:
+        assert conn.execute(text("select count(*) from testtable")).scalar() == 2500
+        assert (
+            conn.execute(text("select name from testtable where id = 2")).scalar()
+            == "updated"
+        )
+        assert (
+            conn.execute(text("select age from testtable where id = 3000")).scalar()
+            == 1
+        )
+        assert sorted(
+            t for t in list_tables(conn) if not t.startswith("_migration")
+        ) == ["testtable"]
+        assert conn.execute(text("show triggers")).all() == []
+    engine.dispose()
+
+
+def test_online_alter_unsupported(sort_plan_by_version):
+    logger.info("=== start === test_online_alter_unsupported")
+    tc.init_workspace()
+    tc.make_schema_migration_plan()
+    tc.migrate_dev()
+    engine = helper.build_engine_from_env("dev")
+    with pytest.raises(err.OnlineAlterError):
+        OnlineAlter(engine, "testtable", "CHANGE COLUMN `name` `title` text").run()
+    engine.dispose()
+
+
+def test_migrate_with_online_alter(sort_plan_by_version, monkeypatch):
+    logger.info("=== start === test_migrate_with_online_alter")
+    monkeypatch.setattr(cli_env, "ONLINE_ALTER_MIN_SIZE", "1")
+    tc.init_workspace()
+    tc.make_schema_migration_plan()
+    tc.migrate_dev()
+    engine = helper.build_engine_from_env("dev")
+    fill_testtable(engine, 100)
+
+    # skeema runs the ALTER through sdm osc
+    with open(f"{cli_env.SDM_SCHEMA_DIR}/testtable.sql", "w") as f:
+        f.write(
+            "create table testtable (id int primary key, name varchar(512), age int);"
+        )
+    tc.make_cli({"name": "alter_test_table"}).make_schema_migration()
+    tc.migrate_dev()
+    with engine.connect() as conn:
+        assert conn.execute(text("select count(*) from testtable")).scalar() == 100
+        columns = [
+            row[0] for row in conn.execute(text("show columns from testtable")).all()
+        ]
+        assert columns == ["id", "name", "age"]
+    engine.dispose()
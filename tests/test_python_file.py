@@ -52,3 +52,49 @@ def run(session: Session, args: dict):
         assert len(hists) == 3
         row = dao.session.execute(text("select name from testtable;")).one()
         assert row[0] == "foo.bar"
+
+
+def test_migrate_python_file_in_process_backend(sort_plan_by_version, monkeypatch):
+    logger.info("=== start === test_migrate_python_file_in_process_backend")
+    monkeypatch.setattr(cli_env, "PYTHON_MIGRATION_BACKEND", "process")
+    tc.init_workspace()
+    tc.make_schema_migration_plan()
+    tc.migrate_dev()
+
+    with open(
+        os.path.join(cli_env.MIGRATION_CWD, cli_env.DATA_DIR, "transform.py"), "w"
+    ) as f:
+        f.write("""import logging
+from sqlalchemy.orm import Session
+from sqlalchemy import text
+
+def transform(i: int) -> str:
+    return f"name_{i * i}"
+
+def run(session: Session, args: dict):
+    names = args["SDM_FAN_OUT"](transform, range(10), workers=2)
+    logging.getLogger(__name__).info("transformed %d names", len(names))
+    with session.begin():
+        for i, name in enumerate(names):
+            session.execute(
+                text("insert into testtable (id, name) values (:id, :name)"),
+                {"id": i, "name": name},
+            )
+    return 0
+""")
+    cli = tc.make_cli({"name": "transform", "type": "python"})
+    cli.make_data_migration()
+    data_plan = cli.read_migration_plans().get_plan_by_index(-1)
+    data_plan.change.forward.file = "transform.py"
+    data_plan.change.backward = mp.DataBackward(
+        type="sql", sql="delete from testtable;"
+    )
+    data_plan.save()
+
+    cli = tc.migrate_dev()
+    tc.check_len_hists_row(cli, len_hists=3, len_row=10)
+    with cli.dao.session.begin():
+        row = cli.dao.session.execute(
+            text("select name from testtable where id = 3;")
+        ).one()
+        assert row[0] == "name_9"
@@ -1,10 +1,12 @@
 import logging
 import os
+import time
 
 import pytest
 
 from migration import err
 from migration import migration_plan as mp
+from migration.db import model as dbmodel
 from migration.env import cli_env
 
 from . import testcommon as tc
@@ -167,3 +169,45 @@ def test_repeatable_migration(sort_plan_by_version):
     )
     cli.rollback()
     tc.check_len_hists_row(cli=cli, len_hists=4, len_row=3)
+
+
+def make_parallel_plan(name: str, forward_sql: str, conflicts_with=None):
+    _, plan = tc.make_repeatable_migration_plan(name=name, forward_sql=forward_sql)
+    plan.parallel_group = "sync"
+    plan.conflicts_with = conflicts_with
+    plan.save()
+
+
+def test_parallel_repeatable_migration(sort_plan_by_version):
+    logger.info("=== start === test_parallel_repeatable_migration")
+    tc.init_workspace()
+    tc.make_schema_migration_plan()
+    tc.migrate_dev()
+
+    def sleep_sql(i: int) -> str:
+        return (
+            f"insert into testtable (id, name) select {i}, 'sync' from"
+            " (select sleep(1)) t"
+        )
+
+    make_parallel_plan("sync_0", sleep_sql(0))
+    make_parallel_plan("sync_1", sleep_sql(1))
+    make_parallel_plan("sync_2", sleep_sql(2), conflicts_with=["sync_0"])
+    start = time.perf_counter()
+    cli = tc.migrate_dev()
+    elapsed = time.perf_counter() - start
+    # two batches, sync_2 never runs with sync_0
+    assert 1.9 < elapsed < 2.9
+    tc.check_len_hists_row(cli, len_hists=5, len_row=3)
+
+    # a failure does not stop the other plans of the batch
+    make_parallel_plan("sync_3", sleep_sql(3))
+    make_parallel_plan("sync_failing", "insert into no_such_table values (1)")
+    with pytest.raises(Exception):
+        tc.migrate_dev()
+    cli = tc.make_cli()
+    cli.build_dao()
+    states = {hist.name: hist.state for hist in cli.dao.get_all_dto()}
+    assert states["sync_3"] == dbmodel.MigrationState.SUCCESSFUL
+    assert states["sync_failing"] == dbmodel.MigrationState.PROCESSING
+    tc.check_len_hists_row(cli, len_hists=7, len_row=4)
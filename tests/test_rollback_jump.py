@@ -0,0 +1,92 @@
+import logging
+
+from sqlalchemy import text
+
+from migration.db import model
+from migration.env import cli_env
+from migration.lib import CLI
+from migration.migrator import Migrator
+
+from . import testcommon as tc
+
+logger = logging.getLogger(__name__)
+
+
+class CountingMigrator(Migrator):
+    def __init__(self):
+        super().__init__()
+        self.moves = []
+
+    def move_schema_to(self, sha1, environment, allow_unsafe=False):
+        self.moves.append(sha1)
+        super().move_schema_to(sha1, environment, allow_unsafe=allow_unsafe)
+
+
+def list_tables(dao):
+    return [
+        row[0]
+        for row in dao.session.execute(text("show tables")).all()
+        if not row[0].startswith(cli_env.TABLE_MIGRATION_HISTORY)
+    ]
+
+
+def test_rollback_jump(sort_plan_by_version):
+    logger.info("=== start === test_rollback_jump")
+    tc.init_workspace()
+    tc.make_table_migration_plans(4)
+    tc.migrate_dev()
+
+    migrator = CountingMigrator()
+    cli = CLI(
+        args=tc.make_args({"environment": "dev", "version": "1", "jump": True}),
+        migrator=migrator,
+    )
+    cli.rollback()
+    # one push instead of three
+    assert len(migrator.moves) == 1
+
+    dao = cli.dao
+    with dao.session.begin():
+        assert sorted(list_tables(dao)) == ["t1"]
+        hists = dao.get_all()
+        assert [hist.ver for hist in hists] == ["0000", "0001"]
+        operations = dao.session.execute(
+            text(
+                f"select operation from {model.MigrationHistoryLog.__tablename__}"
+                " order by id desc limit 4"
+            )
+        ).all()
+        assert [row[0] for row in operations] == [
+            "delete",
+            "delete",
+            "delete",
+            "update_rollback",
+        ]
+
+    # migrate again on top of the jumped schema
+    cli = tc.migrate_dev()
+    with cli.dao.session.begin():
+        assert len(cli.dao.get_all()) == 5
+
+
+def test_rollback_jump_fallback(sort_plan_by_version):
+    logger.info("=== start === test_rollback_jump_fallback")
+    tc.init_workspace()
+    tc.make_table_migration_plans(2)
+    tc.make_data_migration_plan(
+        "insert into t1 (id) values (1);",
+        "delete from t1 where id = 1;",
+    )
+    tc.migrate_dev()
+
+    migrator = CountingMigrator()
+    cli = CLI(
+        args=tc.make_args({"environment": "dev", "version": "1", "jump": True}),
+        migrator=migrator,
+    )
+    cli.rollback()
+    # the data plan has a backward, so it is rollbacked step by step
+    assert len(migrator.moves) == 1
+    with cli.dao.session.begin():
+        assert cli.dao.session.execute(text("select count(*) from t1")).scalar() == 0
+        assert len(cli.dao.get_all()) == 2
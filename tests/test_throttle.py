@@ -0,0 +1,93 @@
+import datetime
+import logging
+import os
+
+import pytest
+from sqlalchemy import text
+
+from migration import err, throttle
+from migration.db import db
+from migration.db import model as dbmodel
+from migration.env import cli_env
+
+from . import testcommon as tc
+
+logger = logging.getLogger(__name__)
+
+
+def use_heartbeat_replica():
+    """
+    use the first server as a replica of dev, its lag is read from a
+    heartbeat table
+    """
+    with open(os.path.join(cli_env.MIGRATION_CWD, cli_env.ENV_INI_FILE), "a") as f:
+        f.write(
+            f"loose-sdm-replicas={cli_env.UNITTEST_MYSQL_HOST1}:"
+            f"{cli_env.UNITTEST_MYSQL_PORT1}\n"
+            "loose-sdm-heartbeat-table=heartbeat\n"
+            "loose-sdm-max-replica-lag=5\n"
+        )
+    engine = db.make_engine(
+        host=cli_env.UNITTEST_MYSQL_HOST1,
+        port=cli_env.UNITTEST_MYSQL_PORT1,
+        user="root",
+        password=cli_env.MYSQL_PWD,
+        schema=cli_env.UNITTEST_DB_NAME,
+        create_all_tables=False,
+    )
+    with engine.begin() as conn:
+        conn.execute(text("DROP TABLE IF EXISTS heartbeat"))
+        conn.execute(text("CREATE TABLE heartbeat (ts varchar(26) NOT NULL)"))
+    return engine
+
+
+def beat(engine, lag: float):
+    ts = datetime.datetime.utcnow() - datetime.timedelta(seconds=lag)
+    with engine.begin() as conn:
+        conn.execute(text("DELETE FROM heartbeat"))
+        conn.execute(
+            text("INSERT INTO heartbeat (ts) VALUES (:ts)"), {"ts": ts.isoformat()}
+        )
+
+
+def test_replica_lag_throttle(sort_plan_by_version, monkeypatch):
+    logger.info("=== start === test_replica_lag_throttle")
+    tc.init_workspace()
+    tc.make_schema_migration_plan()
+    tc.make_data_migration_plan(
+        "insert into testtable (id, name) values (1, 'foo.bar');",
+        "delete from testtable where id = 1;",
+    )
+    primary = use_heartbeat_replica()
+
+    with throttle.build_throttle_from_env("dev") as replica_throttle:
+        assert replica_throttle.max_lag == 5
+        beat(primary, 0)
+        lags = replica_throttle.get_lags()
+        assert (
+            0
+            <= lags[f"{cli_env.UNITTEST_MYSQL_HOST1}:{cli_env.UNITTEST_MYSQL_PORT1}"]
+            < 5
+        )
+
+        beat(primary, 60)
+        replica_throttle.timeout = 1
+        with pytest.raises(err.ReplicaLagError):
+            replica_throttle.wait()
+
+    # the data plan is not executed while the replica lags
+    monkeypatch.setattr(cli_env, "REPLICA_LAG_TIMEOUT", 1)
+    with pytest.raises(err.ReplicaLagError):
+        tc.migrate_dev()
+    cli = tc.make_cli()
+    cli.build_dao()
+    hists = cli.dao.get_all_dto()
+    assert len(hists) == 3
+    assert hists[-1].state == dbmodel.MigrationState.PROCESSING
+    tc.check_len_hists_row(cli, len_hists=3, len_row=0)
+
+    beat(primary, 0)
+    cli = tc.make_cli()
+    cli.fix_migrate()
+    tc.check_len_hists_row(cli, len_hists=3, len_row=1)
+    primary.dispose()
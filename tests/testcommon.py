@@ -91,6 +91,18 @@ def make_schema_migration_plan(
     return cli
 
 
+def make_table_migration_plans(n: int):
+    """
+    make n schema migration plans, the i-th one adds table t{i}
+    """
+    for i in range(1, n + 1):
+        with open(
+            os.path.join(cli_env.MIGRATION_CWD, cli_env.SCHEMA_DIR, f"t{i}.sql"), "w"
+        ) as f:
+            f.write(f"create table t{i} (id int primary key);")
+        CLI(args=make_args({"name": f"add_t{i}"})).make_schema_migration()
+
+
 def make_repeatable_migration_plan(
     name: str = "seed_data",
     forward_sql: str = "insert into testtable (id, name) values (100, 'fooooo')",
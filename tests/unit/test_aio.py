@@ -0,0 +1,91 @@
+import asyncio
+import subprocess
+import threading
+import time
+
+import pytest
+
+from migration import aio
+
+
+def test_for_each_environment():
+    hosts = {"dev": "a", "qa": "a", "staging": "a", "prod": "b"}
+    limiter = aio.HostLimiter(per_host=2, host_of=lambda env: (hosts[env], "3306"))
+    running = {"a": 0, "b": 0}
+    peak = {"a": 0, "b": 0}
+    mutex = threading.Lock()
+
+    def work(env):
+        host = hosts[env]
+        with mutex:
+            running[host] += 1
+            peak[host] = max(peak[host], running[host])
+        time.sleep(0.1)
+        with mutex:
+            running[host] -= 1
+        if env == "qa":
+            raise Exception("qa is down")
+        return env.upper()
+
+    outcomes = aio.run(aio.for_each_environment(list(hosts), work, limiter))
+    assert [o.environment for o in outcomes] == list(hosts)
+    assert [o.result for o in outcomes] == ["DEV", None, "STAGING", "PROD"]
+    assert str(outcomes[1].error) == "qa is down"
+    assert peak == {"a": 2, "b": 1}
+
+
+def test_for_each_environment_coroutine():
+    async def work(env):
+        await asyncio.sleep(0.01)
+        return len(env)
+
+    limiter = aio.HostLimiter(host_of=lambda env: ("localhost", "3306"))
+    outcomes = aio.run(aio.for_each_environment(["dev", "prod"], work, limiter))
+    assert [o.result for o in outcomes] == [3, 4]
+
+
+def test_run_subprocess(tmp_path):
+    async def run_all():
+        await asyncio.gather(
+            *[aio.run_subprocess(["sleep", "0.3"]) for _ in range(3)],
+            aio.run_subprocess(["touch", "done"], cwd=str(tmp_path)),
+        )
+
+    started = time.perf_counter()
+    aio.run(run_all())
+    # the subprocesses overlap
+    assert time.perf_counter() - started < 0.8
+    assert (tmp_path / "done").exists()
+
+    with pytest.raises(subprocess.CalledProcessError):
+        aio.run(aio.run_subprocess(["false"]))
+
+
+def test_run_in_running_loop():
+    async def double(x: int) -> int:
+        await asyncio.sleep(0)
+        return x * 2
+
+    async def embedded() -> int:
+        # like a synchronous library call from an asyncio service
+        return aio.run(double(21))
+
+    assert aio.run(double(1)) == 2
+    assert asyncio.run(embedded()) == 42
+
+
+def test_for_each_environment_thread_per_environment():
+    # more than the threads of the default executor of asyncio
+    environments = [f"shard_{i}" for i in range(40)]
+    barrier = threading.Barrier(len(environments), timeout=10)
+    limiter = aio.HostLimiter(
+        per_host=len(environments), host_of=lambda env: ("localhost", "3306")
+    )
+
+    def work(env):
+        # every environment waits for all the others
+        barrier.wait()
+        return env
+
+    outcomes = aio.run(aio.for_each_environment(environments, work, limiter))
+    assert [o.result for o in outcomes] == environments
@@ -0,0 +1,61 @@
+import pytest
+
+from migration import err
+from migration import migration_plan as mp
+from migration.bulk_load import map_columns, read_csv
+from migration.env import cli_env
+
+
+def test_map_columns():
+    header = ["code", "name", "comment"]
+    assert map_columns(header, None) == [(0, "code"), (1, "name"), (2, "comment")]
+    assert map_columns(header, {"name": "title", "code": "id"}) == [
+        (1, "title"),
+        (0, "id"),
+    ]
+    with pytest.raises(err.BulkLoadError):
+        map_columns(header, {"missing": "id"})
+
+
+def test_read_csv(tmp_path):
+    path = tmp_path / "data.csv"
+    path.write_bytes('\ufeffid,name\r\n1,"a, ""b"""\r\n2,\r\n'.encode("utf-8"))
+    header, rows = read_csv(str(path))
+    assert header == ["id", "name"]
+    assert list(rows) == [["1", 'a, "b"'], ["2", None]]
+
+
+def test_data_file_in_checksum(tmp_path, monkeypatch):
+    monkeypatch.setattr(cli_env, "MIGRATION_CWD", str(tmp_path))
+    (tmp_path / cli_env.DATA_DIR).mkdir()
+    data_file = tmp_path / cli_env.DATA_DIR / "country.csv"
+    data_file.write_text("id,name\n1,foo\n")
+
+    def make_plan() -> mp.MigrationPlan:
+        return mp.MigrationPlan(
+            version="0002",
+            name="load_country",
+            author="",
+            type=mp.Type.DATA,
+            change=mp.Change(
+                forward=mp.DataForward(
+                    type=mp.DataChangeType.BULK_LOAD,
+                    file="country.csv",
+                    table="country",
+                    columns={"id": "id", "name": "name"},
+                ),
+                backward=None,
+            ),
+            dependencies=[],
+        )
+
+    plan = make_plan()
+    assert plan.change.forward.to_dict() == {
+        "type": "bulk_load",
+        "file": "country.csv",
+        "table": "country",
+        "columns": {"id": "id", "name": "name"},
+    }
+    checksum = plan.get_checksum()
+    data_file.write_text("id,name\n1,bar\n")
+    assert make_plan().get_checksum() != checksum
@@ -0,0 +1,49 @@
+from migration.cost_estimator import (AlterAlgorithm, classify_alter,
+                                      format_bytes, parse_create_table,
+                                      split_top_level)
+
+TABLE = """CREATE TABLE `t` (
+  `id` int NOT NULL,
+  `price` decimal(10,2) DEFAULT NULL,
+  `kind` enum('a','b') DEFAULT 'a',
+  PRIMARY KEY (`id`)
+) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4;
+"""
+
+
+def test_split_top_level():
+    assert split_top_level("a, b(1, 2), 'c,d'", ",") == ["a", "b(1, 2)", "'c,d'"]
+    assert split_top_level("delete from t; update t set a = ';';", ";") == [
+        "delete from t",
+        "update t set a = ';'",
+    ]
+
+
+def test_parse_create_table():
+    columns, keys, options = parse_create_table(TABLE)
+    assert [name for name, _ in columns] == ["id", "price", "kind"]
+    assert keys == ["PRIMARY KEY (`id`)"]
+    assert options == "ENGINE=InnoDB DEFAULT CHARSET=utf8mb4"
+
+
+def test_classify_alter():
+    assert classify_alter(None, TABLE) == (AlterAlgorithm.INSTANT, 0)
+    assert classify_alter(TABLE, None) == (AlterAlgorithm.INSTANT, 0)
+    add_column = TABLE.replace(
+        "  PRIMARY KEY", "  `name` varchar(255) DEFAULT NULL,\n  PRIMARY KEY"
+    )
+    assert classify_alter(TABLE, add_column) == (AlterAlgorithm.INSTANT, 0)
+    add_index = TABLE.replace(
+        "PRIMARY KEY (`id`)", "PRIMARY KEY (`id`),\n  KEY `idx_kind` (`kind`)"
+    )
+    assert classify_alter(TABLE, add_index) == (AlterAlgorithm.INPLACE, 1)
+    modify_column = TABLE.replace("decimal(10,2)", "decimal(12,2)")
+    assert classify_alter(TABLE, modify_column) == (AlterAlgorithm.COPY, 0)
+    change_charset = TABLE.replace("utf8mb4", "latin1")
+    assert classify_alter(TABLE, change_charset) == (AlterAlgorithm.COPY, 0)
+
+
+def test_format_bytes():
+    assert format_bytes(0) == "0B"
+    assert format_bytes(1536) == "1.5KiB"
+    assert format_bytes(3 * 1024**3) == "3.0GiB"
@@ -0,0 +1,153 @@
+import os
+import threading
+from types import SimpleNamespace
+
+import pytest
+
+from migration import client, daemon, helper
+
+
+@pytest.fixture(params=[daemon.InotifyWatcher, daemon.PollingWatcher])
+def watcher_class(request):
+    return request.param
+
+
+def test_watcher(tmp_path, watcher_class):
+    plans, store, missing = [str(tmp_path / d) for d in ["plans", "store", "data"]]
+    os.makedirs(os.path.join(store, "ab"))
+    os.makedirs(plans)
+    watcher = watcher_class([plans, store, missing])
+    try:
+        assert watcher.changed() == set()
+
+        with open(os.path.join(store, "ab", "cdef"), "w") as f:
+            f.write("create table t (id int);")
+        assert watcher.changed() == {store}
+        assert watcher.changed() == set()
+
+        # files of new directories are watched
+        os.makedirs(os.path.join(plans, "sub"))
+        assert watcher.changed() == {plans}
+        with open(os.path.join(plans, "sub", "0001.json"), "w") as f:
+            f.write("{}")
+        assert watcher.changed() == {plans}
+
+        os.makedirs(missing)
+        assert watcher.changed() == {missing}
+        with open(os.path.join(missing, "a.sql"), "w") as f:
+            f.write("select 1;")
+        assert watcher.changed() == {missing}
+    finally:
+        watcher.close()
+
+
+class FakeWatcher:
+    def __init__(self):
+        self.pending = set()
+
+    def changed(self):
+        changed, self.pending = self.pending, set()
+        return changed
+
+    def close(self):
+        pass
+
+
+class FakePlanManager:
+    loaded = 0
+
+    def __init__(self):
+        FakePlanManager.loaded += 1
+        self.plans = []
+        self.repeatable_plans = []
+
+
+def test_warm_state(monkeypatch):
+    monkeypatch.setattr(daemon.mp, "MigrationPlanManager", FakePlanManager)
+    monkeypatch.setattr(daemon.cli_env, "MIGRATION_CWD", "/ws")
+    FakePlanManager.loaded = 0
+    watcher = FakeWatcher()
+    warm = daemon.WarmState(watcher)
+
+    first = warm.plans()
+    assert warm.plans() is not first
+    assert FakePlanManager.loaded == 1
+
+    assert not warm.integrity_checked(fast=True)
+    warm.set_integrity_checked(True, warm.generation)
+    assert warm.integrity_checked(fast=True)
+    assert not warm.integrity_checked(fast=False)
+    warm.set_integrity_checked(False, warm.generation)
+    assert warm.integrity_checked(fast=True)
+
+    # the store does not change the plans
+    watcher.pending = {"/ws/.schema_store"}
+    assert not warm.integrity_checked(fast=True)
+    warm.plans()
+    assert FakePlanManager.loaded == 1
+
+    # a check that started before a change is not recorded
+    generation = warm.refresh()
+    watcher.pending = {"/ws/data"}
+    warm.refresh()
+    warm.set_integrity_checked(False, generation)
+    assert not warm.integrity_checked(fast=False)
+    warm.plans()
+    assert FakePlanManager.loaded == 2
+
+
+def test_forward(tmp_path, capfd, monkeypatch):
+    calls = []
+
+    def run_command(argv):
+        calls.append(argv)
+        print(f"running {' '.join(argv)}", flush=True)
+        if argv[0] == "fail":
+            raise Exception("failed")
+
+    socket_path = str(tmp_path / "sdm.sock")
+    # nothing is served yet
+    assert client.forward(["info", "dev"], socket_path) is None
+
+    server = daemon.DaemonServer(socket_path, run_command, watcher=FakeWatcher())
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    try:
+        assert client.forward(["info", "dev"], socket_path) == 0
+        assert client.forward(["fail"], socket_path) == 1
+        assert client.forward(["serve"], socket_path) is None
+        assert calls == [["info", "dev"], ["fail"]]
+        # the command would not run like it does locally
+        monkeypatch.setenv("SDM_TEST_FORWARD", "1")
+        assert client.forward(["info", "dev"], socket_path) is None
+        assert len(calls) == 2
+        monkeypatch.delenv("SDM_TEST_FORWARD")
+        # the output of the command is written to the stdout of the client
+        assert "running info dev" in capfd.readouterr().out
+
+        with pytest.raises(daemon.err.DaemonError):
+            daemon.DaemonServer(socket_path, run_command, watcher=FakeWatcher())
+    finally:
+        server.shutdown()
+        server.server_close()
+        thread.join()
+
+
+def test_pooled_tables_created_again_when_forgotten(monkeypatch):
+    created = []
+    monkeypatch.setattr(
+        helper, "make_engine", lambda **_: SimpleNamespace(dispose=lambda: None)
+    )
+    monkeypatch.setattr(helper, "create_tables", created.append)
+    section = dict(host="h", port="3306", user="u", schema="s")
+    helper.enable_engine_pool()
+    try:
+        engine = helper._pooled_engine(section, echo=False)
+        assert helper._pooled_engine(section, echo=False) is engine
+        assert created == [engine]
+        # e.g. test run --clear dropped them
+        helper.forget_engine_tables(engine)
+        assert helper._pooled_engine(section, echo=False) is engine
+        assert created == [engine, engine]
+    finally:
+        helper.dispose_engine_pool()
@@ -0,0 +1,162 @@
+import asyncio
+import datetime
+from types import SimpleNamespace
+
+import pytest
+from sqlalchemy import exc
+from unitcommon import make_plan
+
+from migration import fleet, lib
+from migration import migration_plan as mp
+from migration.db.model import MigrationHistoryDTO, MigrationState
+
+
+def make_history(version: int, state=MigrationState.SUCCESSFUL):
+    now = datetime.datetime(2024, 1, 1)
+    return MigrationHistoryDTO(
+        ver=str(version).zfill(4),
+        name=f"plan_{version}",
+        type=mp.Type.DATA,
+        state=state,
+        created=now,
+        updated=now,
+        checksum="",
+    )
+
+
+def test_fleet_status():
+    plans = [make_plan(v) for v in range(1, 5)]
+    statuses = [
+        fleet.status_of("dev", plans, [make_history(v) for v in range(1, 5)]),
+        fleet.status_of(
+            "qa",
+            plans,
+            [
+                make_history(1),
+                make_history(2),
+                make_history(3, MigrationState.PROCESSING),
+            ],
+        ),
+        fleet.status_of("prod", plans, [make_history(1), make_history(2)]),
+        fleet.failed("shard", Exception("Can't connect to MySQL server")),
+    ]
+    assert [(s.head, s.behind) for s in statuses[:3]] == [
+        ("0004", 0),
+        ("0002", 2),
+        ("0002", 2),
+    ]
+    assert statuses[1].pending == MigrationState.PROCESSING
+    assert fleet.drift_versions(plans, statuses) == ["0003", "0004"]
+
+    headers, rows, hidden = fleet.matrix(plans, statuses, max_versions=1)
+    assert headers == ["environment", "head", "behind", "pending", "0004"]
+    assert rows == [
+        ["dev", "0004", "0", "", "+"],
+        ["qa", "0002", "2", "PROCESSING", "."],
+        ["prod", "0002", "2", "", "."],
+        ["shard", "?", "", "Can't connect to MySQL server", "?"],
+    ]
+    assert hidden == 1
+
+    report = fleet.to_json(plans, statuses)
+    assert report["latest"] == "0004"
+    assert report["environments"][1]["states"]["0003"] == "PROCESSING"
+    assert report["environments"][3]["error"] == "Can't connect to MySQL server"
+
+
+def test_unknown_versions_drift():
+    plans = [make_plan(1)]
+    statuses = [
+        fleet.status_of("dev", plans, [make_history(1), make_history(2)]),
+        fleet.status_of("prod", plans, [make_history(1)]),
+    ]
+    assert statuses[0].unknown == ["0002"]
+    assert fleet.drift_versions(plans, statuses) == ["0002"]
+
+
+def test_never_migrated_environment_has_no_history(monkeypatch):
+    session = SimpleNamespace(close=lambda: None, get_bind=lambda: None)
+    monkeypatch.setattr(lib.helper, "build_session_from_env", lambda *_, **__: session)
+    monkeypatch.setattr(lib.helper, "release_engine", lambda _: None)
+    errors = iter(
+        [
+            Exception(1146, "Table 'dev._migration_history' doesn't exist"),
+            Exception(1045, "Access denied"),
+        ]
+    )
+
+    def get_all_versioned_dto(self):
+        raise exc.ProgrammingError("select", {}, next(errors))
+
+    monkeypatch.setattr(
+        lib.hist_dao.MigrationHistoryDAO, "get_all_versioned_dto", get_all_versioned_dto
+    )
+    dev = lib.Workspace().environment("dev")
+    assert dev.read_versioned_history() == []
+    with pytest.raises(exc.ProgrammingError):
+        dev.read_versioned_history()
+
+
+def test_select_dto_async():
+    history = make_history(1)
+
+    class Connection:
+        async def execute(self, stmt):
+            self.sql = str(stmt)
+            return [
+                (
+                    history.ver,
+                    history.name,
+                    history.type,
+                    history.state,
+                    history.created,
+                    history.updated,
+                    history.checksum,
+                )
+            ]
+
+    conn = Connection()
+    dtos = asyncio.run(lib.hist_dao.select_dto_async(conn, versioned=True))
+    assert dtos == [history]
+    assert "WHERE" in conn.sql
+
+
+def test_info_all_envs_shares_a_host_engine(monkeypatch):
+    hosts = {"dev": "a", "qa": "a", "prod": "b"}
+    built, read = [], []
+
+    class Engine:
+        disposed = False
+
+        def dispose(self):
+            self.disposed = True
+
+    def build_host_engine_from_env(env, pool_size, echo=False):
+        built.append((env, pool_size))
+        return Engine()
+
+    def read_versioned_history(self, host_engine=None):
+        read.append((self.name, host_engine))
+        return []
+
+    monkeypatch.setattr(lib.db, "async_driver_available", lambda: False)
+    monkeypatch.setattr(
+        lib.helper,
+        "get_env_ini_section",
+        lambda env: dict(host=hosts[env], port="3306", user="root", schema=env),
+    )
+    monkeypatch.setattr(
+        lib.helper, "build_host_engine_from_env", build_host_engine_from_env
+    )
+    monkeypatch.setattr(
+        lib.Environment, "read_versioned_history", read_versioned_history
+    )
+    ws = lib.Workspace()
+    monkeypatch.setattr(ws, "read_migration_plans", lambda: None)
+    ws.mpm = SimpleNamespace(get_plans=lambda: [])
+    statuses = ws.info_all_envs(list(hosts), output_format="json", host_concurrency=16)
+    assert [s.error for s in statuses] == [None, None, None]
+    assert built == [("dev", 16), ("prod", 16)]
+    engines = dict(read)
+    assert engines["dev"] is engines["qa"] is not engines["prod"]
+    assert all(engine.disposed for engine in engines.values())
@@ -0,0 +1,18 @@
+import datetime
+
+from migration.db.hist_dao import month_partitions
+
+
+def test_month_partitions():
+    assert month_partitions(datetime.date(2025, 11, 15), datetime.date(2026, 2, 1)) == [
+        ("p202511", datetime.date(2025, 12, 1)),
+        ("p202512", datetime.date(2026, 1, 1)),
+        ("p202601", datetime.date(2026, 2, 1)),
+        ("p202602", datetime.date(2026, 3, 1)),
+    ]
+
+
+def test_month_partitions_single_month():
+    assert month_partitions(datetime.date(2026, 1, 31), datetime.date(2026, 1, 1)) == [
+        ("p202601", datetime.date(2026, 2, 1))
+    ]
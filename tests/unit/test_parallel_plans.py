@@ -0,0 +1,61 @@
+from migration import migration_plan as mp
+
+
+def make_plan(name: str, group=None, conflicts_with=None) -> mp.MigrationPlan:
+    return mp.MigrationPlan(
+        version=mp.RepeatableVersion,
+        name=name,
+        author="",
+        type=mp.Type.REPEATABLE,
+        change=mp.Change(
+            forward=mp.DataForward(type=mp.DataChangeType.SQL, sql="SELECT 1;"),
+            backward=None,
+        ),
+        dependencies=[],
+        parallel_group=group,
+        conflicts_with=conflicts_with,
+    )
+
+
+def names_of(batches):
+    return [[plan.name for plan in batch] for batch in batches]
+
+
+def test_group_parallel_plans():
+    plans = [
+        make_plan("a", "g"),
+        make_plan("solo"),
+        make_plan("b", "g"),
+        make_plan("c", "g", conflicts_with=["a"]),
+        make_plan("d", "h"),
+        make_plan("e", "g"),
+    ]
+    assert names_of(mp.group_parallel_plans(plans)) == [
+        ["a"],
+        ["solo"],
+        ["b", "c", "e"],
+        ["d"],
+    ]
+
+
+def test_group_parallel_plans_keeps_conflict_order():
+    plans = [
+        make_plan("a", "g"),
+        make_plan("c", "g", conflicts_with=["a"]),
+        make_plan("e", "g", conflicts_with=["c"]),
+    ]
+    assert names_of(mp.group_parallel_plans(plans)) == [["a"], ["c"], ["e"]]
+
+
+def test_conflicts_are_symmetric():
+    a = make_plan("a", "g", conflicts_with=["b"])
+    b = make_plan("b", "g")
+    assert a.conflicts(b) and b.conflicts(a)
+    assert names_of(mp.group_parallel_plans([b, a])) == [["b"], ["a"]]
+
+
+def test_parallel_fields_saved_only_when_set():
+    assert "parallel_group" not in make_plan("a").to_dict()
+    obj = make_plan("a", "g", conflicts_with=["b"]).to_dict()
+    assert obj["parallel_group"] == "g"
+    assert obj["conflicts_with"] == ["b"]
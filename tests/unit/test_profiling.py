@@ -0,0 +1,113 @@
+import json
+import os
+import pstats
+import subprocess
+import time
+
+import pytest
+
+from migration import profiling, tracing
+
+
+def busy(seconds: float):
+    end = time.perf_counter() + seconds
+    while time.perf_counter() < end:
+        pass
+
+
+def test_split_profile_args():
+    assert profiling.split_profile_args(["migrate", "dev"]) == (
+        None,
+        ["migrate", "dev"],
+    )
+    assert profiling.split_profile_args(["--profile", "migrate"]) == (
+        profiling.ProfileMode.CPROFILE,
+        ["migrate"],
+    )
+    assert profiling.split_profile_args(["--profile=wall", "info", "dev"]) == (
+        profiling.ProfileMode.WALL,
+        ["info", "dev"],
+    )
+    # options of the command are left alone
+    assert profiling.split_profile_args(["skeema", "--profile"]) == (
+        None,
+        ["skeema", "--profile"],
+    )
+    with pytest.raises(ValueError):
+        profiling.split_profile_args(["--profile=foo", "info"])
+
+
+def test_cprofile(tmp_path):
+    with profiling.Profiler(
+        profiling.ProfileMode.CPROFILE, label="test", output_dir=str(tmp_path)
+    ) as profiler:
+        busy(0.05)
+        cmd = ["sh", "-c", "sleep 0.05"]
+        with tracing.subprocess_span(cmd):
+            subprocess.check_call(cmd)
+
+    assert len(profiler.paths) == 2
+    stats = pstats.Stats(profiler.paths[0])
+    assert any(func == "busy" for _, _, func in stats.stats)
+    with open(profiler.paths[1]) as f:
+        summary = f.read()
+    assert "busy" in summary
+    assert "subprocess sh: 1 calls" in summary
+    assert profiler.spans[0].duration >= 0.05
+
+
+def test_wall(tmp_path):
+    with profiling.Profiler(
+        profiling.ProfileMode.WALL,
+        label="test",
+        output_dir=str(tmp_path),
+        interval=0.001,
+    ) as profiler:
+        busy(0.1)
+        with tracing.span("outer"):
+            with tracing.span("inner"):
+                time.sleep(0.02)
+
+    pstats_path, summary_path, speedscope_path = profiler.paths
+    stats = pstats.Stats(pstats_path)
+    busy_stats = next(v for k, v in stats.stats.items() if k[2] == "busy")
+    # cumulative seconds of the samples in busy
+    assert 0.05 < busy_stats[3] < 1
+    assert os.path.exists(summary_path)
+
+    with open(speedscope_path) as f:
+        speedscope = json.load(f)
+    assert speedscope["$schema"] == profiling.SPEEDSCOPE_SCHEMA
+    frames = speedscope["shared"]["frames"]
+    sampled = speedscope["profiles"][0]
+    assert sampled["type"] == "sampled"
+    assert len(sampled["samples"]) == len(sampled["weights"]) > 0
+    assert any(frames[i]["name"] == "busy" for s in sampled["samples"] for i in s)
+    evented = next(p for p in speedscope["profiles"] if p["type"] == "evented")
+    assert [(e["type"], frames[e["frame"]]["name"]) for e in evented["events"]] == [
+        ("O", "outer"),
+        ("O", "inner"),
+        ("C", "inner"),
+        ("C", "outer"),
+    ]
+
+
+def test_nested_profile_is_rejected(tmp_path):
+    with profiling.Profiler(profiling.ProfileMode.CPROFILE, output_dir=str(tmp_path)):
+        with pytest.raises(Exception):
+            with profiling.Profiler(
+                profiling.ProfileMode.CPROFILE, output_dir=str(tmp_path)
+            ):
+                pass
+
+
+def test_profiles_of_one_process_get_their_own_files(tmp_path):
+    names = set()
+    for _ in range(2):
+        with profiling.Profiler(
+            profiling.ProfileMode.CPROFILE, label="info", output_dir=str(tmp_path)
+        ) as profiler:
+            pass
+        names.add(profiler.name)
+    assert len(names) == 2
+    assert len(os.listdir(tmp_path)) == 4
@@ -0,0 +1,18 @@
+from migration.migrator import Migrator
+
+
+def test_python_module_loaded_once(tmp_path):
+    path = tmp_path / "migration.py"
+    path.write_text("LOADED = object()\n\ndef run(session, args):\n    return 0\n")
+    migrator = Migrator()
+    module = migrator.load_python_module(str(path))
+    assert migrator.load_python_module(str(path)) is module
+
+    # a changed file is loaded again
+    path.write_text("LOADED = object()\n\ndef run(session, args):\n    return 1\n")
+    changed = migrator.load_python_module(str(path))
+    assert changed is not module
+    assert changed.run(None, {}) == 1
+
+    migrator.clear_python_modules()
+    assert migrator.load_python_module(str(path)) is not changed
@@ -0,0 +1,75 @@
+import logging
+import os
+
+import pytest
+
+from migration import err, python_runner
+from migration.python_runner import ProcessRunner, fan_out, parse_size
+
+FAN_OUT_FILE = """
+def square(x):
+    return x * x
+
+def run_fan_out(fan_out):
+    return fan_out(square, range(10), workers=2)
+"""
+
+
+def write_module(tmp_path, content: str) -> str:
+    path = tmp_path / "migration.py"
+    path.write_text(content)
+    return str(path)
+
+
+def test_parse_size():
+    assert parse_size("0") == 0
+    assert parse_size("512") == 512
+    assert parse_size("2k") == 2048
+    assert parse_size("1.5G") == int(1.5 * 1024**3)
+
+
+def test_process_tree_rss():
+    assert python_runner.process_tree_rss(os.getpid()) > 0
+
+
+def test_fan_out(tmp_path):
+    module = python_runner.load_module(write_module(tmp_path, FAN_OUT_FILE))
+    assert module.run_fan_out(fan_out) == [i * i for i in range(10)]
+
+
+def test_fan_out_needs_module_level_function():
+    with pytest.raises(Exception):
+        fan_out(lambda x: x, [1])
+
+
+def test_process_timeout(tmp_path):
+    path = write_module(tmp_path, "import time\ntime.sleep(60)\n")
+    with pytest.raises(err.PythonMigrationError, match="timed out"):
+        ProcessRunner(timeout=1, max_rss=0).run(path, "dev", {})
+
+
+def test_process_max_rss(tmp_path):
+    path = write_module(
+        tmp_path, "import time\ndata = bytearray(512 * 1024 * 1024)\ntime.sleep(60)\n"
+    )
+    with pytest.raises(err.PythonMigrationError, match="memory"):
+        ProcessRunner(timeout=30, max_rss=256 * 1024 * 1024).run(path, "dev", {})
+
+
+def test_process_exit(tmp_path):
+    path = write_module(tmp_path, "import os\nos._exit(3)\n")
+    with pytest.raises(err.PythonMigrationError, match="exited with code 3"):
+        ProcessRunner(timeout=30, max_rss=0).run(path, "dev", {})
+
+
+def test_process_error_and_logs(tmp_path, caplog):
+    path = write_module(
+        tmp_path,
+        "import logging\n"
+        "logging.getLogger('migration.child').warning('hello from child')\n"
+        "raise ValueError('broken migration')\n",
+    )
+    with caplog.at_level(logging.INFO):
+        with pytest.raises(err.PythonMigrationError, match="broken migration"):
+            ProcessRunner(timeout=30, max_rss=0).run(path, "dev", {})
+    assert "hello from child" in caplog.text
@@ -0,0 +1,69 @@
+import datetime
+import io
+import json
+
+import pytest
+
+from migration import auto_test_plan, consts, main, report
+from migration.db.model import MigrationState
+
+ROWS = [
+    ["0001", MigrationState.SUCCESSFUL, datetime.datetime(2024, 1, 1)],
+    ["0002", MigrationState.PROCESSING, None],
+]
+
+
+def write(output_format: str) -> str:
+    stream = io.StringIO()
+    with report.RowWriter(output_format, ["ver", "state", "updated"], stream) as w:
+        for row in ROWS:
+            w.write(row)
+    assert w.count == len(ROWS)
+    return stream.getvalue()
+
+
+def test_jsonl():
+    assert (
+        write(consts.OUTPUT_FORMAT_JSONL)
+        == '{"ver": "0001", "state": "SUCCESSFUL", "updated": "2024-01-01T00:00:00"}\n'
+        '{"ver": "0002", "state": "PROCESSING", "updated": null}\n'
+    )
+
+
+def test_csv():
+    assert (
+        write(consts.OUTPUT_FORMAT_CSV)
+        == "ver,state,updated\n0001,SUCCESSFUL,2024-01-01T00:00:00\n0002,PROCESSING,\n"
+    )
+
+
+def test_json_is_an_array():
+    assert json.loads(write(consts.OUTPUT_FORMAT_JSON))[1] == dict(
+        ver="0002", state="PROCESSING", updated=None
+    )
+    stream = io.StringIO()
+    report.RowWriter(consts.OUTPUT_FORMAT_JSON, ["plan"], stream).close()
+    assert json.loads(stream.getvalue()) == []
+
+
+def test_table_is_not_streamed():
+    with pytest.raises(Exception):
+        report.RowWriter(consts.OUTPUT_FORMAT_TABLE, ["ver"])
+
+
+@pytest.mark.parametrize("output_format", consts.STREAM_OUTPUT_FORMAT)
+def test_read_test_plan_file(tmp_path, output_format):
+    plans = ["0001_a", "0002_b,c"]
+    path = tmp_path / f"plan.{output_format}"
+    with open(path, "w") as f, report.RowWriter(
+        output_format, [auto_test_plan.TEST_PLAN_HEADER], f
+    ) as w:
+        for plan in plans:
+            w.write([plan])
+    assert auto_test_plan.read_test_plan_file(str(path)) == plans
+
+
+def test_logs_move_only_for_stdout_output():
+    assert main.parse_args(["info", "dev", "--format", "jsonl"]).output_to_stdout
+    args = main.parse_args(["test", "gen", "monkey", "--format", "jsonl"])
+    assert not args.output_to_stdout
@@ -0,0 +1,54 @@
+from unitcommon import make_plan
+
+from migration import migration_plan as mp
+from migration.db.hist_dao import Direction
+from migration.route_planner import RoutePlanner, StepType
+
+
+def make_timings(plans, forward: float, backward: float):
+    timings = {}
+    for plan in plans:
+        timings[(plan.version, plan.name, Direction.FORWARD)] = forward
+        timings[(plan.version, plan.name, Direction.BACKWARD)] = backward
+    return timings
+
+
+def route_of(steps):
+    return [(step.type, step.start, step.end) for step in steps]
+
+
+def test_coalesce_schema_plans():
+    plans = [make_plan(i, mp.Type.SCHEMA) for i in range(6)]
+    planner = RoutePlanner(plans, make_timings(plans, 10, 10))
+    assert route_of(planner.plan(0, 5)) == [(StepType.SCHEMA_PUSH, 0, 5)]
+    assert route_of(planner.plan(5, 1)) == [(StepType.SCHEMA_JUMP, 5, 1)]
+    assert route_of(planner.plan(2, 3)) == [(StepType.FORWARD, 2, 3)]
+
+
+def test_data_plan_is_stepped():
+    plans = [make_plan(i, mp.Type.SCHEMA) for i in range(6)]
+    plans[3] = make_plan(3, mp.Type.DATA)
+    planner = RoutePlanner(plans, make_timings(plans, 10, 10))
+    assert route_of(planner.plan(5, 0)) == [
+        (StepType.SCHEMA_JUMP, 5, 3),
+        (StepType.BACKWARD, 3, 2),
+        (StepType.SCHEMA_JUMP, 2, 0),
+    ]
+    assert route_of(planner.plan(0, 5)) == [
+        (StepType.SCHEMA_PUSH, 0, 2),
+        (StepType.FORWARD, 2, 3),
+        (StepType.SCHEMA_PUSH, 3, 5),
+    ]
+
+
+def test_pinned_and_untimed_plans():
+    plans = [make_plan(i, mp.Type.SCHEMA) for i in range(4)]
+    # plan 2 is never timed, it costs the average of the timed schema plans
+    timings = make_timings(plans[:2] + plans[3:], 10, 10)
+    planner = RoutePlanner(plans, timings, pinned={2})
+    assert planner.cost(2, Direction.FORWARD) == 10
+    assert route_of(planner.plan(0, 3)) == [
+        (StepType.FORWARD, 0, 1),
+        (StepType.FORWARD, 1, 2),
+        (StepType.FORWARD, 2, 3),
+    ]
@@ -0,0 +1,99 @@
+import fcntl
+import os
+import threading
+import time
+
+import pytest
+
+from migration import helper
+from migration.env import cli_env
+from migration.schema_workdir import SchemaWorkdirCache
+
+
+@pytest.fixture
+def workspace(tmp_path, monkeypatch):
+    monkeypatch.setattr(cli_env, "MIGRATION_CWD", str(tmp_path))
+    os.makedirs(tmp_path / cli_env.SCHEMA_STORE_DIR)
+    os.makedirs(tmp_path / cli_env.SCHEMA_DIR)
+    with open(tmp_path / cli_env.SCHEMA_DIR / ".skeema", "w") as f:
+        f.write("[dev]\nhost=127.0.0.1\n")
+    return tmp_path
+
+
+def write_index(tables: dict) -> str:
+    lines = []
+    for filename, content in tables.items():
+        sha1 = helper.sha1_encode([content])
+        os.makedirs(os.path.dirname(helper.sha1_to_path(sha1)), exist_ok=True)
+        helper.write_sha1_file(sha1, content)
+        lines.append(f"{sha1}:{filename}")
+    index_sha1 = helper.sha1_encode([line.split(":")[0] for line in lines])
+    os.makedirs(os.path.dirname(helper.sha1_to_path(index_sha1)), exist_ok=True)
+    helper.write_sha1_file(index_sha1, "\n".join(lines))
+    return index_sha1
+
+
+def test_acquire_links_and_reuses(workspace):
+    index_sha1 = write_index({"t1.sql": "create table t1 (id int);"})
+    cache = SchemaWorkdirCache(scratch_dir=str(workspace / "tmp"))
+
+    with cache.acquire(index_sha1) as workdir:
+        schema_dir = os.path.join(workdir, cli_env.SCHEMA_DIR)
+        assert sorted(os.listdir(schema_dir)) == [".skeema", "t1.sql"]
+        sql_path = os.path.join(schema_dir, "t1.sql")
+        with open(sql_path) as f:
+            assert f.read() == "create table t1 (id int);"
+        inode = os.stat(sql_path).st_ino
+
+    # the skeema config is refreshed, the sql files are reused
+    with open(workspace / cli_env.SCHEMA_DIR / ".skeema", "w") as f:
+        f.write("[dev]\nhost=10.0.0.1\n")
+    with cache.acquire(index_sha1) as workdir2:
+        assert workdir2 == workdir
+        assert os.stat(os.path.join(workdir2, "schema", "t1.sql")).st_ino == inode
+        with open(os.path.join(workdir2, "schema", ".skeema")) as f:
+            assert "10.0.0.1" in f.read()
+
+
+def test_evict_least_recently_used(workspace):
+    cache = SchemaWorkdirCache(scratch_dir=str(workspace / "tmp"), max_entries=2)
+    sha1s = [
+        write_index({f"t{i}.sql": f"create table t{i} (id int);"}) for i in range(3)
+    ]
+    with cache.acquire(sha1s[0]):
+        for sha1 in sha1s[1:]:
+            with cache.acquire(sha1):
+                pass
+        # sha1s[0] is still in use, so sha1s[1] is evicted instead
+        assert sorted(cache.entries()) == sorted([sha1s[0], sha1s[2]])
+
+    # the lock files go with their entries
+    assert sorted(n for n in os.listdir(cache.cache_dir) if n.endswith(".lock")) == [
+        f"{sha1}.lock" for sha1 in sorted(cache.entries())
+    ]
+    # e.g. left by a failed build
+    open(os.path.join(cache.cache_dir, "0" * 40 + ".lock"), "w").close()
+    cache.clear()
+    assert cache.entries() == []
+    assert os.listdir(cache.cache_dir) == []
+
+
+def test_acquire_waiting_on_a_removed_lock_file(workspace):
+    sha1 = write_index({"t1.sql": "create table t1 (id int);"})
+    cache = SchemaWorkdirCache(scratch_dir=str(workspace / "tmp"))
+    os.makedirs(cache.cache_dir)
+    locked = []
+
+    def acquire():
+        with cache.acquire(sha1):
+            locked.append(os.path.exists(cache._lock_path(sha1)))
+
+    # an eviction holds the lock while the acquire waits on it
+    with cache._lock(sha1, fcntl.LOCK_EX):
+        thread = threading.Thread(target=acquire)
+        thread.start()
+        time.sleep(0.2)
+        os.remove(cache._lock_path(sha1))
+    thread.join()
+    # the acquire locked the lock file now at the path, not the removed one
+    assert locked == [True]
@@ -0,0 +1,102 @@
+import os
+
+from migration import helper
+from migration.store_gc import SchemaStoreGC
+
+
+def write_object(store_dir: str, content: str) -> str:
+    sha1 = helper.sha1_encode([content])
+    os.makedirs(os.path.join(store_dir, sha1[:2]), exist_ok=True)
+    with open(os.path.join(store_dir, sha1[:2], sha1[2:]), "w") as f:
+        f.write(content)
+    return sha1
+
+
+def make_store(tmp_path) -> tuple:
+    store_dir = str(tmp_path / "store")
+    scratch_dir = str(tmp_path / "scratch")
+    os.makedirs(store_dir)
+    sql_sha1 = write_object(store_dir, "create table t (id int);")
+    index_sha1 = write_object(store_dir, f"{sql_sha1}:t.sql")
+    return store_dir, scratch_dir, index_sha1, sql_sha1
+
+
+def test_collect_unreachable(tmp_path):
+    store_dir, scratch_dir, index_sha1, _ = make_store(tmp_path)
+    garbage = write_object(store_dir, "create table garbage (id int);")
+    with open(os.path.join(store_dir, "foo"), "w") as f:
+        f.write("bar")
+
+    gc = SchemaStoreGC(store_dir=store_dir, scratch_dir=scratch_dir)
+    unexpected = gc.collect([index_sha1], dry_run=True)
+    assert sorted(unexpected) == sorted(["foo", os.path.join(garbage[:2], garbage[2:])])
+    assert os.path.exists(os.path.join(store_dir, "foo"))
+
+    gc = SchemaStoreGC(store_dir=store_dir, scratch_dir=scratch_dir)
+    unexpected = gc.collect([index_sha1])
+    assert len(unexpected) == 2
+    assert not os.path.exists(os.path.join(store_dir, "foo"))
+    assert not os.path.exists(os.path.join(store_dir, garbage[:2], garbage[2:]))
+
+    gc = SchemaStoreGC(store_dir=store_dir, scratch_dir=scratch_dir)
+    assert gc.collect([index_sha1], dry_run=True) == []
+
+
+def test_clean_bucket_is_skipped(tmp_path, monkeypatch):
+    store_dir, scratch_dir, index_sha1, _ = make_store(tmp_path)
+    gc = SchemaStoreGC(store_dir=store_dir, scratch_dir=scratch_dir)
+    assert gc.collect([index_sha1]) == []
+
+    swept = []
+    gc = SchemaStoreGC(store_dir=store_dir, scratch_dir=scratch_dir)
+    original = gc._sweep_bucket
+    monkeypatch.setattr(
+        gc, "_sweep_bucket", lambda b, r: swept.append(b) or original(b, r)
+    )
+    assert gc.collect([index_sha1]) == []
+    assert swept == []
+
+    # a new object makes its bucket dirty again
+    garbage = write_object(store_dir, "garbage")
+    assert gc.collect([index_sha1]) == [os.path.join(garbage[:2], garbage[2:])]
+    assert swept == [garbage[:2]]
+
+
+def test_unreferenced_index_is_collected(tmp_path):
+    store_dir, scratch_dir, index_sha1, sql_sha1 = make_store(tmp_path)
+    gc = SchemaStoreGC(store_dir=store_dir, scratch_dir=scratch_dir)
+    assert gc.collect([index_sha1], dry_run=True) == []
+
+    gc = SchemaStoreGC(store_dir=store_dir, scratch_dir=scratch_dir)
+    unexpected = gc.collect([], dry_run=True)
+    assert sorted(unexpected) == sorted(
+        [
+            os.path.join(index_sha1[:2], index_sha1[2:]),
+            os.path.join(sql_sha1[:2], sql_sha1[2:]),
+        ]
+    )
+
+
+def test_record_written_avoids_reading_index(tmp_path):
+    store_dir, scratch_dir, _, sql_sha1 = make_store(tmp_path)
+    gc = SchemaStoreGC(store_dir=store_dir, scratch_dir=scratch_dir)
+    gc.record_written("ff" + "0" * 38, [sql_sha1])
+    gc.save_state()
+
+    gc = SchemaStoreGC(store_dir=store_dir, scratch_dir=scratch_dir)
+    # the index file does not exist, so it must come from the cache
+    assert gc.mark(["ff" + "0" * 38]) == {"ff" + "0" * 38, sql_sha1}
+
+
+def test_collect_with_time_budget(tmp_path):
+    store_dir, scratch_dir, index_sha1, _ = make_store(tmp_path)
+    for i in range(10):
+        write_object(store_dir, f"garbage {i}")
+
+    unexpected = set()
+    for _ in range(20):
+        gc = SchemaStoreGC(store_dir=store_dir, scratch_dir=scratch_dir)
+        unexpected.update(gc.collect([index_sha1], max_time=0))
+    assert len(unexpected) == 10
+    gc = SchemaStoreGC(store_dir=store_dir, scratch_dir=scratch_dir)
+    assert gc.collect([index_sha1]) == []
@@ -0,0 +1,51 @@
+import pytest
+
+from migration import err
+from migration.throttle import ReplicaLagThrottle, parse_replicas
+
+
+class ScriptedThrottle(ReplicaLagThrottle):
+    """
+    replays a list of replica lags instead of querying the replicas
+    """
+
+    def __init__(self, lags, **kwargs):
+        super().__init__({}, **kwargs)
+        self.lags = list(lags)
+        self.checks = 0
+
+    def get_lags(self):
+        self.checks += 1
+        return self.lags.pop(0) if len(self.lags) > 1 else self.lags[0]
+
+
+def test_parse_replicas():
+    assert parse_replicas("") == []
+    assert parse_replicas("db1, db2:3307,") == [("db1", 3306), ("db2", 3307)]
+
+
+def test_wait_until_caught_up():
+    throttle = ScriptedThrottle(
+        [{"r1": 5.0, "r2": None}, {"r1": 0.5, "r2": 3.0}, {"r1": 0.0, "r2": 1.0}],
+        max_lag=1,
+        check_interval=0.01,
+    )
+    throttle.wait()
+    assert throttle.checks == 3
+    assert throttle.paused_seconds > 0
+
+
+def test_wait_checks_once_per_interval():
+    throttle = ScriptedThrottle([{"r1": 0.0}], max_lag=1, check_interval=60)
+    for _ in range(10):
+        throttle()
+    assert throttle.checks == 1
+    assert throttle.paused_seconds == 0
+
+
+def test_wait_timeout():
+    throttle = ScriptedThrottle(
+        [{"r1": 100.0}], max_lag=1, check_interval=0.01, timeout=0.05
+    )
+    with pytest.raises(err.ReplicaLagError):
+        throttle.wait()
@@ -0,0 +1,98 @@
+import json
+import threading
+
+import pytest
+from sqlalchemy import create_engine, text
+from sqlalchemy.orm import Session
+
+from migration import tracing
+from migration.db.hist_dao import trace_transactions
+
+
+def read_spans(path) -> list:
+    spans = []
+    with open(path) as f:
+        for line in f:
+            request = json.loads(line)
+            resource_spans = request["resourceSpans"][0]
+            attributes = {
+                a["key"]: list(a["value"].values())[0]
+                for a in resource_spans["resource"]["attributes"]
+            }
+            assert attributes["service.name"] == "sdm"
+            spans.extend(resource_spans["scopeSpans"][0]["spans"])
+    return spans
+
+
+def test_disabled():
+    assert not tracing.enabled()
+    with tracing.span("nothing") as s:
+        assert s is None
+    assert tracing.traceparent_env() == {}
+
+
+def test_export_to_file(tmp_path):
+    path = str(tmp_path / "trace" / "spans.jsonl")
+    with tracing.export_to_file(path):
+        with tracing.span("sdm migrate", {"sdm.command": "migrate"}):
+            with tracing.span("migrator.forward", {"sdm.plan.version": "0001"}) as s:
+                s.set("sdm.rows", 3)
+            with pytest.raises(ValueError):
+                with tracing.span("migrator.forward"):
+                    raise ValueError("boom")
+            worker = threading.Thread(
+                target=lambda: tracing.end_span(tracing.start_span("worker"))
+            )
+            worker.start()
+            worker.join()
+    assert not tracing.enabled()
+
+    spans = {
+        s["name"] + s.get("status", {}).get("message", ""): s for s in read_spans(path)
+    }
+    root = spans["sdm migrate"]
+    ok = spans["migrator.forward"]
+    failed = spans["migrator.forwardValueError: boom"]
+    assert "parentSpanId" not in root
+    assert len({s["traceId"] for s in spans.values()}) == 1
+    assert len(root["traceId"]) == 32 and len(root["spanId"]) == 16
+    for s in [ok, failed, spans["worker"]]:
+        assert s["parentSpanId"] == root["spanId"]
+    assert failed["status"]["code"] == tracing.STATUS_ERROR
+    assert {"key": "sdm.rows", "value": {"intValue": "3"}} in ok["attributes"]
+    assert int(ok["endTimeUnixNano"]) >= int(ok["startTimeUnixNano"])
+
+
+def test_traceparent(tmp_path, monkeypatch):
+    trace_id, parent_id = "ab" * 16, "cd" * 8
+    monkeypatch.setenv(tracing.TRACEPARENT_ENV, f"00-{trace_id}-{parent_id}-01")
+    path = str(tmp_path / "spans.jsonl")
+    with tracing.export_to_file(path):
+        with tracing.span("sdm migrate") as s:
+            assert tracing.traceparent_env() == {
+                tracing.TRACEPARENT_ENV: f"00-{trace_id}-{s.span_id}-01"
+            }
+    (span,) = read_spans(path)
+    assert span["traceId"] == trace_id
+    assert span["parentSpanId"] == parent_id
+
+
+def test_trace_transactions():
+    finished = []
+    tracing.add_listener(finished.append)
+    try:
+        session = Session(create_engine("sqlite://"))
+        trace_transactions(session)
+        with tracing.span("outer"):
+            with session.begin():
+                session.execute(text("select 1"))
+                with session.begin_nested():
+                    session.execute(text("select 2"))
+            # autobegin
+            session.execute(text("select 3"))
+            session.commit()
+    finally:
+        tracing.remove_listener(finished.append)
+    names = [s.name for s in finished]
+    assert names == ["dao.transaction", "dao.transaction", "outer"]
+    assert all(s.parent_id == finished[-1].span_id for s in finished[:2])
@@ -0,0 +1,126 @@
+import asyncio
+import contextlib
+from argparse import Namespace
+from types import SimpleNamespace
+
+from migration import lib
+
+
+def test_environment_is_cached():
+    workspace = lib.Workspace()
+    dev = workspace.environment("dev")
+    assert workspace.environment("dev") is dev
+    assert workspace.environment("prod") is not dev
+    assert dev.workspace is workspace
+    assert dev.migrator is workspace.migrator
+    assert lib.Workspace().migrator is not workspace.migrator
+    workspace.close()
+
+
+def test_run_drops_python_modules(monkeypatch):
+    dev = lib.Workspace().environment("dev")
+    cleared = []
+    monkeypatch.setattr(dev.migrator, "clear_python_modules", lambda: cleared.append(1))
+
+    @contextlib.contextmanager
+    def hold_env_lock(operator, dry_run):
+        dev._env_lock = object()
+        try:
+            yield dev._env_lock
+        finally:
+            dev._env_lock = None
+
+    monkeypatch.setattr(dev, "hold_env_lock", hold_env_lock)
+
+    @lib.with_env_lock
+    def run(self, nested: bool = False):
+        if nested:
+            run(self)
+        assert cleared == []
+
+    # once, when the outermost run ends
+    run(dev, nested=True)
+    assert cleared == [1]
+
+
+def test_cli_maps_args(monkeypatch):
+    calls = []
+
+    def record(name):
+        def method(self, *args, **kwargs):
+            calls.append((name, self.name, args, kwargs))
+
+        return method
+
+    for name in ["migrate", "rollback", "fix_migrate"]:
+        monkeypatch.setattr(lib.Environment, name, record(name))
+
+    cli = lib.CLI(args=Namespace(environment="dev", version="3", operator="ci"))
+    cli.migrate()
+    cli.rollback()
+    cli.fix_rollback()
+    assert calls == [
+        (
+            "migrate",
+            "dev",
+            (),
+            dict(
+                version="3",
+                name=None,
+                fake=False,
+                dry_run=False,
+                operator="ci",
+                coalesce=False,
+                output_format="table",
+            ),
+        ),
+        (
+            "rollback",
+            "dev",
+            (),
+            dict(
+                version="3",
+                name=None,
+                fake=False,
+                dry_run=False,
+                operator="ci",
+                jump=False,
+                output_format="table",
+            ),
+        ),
+        ("fix_migrate", "dev", (), dict(forward=False, fake=False, operator="ci")),
+    ]
+    # args are not changed by the commands
+    assert vars(cli.args) == dict(environment="dev", version="3", operator="ci")
+
+
+def test_env_lock_engine_released_on_failure(monkeypatch):
+    engine, released = SimpleNamespace(url=SimpleNamespace(database="dev")), []
+    monkeypatch.setattr(lib.helper, "build_engine_from_env", lambda *_, **__: engine)
+    monkeypatch.setattr(lib.helper, "release_engine", released.append)
+    monkeypatch.setattr(lib.env_lock.EnvironmentLock, "__enter__", lambda self: self)
+    monkeypatch.setattr(lib.env_lock.EnvironmentLock, "__exit__", lambda *_: None)
+
+    dev = lib.Workspace().environment("dev")
+    try:
+        with dev.hold_env_lock(operator="ci"):
+            raise RuntimeError("migration failed")
+    except RuntimeError:
+        pass
+    assert released == [engine]
+    assert dev._env_lock is None
+
+
+def test_for_each_environment_awaits_coroutine_functions():
+    async def read(env: lib.Environment) -> str:
+        await asyncio.sleep(0)
+        return env.name
+
+    workspace = lib.Workspace()
+    limiter = lib.aio.HostLimiter(host_of=lambda _: ("127.0.0.1", "3306"))
+    outcomes = workspace.for_each_environment(["dev", "prod"], read, limiter)
+    assert [o.result for o in outcomes] == ["dev", "prod"]
+    outcomes = workspace.for_each_environment(
+        ["dev"], lambda env: env.name, lib.aio.HostLimiter(host_of=limiter.host_of)
+    )
+    assert outcomes[0].result == "dev"
@@ -0,0 +1,22 @@
+from migration import migration_plan as mp
+
+
+def make_plan(version: int, type: mp.Type = mp.Type.DATA) -> mp.MigrationPlan:
+    if type == mp.Type.SCHEMA:
+        change = mp.Change(
+            forward=mp.SchemaForward(id=f"{version:040d}"),
+            backward=mp.SchemaBackward(id=f"{version - 1:040d}"),
+        )
+    else:
+        change = mp.Change(
+            forward=mp.DataForward(type=mp.DataChangeType.SQL, sql="SELECT 1;"),
+            backward=mp.DataBackward(type=mp.DataChangeType.SQL, sql="SELECT 1;"),
+        )
+    return mp.MigrationPlan(
+        version=str(version).zfill(4),
+        name=f"plan_{version}",
+        author="",
+        type=type,
+        change=change,
+        dependencies=[],
+    )